@@ -4,17 +4,17 @@ import logging
 from datetime import datetime
 import streamlit as st
 
-from langchain_openai import AzureOpenAI
-from langchain.chains import RetrievalQA
-
 # Core Imports
 from core.settings import settings
 from core.logging_config import configure_logging
 from core.validator import (
     authenticate_user,
     load_vector_db,
+    start_vector_db_warmup,
+    stream_answer,
+    render_streaming_answer,
     save_chat_message,
-    load_chat_history,
+    load_chat_history_page,
 )
 
 # Import visualization module
@@ -63,6 +63,8 @@ def init_session_state():
         st.session_state.role = None
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "chat_cursor" not in st.session_state:
+        st.session_state.chat_cursor = None
 
 
 def login_page():
@@ -85,8 +87,11 @@ def login_page():
                 st.session_state.authenticated = True
                 st.session_state.username = username
                 st.session_state.role = role
-                # For app.py legacy, we load full history into memory session state
-                st.session_state.messages = load_chat_history(username)
+                # Load the most recent page; older pages are fetched on demand
+                (
+                    st.session_state.messages,
+                    st.session_state.chat_cursor,
+                ) = load_chat_history_page(username)
                 st.success(f"Welcome, {username}!")
                 st.rerun()
             else:
@@ -115,6 +120,7 @@ def logout():
     st.session_state.username = None
     st.session_state.role = None
     st.session_state.messages = []
+    st.session_state.chat_cursor = None
     st.success("You have been logged out")
     st.rerun()
 
@@ -175,6 +181,15 @@ def main_app():
     with tab1:
         st.subheader("💬 Clinical Knowledge Assistant")
 
+        if st.session_state.chat_cursor:
+            if st.button("⬆️ Load older messages"):
+                older, st.session_state.chat_cursor = load_chat_history_page(
+                    st.session_state.username,
+                    cursor=st.session_state.chat_cursor,
+                )
+                st.session_state.messages = older + st.session_state.messages
+                st.rerun()
+
         # Display chat history
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
@@ -197,37 +212,25 @@ def main_app():
 
             # Generate response
             with st.chat_message("assistant"):
-                with st.spinner("📚 Consulting Knowledge Base..."):
-                    try:
-                        llm = AzureOpenAI(
-                            temperature=0,
-                            deployment_name=settings.AZURE_OPENAI_DEPLOYMENT,
-                            api_version=settings.AZURE_OPENAI_API_VERSION,
-                            api_key=settings.AZURE_OPENAI_API_KEY,
-                            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT
-                        )
-
-                        qa_chain = RetrievalQA.from_chain_type(
-                            llm=llm,
-                            chain_type="stuff",
-                            retriever=db.as_retriever(
-                                search_kwargs={"k": 5}
-                            )
-                        )
-
-                        response = qa_chain.run(query)
-                        st.markdown(response)
-
-                        st.session_state.messages.append({
-                            "role": "assistant",
-                            "content": response
-                        })
-                        # Persist response
-                        save_chat_message(st.session_state.username, "assistant", response)
-
-                    except Exception as e:
-                        error_msg = f"Error generating response: {e}"
-                        st.error(error_msg)
+                try:
+                    # Retrieval only; tokens are rendered as they arrive
+                    with st.spinner("📚 Consulting Knowledge Base..."):
+                        answer = stream_answer(query, search_k=5, temperature=0.0, label="app")
+                    if answer is None:
+                        raise RuntimeError("Knowledge base is offline")
+
+                    response = render_streaming_answer(answer)
+
+                    st.session_state.messages.append({
+                        "role": "assistant",
+                        "content": response
+                    })
+                    # Persist response
+                    save_chat_message(st.session_state.username, "assistant", response)
+
+                except Exception as e:
+                    error_msg = f"Error generating response: {e}"
+                    st.error(error_msg)
 
 
     with tab2:
@@ -263,6 +266,7 @@ def main_app():
     with col1:
         if st.button("📋 Clear History", use_container_width=True):
             st.session_state.messages = []
+            st.session_state.chat_cursor = None
             # Note: Logic to clear history in DB/File is in db module or needs helper in validator
             # For now, just clear session.
             st.success("Chat history cleared (session only)")
@@ -317,6 +321,8 @@ def admin_panel():
 
 if __name__ == "__main__":
     init_session_state()
+    # Open the knowledge base while the user logs in
+    start_vector_db_warmup()
 
     if not st.session_state.authenticated:
         login_page()
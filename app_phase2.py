@@ -6,18 +6,12 @@ Uses database for production, JSON for development/testing.
 """
 
 import os
+import html
 import logging
+from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Any
 
 import streamlit as st
-# AI/ML Imports (Optional for basic platform run)
-try:
-    from langchain_openai import AzureOpenAI
-    from langchain.chains import RetrievalQA
-    AI_AVAILABLE = True
-except ImportError:
-    AI_AVAILABLE = False
-    logging.warning("LangChain/AI modules not available (running in non-AI mode)")
 
 # Core imports
 from core.settings import settings
@@ -26,14 +20,30 @@ from core.safe_logging import mask_identifier, log_exception_safe
 from core.validator import (
     authenticate_user,
     load_vector_db,
+    start_vector_db_warmup,
+    get_vector_db_status,
     save_chat_message,
-    load_chat_history,
+    load_chat_history_page,
+    search_chat_messages,
+    SEARCH_HIGHLIGHT,
+    start_user_session,
+    check_user_session,
+    end_user_session,
     audit_log,
     analytics_log,
     hash_password,
+    stream_answer,
+    render_streaming_answer,
+    get_answer_cache_stats,
+    get_embedding_cache_stats,
+    purge_answer_cache,
+    AI_AVAILABLE,
     DB_AVAILABLE
 )
-from core.analytics_dashboard import render_dashboard
+# AI/ML modules are optional for a basic platform run
+if not AI_AVAILABLE:
+    logging.warning("LangChain/AI modules not available (running in non-AI mode)")
+from core.analytics_dashboard import render_dashboard, render_query_metrics
 
 # Optional Imports with new paths
 try:
@@ -41,8 +51,12 @@ try:
         init_database,
         add_user,
         get_user,
+        get_user_cache_stats,
     )
     from db.db_migrations import run_migrations
+    from db.rollups import start_rollup_refresher
+    from db.partitions import start_partition_maintenance
+    from db.sessions import start_session_sweeper, get_session_cache_stats
 except ImportError:
     pass # DB_AVAILABLE handled in core/validator.py
 
@@ -105,6 +119,9 @@ def init_database_if_needed():
                 logger.info("Initializing database schema...")
                 init_database()
                 run_migrations()
+                start_rollup_refresher()
+                start_partition_maintenance()
+                start_session_sweeper()
                 st.session_state.db_initialized = True
                 logger.info("Database initialized successfully")
 
@@ -185,6 +202,7 @@ def login_page():
                 st.session_state.authenticated = True
                 st.session_state.username = username
                 st.session_state.role = role
+                st.session_state.session_token = start_user_session(username)
                 audit_log(username, "login")
                 logger.info("User login successful")
                 st.success(f"Welcome back, {username}!")
@@ -220,6 +238,12 @@ def main_app():
     """Main application interface."""
     init_database_if_needed()
 
+    # Expired or revoked sessions (e.g. deactivated account) end here
+    if not check_user_session(st.session_state.get("session_token")):
+        st.session_state.authenticated = False
+        st.session_state.session_token = None
+        st.rerun()
+
     # Sidebar
     with st.sidebar:
         st.markdown("### 👤 Current User")
@@ -230,6 +254,8 @@ def main_app():
 
         if st.button("🚪 Logout", use_container_width=True):
             audit_log(st.session_state.username, "logout")
+            end_user_session(st.session_state.get("session_token"))
+            st.session_state.session_token = None
             st.session_state.authenticated = False
             st.session_state.username = None
             st.session_state.role = None
@@ -292,9 +318,44 @@ def main_app():
         )
 
         if "chat_history" not in st.session_state:
-            st.session_state.chat_history = load_chat_history(
-                st.session_state.username
+            (
+                st.session_state.chat_history,
+                st.session_state.chat_cursor,
+            ) = load_chat_history_page(st.session_state.username)
+
+        with st.expander("🔎 Search my conversations"):
+            search_query = st.text_input(
+                "Search", placeholder="e.g. pressure ulcers", key="chat_search_query"
             )
+            search_days = st.selectbox(
+                "From", [7, 30, 365, None], index=1, key="chat_search_days",
+                format_func=lambda d: f"Last {d} days" if d else "All time",
+            )
+            if search_query:
+                since = (
+                    (datetime.utcnow() - timedelta(days=search_days)).strftime("%Y-%m-%d")
+                    if search_days else None
+                )
+                hits = search_chat_messages(st.session_state.username, search_query, since=since)
+                if not hits:
+                    st.caption("No matching messages.")
+                for hit in hits:
+                    snippet = html.escape(hit["snippet"] or "")
+                    snippet = snippet.replace(SEARCH_HIGHLIGHT[0], "<mark>").replace(SEARCH_HIGHLIGHT[1], "</mark>")
+                    st.markdown(
+                        f"**{hit['role'].title()}** · {str(hit['created_at'])[:16]}<br>{snippet}",
+                        unsafe_allow_html=True,
+                    )
+
+        # Older messages are fetched one page at a time, only on request
+        if st.session_state.get("chat_cursor"):
+            if st.button("⬆️ Load older messages"):
+                older, st.session_state.chat_cursor = load_chat_history_page(
+                    st.session_state.username,
+                    cursor=st.session_state.chat_cursor,
+                )
+                st.session_state.chat_history = older + st.session_state.chat_history
+                st.rerun()
 
         # Display chat history
         for message in st.session_state.chat_history:
@@ -323,25 +384,16 @@ def main_app():
                 st.markdown(user_input)
 
             with st.chat_message("assistant"):
+                streamed = False
                 if vector_db and AI_AVAILABLE:
                     try:
-                        # Use AzureOpenAI with settings handled implicitly or explicitly if needed
-                        # LangChain's AzureOpenAI usually picks up env vars if not passed,
-                        # but we can pass them from settings if we want to be explicit.
-                        # For now, relying on Env vars or what validator set up if possible,
-                        # but RetrievalQA creates a new LLM instance usually.
-                        llm = AzureOpenAI(
-                            deployment_name=settings.AZURE_OPENAI_DEPLOYMENT,
-                            api_version=settings.AZURE_OPENAI_API_VERSION,
-                            api_key=settings.AZURE_OPENAI_API_KEY,
-                            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT
-                        )
-                        qa = RetrievalQA.from_chain_type(
-                            llm=llm,
-                            chain_type="stuff",
-                            retriever=vector_db.as_retriever(),
-                        )
-                        response = qa.run(user_input)
+                        # Retrieval only; tokens are rendered as they arrive
+                        with st.spinner("📚 Consulting Knowledge Base..."):
+                            answer = stream_answer(user_input, label="app_phase2")
+                        if answer is None:
+                            raise RuntimeError("Knowledge base is offline")
+                        response = render_streaming_answer(answer)
+                        streamed = True
                     except Exception as e:
                         log_exception_safe(logger, "QA error", e)
                         response = (
@@ -354,7 +406,8 @@ def main_app():
                         "Please set up the knowledge base."
                     )
 
-                st.markdown(response)
+                if not streamed:
+                    st.markdown(response)
                 st.session_state.chat_history.append(
                     {"role": "assistant", "content": response}
                 )
@@ -415,7 +468,10 @@ def main_app():
             st.markdown("## 🔧 Admin Panel")
             admin_option = st.selectbox(
                 "Select Admin Function",
-                ["User Management", "System Status", "Database Info", "Backups"],
+                [
+                    "User Management", "System Status", "Query Performance",
+                    "Answer Cache", "Database Info", "Backups",
+                ],
             )
 
             if admin_option == "User Management":
@@ -441,6 +497,42 @@ def main_app():
                     f"**Vector DB:** "
                     f"{'Loaded' if vector_db else 'Not Available'}"
                 )
+                st.write("**Vector DB Startup:**")
+                st.json(get_vector_db_status())
+                if vector_db:
+                    st.write("**Query Embedding Cache:**")
+                    st.json(get_embedding_cache_stats())
+                if DB_AVAILABLE and settings.USE_DATABASE:
+                    st.write("**User Cache:**")
+                    st.json(get_user_cache_stats())
+                    st.write("**Session Token Cache:**")
+                    st.json(get_session_cache_stats())
+
+            elif admin_option == "Query Performance":
+                if DB_AVAILABLE and settings.USE_DATABASE:
+                    render_query_metrics()
+                else:
+                    st.info("Database not configured")
+
+            elif admin_option == "Answer Cache":
+                st.subheader("Answer Cache")
+                stats = get_answer_cache_stats()
+                if stats.get("enabled", True):
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Hit rate", f"{stats['hit_rate']:.0%}")
+                    col2.metric("Exact / semantic hits", f"{stats['exact_hits']} / {stats['semantic_hits']}")
+                    col3.metric("Cached answers (this process)", stats["size"])
+                    st.json(stats)
+                    st.caption(
+                        "Purge after updating clinical guidance that is not yet"
+                        " reindexed, or to withdraw an incorrect answer."
+                    )
+                    if st.button("🗑️ Purge cached answers"):
+                        removed = purge_answer_cache()
+                        audit_log(st.session_state.username, "answer_cache_purged", {"removed": removed})
+                        st.success(f"Purged {removed} cached answers")
+                else:
+                    st.info("Answer cache disabled (ANSWER_CACHE_ENABLED)")
 
             elif admin_option == "Database Info":
                 st.subheader("Database Information")
@@ -500,6 +592,9 @@ def main():
     if "authenticated" not in st.session_state:
         st.session_state.authenticated = False
 
+    # Open the knowledge base while the user logs in
+    start_vector_db_warmup()
+
     if not st.session_state.authenticated:
         login_page()
     else:
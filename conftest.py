@@ -0,0 +1,54 @@
+"""
+Shared pytest fixtures.
+
+``sqlite_db`` gives a test its own SQLite database with the full schema and
+migrations applied. Tests using it need the application settings
+(pydantic-settings) and are skipped where that is not installed. Every
+other test still gets a scratch SQLITE_DB_PATH, so nothing writes to (or
+switches the journal mode of) the checked-in nursing_validator.db.
+"""
+import os
+import sys
+
+import pytest
+
+# Add repository root to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def _scratch_sqlite_path(tmp_path, monkeypatch):
+    """Point SQLITE_DB_PATH at a temp file for tests that reach the db package without ``sqlite_db``."""
+    try:
+        from core.settings import settings
+    except ImportError:
+        yield
+        return
+    monkeypatch.setattr(settings, "SQLITE_DB_PATH", str(tmp_path / "scratch.db"))
+    yield
+    if "db.database" in sys.modules:
+        sys.modules["db.database"].close_connection_pool()
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """Point the db package at a fresh SQLite file; yields the db.database module."""
+    pytest.importorskip("pydantic_settings")
+    from core.settings import settings
+    from db import database, partitions
+    from db.db_migrations import _reset_caches, run_migrations
+
+    database.close_connection_pool()
+    monkeypatch.setattr(settings, "USE_DATABASE", True)
+    monkeypatch.setattr(settings, "DB_TYPE", "sqlite")
+    monkeypatch.setattr(settings, "SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    _reset_caches()
+    partitions._known_partitions.clear()
+
+    database.init_database()
+    assert run_migrations()
+    yield database
+
+    database.close_connection_pool()
+    _reset_caches()
+    partitions._known_partitions.clear()
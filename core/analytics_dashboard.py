@@ -4,7 +4,26 @@ import altair as alt
 import streamlit as st
 import json
 from datetime import datetime, timedelta
-from db.database import get_analytics_summary, get_top_users, get_audit_logs
+from db.database import (
+    get_analytics_summary, get_top_users, get_audit_logs, get_active_user_count,
+    get_pool_metrics, get_replica_metrics, get_sqlite_writer_metrics,
+)
+from db.instrumentation import get_query_metrics
+from core.metrics import get_registry
+
+# Streamlit reruns the script on every widget interaction; rollup reads are
+# cheap, but there is no need to repeat them within a few seconds.
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_summary(start_date: str, end_date: str):
+    return get_analytics_summary(start_date=start_date, end_date=end_date)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_active_users(start_date: str, end_date: str):
+    return get_active_user_count(start_date, end_date)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_top_users(limit: int):
+    return get_top_users(limit=limit)
 
 def render_dashboard():
     """Render the advanced analytics dashboard."""
@@ -21,15 +40,16 @@ def render_dashboard():
     e_str = end_date.strftime("%Y-%m-%d")
 
     # Fetch Data
-    summary_data = get_analytics_summary(start_date=s_str, end_date=e_str)
+    summary_data = _cached_summary(s_str, e_str)
     
     # KPI Cards
     total_events = sum(d['total_events'] for d in summary_data)
-    unique_users = sum(d['unique_users'] for d in summary_data) # Approximation
+    # Distinct users across the whole range (merged HyperLogLog sketches)
+    active_users = _cached_active_users(s_str, e_str)
     
     kpi1, kpi2, kpi3 = st.columns(3)
     kpi1.metric("Total Events", total_events)
-    # kpi2.metric("Active Users", unique_users) 
+    kpi2.metric("Active Users", active_users)
     
     # Tabs
     tab1, tab2, tab3 = st.tabs(["📉 Overview", "👥 User Engagement", "🛡️ Compliance & Audit"])
@@ -65,7 +85,7 @@ def render_dashboard():
 
     with tab2:
         st.subheader("Top Active Users")
-        top_users = get_top_users(limit=10)
+        top_users = _cached_top_users(10)
         if top_users:
             top_df = pd.DataFrame(top_users)
             st.table(top_df)
@@ -110,3 +130,65 @@ def render_dashboard():
             )
         else:
             st.info("No audit logs found.")
+
+def render_query_metrics():
+    """Admin panel: per-query latency, pool waits and slow-query samples."""
+    st.subheader("🗄️ Query Performance")
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        sort_by = st.selectbox("Sort by", ["sum", "p95", "p99", "max", "count"], key="query_metrics_sort")
+    with col2:
+        limit = st.number_input("Top N", min_value=5, max_value=200, value=25, step=5, key="query_metrics_limit")
+    with col3:
+        st.write("")
+        if st.button("Reset metrics", key="query_metrics_reset"):
+            get_registry().reset()
+
+    metrics = get_query_metrics(sort_by=sort_by, limit=int(limit))
+    st.caption(f"Since {datetime.fromtimestamp(metrics['since']).strftime('%Y-%m-%d %H:%M:%S')} (this process only)")
+
+    if metrics["queries"]:
+        df = pd.DataFrame(metrics["queries"])
+        for col in ("sum", "mean", "p50", "p95", "p99", "max", "fetch_sum"):
+            df[col] = (df[col] * 1000).round(2)
+        df = df.rename(columns={
+            "sum": "total_ms", "mean": "mean_ms", "p50": "p50_ms", "p95": "p95_ms",
+            "p99": "p99_ms", "max": "max_ms", "fetch_sum": "fetch_total_ms",
+        })
+        st.dataframe(
+            df[["template", "count", "total_ms", "mean_ms", "p50_ms", "p95_ms", "p99_ms",
+                "max_ms", "fetch_total_ms", "rows", "errors"]],
+            use_container_width=True,
+        )
+    else:
+        st.info("No queries recorded yet.")
+
+    st.markdown("**Connection pool**")
+    pool_wait = metrics["pool_wait"]
+    # One row per pool (postgres, postgres_replica, asyncpg, aiosqlite)
+    for backend, wait in sorted(pool_wait.items()):
+        c1, c2, c3 = st.columns(3)
+        c1.metric(f"Acquisitions ({backend})", wait["count"])
+        c2.metric("Wait p95 (ms)", round(wait["p95"] * 1000, 2))
+        c3.metric("Wait max (ms)", round(wait["max"] * 1000, 2))
+    st.json({
+        "pool": get_pool_metrics(),
+        "replicas": get_replica_metrics(),
+        "sqlite_writer": get_sqlite_writer_metrics(),
+    })
+
+    st.markdown("**Slow queries** (parameters redacted)")
+    slow = metrics["slow_queries"]
+    if slow:
+        st.dataframe(pd.DataFrame([
+            {
+                "at": datetime.fromtimestamp(s["at"]).strftime("%H:%M:%S"),
+                "ms": round(s["seconds"] * 1000, 1),
+                "template": s["template"],
+                "params": json.dumps(s["params"]),
+            }
+            for s in reversed(slow)
+        ]), use_container_width=True)
+    else:
+        st.info("No slow queries recorded.")
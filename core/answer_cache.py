@@ -0,0 +1,303 @@
+"""
+Answer cache in front of the RAG chain.
+
+Repeated clinical questions ("NEWS2 escalation thresholds") are answered
+from cache instead of a retrieval plus LLM call. A lookup tries:
+
+1. an exact match on the normalised question text, in memory and then in
+   the database. Normalising folds only case, whitespace and trailing
+   sentence punctuation: operators, signs, units and decimal points are
+   kept, so "NEWS2 >5" never matches "NEWS2 <5" and "0.5 mg" never matches
+   "5 mg";
+2. optionally, a semantic match, where the cosine similarity of the
+   question's embedding to a cached question is at least the threshold.
+   It is off unless a threshold is given: questions that differ only in a
+   dose, threshold or negation embed very close together.
+
+Entries live in a namespace that includes the knowledge-base version, so
+reindexing the guidance never serves answers from the old corpus. Memory
+holds an LRU of at most ``maxsize`` entries with a TTL. A store (see
+db.answer_cache) persists answers across restarts and processes. Store
+failures are logged, and the question is then answered without the cache.
+
+A purge removes the answers from the store, and it also increments the
+store's purge generation. Every process re-reads the generation at most
+``purge_check`` seconds apart. When it has changed, the process drops the
+answers held in its memory. A purged answer is therefore served for at most
+``purge_check`` seconds, not until its TTL runs out.
+"""
+import math
+import re
+import time
+import logging
+import threading
+import unicodedata
+from array import array
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+from core.cache import TTLCache
+from core.metrics import get_registry
+from core.safe_logging import log_exception_safe
+
+logger = logging.getLogger(__name__)
+
+LOOKUPS = "answer_cache.lookups"  # label: exact, semantic or miss
+
+_SPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.,;:]+$")
+
+
+def normalize_question(text: str) -> str:
+    """Case- and whitespace-insensitive form used for exact matches, minus trailing ``?!.,;:``."""
+    text = _SPACE.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def unit_vector(values: Sequence[float]) -> array:
+    """``values`` scaled to length 1, as float32 (the stored form)."""
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return array("f", (v / norm for v in values))
+
+
+class CachedDocument(NamedTuple):
+    """A source document as remembered by the cache (shape of a LangChain Document)."""
+
+    page_content: str
+    metadata: Dict[str, Any]
+
+
+class CachedAnswer(NamedTuple):
+    question: str
+    answer: str
+    sources: List[CachedDocument]
+    embedding: Optional[array]
+
+
+class Lookup(NamedTuple):
+    """Result of :meth:`AnswerCache.lookup`; pass ``embedding`` on to put()."""
+
+    answer: Optional[CachedAnswer]
+    kind: str  # "exact", "semantic" or "miss"
+    embedding: Optional[array]
+
+
+class AnswerCache:
+    """
+    Two-level (exact, then semantic) answer cache with optional persistence.
+
+    Args:
+        maxsize: Entries kept in memory (LRU beyond that)
+        ttl: Seconds an answer stays valid
+        threshold: Minimum cosine similarity for a semantic hit; None (the
+            default) or above 1 disables semantic matching
+        store: Persistence with load/fetch/save/purge/generation (see
+            db.answer_cache), or None
+        purge_check: Seconds between reads of the store's purge generation
+        clock: Wall-clock time source, injectable for tests
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        ttl: float = 86400.0,
+        threshold: Optional[float] = None,
+        store: Any = None,
+        purge_check: float = 2.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.ttl = ttl
+        self.threshold = threshold
+        self.store = store
+        self.purge_check = purge_check
+        self._clock = clock
+        self._generation: Optional[int] = None
+        self._checked_at = float("-inf")
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl, clock=clock)
+        self._loaded: set = set()
+        self._lock = threading.Lock()
+        self._counts = {"exact": 0, "semantic": 0, "miss": 0}
+
+    def lookup(
+        self,
+        namespace: str,
+        question: str,
+        embed: Optional[Callable[[str], Sequence[float]]] = None,
+    ) -> Lookup:
+        """
+        Find a cached answer for ``question``.
+
+        ``embed`` is only called after the exact match misses, and only
+        when semantic matching is enabled.
+        """
+        self._sync()
+        self._warm(namespace)
+        key = normalize_question(question)
+
+        hit = self._entries.get((namespace, key))
+        if hit is None:
+            hit = self._fetch(namespace, key)
+        if hit is not None:
+            return self._count(Lookup(hit, "exact", hit.embedding))
+
+        embedding = None
+        if embed is not None and self.threshold is not None and self.threshold <= 1.0:
+            embedding = unit_vector(embed(question))
+            hit = self._nearest(namespace, embedding)
+            if hit is not None:
+                return self._count(Lookup(hit, "semantic", embedding))
+        return self._count(Lookup(None, "miss", embedding))
+
+    def put(
+        self,
+        namespace: str,
+        question: str,
+        answer: str,
+        sources: Sequence[Any] = (),
+        embedding: Optional[array] = None,
+    ) -> None:
+        """Remember ``answer`` (and its source documents) for ``question``."""
+        key = normalize_question(question)
+        entry = CachedAnswer(
+            question,
+            answer,
+            [CachedDocument(getattr(d, "page_content", ""), dict(getattr(d, "metadata", None) or {}))
+             for d in sources],
+            embedding,
+        )
+        self._entries.set((namespace, key), entry)
+        if self.store is not None:
+            try:
+                self.store.save(namespace, key, entry)
+            except Exception as e:
+                log_exception_safe(logger, "Failed to persist cached answer", e, level="warning")
+
+    def purge(self, namespace: Optional[str] = None) -> int:
+        """Drop cached answers (all, or one namespace); returns how many were removed."""
+        if namespace is None:
+            dropped = len(self._entries)
+            self._entries.clear()
+        else:
+            dropped = self._entries.discard_where(lambda k, _v: k[0] == namespace)
+        with self._lock:
+            self._loaded = set() if namespace is None else self._loaded - {namespace}
+        if self.store is not None:
+            try:
+                dropped = self.store.purge(namespace)  # includes other processes' answers
+                self._generation = self.store.generation()  # our own purge, nothing to drop
+            except Exception as e:
+                log_exception_safe(logger, "Failed to purge persisted answers", e, level="warning")
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and exact/semantic hit rates since start."""
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = sum(counts.values())
+        hits = counts["exact"] + counts["semantic"]
+        return {
+            "size": len(self._entries),
+            "lookups": lookups,
+            "exact_hits": counts["exact"],
+            "semantic_hits": counts["semantic"],
+            "misses": counts["miss"],
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "ttl_s": self.ttl,
+            "threshold": self.threshold,
+        }
+
+    # ------------------------------------------------------------------
+
+    def _count(self, result: Lookup) -> Lookup:
+        with self._lock:
+            self._counts[result.kind] += 1
+        get_registry().increment(LOOKUPS, result.kind)
+        return result
+
+    def _sync(self) -> None:
+        """Drop memory if the store was purged since the last check (by any process)."""
+        if self.store is None:
+            return
+        now = self._clock()
+        with self._lock:
+            if now - self._checked_at < self.purge_check:
+                return
+            self._checked_at = now
+        try:
+            generation = self.store.generation()
+        except Exception as e:
+            log_exception_safe(logger, "Failed to read answer cache generation", e, level="warning")
+            return
+        if self._generation is not None and generation != self._generation:
+            self._entries.clear()
+            with self._lock:
+                self._loaded = set()
+            logger.info("Answer cache purged elsewhere; dropped answers held in memory")
+        self._generation = generation
+
+    def _remaining_ttl(self, created_at: float) -> float:
+        return self.ttl - (self._clock() - created_at)
+
+    def _remember(self, namespace: str, row: Dict[str, Any]) -> Optional[CachedAnswer]:
+        remaining = self._remaining_ttl(row["created_at"])
+        if remaining <= 0:
+            return None
+        entry = CachedAnswer(row["question"], row["answer"], row["sources"], row["embedding"])
+        self._entries.set((namespace, row["key"]), entry, ttl=remaining)
+        return entry
+
+    def _warm(self, namespace: str) -> None:
+        """Load a namespace's most recent persisted answers once per process."""
+        if self.store is None or namespace in self._loaded:
+            return
+        with self._lock:
+            if namespace in self._loaded:
+                return
+            self._loaded.add(namespace)
+        try:
+            rows = self.store.load(namespace, self._clock() - self.ttl, self._entries.maxsize)
+        except Exception as e:
+            log_exception_safe(logger, "Failed to load cached answers", e, level="warning")
+            return
+        for row in reversed(rows):  # newest last, so they are most recently used
+            self._remember(namespace, row)
+
+    def _fetch(self, namespace: str, key: str) -> Optional[CachedAnswer]:
+        """Exact match written by another process since this one warmed up."""
+        if self.store is None:
+            return None
+        try:
+            row = self.store.fetch(namespace, key, self._clock() - self.ttl)
+        except Exception as e:
+            log_exception_safe(logger, "Failed to read cached answer", e, level="warning")
+            return None
+        return self._remember(namespace, row) if row else None
+
+    def _nearest(self, namespace: str, embedding: array) -> Optional[CachedAnswer]:
+        candidates = [
+            (key, entry) for (ns, key), entry in self._entries.items()
+            if ns == namespace and entry.embedding is not None and len(entry.embedding) == len(embedding)
+        ]
+        if not candidates:
+            return None
+        if NUMPY_AVAILABLE:
+            matrix = np.frombuffer(b"".join(e.embedding.tobytes() for _, e in candidates), dtype=np.float32)
+            scores = matrix.reshape(len(candidates), -1) @ np.frombuffer(embedding.tobytes(), dtype=np.float32)
+            best = int(scores.argmax())
+            score = float(scores[best])
+        else:
+            score, best = max(
+                (sum(a * b for a, b in zip(entry.embedding, embedding)), i)
+                for i, (_, entry) in enumerate(candidates)
+            )
+        if score < self.threshold:
+            return None
+        key, entry = candidates[best]
+        # Refresh its LRU position like an exact hit would
+        return self._entries.get((namespace, key)) or entry
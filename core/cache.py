@@ -0,0 +1,127 @@
+"""
+In-process caching utilities.
+
+Provides a small thread-safe LRU cache with per-entry TTL and hit/miss/
+eviction counters, used to keep hot lookups (e.g. user identity) off the
+database on every request.
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    Args:
+        maxsize: Maximum number of entries; the least recently used entry is
+            evicted when a new key would exceed it
+        ttl: Seconds an entry stays valid after it was set (0 disables expiry)
+        clock: Monotonic time source, injectable for tests
+
+    Example:
+        >>> cache = TTLCache(maxsize=2, ttl=60)
+        >>> cache.set("nurse", {"id": 2})
+        >>> cache.get("nurse")
+        {'id': 2}
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value for ``key`` (refreshing its LRU position) or ``default``."""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self._misses += 1
+                return default
+            expires_at, value = item
+            if self.ttl and self._clock() >= expires_at:
+                del self._data[key]
+                self._expirations += 1
+                self._misses += 1
+                return default
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store ``value`` under ``key`` (for ``ttl`` seconds if given), evicting the LRU entry if full."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def pop(self, key: Hashable) -> bool:
+        """Invalidate ``key``; returns True if it was cached."""
+        with self._lock:
+            if self._data.pop(key, _MISSING) is _MISSING:
+                return False
+            self._invalidations += 1
+            return True
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Invalidate every entry for which ``predicate(key, value)`` is true."""
+        with self._lock:
+            doomed = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for key in doomed:
+                del self._data[key]
+            self._invalidations += len(doomed)
+            return len(doomed)
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of unexpired entries, least recently used first (no LRU or counter updates)."""
+        with self._lock:
+            now = self._clock()
+            return [(k, v) for k, (expires_at, v) in self._data.items() if not self.ttl or now < expires_at]
+
+    def clear(self) -> None:
+        """Drop all entries (counters are kept)."""
+        with self._lock:
+            self._invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss/eviction counters."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,353 @@
+"""
+Append-only JSONL chat-history store.
+
+File fallback used when the database is unavailable. Each user gets their own
+shard (``<hash>.jsonl``) plus an offset index (``<hash>.idx``, one 8-byte
+offset per message), so saving a message is a single append and loading the
+last N messages reads only the tail of the shard. Writers are serialised per
+shard with an OS file lock, so multiple threads and processes can share the
+directory. A compaction pass trims shards over a retention limit, dropping
+torn lines and rebuilding the index; once a shard has been trimmed its index
+starts with a header record counting the messages dropped, so page positions
+keep numbering messages from the first one ever saved.
+"""
+import os
+import json
+import time
+import struct
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from core.safe_logging import log_exception_safe, mask_identifier
+
+logger = logging.getLogger(__name__)
+
+_OFFSET = struct.Struct("<Q")
+# Marks the optional first index record holding the trimmed-message count;
+# a real first offset is always 0
+_BASE_FLAG = 1 << 63
+
+
+def _index_layout(idx) -> Tuple[int, int, int]:
+    """(header bytes, messages trimmed before the first indexed one, indexed messages)."""
+    size = idx.seek(0, os.SEEK_END)
+    if size >= _OFFSET.size:
+        idx.seek(0)
+        first = _OFFSET.unpack(idx.read(_OFFSET.size))[0]
+        if first & _BASE_FLAG:
+            return _OFFSET.size, first & ~_BASE_FLAG, size // _OFFSET.size - 1
+    return 0, 0, size // _OFFSET.size
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive OS-level lock on ``path`` (created if missing)."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        yield
+    finally:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+class ChatHistoryStore:
+    """
+    Per-user sharded, append-only chat history on the local filesystem.
+
+    Args:
+        base_dir: Directory holding the shards (created if missing)
+        max_messages: Messages kept per user by :meth:`compact` (0 keeps all)
+    """
+
+    def __init__(self, base_dir: str, max_messages: int = 0):
+        self.base_dir = base_dir
+        self.max_messages = max_messages
+        os.makedirs(base_dir, exist_ok=True)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Paths and locking
+    # ------------------------------------------------------------------
+
+    def _shard(self, username: str) -> str:
+        digest = hashlib.sha256(username.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.base_dir, digest)
+
+    @contextmanager
+    def _locked(self, shard: str) -> Iterator[None]:
+        # flock alone is per open file description; the thread lock also
+        # covers platforms where in-process exclusion is not guaranteed.
+        with self._locks_guard:
+            lock = self._locks.setdefault(shard, threading.Lock())
+        with lock, _file_lock(shard + ".lock"):
+            yield
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def append(self, username: str, role: str, content: str) -> None:
+        """Append one message to the user's shard."""
+        self.append_many(username, [{"role": role, "content": content}])
+
+    def append_many(self, username: str, messages: Iterable[Dict[str, Any]]) -> int:
+        """Append several messages under a single lock acquisition."""
+        now = datetime.now(timezone.utc).isoformat()
+        lines = [
+            (json.dumps(
+                {"role": m["role"], "content": m["content"], "created_at": m.get("created_at", now)},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ) + "\n").encode("utf-8")
+            for m in messages
+        ]
+        if not lines:
+            return 0
+
+        shard = self._shard(username)
+        with self._locked(shard):
+            with open(shard + ".jsonl", "a+b") as data:
+                offset = data.seek(0, os.SEEK_END)
+                if offset:
+                    data.seek(offset - 1)
+                    if data.read(1) != b"\n":
+                        # Terminate a torn line so it cannot swallow this append
+                        data.write(b"\n")
+                        offset += 1
+                offsets = []
+                for line in lines:
+                    offsets.append(offset)
+                    offset += len(line)
+                data.write(b"".join(lines))
+                data.flush()
+            # Written after the data: a crash in between leaves an index that
+            # is merely short, which reads tolerate and compaction repairs.
+            with open(shard + ".idx", "ab") as idx:
+                idx.write(b"".join(_OFFSET.pack(o) for o in offsets))
+        return len(lines)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def tail(self, username: str, limit: Optional[int] = 100) -> List[Dict[str, Any]]:
+        """Return the last ``limit`` messages in chronological order (all if None)."""
+        shard = self._shard(username)
+        if not os.path.exists(shard + ".jsonl"):
+            return []
+
+        start = 0
+        # Locked so a concurrent compaction cannot swap the files between
+        # reading the index and seeking in the data file.
+        with self._locked(shard):
+            if limit is not None:
+                try:
+                    with open(shard + ".idx", "rb") as idx:
+                        header, _base, count = _index_layout(idx)
+                        if count > limit:
+                            idx.seek(header + (count - limit) * _OFFSET.size)
+                            start = _OFFSET.unpack(idx.read(_OFFSET.size))[0]
+                except FileNotFoundError:
+                    pass
+
+            with open(shard + ".jsonl", "rb") as data:
+                data.seek(start)
+                messages = list(self._parse(data))
+        return messages[-limit:] if limit is not None else messages
+
+    def page(
+        self, username: str, limit: int = 50, before: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Return up to ``limit`` indexed messages preceding position ``before``.
+
+        Positions number messages from the first one ever saved to the shard
+        and are not changed by compaction, so a position stays valid across
+        one; messages trimmed since are simply not returned. None means the
+        newest page. Returns (messages in chronological order, position to
+        pass as ``before`` for the next older page, or None at the start).
+        """
+        shard = self._shard(username)
+        with self._locked(shard):
+            try:
+                with open(shard + ".idx", "rb") as idx:
+                    header, base, count = _index_layout(idx)
+                    end = count if before is None else min(before - base, count)
+                    start = max(end - limit, 0)
+                    if start >= end:
+                        return [], None
+                    idx.seek(header + start * _OFFSET.size)
+                    offsets = idx.read((end - start + 1) * _OFFSET.size)
+            except FileNotFoundError:
+                return [], None
+
+            first = _OFFSET.unpack_from(offsets, 0)[0]
+            with open(shard + ".jsonl", "rb") as data:
+                data.seek(first)
+                if end < count:
+                    stop = _OFFSET.unpack_from(offsets, (end - start) * _OFFSET.size)[0]
+                    chunk = data.read(stop - first).splitlines()
+                else:
+                    chunk = data.readlines()
+        return list(self._parse(chunk)), (base + start if start else None)
+
+    @staticmethod
+    def _parse(lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+        for line in lines:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # Torn write; dropped at next compaction
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+
+    def _needs_compaction(self, shard: str) -> bool:
+        """True if the shard is over ``max_messages`` or its index does not end at the end of the data."""
+        try:
+            with open(shard + ".idx", "rb") as idx, open(shard + ".jsonl", "rb") as data:
+                header, _base, count = _index_layout(idx)
+                size = data.seek(0, os.SEEK_END)
+                if self.max_messages and count > self.max_messages:
+                    return True
+                if not count:
+                    return size > 0
+                idx.seek(header + (count - 1) * _OFFSET.size)
+                last = _OFFSET.unpack(idx.read(_OFFSET.size))[0]
+                data.seek(last)
+                line = data.readline()
+                return not line.endswith(b"\n") or last + len(line) != size
+        except FileNotFoundError:
+            return True
+
+    def compact_shard(self, shard: str) -> Optional[int]:
+        """
+        Rewrite one shard keeping the newest ``max_messages``; returns messages kept.
+
+        Returns None without rewriting when the shard is within the limit and
+        fully indexed (torn lines in the middle wait for the next trim).
+        """
+        with self._locked(shard):
+            if not os.path.exists(shard + ".jsonl"):
+                return 0
+            if not self._needs_compaction(shard):
+                return None
+            with open(shard + ".jsonl", "rb") as data:
+                messages = list(self._parse(data))
+            try:
+                with open(shard + ".idx", "rb") as idx:
+                    base = _index_layout(idx)[1]
+            except FileNotFoundError:
+                base = 0
+            if self.max_messages and len(messages) > self.max_messages:
+                base += len(messages) - self.max_messages
+                messages = messages[-self.max_messages:]
+
+            offsets = []
+            offset = 0
+            tmp_data, tmp_idx = shard + ".jsonl.tmp", shard + ".idx.tmp"
+            with open(tmp_data, "wb") as data:
+                for message in messages:
+                    line = (json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+                    offsets.append(offset)
+                    offset += len(line)
+                    data.write(line)
+                data.flush()
+                os.fsync(data.fileno())
+            with open(tmp_idx, "wb") as idx:
+                if base:
+                    idx.write(_OFFSET.pack(base | _BASE_FLAG))
+                idx.write(b"".join(_OFFSET.pack(o) for o in offsets))
+            os.replace(tmp_data, shard + ".jsonl")
+            os.replace(tmp_idx, shard + ".idx")
+            return len(messages)
+
+    def compact(self, modified_since: float = 0.0) -> int:
+        """Compact shards modified after ``modified_since`` (epoch seconds); returns how many were rewritten."""
+        compacted = 0
+        for name in os.listdir(self.base_dir):
+            if not name.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.base_dir, name)
+            try:
+                if os.path.getmtime(path) <= modified_since:
+                    continue
+                if self.compact_shard(path[: -len(".jsonl")]) is not None:
+                    compacted += 1
+            except Exception as e:
+                log_exception_safe(logger, "Chat history compaction failed", e, level="warning")
+        return compacted
+
+    def start_compaction_job(self, interval: float = 3600.0) -> None:
+        """Compact recently modified shards every ``interval`` seconds in the background."""
+        if self._compactor is not None:
+            return
+
+        def run():
+            last_run = 0.0
+            while not self._stop.wait(interval):
+                started = time.time()
+                count = self.compact(modified_since=last_run)
+                last_run = started
+                if count:
+                    logger.info(f"Compacted {count} chat history shard(s)")
+
+        self._compactor = threading.Thread(target=run, name="chat-history-compactor", daemon=True)
+        self._compactor.start()
+
+    def stop_compaction_job(self) -> None:
+        """Stop the background compaction thread."""
+        self._stop.set()
+
+    # ------------------------------------------------------------------
+    # Migration
+    # ------------------------------------------------------------------
+
+    def migrate_legacy_json(self, legacy_path: str) -> int:
+        """
+        One-shot import of the old ``{username: [messages]}`` JSON file.
+
+        The legacy file is renamed to ``<legacy_path>.migrated`` afterwards so
+        the import never runs twice. Returns the number of messages imported.
+        """
+        if not os.path.exists(legacy_path):
+            return 0
+        with _file_lock(os.path.join(self.base_dir, ".migrate.lock")):
+            if not os.path.exists(legacy_path):
+                return 0  # Another process migrated it while we waited
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                history_data = json.load(f)
+
+            imported = 0
+            for username, messages in history_data.items():
+                imported += self.append_many(username, messages)
+                logger.info(
+                    f"Migrated {len(messages)} chat message(s) for {mask_identifier(username, 'user')}"
+                )
+            os.replace(legacy_path, legacy_path + ".migrated")
+            logger.info(f"Legacy chat history migrated ({imported} messages)")
+            return imported
@@ -0,0 +1,362 @@
+"""
+Query-embedding cache.
+
+Every retrieval embeds the question with a network call, even when the same
+question was asked a minute ago. :class:`CachedEmbeddings` wraps a LangChain
+embeddings object (``embed_query`` / ``embed_documents``) and:
+
+* keys vectors by a SHA-256 of the model name and the exact text;
+* checks an in-memory LRU first, then an optional :class:`VectorFile` on
+  disk that survives restarts and is shared by every process on the host;
+* coalesces concurrent requests for the same text into one call;
+* batches misses that arrive within ``batch_window`` seconds of each other
+  into a single ``embed_documents`` call.
+
+Disk errors are logged and the wrapper carries on with the memory cache.
+"""
+import os
+import mmap
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from array import array
+from concurrent.futures import Future, wait
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.cache import TTLCache
+from core.chat_store import _file_lock
+from core.metrics import get_registry
+from core.safe_logging import log_exception_safe
+
+logger = logging.getLogger(__name__)
+
+LOOKUPS = "embedding_cache.lookups"  # label: memory, disk, coalesced or miss
+CALL_SECONDS = "embedding.call.seconds"  # label: query (micro-batched) or documents
+CALL_TEXTS = "embedding.call.texts"  # texts sent per label; divide by call count for batch size
+
+_KEY_BYTES = 32  # SHA-256 digest
+_FLOAT_BYTES = array("f").itemsize
+
+
+def content_key(model: str, text: str) -> bytes:
+    """Cache key of ``text`` embedded by ``model``."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+
+class VectorFile:
+    """
+    Append-only on-disk map from content key to float32 vector.
+
+    ``keys`` holds fixed-width 32-byte keys and ``vectors.f32`` the vectors
+    in the same row order, read through a memory map so a hit costs a page
+    lookup rather than a file read. Vectors are written before their keys,
+    so a row is only visible once complete; appends take an OS file lock,
+    so processes can share the directory and pick up each other's rows.
+
+    Args:
+        directory: Where the files live (created if missing); use one per model
+        max_rows: Stop persisting new vectors beyond this many rows (0 = no limit)
+    """
+
+    def __init__(self, directory: str, max_rows: int = 0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_rows = max_rows
+        self._keys_path = os.path.join(directory, "keys")
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._index: Dict[bytes, int] = {}
+        self._rows = 0
+        self._dim: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._mutex = threading.Lock()
+        with self._mutex:
+            self._refresh()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._dim
+
+    def get(self, key: bytes) -> Optional[array]:
+        """The vector stored under ``key``, or None (re-scans rows appended by other processes)."""
+        with self._mutex:
+            row = self._index.get(key)
+            if row is None:
+                self._refresh()
+                row = self._index.get(key)
+                if row is None:
+                    return None
+            return self._read(row)
+
+    def put(self, items: Iterable[Tuple[bytes, Sequence[float]]]) -> int:
+        """Append vectors whose keys are not stored yet; returns how many were written."""
+        with self._mutex, _file_lock(self._lock_path):
+            self._refresh()
+            pending: Dict[bytes, Sequence[float]] = {}
+            for key, vector in items:
+                if key not in self._index and key not in pending:
+                    pending[key] = vector
+            if not pending:
+                return 0
+            if self._dim is None:
+                self._dim = len(next(iter(pending.values())))
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self._dim}, f)
+            rows = [(k, v) for k, v in pending.items() if len(v) == self._dim]
+            if self.max_rows:
+                rows = rows[:max(0, self.max_rows - self._rows)]
+            if not rows:
+                return 0
+
+            # Drop a torn tail left by a writer that died mid-append
+            row_bytes = self._dim * _FLOAT_BYTES
+            for path, size in ((self._vectors_path, self._rows * row_bytes),
+                               (self._keys_path, self._rows * _KEY_BYTES)):
+                with open(path, "ab") as f:
+                    if f.tell() > size:
+                        f.truncate(size)
+
+            with open(self._vectors_path, "ab") as f:
+                f.write(b"".join(array("f", v).tobytes() for _, v in rows))
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(k for k, _ in rows))
+            for key, _ in rows:
+                self._index[key] = self._rows
+                self._rows += 1
+            return len(rows)
+
+    def close(self) -> None:
+        with self._mutex:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    # ------------------------------------------------------------------
+
+    def _refresh(self) -> None:
+        """Index complete rows appended since the last scan."""
+        if self._dim is None:
+            try:
+                with open(self._meta_path, encoding="utf-8") as f:
+                    self._dim = int(json.load(f)["dim"])
+            except FileNotFoundError:
+                return
+        try:
+            key_rows = os.path.getsize(self._keys_path) // _KEY_BYTES
+            vector_rows = os.path.getsize(self._vectors_path) // (self._dim * _FLOAT_BYTES)
+        except FileNotFoundError:
+            return
+        rows = min(key_rows, vector_rows)
+        if rows <= self._rows:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._rows * _KEY_BYTES)
+            data = f.read((rows - self._rows) * _KEY_BYTES)
+        for i in range(len(data) // _KEY_BYTES):
+            self._index.setdefault(data[i * _KEY_BYTES:(i + 1) * _KEY_BYTES], self._rows + i)
+        self._rows += len(data) // _KEY_BYTES
+
+    def _read(self, row: int) -> array:
+        row_bytes = self._dim * _FLOAT_BYTES
+        end = (row + 1) * row_bytes
+        if self._map is None or len(self._map) < end:
+            # The file grew since it was mapped
+            if self._map is not None:
+                self._map.close()
+            with open(self._vectors_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        vector = array("f")
+        vector.frombytes(self._map[end - row_bytes:end])
+        return vector
+
+
+class CachedEmbeddings:
+    """
+    Caching, coalescing and micro-batching wrapper for a LangChain embeddings object.
+
+    Args:
+        embeddings: Object with ``embed_documents(texts)`` (and ``embed_query``)
+        model: Model name, part of every cache key
+        maxsize: Vectors kept in memory (LRU beyond that)
+        store: :class:`VectorFile` for persistence, or None for memory only
+        batch_window: Seconds the first miss waits for others to join its batch (0 = no wait)
+        max_batch: Texts per call; a full batch is sent at once
+
+    Example:
+        >>> embeddings = CachedEmbeddings(AzureOpenAIEmbeddings(...), model="ada-002")
+        >>> Chroma(persist_directory=path, embedding_function=embeddings)
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        model: str = "",
+        maxsize: int = 10000,
+        store: Optional[VectorFile] = None,
+        batch_window: float = 0.005,
+        max_batch: int = 16,
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.store = store
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self._memory = TTLCache(maxsize=maxsize, ttl=0)
+        self._lock = threading.Lock()
+        self._inflight: Dict[bytes, Future] = {}
+        self._batch: List[Tuple[bytes, str, Future]] = []
+        self._counts = {"memory": 0, "disk": 0, "coalesced": 0, "miss": 0}
+        self._calls = 0
+
+    def embed_query(self, text: str) -> List[float]:
+        key = content_key(self.model, text)
+        vector = self._cached(key)
+        if vector is None:
+            vector = self._embed_miss(key, text)
+        return list(vector)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed many texts (e.g. at ingest): cached ones are reused, the rest go in one call."""
+        keys = [content_key(self.model, t) for t in texts]
+        found: Dict[bytes, Sequence[float]] = {}
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            vector = self._cached(key)
+            if vector is None:
+                missing[key] = text
+                self._count("miss")
+            else:
+                found[key] = vector
+        if missing:
+            vectors = self._call("documents", list(missing.values()))
+            found.update(self._remember(list(zip(missing, vectors))))
+        return [list(found[key]) for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_query, text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_documents, texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookup counts by outcome, embedding calls made and vectors held."""
+        with self._lock:
+            counts = dict(self._counts)
+            calls = self._calls
+        lookups = sum(counts.values())
+        return {
+            "lookups": lookups,
+            **counts,
+            "hit_rate": round((lookups - counts["miss"]) / lookups, 4) if lookups else 0.0,
+            "calls": calls,
+            "memory_size": len(self._memory),
+            "disk_rows": len(self.store) if self.store is not None else None,
+        }
+
+    # ------------------------------------------------------------------
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self._counts[kind] += 1
+        get_registry().increment(LOOKUPS, kind)
+
+    def _cached(self, key: bytes) -> Optional[Sequence[float]]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._count("memory")
+            return vector
+        if self.store is None:
+            return None
+        try:
+            vector = self.store.get(key)
+        except Exception as e:
+            log_exception_safe(logger, "Embedding cache read failed", e, level="warning")
+            return None
+        if vector is None:
+            return None
+        vector = vector.tolist()
+        self._memory.set(key, vector)
+        self._count("disk")
+        return vector
+
+    def _embed_miss(self, key: bytes, text: str) -> Sequence[float]:
+        """Join (or start) the batch for ``text`` and wait for its vector."""
+        lead = run = None
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                kind = "miss"
+                future = Future()
+                self._inflight[key] = future
+                batch = self._batch
+                batch.append((key, text, future))
+                if len(batch) >= self.max_batch:
+                    self._batch, run = [], batch
+                elif len(batch) == 1:
+                    lead = batch
+            else:
+                kind = "coalesced"
+        self._count(kind)
+
+        if lead is not None:
+            # First miss of a batch: give others the window to join, then send
+            # it unless whoever filled it up has already sent it
+            if self.batch_window > 0:
+                wait([future], timeout=self.batch_window)
+            with self._lock:
+                if self._batch is lead:
+                    self._batch, run = [], lead
+        if run is not None:
+            self._run(run)
+        return future.result()
+
+    def _run(self, batch: List[Tuple[bytes, str, Future]]) -> None:
+        try:
+            vectors = self._call("query", [text for _, text, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+        else:
+            pairs = [(key, vector) for (key, _, _), vector in zip(batch, vectors)]
+            for key, vector in pairs:
+                self._memory.set(key, vector)
+            for (_, _, future), (_, vector) in zip(batch, pairs):
+                future.set_result(vector)
+            self._persist(pairs)
+        finally:
+            with self._lock:
+                for key, _, _ in batch:
+                    self._inflight.pop(key, None)
+
+    def _call(self, label: str, texts: List[str]) -> List[List[float]]:
+        started = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        registry = get_registry()
+        registry.observe(CALL_SECONDS, label, time.perf_counter() - started)
+        registry.increment(CALL_TEXTS, label, len(texts))
+        with self._lock:
+            self._calls += 1
+        return vectors
+
+    def _remember(self, pairs: List[Tuple[bytes, Sequence[float]]]) -> Dict[bytes, Sequence[float]]:
+        for key, vector in pairs:
+            self._memory.set(key, vector)
+        self._persist(pairs)
+        return dict(pairs)
+
+    def _persist(self, pairs: List[Tuple[bytes, Sequence[float]]]) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.put(pairs)
+        except Exception as e:
+            log_exception_safe(logger, "Embedding cache write failed", e, level="warning")
@@ -0,0 +1,141 @@
+"""
+In-process metrics registry.
+
+Lightweight counters and fixed-bucket latency histograms keyed by a metric
+name and a label (for example a normalised SQL template). Everything lives in
+process memory; the admin panel reads :func:`get_registry().snapshot()`.
+Recording is a dict lookup plus a bisect under a lock, cheap enough for
+every database call.
+"""
+import bisect
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Sequence, Tuple
+
+# Upper bounds in seconds; the last bucket is open-ended
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with count, sum, max and bucket-interpolated percentiles.
+
+    Args:
+        buckets: Ascending bucket upper bounds
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p: float) -> float:
+        """Estimate the ``p`` quantile (0-1) by linear interpolation inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = p * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(low + (high - low) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of labelled counters, histograms and sample logs.
+
+    Example:
+        >>> reg = MetricsRegistry()
+        >>> reg.observe("db.query.seconds", "SELECT 1", 0.002)
+        >>> reg.increment("db.query.rows", "SELECT 1", 1)
+        >>> reg.snapshot()["histograms"]["db.query.seconds"]["SELECT 1"]["count"]
+        1
+    """
+
+    def __init__(self, sample_size: int = 100):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[str, Histogram]] = {}
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._samples: Dict[str, Deque[Dict[str, Any]]] = {}
+        self.sample_size = sample_size
+        self.started_at = time.time()
+
+    def observe(self, name: str, label: str, value: float) -> None:
+        """Record ``value`` in the histogram ``name`` for ``label``."""
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(label)
+            if hist is None:
+                hist = series[label] = Histogram()
+            hist.observe(value)
+
+    def increment(self, name: str, label: str = "", amount: float = 1) -> None:
+        """Add ``amount`` to the counter ``name`` for ``label``."""
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[label] = series.get(label, 0) + amount
+
+    def sample(self, name: str, record: Dict[str, Any]) -> None:
+        """Keep ``record`` in the bounded most-recent sample log ``name``."""
+        with self._lock:
+            log = self._samples.get(name)
+            if log is None:
+                log = self._samples[name] = deque(maxlen=self.sample_size)
+            log.append(dict(record, at=time.time()))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Point-in-time copy of every metric (histograms summarised)."""
+        with self._lock:
+            return {
+                "since": self.started_at,
+                "histograms": {
+                    name: {label: h.snapshot() for label, h in series.items()}
+                    for name, series in self._histograms.items()
+                },
+                "counters": {name: dict(series) for name, series in self._counters.items()},
+                "samples": {name: list(log) for name, log in self._samples.items()},
+            }
+
+    def reset(self) -> None:
+        """Drop all recorded metrics."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._samples.clear()
+            self.started_at = time.time()
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """The process-wide metrics registry."""
+    return _registry
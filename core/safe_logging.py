@@ -154,3 +154,32 @@ def safe_log_warning(
     
     logger.warning(message.format(**masked_values))
 
+
+
+def redact_params(params) -> object:
+    """
+    Replace query parameter values with their type names for safe logging.
+
+    The shape (tuple/list/dict and its length or keys) is kept so slow-query
+    samples remain useful for diagnosis, but no value is ever exposed.
+
+    Example:
+        >>> redact_params(("alice", 42, None))
+        ('<str>', '<int>', None)
+        >>> redact_params({"user_id": 7})
+        {'user_id': '<int>'}
+    """
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact_params(value) if isinstance(value, (list, tuple, dict)) else _redact_value(value)
+                for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return type(params)(
+            redact_params(v) if isinstance(v, (list, tuple, dict)) else _redact_value(v) for v in params
+        )
+    return _redact_value(params)
+
+
+def _redact_value(value) -> object:
+    return None if value is None else f"<{type(value).__name__}>"
@@ -32,6 +32,12 @@ class Settings(BaseSettings):
     USE_DATABASE: bool = Field(default=True)
     DB_TYPE: str = Field(default="sqlite")  # postgres or sqlite
     SQLITE_DB_PATH: str = Field(default="nursing_validator.db")
+    SQLITE_JOURNAL_MODE: str = Field(default="WAL")  # WAL lets reads run alongside the writer
+    SQLITE_SYNCHRONOUS: str = Field(default="NORMAL")  # NORMAL is crash-safe under WAL
+    SQLITE_BUSY_TIMEOUT: int = Field(default=5000)  # milliseconds to wait for a lock
+    SQLITE_CACHE_SIZE_KB: int = Field(default=65536)  # page cache per connection
+    SQLITE_MMAP_SIZE: int = Field(default=268435456)  # bytes of the file memory-mapped for reads
+    SQLITE_WRITER_THREAD: bool = Field(default=True)  # serialise writes through one thread
     
     # Postgres Settings
     DB_HOST: str = Field(default="localhost")
@@ -41,17 +47,109 @@ class Settings(BaseSettings):
     DB_PASSWORD: str = Field(default="nursing_password")
     DB_POOL_MIN: int = Field(default=2)
     DB_POOL_MAX: int = Field(default=20)
+    DB_POOL_TIMEOUT: float = Field(default=10.0)  # seconds to wait for a free connection
+    DB_POOL_MAX_LIFETIME: float = Field(default=1800.0)  # recycle connections after N seconds
+    DB_POOL_HEALTHCHECK_INTERVAL: float = Field(default=30.0)  # probe connections idle longer than N seconds
+    DB_READ_REPLICAS: str = Field(default="")  # comma-separated host[:port] of streaming replicas for dashboard/analytics reads
+    DB_REPLICA_MAX_LAG: float = Field(default=30.0)  # seconds; replicas further behind are skipped
+    DB_REPLICA_CHECK_INTERVAL: float = Field(default=5.0)  # seconds between lag probes (and retry delay after a failure)
+    DB_REPLICA_POOL_MAX: int = Field(default=10)  # connections per replica
+    DB_REPLICA_ACQUIRE_TIMEOUT: float = Field(default=2.0)  # seconds to wait for a replica connection before using the primary
+    DB_INSTRUMENTATION: bool = Field(default=True)  # per-query timing in core.metrics
+    DB_SLOW_QUERY_MS: float = Field(default=250.0)  # sample and log queries slower than this
+
+    # File fallback for chat history (used when the database is unavailable)
+    CHAT_HISTORY_DIR: str = Field(default=".chat_history")
+    CHAT_HISTORY_MAX_MESSAGES: int = Field(default=5000)  # per user, enforced by compaction; 0 keeps all
+    CHAT_HISTORY_COMPACT_INTERVAL: float = Field(default=3600.0)  # seconds; 0 disables the job
+    CHAT_PAGE_SIZE: int = Field(default=20)  # messages loaded per "load older" step
+
+    # User identity cache (per process)
+    USER_CACHE_SIZE: int = Field(default=1024)
+    USER_CACHE_TTL: float = Field(default=60.0)  # seconds
+
+    # Login sessions (db.sessions)
+    SESSION_TTL: float = Field(default=28800.0)  # seconds; 8-hour shift
+    SESSION_CACHE_SIZE: int = Field(default=4096)
+    SESSION_CACHE_TTL: float = Field(default=30.0)  # seconds a validated token is trusted without a DB read
+    SESSION_SWEEP_INTERVAL: float = Field(default=60.0)  # seconds; 0 disables the sweeper
+    SESSION_SWEEP_BATCH: int = Field(default=1000)
+
+    # Audit/analytics write-behind queue
+    EVENT_WRITE_BEHIND: bool = Field(default=True)
+    EVENT_QUEUE_MAX: int = Field(default=10000)
+    EVENT_BATCH_SIZE: int = Field(default=500)
+    EVENT_FLUSH_INTERVAL: float = Field(default=1.0)  # seconds
+    EVENT_ENQUEUE_TIMEOUT: float = Field(default=0.25)  # seconds to block on a full queue
+    EVENT_SPILL_DIR: str = Field(default=".event_spill")  # batches that failed every retry, replayed later; empty discards them
+
+    # Bulk data access (bulk_save_chat_messages, bulk_log_*_events)
+    BULK_CHUNK_ROWS: int = Field(default=10000)  # rows per transaction
+    BULK_COPY_MIN_ROWS: int = Field(default=1000)  # Postgres batches this large use COPY instead of execute_values
+
+    # Async data access (db.async_database); Postgres uses DB_POOL_MIN/DB_POOL_MAX
+    ASYNC_SQLITE_CONNECTIONS: int = Field(default=4)  # aiosqlite connections (each owns a thread)
+
+    # Analytics rollups
+    ROLLUP_REFRESH_INTERVAL: float = Field(default=60.0)  # seconds; 0 disables the background job
+    ROLLUP_BATCH_SIZE: int = Field(default=50000)  # events per refresh transaction
+
+    # Time partitioning of audit_logs / analytics_events (db.partitions)
+    DB_PARTITIONING: bool = Field(default=False)  # new databases only; use convert_to_partitioned for existing ones
+    PARTITION_MONTHS_AHEAD: int = Field(default=3)
+    PARTITION_MAINTENANCE_INTERVAL: int = Field(default=21600)  # seconds
+    AUDIT_RETENTION_MONTHS: int = Field(default=0)  # 0 keeps everything
+    ANALYTICS_RETENTION_MONTHS: int = Field(default=0)
+    PARTITION_ARCHIVE_DIR: str = Field(default="./archive")  # empty string drops without archiving
+
+    # Audit-log export from the analytics dashboard (db.export)
+    EXPORT_DOWNLOAD_MAX_MB: int = Field(default=100)  # larger exports are saved under EXPORT_DIR, not offered as a download
+    EXPORT_DIR: str = Field(default="./exports")
+
+    # Schema migrations (db.db_migrations)
+    MIGRATION_LOCK_TIMEOUT_MS: int = Field(default=5000)  # Postgres DDL gives up instead of queueing writers behind it
+    MIGRATION_BACKFILL_BATCH: int = Field(default=5000)  # primary-key range per backfill transaction
+    MIGRATION_BACKFILL_PAUSE: float = Field(default=0.1)  # seconds between backfill batches
+
+    # Backups (db.db_migrations; BACKUP_DIR is read from the environment)
+    BACKUP_JOBS: int = Field(default=4)  # pg_dump/pg_restore workers and chunking threads
+    BACKUP_COMPRESSION_LEVEL: int = Field(default=6)  # gzip level 0-9
+    BACKUP_CHUNK_SIZE_MB: int = Field(default=4)  # dedup granularity
+    SQLITE_BACKUP_PAGES: int = Field(default=1024)  # pages copied per backup step
+    SQLITE_BACKUP_SLEEP: float = Field(default=0.005)  # seconds between steps, lets writers commit
 
     # Vector Database
     VECTOR_DB_PATH: str = Field(default="chroma_db_fons")
-    LOCAL_DB_PATH: str = Field(default="/tmp/chroma_db_fons_fast")
+    LOCAL_DB_PATH: str = Field(default="/tmp/chroma_db_fons_fast")  # writable copy (copy mode, or in_place after the first write)
+    VECTOR_DB_OPEN_MODE: str = Field(default="in_place")  # in_place: open VECTOR_DB_PATH directly if it is read-only, else copy; copy: always copy to LOCAL_DB_PATH first
+    VECTOR_DB_PREFAULT: bool = Field(default=True)  # in_place: read index files ahead via mmap at boot
+    VECTOR_DB_WARMUP: bool = Field(default=True)  # load the index segment with one stored vector before the first question
+    VECTOR_DB_STARTUP_TIMEOUT: float = Field(default=120.0)  # seconds a request waits for the background open
     EMBEDDING_MODEL: str = Field(default="text-embedding-ada-002")
+    EMBEDDING_CACHE_ENABLED: bool = Field(default=True)  # cache query embeddings (core.embedding_cache)
+    EMBEDDING_CACHE_SIZE: int = Field(default=10000)  # vectors kept in memory per process
+    EMBEDDING_CACHE_DIR: str = Field(default=".embedding_cache")  # on-disk vectors shared by processes; empty keeps them in memory only
+    EMBEDDING_CACHE_MAX_ROWS: int = Field(default=100000)  # on-disk vectors (about 6 KB each for ada-002); 0 = no limit
+    EMBEDDING_BATCH_WINDOW_MS: float = Field(default=5.0)  # wait for concurrent misses to share one embeddings call
+    EMBEDDING_BATCH_MAX: int = Field(default=16)  # texts per embeddings call (Azure's per-request input limit)
 
     # Azure OpenAI
     AZURE_OPENAI_ENDPOINT: Optional[str] = Field(default=None)
     AZURE_OPENAI_API_KEY: Optional[str] = Field(default=None)
     AZURE_OPENAI_API_VERSION: Optional[str] = Field(default="2023-05-15")
     AZURE_OPENAI_DEPLOYMENT: Optional[str] = Field(default=None)
+    LLM_HTTP_MAX_CONNECTIONS: int = Field(default=20)  # pooled connections to the LLM endpoint
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = Field(default=60.0)  # seconds an idle connection is kept open
+    LLM_HTTP_TIMEOUT: float = Field(default=60.0)  # seconds per LLM request
+
+    # Answer cache in front of the QA chain (core.answer_cache)
+    ANSWER_CACHE_ENABLED: bool = Field(default=True)
+    ANSWER_CACHE_SIZE: int = Field(default=1000)  # answers kept in memory per process
+    ANSWER_CACHE_TTL: float = Field(default=86400.0)  # seconds an answer is reused
+    ANSWER_CACHE_SEMANTIC: bool = Field(default=False)  # also serve answers to similar (not just identical) questions
+    ANSWER_CACHE_SIMILARITY: float = Field(default=0.98)  # cosine threshold for semantic hits, when enabled
+    ANSWER_CACHE_PURGE_CHECK: float = Field(default=2.0)  # seconds between checks for purges by other processes
+    KB_VERSION: str = Field(default="")  # knowledge-base version for cache keys; empty derives it from the vector DB files
 
     # Streamlit Specific
     STREAMLIT_SERVER_HEADLESS: bool = Field(default=True)
@@ -0,0 +1,119 @@
+"""
+Streaming answers for the chat assistant.
+
+A :class:`StreamingAnswer` carries the retrieved sources, which are known
+before generation starts, and an iterator over the LLM's tokens suitable
+for ``st.write_stream``. It records time-to-first-token separately from
+total latency, both measured from when the question was submitted, in the
+core.metrics registry.
+"""
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from core.metrics import get_registry
+
+RETRIEVAL_SECONDS = "llm.retrieval.seconds"
+FIRST_TOKEN_SECONDS = "llm.first_token.seconds"
+TOTAL_SECONDS = "llm.total.seconds"
+STREAM_ABORTED = "llm.stream.aborted"  # consumer stopped early or the stream raised
+
+
+class StreamingAnswer:
+    """
+    Sources plus a one-shot token stream with latency bookkeeping.
+
+    Args:
+        sources: Retrieved documents (objects with ``metadata``/``page_content``)
+        tokens: Iterator of text chunks; consumed once by iterating this object
+        started: ``clock()`` value when the question was submitted
+        retrieval_seconds: Time spent retrieving ``sources``
+        label: Metrics label, e.g. the app name
+        clock: Time source, injectable for tests
+        on_complete: Called with the full text once the stream finishes
+            (not when it is aborted), e.g. to cache the answer
+        cached: Whether the tokens are a cached answer rather than a new completion
+
+    Example:
+        >>> answer = StreamingAnswer([], iter(["Hel", "lo"]), time.perf_counter())
+        >>> "".join(answer)
+        'Hello'
+    """
+
+    def __init__(
+        self,
+        sources: List[Any],
+        tokens: Iterable[str],
+        started: float,
+        retrieval_seconds: float = 0.0,
+        label: str = "qa",
+        clock: Callable[[], float] = time.perf_counter,
+        on_complete: Optional[Callable[[str], None]] = None,
+        cached: bool = False,
+    ):
+        self.sources = sources
+        self.label = label
+        self.cached = cached
+        self.retrieval_seconds = retrieval_seconds
+        self.first_token_seconds: Optional[float] = None
+        self.total_seconds: Optional[float] = None
+        self._tokens = iter(tokens)
+        self._started = started
+        self._clock = clock
+        self._on_complete = on_complete
+        self._parts: List[str] = []
+
+    def __iter__(self) -> Iterator[str]:
+        completed = False
+        try:
+            for token in self._tokens:
+                if not token:
+                    continue
+                if self.first_token_seconds is None:
+                    self.first_token_seconds = self._clock() - self._started
+                self._parts.append(token)
+                yield token
+            completed = True
+        finally:
+            self.total_seconds = self._clock() - self._started
+            self._record(completed)
+        if self._on_complete is not None:
+            self._on_complete(self.text)
+
+    @property
+    def text(self) -> str:
+        """Everything streamed so far."""
+        return "".join(self._parts)
+
+    def timings(self) -> dict:
+        return {
+            "retrieval_s": self.retrieval_seconds,
+            "first_token_s": self.first_token_seconds,
+            "total_s": self.total_seconds,
+            "cached": self.cached,
+        }
+
+    def _record(self, completed: bool) -> None:
+        registry = get_registry()
+        registry.observe(RETRIEVAL_SECONDS, self.label, self.retrieval_seconds)
+        if self.first_token_seconds is not None:
+            registry.observe(FIRST_TOKEN_SECONDS, self.label, self.first_token_seconds)
+        if completed:
+            registry.observe(TOTAL_SECONDS, self.label, self.total_seconds)
+        else:
+            registry.increment(STREAM_ABORTED, self.label)
+
+
+def format_sources(docs: Iterable[Any]) -> List[str]:
+    """Distinct ``source (p. N)`` labels of retrieved documents, in rank order."""
+    labels: List[str] = []
+    for doc in docs:
+        metadata = getattr(doc, "metadata", None) or {}
+        source = metadata.get("source")
+        if not source:
+            continue
+        page = metadata.get("page")
+        # Page numbers are stored zero-based by the ingest scripts
+        label = f"{source} (p. {int(page) + 1})" if isinstance(page, int) else str(source)
+        if label not in labels:
+            labels.append(label)
+    return labels
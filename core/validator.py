@@ -6,12 +6,16 @@ import os
 import shutil
 import hashlib
 import logging
-from typing import Optional, List, Dict, Any, Union
+import threading
+import time
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple, Union
 
 import streamlit as st
 try:
     from langchain_openai import AzureOpenAI
     from langchain_openai import AzureOpenAIEmbeddings
+    import chromadb
     from langchain_chroma import Chroma
     from langchain.chains import RetrievalQA
     AI_AVAILABLE = True
@@ -20,10 +24,12 @@ except ImportError:
     # Define dummy classes or None to prevent NameError if used in type hints or default args
     AzureOpenAI = None
     AzureOpenAIEmbeddings = None
+    chromadb = None
     Chroma = None
     RetrievalQA = None
 
 from core.settings import settings
+from core.chat_store import ChatHistoryStore
 
 # Attempt to import DB modules
 try:
@@ -31,16 +37,23 @@ try:
         get_user,
         update_last_login,
         save_chat_message as db_save_chat_message,
-        get_chat_history as db_get_chat_history,
+        get_chat_history_page as db_get_chat_history_page,
+        search_chat_history as db_search_chat_history,
         log_audit_event,
         log_analytics_event
     )
+    from db.event_writer import queue_audit_event, queue_analytics_event
+    from db.sessions import create_session, validate_session, refresh_session, revoke_session
     DB_AVAILABLE = True
 except ImportError:
     DB_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Private-use characters marking search hits, so the UI can escape message
+# text first and then turn the markers into highlighting.
+SEARCH_HIGHLIGHT = ("\ue000", "\ue001")
+
 def hash_password(password: str) -> str:
     """Hash a password using SHA-256."""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -107,13 +120,112 @@ def authenticate_user(username: str, password: str) -> Optional[str]:
     logger.warning(f"User not found: {username}")
     return None
 
-@st.cache_resource
-def load_vector_db():
-    """Load and cache ChromaDB vector database."""
-    if not AI_AVAILABLE:
-        logger.warning("AI modules not available - vector DB disabled")
+def start_user_session(username: str) -> Optional[str]:
+    """Open a database session for a freshly authenticated user; returns its token."""
+    if not (settings.USE_DATABASE and DB_AVAILABLE):
+        return None
+    try:
+        user = get_user(username)
+        if user:
+            return create_session(user["id"])
+    except Exception as e:
+        from core.safe_logging import log_exception_safe
+        log_exception_safe(logger, "Failed to create session", e, level="warning")
+    return None
+
+def check_user_session(token: Optional[str]) -> bool:
+    """
+    Whether a session token is still live, sliding its expiry once half used.
+
+    Without a token (database disabled at login) there is nothing to check.
+    If the database is unreachable the session is kept rather than logging
+    the user out mid-shift.
+    """
+    if not token or not (settings.USE_DATABASE and DB_AVAILABLE):
+        return True
+    try:
+        session = validate_session(token)
+        if session is None:
+            return False
+        remaining = (session["expires_at"] - datetime.utcnow()).total_seconds()
+        if remaining < settings.SESSION_TTL / 2:
+            refresh_session(token)
+        return True
+    except Exception as e:
+        from core.safe_logging import log_exception_safe
+        log_exception_safe(logger, "Session validation failed", e, level="warning")
+        return True
+
+def end_user_session(token: Optional[str]) -> None:
+    """Revoke a session on logout."""
+    if not token or not (settings.USE_DATABASE and DB_AVAILABLE):
+        return
+    try:
+        revoke_session(token)
+    except Exception as e:
+        from core.safe_logging import log_exception_safe
+        log_exception_safe(logger, "Failed to revoke session", e, level="warning")
+
+def _load_embeddings():
+    embeddings = AzureOpenAIEmbeddings(
+        azure_deployment=settings.EMBEDDING_MODEL,
+        api_key=settings.AZURE_OPENAI_API_KEY,
+        azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+        api_version=settings.AZURE_OPENAI_API_VERSION
+    )
+    if settings.EMBEDDING_CACHE_ENABLED:
+        embeddings = cache_embeddings(embeddings)
+    return embeddings
+
+def _warm_vector_db(loader, db) -> None:
+    """Query with a stored vector so the index segment is loaded before the first question."""
+    if not settings.VECTOR_DB_WARMUP:
+        return
+    try:
+        with loader.phase("warm"):
+            vectors = db.get(limit=1, include=["embeddings"]).get("embeddings")
+            if vectors is not None and len(vectors):
+                db.similarity_search_by_vector(list(vectors[0]), k=1)
+    except Exception as e:
+        from core.safe_logging import log_exception_safe
+        log_exception_safe(logger, "Vector DB warm-up failed", e, level="warning")
+
+def _open_chroma(path: str, embeddings):
+    """Open the Chroma index at ``path``; returns the store and the client it owns."""
+    client = chromadb.PersistentClient(path=path)
+    return Chroma(client=client, embedding_function=embeddings), client
+
+def _open_in_place(loader, vector_db_path: str, local_db_path: str, embeddings):
+    """Open the read-only index at ``vector_db_path`` without copying; None if that fails."""
+    from core.vector_store import check_unchanged, copy_on_write, fingerprint, prefault_files
+
+    if settings.VECTOR_DB_PREFAULT:
+        with loader.phase("prefault"):
+            prefault_files(vector_db_path)
+    client = None
+    try:
+        before = fingerprint(vector_db_path)
+        with loader.phase("open"):
+            logger.debug(f"Opening ChromaDB in place at {vector_db_path}")
+            db, client = _open_chroma(vector_db_path, embeddings)
+        _warm_vector_db(loader, db)
+        check_unchanged(vector_db_path, before)
+        return copy_on_write(
+            db, vector_db_path, local_db_path,
+            lambda path: _open_chroma(path, embeddings)[0],
+            close=client.close,
+        )
+    except Exception as e:
+        from core.safe_logging import log_exception_safe
+        log_exception_safe(logger, "Opening vector DB in place failed; copying instead", e, level="warning")
+        if client is not None:
+            client.close()
         return None
 
+def _open_vector_db(loader):
+    """Open the vector DB per VECTOR_DB_OPEN_MODE, timing each phase on ``loader``."""
+    from core.vector_store import is_read_only
+
     vector_db_path = settings.VECTOR_DB_PATH
     local_db_path = settings.LOCAL_DB_PATH
 
@@ -121,34 +233,341 @@ def load_vector_db():
         logger.warning(f"Vector database not found at {vector_db_path}")
         return None
 
-    if not os.path.exists(local_db_path):
+    with loader.phase("embeddings"):
+        logger.debug("Loading embeddings...")
+        embeddings = _load_embeddings()
+
+    db = None
+    if settings.VECTOR_DB_OPEN_MODE == "in_place":
+        # Chroma writes to any index it opens, so only a read-only one is opened in place
+        if is_read_only(vector_db_path):
+            db = _open_in_place(loader, vector_db_path, local_db_path, embeddings)
+        else:
+            logger.info(f"{vector_db_path} is writable; copying it instead of opening it in place")
+
+    if db is None:
+        if not os.path.exists(local_db_path):
+            with loader.phase("copy"):
+                logger.info(f"Copying vector DB to {local_db_path}")
+                shutil.copytree(vector_db_path, local_db_path, dirs_exist_ok=True)
+        with loader.phase("open"):
+            logger.debug("Loading ChromaDB...")
+            db, _client = _open_chroma(local_db_path, embeddings)
+        _warm_vector_db(loader, db)
+
+    logger.info("Vector DB loaded successfully")
+    return db
+
+@st.cache_resource
+def get_vector_db_loader():
+    """Process-wide background loader of the vector DB, started on first call."""
+    from core.vector_store import VectorStoreLoader
+
+    return VectorStoreLoader(_open_vector_db).start()
+
+def start_vector_db_warmup() -> None:
+    """Begin opening the vector DB in the background; call at app start, before login."""
+    if AI_AVAILABLE:
+        get_vector_db_loader()
+
+def load_vector_db():
+    """
+    Return the ChromaDB vector database, or None if unavailable.
+
+    Waits for the background loader (see start_vector_db_warmup) for up to
+    VECTOR_DB_STARTUP_TIMEOUT seconds; a later call tries again.
+    """
+    if not AI_AVAILABLE:
+        logger.warning("AI modules not available - vector DB disabled")
+        return None
+    return get_vector_db_loader().result(timeout=settings.VECTOR_DB_STARTUP_TIMEOUT)
+
+def get_vector_db_status() -> Dict[str, Any]:
+    """Vector DB startup state and phase timings, for the admin panel."""
+    if not AI_AVAILABLE:
+        return {"state": "disabled"}
+    return dict(get_vector_db_loader().status(), mode=settings.VECTOR_DB_OPEN_MODE)
+
+def cache_embeddings(embeddings):
+    """
+    Wrap ``embeddings`` in the query-embedding cache (memory, then EMBEDDING_CACHE_DIR).
+
+    Falls back to an in-memory cache if the directory cannot be opened.
+    """
+    from core.embedding_cache import CachedEmbeddings, VectorFile
+
+    store = None
+    if settings.EMBEDDING_CACHE_DIR:
+        # One directory per model: vectors from different models never mix
+        model_dir = "".join(c if c.isalnum() or c in "-_." else "_" for c in settings.EMBEDDING_MODEL)
         try:
-            logger.info(f"Copying vector DB to {local_db_path}")
-            shutil.copytree(vector_db_path, local_db_path, dirs_exist_ok=True)
+            store = VectorFile(
+                os.path.join(settings.EMBEDDING_CACHE_DIR, model_dir),
+                max_rows=settings.EMBEDDING_CACHE_MAX_ROWS,
+            )
         except Exception as e:
             from core.safe_logging import log_exception_safe
-            log_exception_safe(logger, "Failed to copy vector DB", e)
-            return None
+            log_exception_safe(logger, "Embedding cache directory unavailable", e, level="warning")
+    return CachedEmbeddings(
+        embeddings,
+        model=settings.EMBEDDING_MODEL,
+        maxsize=settings.EMBEDDING_CACHE_SIZE,
+        store=store,
+        batch_window=settings.EMBEDDING_BATCH_WINDOW_MS / 1000.0,
+        max_batch=settings.EMBEDDING_BATCH_MAX,
+    )
+
+@st.cache_resource
+def get_llm_http_client():
+    """
+    Process-wide keep-alive HTTP pool for LLM calls, or None without httpx.
 
+    httpx.Client is thread-safe, so every Streamlit session shares its
+    connections and skips TCP/TLS setup after the first request.
+    """
     try:
-        logger.debug("Loading embeddings...")
-        embeddings = AzureOpenAIEmbeddings(
-            azure_deployment=settings.EMBEDDING_MODEL,
-            api_key=settings.AZURE_OPENAI_API_KEY,
-            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
-            api_version=settings.AZURE_OPENAI_API_VERSION
-        )
-        logger.debug("Loading ChromaDB...")
-        db = Chroma(persist_directory=local_db_path, embedding_function=embeddings)
-        logger.info("Vector DB loaded successfully")
-        return db
-    except Exception as e:
-        from core.safe_logging import log_exception_safe
-        log_exception_safe(logger, "Failed to load vector DB", e)
+        import httpx
+    except ImportError:
         return None
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=settings.LLM_HTTP_TIMEOUT,
+    )
+
+def build_qa_chain(vector_db, search_k: int = 4, temperature: float = 0.7, http_client=None):
+    """Assemble a RetrievalQA chain over ``vector_db`` (uncached; see get_qa_chain)."""
+    llm = AzureOpenAI(
+        temperature=temperature,
+        deployment_name=settings.AZURE_OPENAI_DEPLOYMENT,
+        api_version=settings.AZURE_OPENAI_API_VERSION,
+        api_key=settings.AZURE_OPENAI_API_KEY,
+        azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+        http_client=http_client,
+    )
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=vector_db.as_retriever(search_kwargs={"k": search_k}),
+    )
+
+def get_qa_chain(search_k: int = 4, temperature: float = 0.7):
+    """
+    Load and cache the QA chain for these parameters, or None when AI or the vector DB is unavailable.
+
+    The chain keeps no per-conversation state, so one instance serves every
+    session concurrently; build errors are not cached and retry next call,
+    and neither is a vector DB that is still opening.
+    """
+    if not AI_AVAILABLE:
+        return None
+    vector_db = load_vector_db()
+    if vector_db is None:
+        return None
+    return _shared_qa_chain(vector_db, id(vector_db), search_k, temperature)
+
+@st.cache_resource
+def _shared_qa_chain(_vector_db, store_id: int, search_k: int, temperature: float):
+    # Streamlit does not hash _vector_db; store_id keys the cache on which
+    # store it is (the cached chain keeps that store alive, so its id is not
+    # reused), so a reopened vector DB gets a new chain instead of a stale one
+    return build_qa_chain(_vector_db, search_k, temperature, http_client=get_llm_http_client())
+
+@st.cache_resource
+def knowledge_base_version() -> str:
+    """
+    Version of the indexed guidance, used to key cached answers.
+
+    KB_VERSION when set, otherwise a fingerprint of the names, sizes and
+    modification times of the files under VECTOR_DB_PATH, so reindexing
+    (and restarting) stops cached answers from the old corpus being served.
+    """
+    if settings.KB_VERSION:
+        return settings.KB_VERSION
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(settings.VECTOR_DB_PATH):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            rel = os.path.relpath(path, settings.VECTOR_DB_PATH)
+            digest.update(f"{rel}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+@st.cache_resource
+def get_answer_cache():
+    """Process-wide answer cache (persisted when the database is enabled), or None when disabled."""
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    from core.answer_cache import AnswerCache
+
+    store = None
+    if settings.USE_DATABASE and DB_AVAILABLE:
+        from db.answer_cache import AnswerCacheStore
+        store = AnswerCacheStore()
+    return AnswerCache(
+        maxsize=settings.ANSWER_CACHE_SIZE,
+        ttl=settings.ANSWER_CACHE_TTL,
+        threshold=settings.ANSWER_CACHE_SIMILARITY if settings.ANSWER_CACHE_SEMANTIC else None,
+        store=store,
+        purge_check=settings.ANSWER_CACHE_PURGE_CHECK,
+    )
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """Query-embedding cache hit rates and call counts, for the admin panel."""
+    vector_db = load_vector_db()
+    embeddings = getattr(vector_db, "embeddings", None)
+    if not hasattr(embeddings, "stats"):
+        return {"enabled": False}
+    return embeddings.stats()
+
+def get_answer_cache_stats() -> Dict[str, Any]:
+    """Answer cache size and hit rates, for the admin panel."""
+    cache = get_answer_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+def purge_answer_cache() -> int:
+    """Drop every cached answer, in memory and in the database; returns how many were removed."""
+    cache = get_answer_cache()
+    return cache.purge() if cache is not None else 0
+
+def _answer_namespace(search_k: int, temperature: float) -> str:
+    # Different retrieval depth or sampling gives different answers
+    return f"{knowledge_base_version()}:k{search_k}:t{temperature}"
+
+def _question_embedder(chain):
+    """The retriever's embed_query, so semantic lookups match how the vector DB embeds questions."""
+    vectorstore = getattr(chain.retriever, "vectorstore", None)
+    embeddings = getattr(vectorstore, "embeddings", None)
+    return getattr(embeddings, "embed_query", None)
+
+def stream_answer(
+    question: str,
+    search_k: int = 4,
+    temperature: float = 0.7,
+    label: str = "qa",
+    chain=None,
+    use_cache: bool = True,
+):
+    """
+    Answer ``question`` with the cached QA chain (or ``chain``), streaming tokens as they arrive.
+
+    Retrieval runs here, so the returned StreamingAnswer already holds its
+    sources; the completion request starts when the answer is iterated
+    (e.g. by st.write_stream). Returns None when the chain is unavailable.
+
+    With ``use_cache`` the answer cache is consulted first; a hit is
+    returned as a one-chunk StreamingAnswer with ``cached`` set and
+    metrics label ``<label>.cached``, and a completed miss is cached.
+    """
+    from core.streaming import StreamingAnswer
+    from langchain_core.prompts import format_document
+
+    if chain is None:
+        chain = get_qa_chain(search_k, temperature)
+    if chain is None:
+        return None
+
+    started = time.perf_counter()
+    cache = get_answer_cache() if use_cache else None
+    lookup = None
+    if cache is not None:
+        namespace = _answer_namespace(search_k, temperature)
+        try:
+            lookup = cache.lookup(namespace, question, embed=_question_embedder(chain))
+        except Exception as e:
+            from core.safe_logging import log_exception_safe
+            log_exception_safe(logger, "Answer cache lookup failed", e, level="warning")
+        if lookup is not None and lookup.answer is not None:
+            return StreamingAnswer(
+                lookup.answer.sources,
+                iter([lookup.answer.answer]),
+                started=started,
+                retrieval_seconds=time.perf_counter() - started,
+                label=f"{label}.cached",
+                cached=True,
+            )
+
+    docs = chain.retriever.invoke(question)
+    retrieval_seconds = time.perf_counter() - started
+
+    # Same prompt RetrievalQA's "stuff" chain would send, but through
+    # llm.stream() instead of a blocking call
+    combine = chain.combine_documents_chain
+    context = combine.document_separator.join(
+        format_document(doc, combine.document_prompt) for doc in docs
+    )
+    # RetrievalQA hands the query to the stuff chain as "question"
+    prompt = combine.llm_chain.prompt.format(
+        **{combine.document_variable_name: context, "question": question}
+    )
+
+    on_complete = None
+    if cache is not None:
+        embedding = lookup.embedding if lookup is not None else None
+
+        def on_complete(text: str) -> None:
+            if text.strip():
+                cache.put(namespace, question, text, docs, embedding)
+
+    return StreamingAnswer(
+        docs,
+        combine.llm_chain.llm.stream(prompt),
+        started=started,
+        retrieval_seconds=retrieval_seconds,
+        label=label,
+        on_complete=on_complete,
+    )
+
+def render_streaming_answer(answer) -> str:
+    """Show the sources at once, stream the tokens, then the latency caption; returns the answer text."""
+    from core.streaming import format_sources
+
+    sources = format_sources(answer.sources)
+    if sources:
+        with st.expander(f"📄 Sources ({len(sources)})"):
+            st.markdown("\n".join(f"- {label}" for label in sources))
+    st.write_stream(answer)
+    if answer.cached:
+        st.caption(f"Cached answer · {answer.total_seconds:.2f}s")
+    elif answer.first_token_seconds is not None:
+        st.caption(
+            f"First token {answer.first_token_seconds:.2f}s · "
+            f"complete {answer.total_seconds:.2f}s"
+        )
+    return answer.text
+
+_chat_store: Optional[ChatHistoryStore] = None
+_chat_store_lock = threading.Lock()
+
+def get_chat_store(legacy_file: str = ".chat_history.json") -> ChatHistoryStore:
+    """Return the process-wide JSONL chat store, migrating the legacy JSON file once."""
+    global _chat_store
+    if _chat_store is None:
+        with _chat_store_lock:
+            if _chat_store is None:
+                store = ChatHistoryStore(
+                    settings.CHAT_HISTORY_DIR,
+                    max_messages=settings.CHAT_HISTORY_MAX_MESSAGES,
+                )
+                try:
+                    store.migrate_legacy_json(legacy_file)
+                except Exception as e:
+                    from core.safe_logging import log_exception_safe
+                    log_exception_safe(logger, "Legacy chat history migration failed", e, level="warning")
+                if settings.CHAT_HISTORY_COMPACT_INTERVAL > 0:
+                    store.start_compaction_job(settings.CHAT_HISTORY_COMPACT_INTERVAL)
+                _chat_store = store
+    return _chat_store
 
 def save_chat_message(username: str, role: str, content: str, chat_history_file: str = ".chat_history.json") -> bool:
-    """Save chat message to database or JSON file."""
+    """Save chat message to database or the JSONL file store."""
     # 1. Try Database
     if settings.USE_DATABASE and DB_AVAILABLE:
         try:
@@ -160,64 +579,100 @@ def save_chat_message(username: str, role: str, content: str, chat_history_file:
             from core.safe_logging import log_exception_safe
             log_exception_safe(logger, "Failed to save to database", e, level="warning")
 
-    # 2. Fallback to JSON
+    # 2. Fallback to append-only file store (chat_history_file is the legacy JSON to migrate)
     try:
-        history_data = {}
-        if os.path.exists(chat_history_file):
-            import json
-            with open(chat_history_file, "r") as f:
-                history_data = json.load(f)
-
-        if username not in history_data:
-            history_data[username] = []
-
-        history_data[username].append({"role": role, "content": content})
-
-        import json
-        with open(chat_history_file, "w") as f:
-            json.dump(history_data, f, indent=2)
+        get_chat_store(chat_history_file).append(username, role, content)
         return True
     except Exception as e:
         from core.safe_logging import log_exception_safe
         log_exception_safe(logger, "Failed to save chat history to file", e)
         return False
 
-def load_chat_history(username: str, chat_history_file: str = ".chat_history.json") -> List[Dict[str, Any]]:
-    """Load chat history from database or JSON."""
+def load_chat_history_page(
+    username: str,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    chat_history_file: str = ".chat_history.json",
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Load one page of chat history, oldest message first.
+
+    Pass the returned cursor back in to fetch the next older page; it is None
+    once the beginning of the history has been reached.
+    """
+    limit = limit or settings.CHAT_PAGE_SIZE
+    backend, _, token = (cursor or "").partition(":")
+
     # 1. Try Database
-    if settings.USE_DATABASE and DB_AVAILABLE:
+    if settings.USE_DATABASE and DB_AVAILABLE and backend in ("", "db"):
         try:
             user = get_user(username)
             if user:
-                messages = db_get_chat_history(user["id"], limit=100)
-                return [
-                    {"role": msg["role"], "content": msg["content"]}
-                    for msg in messages
-                ]
+                messages, next_cursor = db_get_chat_history_page(
+                    user["id"], limit=limit, cursor=token or None
+                )
+                return (
+                    [{"role": msg["role"], "content": msg["content"]} for msg in reversed(messages)],
+                    f"db:{next_cursor}" if next_cursor else None,
+                )
         except Exception as e:
             from core.safe_logging import log_exception_safe
             log_exception_safe(logger, "Failed to load from database", e, level="warning")
+        if backend == "db":
+            return [], None
 
-    # 2. Fallback to JSON
+    # 2. Fallback to file store (seeks via the offset index)
     try:
-        import json
-        if os.path.exists(chat_history_file):
-            with open(chat_history_file, "r") as f:
-                history_data = json.load(f)
-                return history_data.get(username, [])
+        messages, before = get_chat_store(chat_history_file).page(
+            username, limit=limit, before=int(token) if token else None
+        )
+        return (
+            [{"role": msg["role"], "content": msg["content"]} for msg in messages],
+            f"file:{before}" if before else None,
+        )
     except Exception as e:
         from core.safe_logging import log_exception_safe
         log_exception_safe(logger, "Failed to load chat history from file", e, level="warning")
 
+    return [], None
+
+def search_chat_messages(
+    username: str, query: str, limit: int = 20, since: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Ranked full-text search of a user's saved chat messages.
+
+    Results carry a ``snippet`` with matches wrapped in SEARCH_HIGHLIGHT
+    markers (message text is not HTML-escaped). Searching requires the
+    database; the file fallback returns no results.
+    """
+    if not (settings.USE_DATABASE and DB_AVAILABLE):
+        return []
+    try:
+        user = get_user(username)
+        if user:
+            return db_search_chat_history(
+                user["id"], query, limit=limit, since=since, highlight=SEARCH_HIGHLIGHT
+            )
+    except Exception as e:
+        from core.safe_logging import log_exception_safe
+        log_exception_safe(logger, "Chat history search failed", e, level="warning")
     return []
 
+def load_chat_history(username: str, chat_history_file: str = ".chat_history.json") -> List[Dict[str, Any]]:
+    """Load the most recent chat history (up to 100 messages), oldest first."""
+    messages, _ = load_chat_history_page(username, limit=100, chat_history_file=chat_history_file)
+    return messages
+
 def audit_log(username: str, action: str, details: Optional[Dict] = None):
     """Log user action to database if available, otherwise just logger."""
     if settings.USE_DATABASE and DB_AVAILABLE:
         try:
-            user = get_user(username)
-            if user:
-                log_audit_event(user["id"], action, changes=details)
+            # Write-behind: the background writer resolves the user and batches the INSERT
+            if not queue_audit_event(action, username=username, changes=details):
+                user = get_user(username)
+                if user:
+                    log_audit_event(user["id"], action, changes=details)
         except Exception as e:
             from core.safe_logging import log_exception_safe
             log_exception_safe(logger, "Failed to log audit event to DB", e, level="warning")
@@ -228,9 +683,10 @@ def analytics_log(username: str, event_type: str, event_name: str, data: Optiona
     """Log analytics event."""
     if settings.USE_DATABASE and DB_AVAILABLE:
         try:
-            user = get_user(username)
-            if user:
-                log_analytics_event(user["id"], event_type, event_name, data)
+            if not queue_analytics_event(event_type, event_name, username=username, data=data):
+                user = get_user(username)
+                if user:
+                    log_analytics_event(user["id"], event_type, event_name, data)
         except Exception as e:
             from core.safe_logging import log_exception_safe
             log_exception_safe(logger, "Failed to log analytics to DB", e, level="warning")
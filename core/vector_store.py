@@ -0,0 +1,251 @@
+"""
+Vector store startup.
+
+The FoNS index used to be copied from VECTOR_DB_PATH to LOCAL_DB_PATH
+before the first question could be answered. That took minutes on a large
+index and doubled disk use per pod. This module lets the app open the index
+where it is instead:
+
+* :class:`VectorStoreLoader` opens the store once on a background thread
+  started at boot. It records how long each startup phase took (in the
+  core.metrics registry and in :meth:`~VectorStoreLoader.status`), and the
+  first query waits for it with a bound.
+* :func:`prefault_files` memory-maps the index files and asks the kernel
+  to read them ahead, so loading the segments reads from the page cache.
+* :func:`copy_on_write` copies the index to a private directory the first
+  time something writes to a store that was opened in place.
+* Chroma has no read-only mode and writes to any index it opens (a lock
+  row, re-persisted segments), so an index is only opened in place when
+  :func:`is_read_only` (e.g. a read-only volume); :func:`fingerprint` and
+  :func:`check_unchanged` then confirm it was left as it was.
+"""
+import os
+import mmap
+import time
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from core.metrics import get_registry
+from core.safe_logging import log_exception_safe
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = "vector_db.startup.seconds"  # label: startup phase, "total" or "first_query_wait"
+
+# LangChain VectorStore methods that modify the index
+WRITE_METHODS = (
+    "add_texts", "add_documents", "add_images", "delete",
+    "update_document", "update_documents",
+    "aadd_texts", "aadd_documents", "adelete",
+)
+
+
+def prefault_files(path: str) -> int:
+    """
+    Start reading every file under ``path`` into the page cache; returns the bytes covered.
+
+    Uses madvise(MADV_WILLNEED) where available, which returns at once and
+    lets the kernel read ahead. Elsewhere it touches one byte per page.
+    """
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                with open(os.path.join(root, name), "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if not size:
+                        continue
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        if hasattr(mmap, "MADV_WILLNEED"):
+                            mapped.madvise(mmap.MADV_WILLNEED)
+                        else:
+                            for offset in range(0, size, mmap.PAGESIZE):
+                                mapped[offset]
+                total += size
+            except (OSError, ValueError):
+                continue
+    return total
+
+
+class SourceChangedError(RuntimeError):
+    """A vector store opened in place modified the files it was opened on."""
+
+
+def is_read_only(path: str) -> bool:
+    """True if this process can write neither ``path`` nor anything under it."""
+    for root, _dirs, files in os.walk(path):
+        if any(os.access(os.path.join(root, name), os.W_OK) for name in [""] + files):
+            return False
+    return True
+
+
+def fingerprint(path: str) -> Dict[str, Tuple[int, int]]:
+    """Size and modification time (ns) of every file under ``path``, by relative path."""
+    files = {}
+    for root, _dirs, names in os.walk(path):
+        for name in names:
+            full = os.path.join(root, name)
+            st = os.stat(full)
+            files[os.path.relpath(full, path)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def check_unchanged(path: str, before: Dict[str, Tuple[int, int]]) -> None:
+    """Raise :class:`SourceChangedError` if ``path`` no longer matches ``before``."""
+    after = fingerprint(path)
+    changed = sorted(name for name in set(before) | set(after) if before.get(name) != after.get(name))
+    if changed:
+        raise SourceChangedError(f"{path} was modified while open in place: {', '.join(changed)}")
+
+
+def copy_on_write(
+    store: Any,
+    source: str,
+    target: str,
+    reopen: Callable[[str], Any],
+    close: Optional[Callable[[], None]] = None,
+) -> Any:
+    """
+    Make ``store``, opened in place on ``source``, move to a copy at its first write.
+
+    The first call to any of :data:`WRITE_METHODS` copies ``source`` to
+    ``target`` (replacing whatever is there), opens it with ``reopen`` and
+    rebinds ``store``'s state to the copy before the write runs. Retrievers
+    and chains already holding ``store`` therefore see the write, and
+    ``source`` is never modified. ``close``, if given, then releases the
+    handle on ``source`` (e.g. the Chroma client it was opened with).
+    Returns ``store``.
+    """
+    lock = threading.Lock()
+    wrapped = []
+
+    def materialize() -> None:
+        with lock:
+            if not wrapped:
+                return  # another thread got here first
+            started = time.perf_counter()
+            logger.info(f"First write to the vector store: copying {source} to {target}")
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            shutil.copytree(source, target)
+            fresh = reopen(target)
+            state = {k: v for k, v in vars(fresh).items() if k not in WRITE_METHODS}
+            vars(store).update(state)
+            for name in wrapped:
+                vars(store).pop(name, None)
+            wrapped.clear()
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    log_exception_safe(logger, "Failed to close the in-place vector store", e, level="warning")
+            get_registry().observe(STARTUP_SECONDS, "copy_on_write", time.perf_counter() - started)
+
+    def wrap(name: str) -> Callable[..., Any]:
+        def write(*args, **kwargs):
+            materialize()
+            return getattr(store, name)(*args, **kwargs)
+        write.__name__ = name
+        return write
+
+    for name in WRITE_METHODS:
+        if hasattr(store, name):
+            vars(store)[name] = wrap(name)
+            wrapped.append(name)
+    return store
+
+
+class VectorStoreLoader:
+    """
+    Opens a vector store once, in the background, with per-phase startup timings.
+
+    Args:
+        open_store: Called with the loader (for :meth:`phase`) on the
+            background thread; returns the store, or None if unavailable
+        clock: Time source, injectable for tests
+
+    Example:
+        >>> loader = VectorStoreLoader(lambda loader: open_index()).start()
+        >>> store = loader.result(timeout=120)  # None if failed or still opening
+    """
+
+    def __init__(self, open_store: Callable[["VectorStoreLoader"], Any], clock: Callable[[], float] = time.perf_counter):
+        self._open_store = open_store
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._store: Any = None
+        self._error: Optional[str] = None
+        self._waited = False
+        self.timings: Dict[str, float] = {}
+
+    def start(self) -> "VectorStoreLoader":
+        """Begin opening the store (idempotent)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="vector-db-loader", daemon=True)
+                self._thread.start()
+        return self
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """
+        The opened store, waiting up to ``timeout`` seconds (None waits forever).
+
+        Returns None if opening failed or is still in progress; the first
+        caller's wait is recorded as ``first_query_wait``.
+        """
+        self.start()
+        started = self._clock()
+        ready = self._done.wait(timeout)
+        with self._lock:
+            first, self._waited = not self._waited, True
+        if first:
+            self._record("first_query_wait", self._clock() - started)
+        if not ready:
+            logger.warning(f"Vector store still opening after {timeout}s; answering without it")
+            return None
+        return self._store
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a startup step; the duration is kept even if the step fails."""
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self._record(name, self._clock() - started)
+
+    def status(self) -> Dict[str, Any]:
+        """State (opening, ready, unavailable or failed) and phase durations in seconds."""
+        if not self._done.is_set():
+            state = "opening" if self._thread is not None else "not started"
+        elif self._error is not None:
+            state = "failed"
+        else:
+            state = "ready" if self._store is not None else "unavailable"
+        return {"state": state, "error": self._error, "timings_s": dict(self.timings)}
+
+    # ------------------------------------------------------------------
+
+    def _record(self, name: str, seconds: float) -> None:
+        self.timings[name] = round(seconds, 4)
+        get_registry().observe(STARTUP_SECONDS, name, seconds)
+
+    def _run(self) -> None:
+        try:
+            with self.phase("total"):
+                self._store = self._open_store(self)
+            logger.info(f"Vector store startup: {self.timings}")
+        except Exception as e:
+            self._error = type(e).__name__
+            log_exception_safe(logger, "Failed to open vector store", e)
+        finally:
+            self._done.set()
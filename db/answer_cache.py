@@ -0,0 +1,160 @@
+"""
+Persistence for the answer cache (core.answer_cache).
+
+One row per (namespace, normalised question) in ``answer_cache``. Rows hold
+the answer, its source documents (JSON) and the question embedding as
+float32 bytes. created_at drives the TTL. Expired rows are deleted when a
+process first loads a namespace, and on an admin purge.
+
+``answer_cache_generation`` holds one counter that every purge increments,
+so other processes notice the purge and drop the answers they hold in memory.
+"""
+
+import logging
+from array import array
+from calendar import timegm
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = "question_key, question, answer, sources, embedding, created_at"
+
+
+def ensure_answer_cache_table(cur) -> None:
+    """Create ``answer_cache`` (idempotent)."""
+    if settings.DB_TYPE == "postgres":
+        id_type, json_type, blob_type = "SERIAL PRIMARY KEY", "JSONB", "BYTEA"
+    else:
+        id_type, json_type, blob_type = "INTEGER PRIMARY KEY AUTOINCREMENT", "TEXT", "BLOB"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            id {id_type},
+            namespace VARCHAR(200) NOT NULL,
+            question_key TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            sources {json_type},
+            embedding {blob_type},
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (namespace, question_key)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_created ON answer_cache (created_at)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS answer_cache_generation (
+            id INTEGER PRIMARY KEY,
+            generation BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("INSERT INTO answer_cache_generation (id, generation) VALUES (1, 0) ON CONFLICT DO NOTHING")
+
+
+def _utc(epoch: float) -> datetime:
+    return datetime.utcfromtimestamp(epoch).replace(microsecond=0)
+
+
+def _epoch(value: Any) -> float:
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    return float(timegm(value.utctimetuple()))
+
+
+def _row(row) -> Dict[str, Any]:
+    from core.answer_cache import CachedDocument
+    from db.serialization import decode
+
+    key, question, answer, sources, embedding, created_at = row
+    vector = None
+    if embedding is not None:
+        vector = array("f")
+        vector.frombytes(bytes(embedding))
+    return {
+        "key": key,
+        "question": question,
+        "answer": answer,
+        "sources": [CachedDocument(s.get("page_content", ""), s.get("metadata") or {})
+                    for s in (decode(sources) or [])],
+        "embedding": vector,
+        "created_at": _epoch(created_at),
+    }
+
+
+class AnswerCacheStore:
+    """answer_cache table access in the shape core.answer_cache.AnswerCache expects."""
+
+    def load(self, namespace: str, since: float, limit: int) -> List[Dict[str, Any]]:
+        """Newest unexpired answers of ``namespace`` (expired rows are deleted first)."""
+        from db.database import get_connection, _adapt_query, _run_write
+
+        cutoff = _utc(since)
+        _run_write(lambda cur: cur.execute(_adapt_query(
+            "DELETE FROM answer_cache WHERE created_at < %s"
+        ), (cutoff,)))
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(_adapt_query(
+                f"SELECT {_COLUMNS} FROM answer_cache "
+                "WHERE namespace = %s AND created_at >= %s "
+                "ORDER BY created_at DESC LIMIT %s"
+            ), (namespace, cutoff, limit))
+            return [_row(r) for r in cur.fetchall()]
+
+    def fetch(self, namespace: str, key: str, since: float) -> Optional[Dict[str, Any]]:
+        """One unexpired answer by normalised question, or None."""
+        from db.database import get_connection, _adapt_query
+
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(_adapt_query(
+                f"SELECT {_COLUMNS} FROM answer_cache "
+                "WHERE namespace = %s AND question_key = %s AND created_at >= %s"
+            ), (namespace, key, _utc(since)))
+            row = cur.fetchone()
+        return _row(row) if row else None
+
+    def save(self, namespace: str, key: str, entry) -> None:
+        """Insert or replace the answer for (namespace, key)."""
+        from db.database import _adapt_query, _json_serialize, _run_write
+
+        sources = [{"page_content": d.page_content, "metadata": d.metadata} for d in entry.sources]
+        embedding = entry.embedding.tobytes() if entry.embedding is not None else None
+        params = (
+            namespace, key, entry.question, entry.answer, _json_serialize(sources), embedding,
+            datetime.utcnow().replace(microsecond=0),
+        )
+        _run_write(lambda cur: cur.execute(_adapt_query(
+            f"INSERT INTO answer_cache (namespace, {_COLUMNS}) VALUES (%s, %s, %s, %s, %s, %s, %s) "
+            "ON CONFLICT (namespace, question_key) DO UPDATE SET "
+            "question = excluded.question, answer = excluded.answer, sources = excluded.sources, "
+            "embedding = excluded.embedding, created_at = excluded.created_at"
+        ), params))
+
+    def generation(self) -> int:
+        """Purge counter; a change means another process purged answers."""
+        from db.database import get_connection
+
+        with get_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT generation FROM answer_cache_generation WHERE id = 1")
+            row = cur.fetchone()
+        return row[0] if row else 0
+
+    def purge(self, namespace: Optional[str] = None) -> int:
+        """Delete every answer, or one namespace's, and bump the generation; returns rows removed."""
+        from db.database import _adapt_query, _run_write
+
+        def write(cur):
+            if namespace is None:
+                cur.execute("DELETE FROM answer_cache")
+            else:
+                cur.execute(_adapt_query("DELETE FROM answer_cache WHERE namespace = %s"), (namespace,))
+            count = cur.rowcount
+            cur.execute("UPDATE answer_cache_generation SET generation = generation + 1 WHERE id = 1")
+            return count
+
+        count = _run_write(write)
+        logger.info(f"Purged {count} cached answers")
+        return count
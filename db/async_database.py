@@ -0,0 +1,598 @@
+"""
+Async mirror of the db.database data-access API.
+
+Same functions, names and return shapes as the sync module, as coroutines,
+for asyncio front-ends: asyncpg on Postgres, aiosqlite on SQLite. Queries
+are :class:`db.query.Query` objects compiled at import time, so each call
+only picks the ``$n`` or ``?`` form. JSON columns behave as in the sync
+layer: Postgres JSONB goes through a json codec on every pooled
+connection, SQLite stores JSON text and decodes it on read.
+
+The schema is still created by the sync init_database()/run_migrations().
+The user cache is shared with db.database, so invalidations from either
+side apply to both. Timings go to the same query metrics (db.instrumentation)
+as the sync layer.
+
+Pools:
+* Postgres: an asyncpg pool sized by DB_POOL_MIN / DB_POOL_MAX.
+* SQLite: ASYNC_SQLITE_CONNECTIONS aiosqlite connections with the sync
+  layer's pragmas. Writes also hold one asyncio lock, mirroring the sync
+  writer thread, so coroutines never race for SQLite's database lock.
+"""
+
+import time
+import asyncio
+import sqlite3
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    asyncpg = None
+    ASYNCPG_AVAILABLE = False
+
+try:
+    import aiosqlite
+    AIOSQLITE_AVAILABLE = True
+except ImportError:
+    aiosqlite = None
+    AIOSQLITE_AVAILABLE = False
+
+from core.settings import settings
+from core.metrics import get_registry
+from core.safe_logging import mask_identifier
+from db.bulk import chunked
+from db.query import Query
+from db.serialization import dumps, json_rows, loads
+from db.instrumentation import QUERY_ERRORS, QUERY_SECONDS, query_template, record_pool_wait
+from db.database import (
+    ANALYTICS_COLUMNS, AUDIT_COLUMNS, CHAT_COLUMNS,
+    _decode_chat_rows, _decode_cursor, _encode_cursor, _invalidate_cached_user,
+    _json_text, _user_cache, sqlite_pragmas,
+)
+from db.partitions import insert_target, is_partitioned, relation_for_range
+
+logger = logging.getLogger(__name__)
+
+_pg_pool = None
+_sqlite_pool: Optional["AsyncSQLitePool"] = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+
+# ----------------------------------------------------------------------
+# Pools
+# ----------------------------------------------------------------------
+
+class AsyncSQLitePool:
+    """
+    Fixed set of aiosqlite connections (each runs on its own thread).
+
+    Args:
+        path: Database file
+        size: Number of connections
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle: "asyncio.Queue" = asyncio.Queue()
+        self._write_lock = asyncio.Lock()
+        self._connections: List[Any] = []
+
+    async def open(self) -> "AsyncSQLitePool":
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(
+                self.path,
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                timeout=settings.SQLITE_BUSY_TIMEOUT / 1000.0,
+            )
+            conn.row_factory = sqlite3.Row
+            for pragma in sqlite_pragmas():
+                await conn.execute(pragma)
+            self._connections.append(conn)
+            self._idle.put_nowait(conn)
+        return self
+
+    @asynccontextmanager
+    async def acquire(self, write: bool = False) -> AsyncIterator[Any]:
+        """A free connection; ``write`` also takes the process-wide write lock."""
+        started = time.perf_counter()
+        conn = await self._idle.get()
+        try:
+            if write:
+                async with self._write_lock:
+                    record_pool_wait(time.perf_counter() - started, "aiosqlite")
+                    yield conn
+            else:
+                record_pool_wait(time.perf_counter() - started, "aiosqlite")
+                yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self) -> None:
+        for conn in self._connections:
+            await conn.close()
+        self._connections.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"size": self.size, "idle": self._idle.qsize(), "write_locked": self._write_lock.locked()}
+
+
+async def _init_pg_connection(conn) -> None:
+    for json_type in ("json", "jsonb"):
+        await conn.set_type_codec(json_type, encoder=dumps, decoder=loads, schema="pg_catalog")
+
+
+async def init_async_pool() -> None:
+    """Create the pool for DB_TYPE (idempotent; call from the event loop that will use it)."""
+    global _pg_pool, _sqlite_pool, _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if settings.DB_TYPE == "postgres":
+            if _pg_pool is not None:
+                return
+            if not ASYNCPG_AVAILABLE:
+                raise ImportError("asyncpg is required for the async 'postgres' backend")
+            _pg_pool = await asyncpg.create_pool(
+                host=settings.DB_HOST,
+                port=int(settings.DB_PORT),
+                database=settings.DB_NAME,
+                user=settings.DB_USER,
+                password=settings.DB_PASSWORD,
+                min_size=settings.DB_POOL_MIN,
+                max_size=settings.DB_POOL_MAX,
+                max_inactive_connection_lifetime=settings.DB_POOL_MAX_LIFETIME,
+                timeout=5,
+                init=_init_pg_connection,
+            )
+            logger.info("asyncpg connection pool initialized")
+        else:
+            if _sqlite_pool is not None:
+                return
+            if not AIOSQLITE_AVAILABLE:
+                raise ImportError("aiosqlite is required for the async 'sqlite' backend")
+            _sqlite_pool = await AsyncSQLitePool(
+                settings.SQLITE_DB_PATH, settings.ASYNC_SQLITE_CONNECTIONS
+            ).open()
+            logger.info("aiosqlite connection pool initialized")
+
+
+async def close_async_pool() -> None:
+    """Close every pooled connection."""
+    global _pg_pool, _sqlite_pool
+    if _pg_pool is not None:
+        await _pg_pool.close()
+        _pg_pool = None
+    if _sqlite_pool is not None:
+        await _sqlite_pool.close()
+        _sqlite_pool = None
+
+
+def get_async_pool_metrics() -> Dict[str, Any]:
+    """Pool size and idle connections, empty before the pool exists."""
+    if _pg_pool is not None:
+        return {"size": _pg_pool.get_size(), "idle": _pg_pool.get_idle_size(),
+                "min": _pg_pool.get_min_size(), "max": _pg_pool.get_max_size()}
+    if _sqlite_pool is not None:
+        return _sqlite_pool.metrics()
+    return {}
+
+
+@asynccontextmanager
+async def _pg_acquire() -> AsyncIterator[Any]:
+    await init_async_pool()
+    started = time.perf_counter()
+    async with _pg_pool.acquire(timeout=settings.DB_POOL_TIMEOUT) as conn:
+        record_pool_wait(time.perf_counter() - started, "asyncpg")
+        yield conn
+
+
+@asynccontextmanager
+async def _sqlite_acquire(write: bool = False) -> AsyncIterator[Any]:
+    await init_async_pool()
+    async with _sqlite_pool.acquire(write=write) as conn:
+        yield conn
+
+
+# ----------------------------------------------------------------------
+# Execution helpers
+# ----------------------------------------------------------------------
+
+async def _timed(query: Query, awaitable):
+    template = query_template(query.text)
+    registry = get_registry()
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    except Exception:
+        registry.increment(QUERY_ERRORS, template)
+        raise
+    finally:
+        registry.observe(QUERY_SECONDS, template, time.perf_counter() - started)
+
+
+def _is_pg() -> bool:
+    return settings.DB_TYPE == "postgres"
+
+
+def _timestamp(value: Any) -> Any:
+    """asyncpg needs datetime objects where the sync layer passes ISO strings."""
+    if _is_pg() and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _json_param(data: Any) -> Any:
+    # The Postgres codec serialises; SQLite stores text
+    return data if _is_pg() else _json_text(data)
+
+
+async def _fetch(query: Query, *args) -> List[Dict[str, Any]]:
+    if _is_pg():
+        async with _pg_acquire() as conn:
+            rows = await _timed(query, conn.fetch(query.numbered, *args))
+        return [dict(r) for r in rows]
+    async with _sqlite_acquire() as conn:
+        cur = await _timed(query, conn.execute(query.qmark, args))
+        rows = await cur.fetchall()
+        await cur.close()
+    return [dict(r) for r in rows]
+
+
+@lru_cache(maxsize=None)
+def _returning_id(query: Query) -> Query:
+    return query + "RETURNING id"
+
+
+def _rowcount(status: str) -> int:
+    # asyncpg returns the command tag, e.g. "UPDATE 3"
+    try:
+        return int(status.rsplit(" ", 1)[-1])
+    except (ValueError, AttributeError):
+        return 0
+
+
+class _Transaction:
+    """Backend-neutral statement helpers inside one transaction."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def execute(self, query: Query, *args) -> int:
+        """Run a statement; returns the affected row count."""
+        if _is_pg():
+            return _rowcount(await _timed(query, self.conn.execute(query.numbered, *args)))
+        cur = await _timed(query, self.conn.execute(query.qmark, args))
+        count = cur.rowcount
+        await cur.close()
+        return count
+
+    async def insert(self, query: Query, *args) -> int:
+        """Run an INSERT; returns the new row id."""
+        if _is_pg():
+            returning = _returning_id(query)
+            return await _timed(returning, self.conn.fetchval(returning.numbered, *args))
+        cur = await _timed(query, self.conn.execute(query.qmark, args))
+        row_id = cur.lastrowid
+        await cur.close()
+        return row_id
+
+    async def executemany(self, query: Query, rows: List[tuple]) -> None:
+        if _is_pg():
+            await _timed(query, self.conn.executemany(query.numbered, rows))
+        else:
+            await _timed(query, self.conn.executemany(query.qmark, rows))
+
+
+@asynccontextmanager
+async def _transaction() -> AsyncIterator[_Transaction]:
+    """One committed transaction (rolled back if the block raises)."""
+    if _is_pg():
+        async with _pg_acquire() as conn:
+            async with conn.transaction():
+                yield _Transaction(conn)
+        return
+    async with _sqlite_acquire(write=True) as conn:
+        try:
+            yield _Transaction(conn)
+            await conn.commit()
+        except BaseException:
+            await conn.rollback()
+            raise
+
+
+async def _insert_target(table: str) -> Tuple[str, Optional[str]]:
+    """db.partitions.insert_target off the event loop (it may create a partition)."""
+    if settings.DB_TYPE != "sqlite" or not settings.DB_PARTITIONING:
+        return table, None
+    return await asyncio.to_thread(insert_target, table)
+
+
+# ----------------------------------------------------------------------
+# Users
+# ----------------------------------------------------------------------
+
+_INSERT_USER = Query("INSERT INTO users (username, password_hash, role, email) VALUES (%s, %s, %s, %s)")
+_GET_USER = Query(
+    "SELECT id, username, password_hash, role, email, is_active FROM users WHERE username = %s"
+)
+_UPDATE_LAST_LOGIN = Query("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s")
+_DEACTIVATE_USER = Query("UPDATE users SET is_active = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s")
+
+
+async def add_user(username: str, password_hash: str, role: str, email: Optional[str] = None) -> int:
+    """Add a new user to the database."""
+    async with _transaction() as tx:
+        user_id = await tx.insert(_INSERT_USER, username, password_hash, role, email)
+    _user_cache.pop(username)
+    logger.info(f"User created: {mask_identifier(username, 'user')} (ID: {mask_identifier(str(user_id), 'id')})")
+    return user_id
+
+
+async def get_user(username: str) -> Optional[Dict[str, Any]]:
+    """Get user by username (served from the shared user cache when fresh)."""
+    cached = _user_cache.get(username)
+    if cached is not None:
+        return dict(cached)
+    rows = await _fetch(_GET_USER, username)
+    if not rows:
+        return None
+    _user_cache.set(username, rows[0])
+    return dict(rows[0])
+
+
+async def update_last_login(user_id: int) -> None:
+    """Update user's last login timestamp."""
+    async with _transaction() as tx:
+        await tx.execute(_UPDATE_LAST_LOGIN, user_id)
+    _invalidate_cached_user(user_id)
+
+
+async def deactivate_user(user_id: int) -> bool:
+    """Deactivate a user account and revoke its sessions."""
+    from db.sessions import revoke_user_sessions
+
+    async with _transaction() as tx:
+        updated = await tx.execute(_DEACTIVATE_USER, False, user_id) > 0
+    _invalidate_cached_user(user_id)
+    # Sessions keep their own token cache and counter; reuse the sync service
+    await asyncio.to_thread(revoke_user_sessions, user_id)
+    if updated:
+        logger.info(f"User deactivated (ID: {mask_identifier(str(user_id), 'id')})")
+    return updated
+
+
+# ----------------------------------------------------------------------
+# Chat history
+# ----------------------------------------------------------------------
+
+_INSERT_CHAT = Query(
+    "INSERT INTO chat_history (user_id, session_id, role, content, metadata) VALUES (%s, %s, %s, %s, %s)"
+)
+_CHAT_HISTORY = Query("""
+    SELECT id, role, content, created_at, metadata
+    FROM chat_history
+    WHERE user_id = %s
+    ORDER BY created_at DESC, id DESC
+    LIMIT %s OFFSET %s
+""")
+_CHAT_PAGE_FIRST = Query("""
+    SELECT id, role, content, created_at, metadata
+    FROM chat_history
+    WHERE user_id = %s
+    ORDER BY created_at DESC, id DESC LIMIT %s
+""")
+_CHAT_PAGE_AFTER = Query("""
+    SELECT id, role, content, created_at, metadata
+    FROM chat_history
+    WHERE user_id = %s AND (created_at, id) < (%s, %s)
+    ORDER BY created_at DESC, id DESC LIMIT %s
+""")
+_CHAT_HISTORIES_PG = Query("""
+    SELECT u.user_id, h.id, h.role, h.content, h.created_at, h.metadata
+    FROM unnest(%s::int[]) AS u(user_id)
+    CROSS JOIN LATERAL (
+        SELECT id, role, content, created_at, metadata
+        FROM chat_history
+        WHERE user_id = u.user_id
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    ) h
+""")
+_CLEAR_CHAT = Query("DELETE FROM chat_history WHERE user_id = %s")
+
+
+@lru_cache(maxsize=64)
+def _chat_histories_sqlite(users: int) -> Query:
+    arm = (
+        "SELECT * FROM (SELECT user_id, id, role, content, created_at, metadata "
+        "FROM chat_history WHERE user_id = %s ORDER BY created_at DESC, id DESC LIMIT %s)"
+    )
+    return Query(" UNION ALL ".join(arm for _ in range(users)))
+
+
+async def save_chat_message(
+    user_id: int,
+    role: str,
+    content: str,
+    session_id: Optional[int] = None,
+    metadata: Optional[Dict] = None,
+) -> int:
+    """Save a chat message to the database."""
+    async with _transaction() as tx:
+        return await tx.insert(_INSERT_CHAT, user_id, session_id, role, content, _json_param(metadata))
+
+
+async def get_chat_history(user_id: int, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+    """Get chat history for a user (newest first)."""
+    return _decode_chat_rows(await _fetch(_CHAT_HISTORY, user_id, limit, offset))
+
+
+async def get_chat_history_page(
+    user_id: int, limit: int = 50, cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One keyset page of chat history; see db.database.get_chat_history_page."""
+    if cursor:
+        created_at, row_id = _decode_cursor(cursor)
+        rows = await _fetch(_CHAT_PAGE_AFTER, user_id, _timestamp(created_at), row_id, limit + 1)
+    else:
+        rows = await _fetch(_CHAT_PAGE_FIRST, user_id, limit + 1)
+    rows = _decode_chat_rows(rows)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(last["created_at"], last["id"])
+    return rows, next_cursor
+
+
+async def get_chat_histories(user_ids: Iterable[int], limit: int = 100) -> Dict[int, List[Dict[str, Any]]]:
+    """Latest ``limit`` messages of each user in one round trip (newest first)."""
+    ids = list(dict.fromkeys(int(u) for u in user_ids))
+    histories: Dict[int, List[Dict[str, Any]]] = {u: [] for u in ids}
+    if not ids:
+        return histories
+
+    if _is_pg():
+        rows = await _fetch(_CHAT_HISTORIES_PG, ids, limit)
+    else:
+        rows = []
+        for batch in chunked(ids, 200):
+            query = _chat_histories_sqlite(len(batch))
+            rows.extend(await _fetch(query, *[p for user_id in batch for p in (user_id, limit)]))
+
+    for row in _decode_chat_rows(rows):
+        histories[row.pop("user_id")].append(row)
+    return histories
+
+
+async def clear_chat_history(user_id: int) -> int:
+    """Clear all chat history for a user."""
+    async with _transaction() as tx:
+        return await tx.execute(_CLEAR_CHAT, user_id)
+
+
+# ----------------------------------------------------------------------
+# Audit and analytics events
+# ----------------------------------------------------------------------
+
+@lru_cache(maxsize=64)
+def _insert_query(table: str, columns: Tuple[str, ...], default_created_at: bool = True) -> Query:
+    placeholders = ["%s"] * len(columns)
+    if default_created_at and columns[-1] == "created_at":
+        placeholders[-1] = "COALESCE(%s, CURRENT_TIMESTAMP)"
+    return Query(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(placeholders)})")
+
+
+async def log_audit_event(
+    user_id: Optional[int],
+    action: str,
+    resource_type: Optional[str] = None,
+    resource_id: Optional[str] = None,
+    changes: Optional[Dict] = None,
+    ip_address: Optional[str] = None,
+) -> int:
+    """Log an audit event."""
+    table, created_at = await _insert_target("audit_logs")
+    async with _transaction() as tx:
+        return await tx.insert(
+            _insert_query(table, AUDIT_COLUMNS),
+            user_id, action, resource_type, resource_id, _json_param(changes), ip_address,
+            _timestamp(created_at),
+        )
+
+
+async def log_analytics_event(
+    user_id: int, event_type: str, event_name: str, data: Optional[Dict] = None
+) -> int:
+    """Log an analytics event."""
+    table, created_at = await _insert_target("analytics_events")
+    async with _transaction() as tx:
+        return await tx.insert(
+            _insert_query(table, ANALYTICS_COLUMNS),
+            user_id, event_type, event_name, _json_param(data), _timestamp(created_at),
+        )
+
+
+async def _bulk_write(table: str, columns: Tuple[str, ...], rows: Iterable[tuple]) -> int:
+    """
+    Insert rows (created_at last, None for the default) in chunks of
+    BULK_CHUNK_ROWS, one transaction each; asyncpg pipelines executemany.
+
+    Partitioned SQLite needs per-month routing, which only the sync layer
+    implements, so that case runs db.database's bulk path in a thread.
+    """
+    if settings.DB_TYPE == "sqlite" and is_partitioned(table):
+        from db import database
+
+        return await asyncio.to_thread(database._bulk_write, table, columns, list(rows))
+
+    query = _insert_query(table, columns)
+    total = 0
+    for chunk in chunked(rows, settings.BULK_CHUNK_ROWS):
+        if _is_pg():
+            chunk = [row[:-1] + (_timestamp(row[-1]),) for row in chunk]
+        async with _transaction() as tx:
+            await tx.executemany(query, chunk)
+        total += len(chunk)
+    return total
+
+
+async def bulk_save_chat_messages(messages: Iterable[Dict[str, Any]]) -> int:
+    """Save many chat messages; see db.database.bulk_save_chat_messages."""
+    return await _bulk_write("chat_history", CHAT_COLUMNS, (
+        (m["user_id"], m.get("session_id"), m["role"], m["content"],
+         _json_param(m.get("metadata")), m.get("created_at"))
+        for m in messages
+    ))
+
+
+async def bulk_log_audit_events(events: Iterable[Dict[str, Any]]) -> int:
+    """Log many audit events; see db.database.bulk_log_audit_events."""
+    return await _bulk_write("audit_logs", AUDIT_COLUMNS, (
+        (e.get("user_id"), e["action"], e.get("resource_type"), e.get("resource_id"),
+         _json_param(e.get("changes")), e.get("ip_address"), e.get("created_at"))
+        for e in events
+    ))
+
+
+async def bulk_log_analytics_events(events: Iterable[Dict[str, Any]]) -> int:
+    """Log many analytics events; see db.database.bulk_log_analytics_events."""
+    return await _bulk_write("analytics_events", ANALYTICS_COLUMNS, (
+        (e["user_id"], e["event_type"], e["event_name"], _json_param(e.get("data")), e.get("created_at"))
+        for e in events
+    ))
+
+
+@lru_cache(maxsize=256)
+def _audit_logs_query(relation: str, by_user: bool, since: bool, until: bool) -> Query:
+    query = f"SELECT * FROM {relation} WHERE 1=1"
+    if by_user:
+        query += " AND user_id = %s"
+    if since:
+        query += " AND created_at >= %s"
+    if until:
+        query += " AND created_at <= %s"
+    return Query(query + " ORDER BY created_at DESC LIMIT %s")
+
+
+async def get_audit_logs(
+    user_id: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """Get audit logs with optional filtering."""
+    relation = relation_for_range("audit_logs", start_date, end_date)
+    query = _audit_logs_query(relation, bool(user_id), bool(start_date), bool(end_date))
+    params: List[Any] = [user_id] if user_id else []
+    params += [_timestamp(d) for d in (start_date, end_date) if d]
+    rows = await _fetch(query, *params, limit)
+    return rows if _is_pg() else json_rows(rows, ("changes",))
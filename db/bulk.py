@@ -0,0 +1,78 @@
+"""
+Helpers for the bulk data-access functions in db.database.
+
+Postgres batches are streamed through ``COPY ... FROM STDIN`` in text
+format: rows are encoded lazily as the driver reads, so a batch is never
+held twice in memory and there is no per-row statement overhead.
+"""
+
+import io
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, List, Sequence, TypeVar
+
+T = TypeVar("T")
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_text_value(value: Any) -> str:
+    """Encode one value for COPY text format (NULL is ``\\N``)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    return str(value).translate(_ESCAPES)
+
+
+def copy_text_row(row: Sequence[Any]) -> str:
+    """One COPY text line: tab-separated, newline-terminated."""
+    return "\t".join(copy_text_value(v) for v in row) + "\n"
+
+
+class CopyStream(io.TextIOBase):
+    """Read-only file object yielding COPY text for ``rows`` on demand."""
+
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self._rows = iter(rows)
+        self._buffer = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        if size is None or size < 0:
+            data = self._buffer + "".join(copy_text_row(row) for row in self._rows)
+            self._buffer = ""
+            return data
+        parts = [self._buffer]
+        length = len(self._buffer)
+        for row in self._rows:
+            line = copy_text_row(row)
+            parts.append(line)
+            length += len(line)
+            if length >= size:
+                break
+        data = "".join(parts)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(cur, table: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> None:
+    """``COPY table (columns) FROM STDIN`` from ``rows`` on a psycopg2 cursor."""
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", CopyStream(rows))
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Split ``items`` into lists of at most ``size`` (input may be a generator)."""
+    chunk: List[T] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,243 @@
+"""
+Full-text search over chat history.
+
+SQLite: an FTS5 index (``chat_history_fts``) in external-content mode, so
+message text is stored once, in chat_history. Each entry also carries a
+``user_key`` token ("u<user_id>"); MATCH restricts on it inside the index,
+so one user's search never walks other users' postings. Triggers keep the
+index in sync on insert, update and delete.
+
+Postgres: a ``content_tsv`` column kept in sync by a BEFORE INSERT/UPDATE
+trigger, with a GIN index. Adding the column and trigger is catalog-only;
+existing rows are filled in batches and the index is built concurrently by
+migration 004 in db.db_migrations, so large tables stay writable throughout.
+
+Both rank by relevance (bm25 / ts_rank_cd) and return highlighted snippets.
+"""
+
+import re
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "chat_history_fts"
+TS_CONFIG = "english"
+TSV_EXPRESSION = f"to_tsvector('{TS_CONFIG}', content)"
+
+# Words, optionally ending in * for prefix search; everything else is dropped
+# so user input can never inject FTS5 query syntax.
+_TERM = re.compile(r"[\w']+\*?", re.UNICODE)
+
+_fts5_available: Optional[bool] = None
+
+
+def _user_key(user_id: int) -> str:
+    return f"u{int(user_id)}"
+
+
+def ensure_chat_search_index(cur) -> None:
+    """
+    Create the full-text index and its sync triggers (idempotent).
+
+    On SQLite the FTS5 index is built from existing rows the first time. On
+    Postgres only the column and trigger are created; the backfill and GIN
+    index are separate migration steps.
+    """
+    global _fts5_available
+    if settings.DB_TYPE == "postgres":
+        cur.execute("ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS content_tsv tsvector")
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION chat_history_tsv_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.content_tsv := to_tsvector('{TS_CONFIG}', NEW.content);
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        cur.execute("DROP TRIGGER IF EXISTS chat_history_tsv ON chat_history")
+        cur.execute(
+            "CREATE TRIGGER chat_history_tsv BEFORE INSERT OR UPDATE OF content ON chat_history "
+            "FOR EACH ROW EXECUTE FUNCTION chat_history_tsv_update()"
+        )
+        return
+
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,))
+    exists = cur.fetchone() is not None
+    try:
+        # External content: FTS5 reads text back from this view for snippets
+        cur.execute(
+            "CREATE VIEW IF NOT EXISTS chat_history_fts_source AS "
+            "SELECT id, content, 'u' || user_id AS user_key FROM chat_history"
+        )
+        cur.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "content, user_key, content='chat_history_fts_source', content_rowid='id', "
+            "tokenize='porter unicode61')"
+        )
+    except Exception as e:
+        if "fts5" not in str(e).lower():
+            raise
+        _fts5_available = False
+        logger.warning("SQLite FTS5 not available; chat search falls back to LIKE scans")
+        return
+    _fts5_available = True
+
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_history_fts_insert AFTER INSERT ON chat_history BEGIN
+            INSERT INTO {FTS_TABLE} (rowid, content, user_key)
+            VALUES (new.id, new.content, 'u' || new.user_id);
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_history_fts_delete AFTER DELETE ON chat_history BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, content, user_key)
+            VALUES ('delete', old.id, old.content, 'u' || old.user_id);
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_history_fts_update AFTER UPDATE OF content, user_id ON chat_history BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, content, user_key)
+            VALUES ('delete', old.id, old.content, 'u' || old.user_id);
+            INSERT INTO {FTS_TABLE} (rowid, content, user_key)
+            VALUES (new.id, new.content, 'u' || new.user_id);
+        END
+    """)
+    if not exists:
+        cur.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+        logger.info("Built chat history full-text index")
+
+
+def drop_chat_search_index(cur) -> None:
+    """Remove the full-text index, triggers and (Postgres) tsvector column."""
+    global _fts5_available
+    if settings.DB_TYPE == "postgres":
+        cur.execute("DROP TRIGGER IF EXISTS chat_history_tsv ON chat_history")
+        cur.execute("DROP FUNCTION IF EXISTS chat_history_tsv_update()")
+        cur.execute("DROP INDEX IF EXISTS idx_chat_content_tsv")
+        cur.execute("ALTER TABLE chat_history DROP COLUMN IF EXISTS content_tsv")
+        return
+    for trigger in ("insert", "delete", "update"):
+        cur.execute(f"DROP TRIGGER IF EXISTS chat_history_fts_{trigger}")
+    cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    cur.execute("DROP VIEW IF EXISTS chat_history_fts_source")
+    _fts5_available = None
+
+
+def _sqlite_fts_ready(cur) -> bool:
+    """Whether the FTS5 index exists (looked up once per process)."""
+    global _fts5_available
+    if _fts5_available is None:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,))
+        _fts5_available = cur.fetchone() is not None
+    return _fts5_available
+
+
+def fts5_match_expression(user_id: int, query: str) -> Optional[str]:
+    """
+    FTS5 MATCH string for ``query`` scoped to one user, or None if it has no terms.
+
+    Every term is quoted (implicit AND); a trailing ``*`` keeps prefix search.
+    """
+    terms = []
+    for term in _TERM.findall(query):
+        prefix = term.endswith("*")
+        word = term.rstrip("*").replace('"', "")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    if not terms:
+        return None
+    return f'user_key:"{_user_key(user_id)}" AND content:({" ".join(terms)})'
+
+
+def search_chat_history(
+    user_id: int,
+    query: str,
+    limit: int = 20,
+    since: Optional[str] = None,
+    highlight: Tuple[str, str] = ("<mark>", "</mark>"),
+) -> List[Dict[str, Any]]:
+    """
+    Ranked full-text search over one user's chat messages.
+
+    Args:
+        user_id: Owner of the messages
+        query: Free text; words are ANDed, ``word*`` matches prefixes
+        limit: Maximum results
+        since: Only messages created at or after this timestamp/date
+        highlight: Markers placed around matched terms in ``snippet``
+            (message text itself is not escaped)
+
+    Returns:
+        Dicts with id, role, content, created_at, snippet and rank (higher
+        is more relevant), best match first.
+    """
+    from db.database import get_connection, _adapt_query
+
+    if not query or not query.strip():
+        return []
+
+    with get_connection() as conn:
+        if settings.DB_TYPE == "postgres":
+            from psycopg2.extras import RealDictCursor
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            # Rank first, then build headlines only for the rows returned
+            date_filter = " AND created_at >= %s" if since else ""
+            params: List[Any] = [query, user_id] + ([since] if since else []) + [limit]
+            cur.execute(f"""
+                SELECT id, role, content, created_at, rank,
+                       ts_headline('{TS_CONFIG}', content, q,
+                           'StartSel=' || %s || ', StopSel=' || %s || ', MaxFragments=2, MaxWords=24, MinWords=8'
+                       ) AS snippet
+                FROM (
+                    SELECT id, role, content, created_at, q, ts_rank_cd(content_tsv, q) AS rank
+                    FROM chat_history, websearch_to_tsquery('{TS_CONFIG}', %s) q
+                    WHERE user_id = %s AND content_tsv @@ q{date_filter}
+                    ORDER BY rank DESC, created_at DESC
+                    LIMIT %s
+                ) hits
+                ORDER BY rank DESC, created_at DESC
+            """, [highlight[0], highlight[1]] + params)
+            return [dict(r) for r in cur.fetchall()]
+
+        cur = conn.cursor()
+        if not _sqlite_fts_ready(cur):
+            return _like_search(cur, user_id, query, limit, since)
+
+        match = fts5_match_expression(user_id, query)
+        if match is None:
+            return []
+        date_filter = " AND ch.created_at >= %s" if since else ""
+        params = [highlight[0], highlight[1], match] + ([since] if since else []) + [limit]
+        # bm25 is lower-is-better; negate so rank matches Postgres semantics
+        cur.execute(_adapt_query(f"""
+            SELECT ch.id, ch.role, ch.content, ch.created_at,
+                   -bm25({FTS_TABLE}, 1.0, 0.0) AS rank,
+                   snippet({FTS_TABLE}, 0, %s, %s, '…', 16) AS snippet
+            FROM {FTS_TABLE}
+            JOIN chat_history ch ON ch.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s{date_filter}
+            ORDER BY bm25({FTS_TABLE}, 1.0, 0.0), ch.created_at DESC
+            LIMIT %s
+        """), params)
+        return [dict(r) for r in cur.fetchall()]
+
+
+def _like_search(cur, user_id: int, query: str, limit: int, since: Optional[str]) -> List[Dict[str, Any]]:
+    """Unranked substring search used when the FTS5 index is unavailable."""
+    words = [t.rstrip("*") for t in _TERM.findall(query)]
+    if not words:
+        return []
+    clauses = " AND ".join("content LIKE ?" for _ in words)
+    params: List[Any] = [user_id] + [f"%{w}%" for w in words]
+    if since:
+        clauses += " AND created_at >= ?"
+        params.append(since)
+    cur.execute(
+        f"SELECT id, role, content, created_at FROM chat_history "
+        f"WHERE user_id = ? AND {clauses} ORDER BY created_at DESC LIMIT ?",
+        params + [limit],
+    )
+    return [dict(r, rank=0.0, snippet=r["content"][:200]) for r in cur.fetchall()]
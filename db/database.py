@@ -7,11 +7,13 @@ for chat history, users, sessions, and audit logs.
 
 import os
 import json
+import base64
 import logging
 import sqlite3
 import threading
-from datetime import datetime, date
-from typing import Optional, List, Dict, Any, Generator, Tuple
+import time
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Dict, Any, Callable, Generator, Iterable, Tuple
 from contextlib import contextmanager
 
 try:
@@ -27,53 +29,218 @@ except ImportError:
 
 from core.settings import settings
 from core.safe_logging import mask_identifier, log_exception_safe
+from core.cache import TTLCache
+from db.pool import BoundedConnectionPool, PoolTimeoutError
+from db.sqlite_writer import SQLiteWriter
+from db.instrumentation import instrument_connection, record_pool_wait
+from db.replicas import ReplicaRouter, parse_replicas
+from db.bulk import chunked, copy_rows
+from db.serialization import dumps, json_rows, pg_json, register_psycopg2
+from db.chat_search import search_chat_history  # noqa: F401 (re-export)
+from db.sessions import revoke_user_sessions
+from db.partitions import (
+    create_partitioned_table, insert_target, is_partitioned, relation_for_range,
+    split_by_partition,
+)
 
 logger = logging.getLogger(__name__)
 
 # Connection pool for Postgres (initialized on first use)
-_pg_pool = None
+_pg_pool: Optional[BoundedConnectionPool] = None
+_pg_pool_lock = threading.Lock()
+
+# Read replicas for get_connection(readonly=True), when DB_READ_REPLICAS is set
+_replica_router: Optional[ReplicaRouter] = None
+
+# In-process cache of get_user() results, keyed by username
+_user_cache = TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+
+# Single writer thread for SQLite (started on first write)
+_sqlite_writer: Optional[SQLiteWriter] = None
+_sqlite_writer_lock = threading.Lock()
 
 # Thread-local storage for SQLite connections (since they can't be shared across threads easily)
 _local_sqlite = threading.local()
+# Every open reader connection, so close_connection_pool() can close them from
+# any thread; bumping the generation makes threads reconnect on next use
+_sqlite_conns: List[sqlite3.Connection] = []
+_sqlite_conns_lock = threading.Lock()
+_sqlite_generation = 0
+
+def sqlite_pragmas() -> List[str]:
+    """PRAGMA statements applied to every SQLite connection (sync and async)."""
+    # WAL lets readers proceed while a write is in progress; with it,
+    # synchronous=NORMAL only fsyncs at checkpoints and stays crash-safe.
+    return [
+        f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT)}",
+        f"PRAGMA cache_size = -{int(settings.SQLITE_CACHE_SIZE_KB)}",
+        f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+
+def _sqlite_connect() -> sqlite3.Connection:
+    """Open a SQLite connection with the configured pragmas applied."""
+    conn = sqlite3.connect(
+        settings.SQLITE_DB_PATH, 
+        check_same_thread=False,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=settings.SQLITE_BUSY_TIMEOUT / 1000.0,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in sqlite_pragmas():
+        conn.execute(pragma)
+    return instrument_connection(conn)
 
 def _get_sqlite_conn():
     """Get thread-local SQLite connection."""
-    if not hasattr(_local_sqlite, "conn"):
-        _local_sqlite.conn = sqlite3.connect(
-            settings.SQLITE_DB_PATH, 
-            check_same_thread=False,
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        _local_sqlite.conn.row_factory = sqlite3.Row
+    if getattr(_local_sqlite, "generation", None) != _sqlite_generation:
+        conn = _sqlite_connect()
+        with _sqlite_conns_lock:
+            _sqlite_conns.append(conn)
+            _local_sqlite.generation = _sqlite_generation
+        _local_sqlite.conn = conn
     return _local_sqlite.conn
 
+def _close_sqlite_connections() -> None:
+    """Close every thread's SQLite reader connection; threads reconnect on next use."""
+    global _sqlite_generation
+    with _sqlite_conns_lock:
+        _sqlite_generation += 1
+        conns = list(_sqlite_conns)
+        _sqlite_conns.clear()
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+def _get_sqlite_writer() -> Optional[SQLiteWriter]:
+    """The process-wide SQLite writer thread, or None when disabled."""
+    global _sqlite_writer
+    if settings.DB_TYPE != "sqlite" or not settings.SQLITE_WRITER_THREAD:
+        return None
+    if _sqlite_writer is None:
+        with _sqlite_writer_lock:
+            if _sqlite_writer is None:
+                _sqlite_writer = SQLiteWriter(_sqlite_connect).start()
+    return _sqlite_writer
+
+def _run_write(job: Callable[[Any], Any]) -> Any:
+    """
+    Run ``job(cursor)`` as a committed write and return its result.
+
+    On SQLite with SQLITE_WRITER_THREAD the job runs on the single writer
+    thread (serialised, group-committed); otherwise it runs inline in its
+    own transaction. Jobs must not call back into get_connection().
+    """
+    writer = _get_sqlite_writer()
+    if writer is not None:
+        return writer.execute(job)
+    with get_connection() as conn:
+        return job(conn.cursor())
+
+def get_sqlite_writer_metrics() -> Dict[str, Any]:
+    """Return SQLite writer-thread counters, empty when it is not in use."""
+    if _sqlite_writer is None:
+        return {}
+    return _sqlite_writer.metrics()
+
+def _pg_connect(host: Optional[str] = None, port: Optional[str] = None):
+    """Open a new PostgreSQL connection from settings (to the primary unless host/port are given)."""
+    return psycopg2.connect(
+        host=host or settings.DB_HOST,
+        port=port or settings.DB_PORT,
+        database=settings.DB_NAME,
+        user=settings.DB_USER,
+        password=settings.DB_PASSWORD,
+        connect_timeout=5,
+    )
+
+def _create_replica_router() -> Optional[ReplicaRouter]:
+    """Router over DB_READ_REPLICAS; replica pools open connections lazily."""
+    replicas = parse_replicas(settings.DB_READ_REPLICAS, settings.DB_PORT)
+    if not replicas:
+        return None
+    return ReplicaRouter(
+        [
+            (f"{host}:{port}", BoundedConnectionPool(
+                lambda host=host, port=port: _pg_connect(host, port),
+                0,
+                settings.DB_REPLICA_POOL_MAX,
+                acquire_timeout=settings.DB_REPLICA_ACQUIRE_TIMEOUT,
+                max_lifetime=settings.DB_POOL_MAX_LIFETIME,
+                health_check_interval=settings.DB_POOL_HEALTHCHECK_INTERVAL,
+            ))
+            for host, port in replicas
+        ],
+        max_lag=settings.DB_REPLICA_MAX_LAG,
+        check_interval=settings.DB_REPLICA_CHECK_INTERVAL,
+    )
+
 def init_connection_pool():
-    """Initialize the PostgreSQL connection pool if needed."""
-    global _pg_pool
+    """Initialize the PostgreSQL connection pool (and replica router) if needed."""
+    global _pg_pool, _replica_router
     if settings.DB_TYPE == "postgres":
         if not PSYCOPG2_AVAILABLE:
             raise ImportError("psycopg2 is required for 'postgres' DB_TYPE")
             
         if _pg_pool is None:
-            try:
-                _pg_pool = psycopg2.pool.SimpleConnectionPool(
-                    settings.DB_POOL_MIN,
-                    settings.DB_POOL_MAX,
-                    host=settings.DB_HOST,
-                    port=settings.DB_PORT,
-                    database=settings.DB_NAME,
-                    user=settings.DB_USER,
-                    password=settings.DB_PASSWORD,
-                    connect_timeout=5,
-                )
-                logger.info("PostgreSQL connection pool initialized successfully")
-            except Exception as e:
-                log_exception_safe(logger, "Failed to initialize PG pooling", e)
-                raise
+            with _pg_pool_lock:
+                if _pg_pool is not None:
+                    return
+                try:
+                    register_psycopg2()
+                    _pg_pool = BoundedConnectionPool(
+                        _pg_connect,
+                        settings.DB_POOL_MIN,
+                        settings.DB_POOL_MAX,
+                        acquire_timeout=settings.DB_POOL_TIMEOUT,
+                        max_lifetime=settings.DB_POOL_MAX_LIFETIME,
+                        health_check_interval=settings.DB_POOL_HEALTHCHECK_INTERVAL,
+                    )
+                    _replica_router = _create_replica_router()
+                    logger.info("PostgreSQL connection pool initialized successfully")
+                except Exception as e:
+                    log_exception_safe(logger, "Failed to initialize PG pooling", e)
+                    raise
+
+def _checkout_pg(readonly: bool, max_lag: Optional[float]) -> Tuple[BoundedConnectionPool, Any, Any]:
+    """(pool, connection, replica) for a Postgres unit of work; replica is None on the primary."""
+    router = _replica_router if readonly else None
+    replica = router.choose(max_lag) if router is not None else None
+    if replica is not None:
+        wait_started = time.perf_counter()
+        try:
+            conn = replica.pool.getconn()
+            record_pool_wait(time.perf_counter() - wait_started, "postgres_replica")
+            router.record_read(replica)
+            return replica.pool, conn, replica
+        except PoolTimeoutError:
+            pass  # busy, not broken: this read goes to the primary
+        except Exception as e:
+            router.mark_down(replica, e)
+    if router is not None:
+        router.record_read(None)
+
+    wait_started = time.perf_counter()
+    conn = _pg_pool.getconn()
+    record_pool_wait(time.perf_counter() - wait_started, "postgres")
+    return _pg_pool, conn, None
 
 @contextmanager
-def get_connection():
-    """Context manager for database connections (Postgres or SQLite)."""
+def get_connection(readonly: bool = False, max_lag: Optional[float] = None):
+    """
+    Context manager for database connections (Postgres or SQLite).
+
+    Args:
+        readonly: The block only reads; on Postgres it may then run on a read
+            replica (DB_READ_REPLICAS), falling back to the primary when none
+            is reachable and within the staleness bound. SQLite ignores it.
+        max_lag: Staleness bound in seconds for this read (default
+            DB_REPLICA_MAX_LAG); 0 accepts only fully caught-up replicas
+    """
     if settings.DB_TYPE == "sqlite":
         conn = _get_sqlite_conn()
         try:
@@ -86,16 +253,34 @@ def get_connection():
     else:
         # Postgres
         init_connection_pool()
-        conn = _pg_pool.getconn()
+        source, conn, replica = _checkout_pg(readonly, max_lag)
+        broken = False
         try:
-            yield conn
+            yield instrument_connection(conn)
             conn.commit()
         except Exception as e:
-            conn.rollback()
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+                if replica is not None:
+                    _replica_router.mark_down(replica)
             log_exception_safe(logger, "Postgres DB error", e)
             raise
         finally:
-            _pg_pool.putconn(conn)
+            source.putconn(conn, close=broken)
+
+def get_pool_metrics() -> Dict[str, Any]:
+    """Return connection pool metrics (in-use, waiters, wait time), empty for SQLite."""
+    if _pg_pool is None:
+        return {}
+    return _pg_pool.metrics()
+
+def get_replica_metrics() -> Dict[str, Any]:
+    """Return per-replica lag, availability and pool metrics, empty without replicas."""
+    if _replica_router is None:
+        return {}
+    return _replica_router.metrics()
 
 def _dict_factory(cursor, row):
     """Custom dict factory for sqlite3 rows to match RealDictCursor behavior."""
@@ -111,105 +296,170 @@ def _adapt_query(query: str) -> str:
     return query
 
 def _json_serialize(data: Any) -> Any:
-    """Serialize data to JSON string if using SQLite, else return object for PG adapter."""
+    """Serialize data to JSON string if using SQLite, else wrap it in the psycopg2 Json adapter."""
     if settings.DB_TYPE == "sqlite":
-        return json.dumps(data) if data is not None else None
-    return json.dumps(data) if data is not None else None # PG usually needs string unless using Json adapter
+        return _json_text(data)
+    return pg_json(data)
+
+def _json_text(data: Any) -> Optional[str]:
+    """JSON text for either backend (bulk rows: COPY takes text, not adapters)."""
+    return dumps(data) if data is not None else None
+
+def partitioned_columns_ddl(table: str) -> str:
+    """Column definitions (excluding id) of audit_logs / analytics_events."""
+    json_type = "TEXT" if settings.DB_TYPE == "sqlite" else "JSONB"
+    if table == "audit_logs":
+        return (
+            "user_id INTEGER REFERENCES users(id), "
+            "action VARCHAR(100) NOT NULL, "
+            "resource_type VARCHAR(50), "
+            "resource_id VARCHAR(100), "
+            f"changes {json_type}, "
+            "created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+            "ip_address VARCHAR(45)"
+        )
+    if table == "analytics_events":
+        return (
+            "user_id INTEGER NOT NULL REFERENCES users(id), "
+            "event_type VARCHAR(50) NOT NULL, "
+            "event_name VARCHAR(100) NOT NULL, "
+            f"data {json_type}, "
+            "created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"
+            # Inserting transaction, the Postgres rollup watermark (db.rollups)
+            + (", txid BIGINT NOT NULL DEFAULT txid_current()" if settings.DB_TYPE == "postgres" else "")
+        )
+    raise ValueError(f"Unknown event table: {table}")
+
+def create_schema(cur) -> None:
+    """
+    Create the baseline tables and indexes (idempotent).
+
+    Indexes added after the baseline are built by db.db_migrations, which
+    can create them online on large existing tables.
+    """
+    # Type Abstractions
+    if settings.DB_TYPE == "sqlite":
+        PK_TYPE = "INTEGER PRIMARY KEY AUTOINCREMENT"
+        JSON_TYPE = "TEXT"
+        BOOL_TYPE = "BOOLEAN" # SQLite connects this to int, but declares fine
+        TS_DEFAULT = "DEFAULT CURRENT_TIMESTAMP"
+    else:
+        PK_TYPE = "SERIAL PRIMARY KEY"
+        JSON_TYPE = "JSONB"
+        BOOL_TYPE = "BOOLEAN"
+        TS_DEFAULT = "DEFAULT CURRENT_TIMESTAMP"
+
+    # Create users table
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS users (
+            id {PK_TYPE},
+            username VARCHAR(50) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            email VARCHAR(100),
+            created_at TIMESTAMP {TS_DEFAULT},
+            updated_at TIMESTAMP {TS_DEFAULT},
+            is_active {BOOL_TYPE} DEFAULT 1,
+            last_login TIMESTAMP
+        )
+    """)
+
+    # Create sessions table
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id {PK_TYPE},
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            session_token VARCHAR(255) UNIQUE NOT NULL,
+            created_at TIMESTAMP {TS_DEFAULT},
+            expires_at TIMESTAMP NOT NULL,
+            ip_address VARCHAR(45),
+            user_agent TEXT,
+            is_active {BOOL_TYPE} DEFAULT 1
+        )
+    """)
+
+    # Create chat_history table
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id {PK_TYPE},
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            session_id INTEGER REFERENCES sessions(id),
+            role VARCHAR(20) NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP {TS_DEFAULT},
+            metadata {JSON_TYPE}
+        )
+    """)
+
+    # Create audit_logs and analytics_events (optionally month-partitioned)
+    for table in ("audit_logs", "analytics_events"):
+        if settings.DB_PARTITIONING:
+            if not is_partitioned(table, cur):
+                create_partitioned_table(cur, table, partitioned_columns_ddl(table))
+        else:
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (id {PK_TYPE}, {partitioned_columns_ddl(table)})"
+            )
+
+    # Create Indexes
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_user_id ON chat_history(user_id)")
+    if not is_partitioned("analytics_events", cur):
+        # Partitioned layouts carry their own per-partition indexes
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_analytics_user_id ON analytics_events(user_id)")
+
+    # Analytics rollups, maintained incrementally by db.rollups
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_rollup_hourly (
+            bucket_start TIMESTAMP NOT NULL,
+            event_type VARCHAR(50) NOT NULL,
+            user_id INTEGER NOT NULL,
+            event_count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_start, event_type, user_id)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_rollup_daily (
+            bucket_date DATE NOT NULL,
+            event_type VARCHAR(50) NOT NULL,
+            user_id INTEGER NOT NULL,
+            event_count BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket_date, event_type, user_id)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_user_totals (
+            user_id INTEGER PRIMARY KEY,
+            event_count BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS rollup_watermarks (
+            name VARCHAR(50) PRIMARY KEY,
+            last_id BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP {TS_DEFAULT}
+        )
+    """)
+    BLOB_TYPE = "BLOB" if settings.DB_TYPE == "sqlite" else "BYTEA"
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS analytics_hll_daily (
+            bucket_date DATE NOT NULL,
+            event_type VARCHAR(50) NOT NULL,
+            sketch {BLOB_TYPE} NOT NULL,
+            PRIMARY KEY (bucket_date, event_type)
+        )
+    """)
+    # The id watermark; on Postgres, migration 007 backfills analytics_events.txid
+    # from it and only then adds the transaction-id watermark and its index
+    cur.execute(
+        "INSERT INTO rollup_watermarks (name, last_id) VALUES ('analytics_events', 0) ON CONFLICT DO NOTHING"
+    )
 
 def init_database():
     """Initialize database schema and tables."""
     logger.info(f"Initializing database schema ({settings.DB_TYPE})...")
     with get_connection() as conn:
-        cur = conn.cursor()
         try:
-            # Type Abstractions
-            if settings.DB_TYPE == "sqlite":
-                PK_TYPE = "INTEGER PRIMARY KEY AUTOINCREMENT"
-                JSON_TYPE = "TEXT"
-                BOOL_TYPE = "BOOLEAN" # SQLite connects this to int, but declares fine
-                TS_DEFAULT = "DEFAULT CURRENT_TIMESTAMP"
-            else:
-                PK_TYPE = "SERIAL PRIMARY KEY"
-                JSON_TYPE = "JSONB"
-                BOOL_TYPE = "BOOLEAN"
-                TS_DEFAULT = "DEFAULT CURRENT_TIMESTAMP"
-
-            # Create users table
-            cur.execute(f"""
-                CREATE TABLE IF NOT EXISTS users (
-                    id {PK_TYPE},
-                    username VARCHAR(50) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL,
-                    role VARCHAR(20) NOT NULL,
-                    email VARCHAR(100),
-                    created_at TIMESTAMP {TS_DEFAULT},
-                    updated_at TIMESTAMP {TS_DEFAULT},
-                    is_active {BOOL_TYPE} DEFAULT 1,
-                    last_login TIMESTAMP
-                )
-            """)
-
-            # Create sessions table
-            cur.execute(f"""
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id {PK_TYPE},
-                    user_id INTEGER NOT NULL REFERENCES users(id),
-                    session_token VARCHAR(255) UNIQUE NOT NULL,
-                    created_at TIMESTAMP {TS_DEFAULT},
-                    expires_at TIMESTAMP NOT NULL,
-                    ip_address VARCHAR(45),
-                    user_agent TEXT,
-                    is_active {BOOL_TYPE} DEFAULT 1
-                )
-            """)
-
-            # Create chat_history table
-            cur.execute(f"""
-                CREATE TABLE IF NOT EXISTS chat_history (
-                    id {PK_TYPE},
-                    user_id INTEGER NOT NULL REFERENCES users(id),
-                    session_id INTEGER REFERENCES sessions(id),
-                    role VARCHAR(20) NOT NULL,
-                    content TEXT NOT NULL,
-                    created_at TIMESTAMP {TS_DEFAULT},
-                    metadata {JSON_TYPE}
-                )
-            """)
-
-            # Create audit_logs table
-            cur.execute(f"""
-                CREATE TABLE IF NOT EXISTS audit_logs (
-                    id {PK_TYPE},
-                    user_id INTEGER REFERENCES users(id),
-                    action VARCHAR(100) NOT NULL,
-                    resource_type VARCHAR(50),
-                    resource_id VARCHAR(100),
-                    changes {JSON_TYPE},
-                    created_at TIMESTAMP {TS_DEFAULT},
-                    ip_address VARCHAR(45)
-                )
-            """)
-
-            # Create analytics_events table
-            cur.execute(f"""
-                CREATE TABLE IF NOT EXISTS analytics_events (
-                    id {PK_TYPE},
-                    user_id INTEGER NOT NULL REFERENCES users(id),
-                    event_type VARCHAR(50) NOT NULL,
-                    event_name VARCHAR(100) NOT NULL,
-                    data {JSON_TYPE},
-                    created_at TIMESTAMP {TS_DEFAULT}
-                )
-            """)
-
-            # Create Indexes
-            if settings.DB_TYPE == "sqlite":
-                 cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_user_id ON chat_history(user_id)")
-                 cur.execute("CREATE INDEX IF NOT EXISTS idx_analytics_user_id ON analytics_events(user_id)")
-            else:
-                 cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_user_id ON chat_history(user_id)")
-                 cur.execute("CREATE INDEX IF NOT EXISTS idx_analytics_user_id ON analytics_events(user_id)")
-
+            create_schema(conn.cursor())
             conn.commit()
             logger.info("Database schema initialized successfully")
         except Exception as e:
@@ -218,36 +468,38 @@ def init_database():
 
 def add_user(username: str, password_hash: str, role: str, email: Optional[str] = None) -> int:
     """Add a new user to the database."""
-    with get_connection() as conn:
-        cur = conn.cursor()
-        try:
-            query = _adapt_query("""
-                INSERT INTO users (username, password_hash, role, email)
-                VALUES (%s, %s, %s, %s)
-            """)
-            
-            if settings.DB_TYPE == "postgres":
-                 query += " RETURNING id"
-                 cur.execute(query, (username, password_hash, role, email))
-                 user_id = cur.fetchone()[0]
-            else:
-                 cur.execute(query, (username, password_hash, role, email))
-                 user_id = cur.lastrowid
-                 
-            logger.info(f"User created: {mask_identifier(username, 'user')} (ID: {mask_identifier(str(user_id), 'id')})")
-            return user_id
-        except Exception as e:  # Catch IntegrityError equivalent
-            logger.warning(
-                "User creation failed (possible duplicate or constraint violation).",
-                exc_info=True,
-            )
-            raise  # Re-raise for controller handling if needed
-        except Exception as e: # Catch IntegrityError equivalent
-            log_exception_safe(logger, "User creation failed", e, level="warning")
-            raise # Re-raise for controller handling if needed
+    query = _adapt_query("""
+        INSERT INTO users (username, password_hash, role, email)
+        VALUES (%s, %s, %s, %s)
+    """)
+    if settings.DB_TYPE == "postgres":
+        query += " RETURNING id"
+
+    def write(cur):
+        cur.execute(query, (username, password_hash, role, email))
+        return cur.fetchone()[0] if settings.DB_TYPE == "postgres" else cur.lastrowid
+
+    try:
+        user_id = _run_write(write)
+        _user_cache.pop(username)
+        logger.info(f"User created: {mask_identifier(username, 'user')} (ID: {mask_identifier(str(user_id), 'id')})")
+        return user_id
+    except Exception as e:  # Catch IntegrityError equivalent
+        logger.warning(
+            "User creation failed (possible duplicate or constraint violation).",
+            exc_info=True,
+        )
+        raise  # Re-raise for controller handling if needed
+    except Exception as e: # Catch IntegrityError equivalent
+        log_exception_safe(logger, "User creation failed", e, level="warning")
+        raise # Re-raise for controller handling if needed
 
 def get_user(username: str) -> Optional[Dict[str, Any]]:
-    """Get user by username."""
+    """Get user by username (served from the in-process user cache when fresh)."""
+    cached = _user_cache.get(username)
+    if cached is not None:
+        return dict(cached)
+
     with get_connection() as conn:
         if settings.DB_TYPE == "postgres":
             cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -262,16 +514,40 @@ def get_user(username: str) -> Optional[Dict[str, Any]]:
         
         row = cur.fetchone()
         if row:
-             return dict(row)
+             user = dict(row)
+             _user_cache.set(username, user)
+             return dict(user)
         return None
 
+def _invalidate_cached_user(user_id: int) -> None:
+    """Drop any cached entry for the given user id."""
+    _user_cache.discard_where(lambda _username, user: user["id"] == user_id)
+
 def update_last_login(user_id: int) -> None:
     """Update user's last login timestamp."""
-    with get_connection() as conn:
-        cur = conn.cursor()
+    _run_write(lambda cur: cur.execute(_adapt_query(
+        "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s"
+    ), (user_id,)))
+    _invalidate_cached_user(user_id)
+
+def deactivate_user(user_id: int) -> bool:
+    """Deactivate a user account so it can no longer authenticate."""
+    def write(cur):
         cur.execute(_adapt_query(
-            "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s"
-        ), (user_id,))
+            "UPDATE users SET is_active = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s"
+        ), (False, user_id))
+        return cur.rowcount > 0
+
+    updated = _run_write(write)
+    _invalidate_cached_user(user_id)
+    revoke_user_sessions(user_id)
+    if updated:
+        logger.info(f"User deactivated (ID: {mask_identifier(str(user_id), 'id')})")
+    return updated
+
+def get_user_cache_stats() -> Dict[str, Any]:
+    """Return user cache size and hit/miss/eviction counters."""
+    return _user_cache.stats()
 
 def save_chat_message(
     user_id: int,
@@ -281,73 +557,128 @@ def save_chat_message(
     metadata: Optional[Dict] = None,
 ) -> int:
     """Save a chat message to the database."""
-    with get_connection() as conn:
-        cur = conn.cursor()
-        metadata_json = _json_serialize(metadata)
-        
-        query = _adapt_query("""
-            INSERT INTO chat_history
-            (user_id, session_id, role, content, metadata)
-            VALUES (%s, %s, %s, %s, %s)
-        """)
-        
+    metadata_json = _json_serialize(metadata)
+    
+    query = _adapt_query("""
+        INSERT INTO chat_history
+        (user_id, session_id, role, content, metadata)
+        VALUES (%s, %s, %s, %s, %s)
+    """)
+    
+    def write(cur):
         if settings.DB_TYPE == "postgres":
-            query += " RETURNING id"
-            cur.execute(query, (user_id, session_id, role, content, metadata_json))
-            message_id = cur.fetchone()[0]
-        else:
-            cur.execute(query, (user_id, session_id, role, content, metadata_json))
-            message_id = cur.lastrowid
-            
-        return message_id
+            cur.execute(query + " RETURNING id", (user_id, session_id, role, content, metadata_json))
+            return cur.fetchone()[0]
+        cur.execute(query, (user_id, session_id, role, content, metadata_json))
+        return cur.lastrowid
+
+    return _run_write(write)
+
+def _decode_chat_rows(rows) -> List[Dict[str, Any]]:
+    """Convert chat rows to dicts; SQLite JSON metadata is parsed when first accessed."""
+    # Postgres returns dicts for JSONB columns already
+    if settings.DB_TYPE != "sqlite":
+        return [dict(r) for r in rows]
+    return json_rows(rows, ("metadata",))
 
 def get_chat_history(
     user_id: int, limit: int = 100, offset: int = 0
 ) -> List[Dict[str, Any]]:
-    """Get chat history for a user."""
+    """Get chat history for a user (newest first).
+
+    Prefer get_chat_history_page() for paging: OFFSET cost grows with depth.
+    """
     with get_connection() as conn:
         if settings.DB_TYPE == "postgres":
             cur = conn.cursor(cursor_factory=RealDictCursor)
         else:
-            conn.row_factory = _dict_factory # Use dict wrapper for easier JSON handling
             cur = conn.cursor()
+            # Per-cursor so the shared thread-local connection keeps sqlite3.Row
+            cur.row_factory = _dict_factory # Use dict wrapper for easier JSON handling
             
         cur.execute(_adapt_query("""
             SELECT id, role, content, created_at, metadata
             FROM chat_history
             WHERE user_id = %s
-            ORDER BY created_at DESC
+            ORDER BY created_at DESC, id DESC
             LIMIT %s OFFSET %s
         """), (user_id, limit, offset))
         
-        rows = cur.fetchall()
-        
-        # SQLite JSON handling (deserialize text back to dict)
-        if settings.DB_TYPE == "sqlite":
-             result = []
-             for row in rows:
-                 r = dict(row)
-                 if r.get("metadata") and isinstance(r["metadata"], str):
-                     try:
-                         r["metadata"] = json.loads(r["metadata"])
-                     except: 
-                         pass
-                 result.append(r)
-             return result
-             
-        # Postgres already returns Dict if RealDictCursor handles JSONB? 
-        # Actually psycopg2 returns dict for JSONB automatically.
-        return [dict(r) for r in rows]
+        return _decode_chat_rows(cur.fetchall())
+
+def _encode_cursor(created_at: Any, row_id: int) -> str:
+    """Build an opaque keyset cursor from the last row of a page."""
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat(sep=" ")
+    payload = json.dumps([str(created_at), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of _encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError("Invalid chat history cursor") from e
+
+def get_chat_history_page(
+    user_id: int, limit: int = 50, cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Get one page of chat history using keyset pagination (newest first).
+
+    Seeks on the (user_id, created_at, id) index instead of scanning past an
+    OFFSET, so every page costs the same regardless of depth.
+
+    Args:
+        user_id: Owner of the history
+        limit: Maximum messages to return
+        cursor: Opaque cursor from a previous call; None for the newest page
+
+    Returns:
+        (messages, next_cursor) where next_cursor is None once the oldest
+        message has been returned.
+    """
+    query = """
+        SELECT id, role, content, created_at, metadata
+        FROM chat_history
+        WHERE user_id = %s
+    """
+    params: List[Any] = [user_id]
+    if cursor:
+        created_at, row_id = _decode_cursor(cursor)
+        query += " AND (created_at, id) < (%s, %s)"
+        params.extend([created_at, row_id])
+    query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    params.append(limit + 1)  # one extra row tells us whether another page exists
+
+    with get_connection() as conn:
+        if settings.DB_TYPE == "postgres":
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+        else:
+            cur = conn.cursor()
+            cur.row_factory = _dict_factory
+
+        cur.execute(_adapt_query(query), params)
+        rows = _decode_chat_rows(cur.fetchall())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(last["created_at"], last["id"])
+    return rows, next_cursor
 
 def clear_chat_history(user_id: int) -> int:
     """Clear all chat history for a user."""
-    with get_connection() as conn:
-        cur = conn.cursor()
+    def write(cur):
         cur.execute(_adapt_query(
             "DELETE FROM chat_history WHERE user_id = %s"
         ), (user_id,))
         return cur.rowcount
 
+    return _run_write(write)
+
 def log_audit_event(
     user_id: Optional[int],
     action: str,
@@ -357,86 +688,393 @@ def log_audit_event(
     ip_address: Optional[str] = None,
 ) -> int:
     """Log an audit event."""
-    with get_connection() as conn:
-        cur = conn.cursor()
-        changes_json = _json_serialize(changes)
-        
-        query = _adapt_query("""
-            INSERT INTO audit_logs
-            (user_id, action, resource_type, resource_id, changes, ip_address)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """)
-        
+    changes_json = _json_serialize(changes)
+    table, created_at = insert_target("audit_logs")
+    params = (user_id, action, resource_type, resource_id, changes_json, ip_address, created_at)
+    
+    query = _adapt_query(f"""
+        INSERT INTO {table}
+        (user_id, action, resource_type, resource_id, changes, ip_address, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+    """)
+    
+    def write(cur):
         if settings.DB_TYPE == "postgres":
-            query += " RETURNING id"
-            cur.execute(query, (user_id, action, resource_type, resource_id, changes_json, ip_address))
+            cur.execute(query + " RETURNING id", params)
             return cur.fetchone()[0]
-        else:
-            cur.execute(query, (user_id, action, resource_type, resource_id, changes_json, ip_address))
-            return cur.lastrowid
+        cur.execute(query, params)
+        return cur.lastrowid
+
+    return _run_write(write)
 
 def log_analytics_event(
     user_id: int, event_type: str, event_name: str, data: Optional[Dict] = None
 ) -> int:
     """Log an analytics event."""
+    data_json = _json_serialize(data)
+    table, created_at = insert_target("analytics_events")
+    params = (user_id, event_type, event_name, data_json, created_at)
+    
+    query = _adapt_query(f"""
+        INSERT INTO {table}
+        (user_id, event_type, event_name, data, created_at)
+        VALUES (%s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+    """)
+    
+    def write(cur):
+        if settings.DB_TYPE == "postgres":
+            cur.execute(query + " RETURNING id", params)
+            return cur.fetchone()[0]
+        cur.execute(query, params)
+        return cur.lastrowid
+
+    return _run_write(write)
+
+CHAT_COLUMNS = ("user_id", "session_id", "role", "content", "metadata", "created_at")
+AUDIT_COLUMNS = ("user_id", "action", "resource_type", "resource_id", "changes", "ip_address", "created_at")
+ANALYTICS_COLUMNS = ("user_id", "event_type", "event_name", "data", "created_at")
+
+def _bulk_insert(cur, table: str, columns: Tuple[str, ...], rows: List[tuple]) -> None:
+    """Insert ``rows`` with COPY / execute_values (Postgres) or executemany (SQLite)."""
+    if settings.DB_TYPE == "postgres":
+        if len(rows) >= settings.BULK_COPY_MIN_ROWS:
+            copy_rows(cur, table, columns, rows)
+        else:
+            execute_values(cur, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows, page_size=1000)
+        return
+    placeholders = ", ".join("?" for _ in columns)
+    cur.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+
+def _bulk_job(table: str, columns: Tuple[str, ...], chunk: List[tuple]) -> Callable[[Any], None]:
+    """
+    Write job inserting ``chunk`` (tuples matching ``columns``, created_at last).
+
+    A None created_at gets the column default. On partitioned SQLite every
+    row is routed to the monthly table its created_at falls in.
+    """
+    partitioned = settings.DB_TYPE == "sqlite" and is_partitioned(table)
+    if partitioned:
+        # Resolved outside the write job: may create this month's table
+        now = insert_target(table)[1]
+        dated = [row if row[-1] is not None else row[:-1] + (now,) for row in chunk]
+        undated = []
+    else:
+        dated = [row for row in chunk if row[-1] is not None]
+        undated = [row[:-1] for row in chunk if row[-1] is None]
+
+    def write(cur):
+        if undated:
+            _bulk_insert(cur, table, columns[:-1], undated)
+        if dated and partitioned:
+            for target, group in split_by_partition(cur, table, dated, len(columns) - 1).items():
+                if table != "analytics_events":
+                    _bulk_insert(cur, target, columns, group)
+                    continue
+                # Older months get ids under the rollup watermark; fold them in now
+                from db.rollups import fold_below_watermark
+                cur.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (target,))
+                after_id = cur.fetchone()[0]
+                _bulk_insert(cur, target, columns, group)
+                fold_below_watermark(cur, target, after_id)
+        elif dated:
+            _bulk_insert(cur, table, columns, dated)
+
+    return write
+
+def _bulk_write(table: str, columns: Tuple[str, ...], rows: Iterable[tuple]) -> int:
+    """
+    Insert rows (tuples matching ``columns``, created_at last) in chunks of
+    BULK_CHUNK_ROWS, one transaction per chunk; returns the number inserted.
+    """
+    total = 0
+    for chunk in chunked(rows, settings.BULK_CHUNK_ROWS):
+        _run_write(_bulk_job(table, columns, chunk))
+        total += len(chunk)
+    return total
+
+def bulk_save_chat_messages(messages: Iterable[Dict[str, Any]]) -> int:
+    """
+    Save many chat messages; returns how many were inserted (no ids).
+
+    Each message is a dict with user_id, role and content, and optionally
+    session_id, metadata and created_at (defaults to now; set it when
+    importing history). Rows are written BULK_CHUNK_ROWS per transaction,
+    so a failure part-way leaves earlier chunks committed.
+    """
+    return _bulk_write("chat_history", CHAT_COLUMNS, (
+        (m["user_id"], m.get("session_id"), m["role"], m["content"],
+         _json_text(m.get("metadata")), m.get("created_at"))
+        for m in messages
+    ))
+
+def bulk_log_audit_events(events: Iterable[Dict[str, Any]]) -> int:
+    """
+    Log many audit events; returns how many were inserted.
+
+    Each event is a dict with user_id and action, and optionally
+    resource_type, resource_id, changes, ip_address and created_at.
+    Chunked like bulk_save_chat_messages.
+    """
+    return _bulk_write("audit_logs", AUDIT_COLUMNS, (
+        (e.get("user_id"), e["action"], e.get("resource_type"), e.get("resource_id"),
+         _json_text(e.get("changes")), e.get("ip_address"), e.get("created_at"))
+        for e in events
+    ))
+
+def bulk_log_analytics_events(events: Iterable[Dict[str, Any]]) -> int:
+    """
+    Log many analytics events; returns how many were inserted.
+
+    Each event is a dict with user_id, event_type and event_name, and
+    optionally data and created_at. Chunked like bulk_save_chat_messages.
+    """
+    return _bulk_write("analytics_events", ANALYTICS_COLUMNS, (
+        (e["user_id"], e["event_type"], e["event_name"], _json_text(e.get("data")), e.get("created_at"))
+        for e in events
+    ))
+
+def get_chat_histories(user_ids: Iterable[int], limit: int = 100) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Latest ``limit`` messages of each user in one round trip (newest first).
+
+    Every requested id is a key of the result (an empty list when the user
+    has no history). Each user's rows come from one LIMITed seek on the
+    (user_id, created_at, id) index: a LATERAL subquery on Postgres, a
+    UNION ALL of per-user subqueries on SQLite.
+    """
+    ids = list(dict.fromkeys(int(u) for u in user_ids))
+    histories: Dict[int, List[Dict[str, Any]]] = {u: [] for u in ids}
+    if not ids:
+        return histories
+
     with get_connection() as conn:
-        cur = conn.cursor()
-        data_json = _json_serialize(data)
-        
-        query = _adapt_query("""
-            INSERT INTO analytics_events
-            (user_id, event_type, event_name, data)
-            VALUES (%s, %s, %s, %s)
-        """)
-        
         if settings.DB_TYPE == "postgres":
-             query += " RETURNING id"
-             cur.execute(query, (user_id, event_type, event_name, data_json))
-             return cur.fetchone()[0]
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+                SELECT u.user_id, h.id, h.role, h.content, h.created_at, h.metadata
+                FROM unnest(%s::int[]) AS u(user_id)
+                CROSS JOIN LATERAL (
+                    SELECT id, role, content, created_at, metadata
+                    FROM chat_history
+                    WHERE user_id = u.user_id
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                ) h
+            """, (ids, limit))
+            rows = cur.fetchall()
         else:
-             cur.execute(query, (user_id, event_type, event_name, data_json))
-             return cur.lastrowid
+            cur = conn.cursor()
+            cur.row_factory = _dict_factory
+            rows = []
+            # One LIMITed index seek per user; batches stay under SQLite's
+            # compound-SELECT and bound-parameter limits
+            arm = (
+                "SELECT * FROM (SELECT user_id, id, role, content, created_at, metadata "
+                "FROM chat_history WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?)"
+            )
+            for batch in chunked(ids, 200):
+                cur.execute(
+                    " UNION ALL ".join(arm for _ in batch),
+                    [p for user_id in batch for p in (user_id, limit)],
+                )
+                rows.extend(cur.fetchall())
 
+    for row in _decode_chat_rows(rows):
+        histories[row.pop("user_id")].append(row)
+    return histories
+
+# Column layout of the rows produced by db.event_writer, keyed by event kind
+_EVENT_TABLES = {
+    "audit": ("audit_logs", AUDIT_COLUMNS, AUDIT_COLUMNS.index("changes")),
+    "analytics": ("analytics_events", ANALYTICS_COLUMNS, ANALYTICS_COLUMNS.index("data")),
+}
+
+def _insert_event_rows(rows_by_kind: Dict[str, List[tuple]]) -> int:
+    """
+    Insert a batch of audit/analytics rows from db.event_writer (bulk path).
+
+    Every kind goes into one transaction, so a failed batch leaves nothing
+    behind and can be retried without duplicating rows.
+    """
+    jobs = []
+    for kind, rows in rows_by_kind.items():
+        if not rows:
+            continue
+        table, columns, json_idx = _EVENT_TABLES[kind]
+        jobs.append(_bulk_job(table, columns, [
+            row[:json_idx] + (_json_text(row[json_idx]),) + row[json_idx + 1:] + (None,)
+            for row in rows
+        ]))
+
+    def write(cur):
+        for job in jobs:
+            job(cur)
+
+    if jobs:
+        _run_write(write)
+    return sum(len(rows) for rows in rows_by_kind.values())
+
+def _day_bounds(start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, List[Any]]:
+    """WHERE fragment restricting a DATE-valued ``event_date`` to an inclusive day range."""
+    clause = ""
+    params: List[Any] = []
+    if start_date:
+        clause += " AND event_date >= %s"
+        params.append(str(start_date)[:10])
+    if end_date:
+        clause += " AND event_date <= %s"
+        params.append(str(end_date)[:10])
+    return clause, params
 
 def get_analytics_summary(
     start_date: Optional[str] = None, end_date: Optional[str] = None
-) -> Dict[str, Any]:
-    """Get analytics summary for a date range."""
-    with get_connection() as conn:
+) -> List[Dict[str, Any]]:
+    """
+    Get per-day, per-event-type analytics totals for an inclusive date range.
+
+    Reads the daily rollup plus the raw events above the rollup watermark,
+    so results are exact without scanning the whole events table.
+    """
+    from db.rollups import tail_condition
+
+    with get_connection(readonly=True) as conn:
         if settings.DB_TYPE == "postgres":
              cur = conn.cursor(cursor_factory=RealDictCursor)
         else:
              conn.row_factory = sqlite3.Row
              cur = conn.cursor()
-             
-        query = _adapt_query("""
+
+        day_filter, day_params = _day_bounds(start_date, end_date)
+        # Bound the raw tail too, so partitioned tables only touch the months in range
+        tail_filter, tail_params = "", []
+        if start_date:
+            tail_filter += " AND created_at >= %s"
+            tail_params.append(str(start_date)[:10])
+        if end_date:
+            tail_filter += " AND created_at < %s"
+            tail_params.append((date.fromisoformat(str(end_date)[:10]) + timedelta(days=1)).isoformat())
+        query = f"""
             SELECT
                 COUNT(DISTINCT user_id) as unique_users,
-                COUNT(*) as total_events,
+                SUM(event_count) as total_events,
                 event_type,
-                DATE(created_at) as event_date
-            FROM analytics_events
+                event_date
+            FROM (
+                SELECT bucket_date AS event_date, event_type, user_id, event_count
+                FROM analytics_rollup_daily
+                UNION ALL
+                SELECT DATE(created_at) AS event_date, event_type, user_id, COUNT(*) AS event_count
+                FROM {relation_for_range("analytics_events", start_date, end_date)}
+                WHERE {tail_condition()} {tail_filter}
+                GROUP BY DATE(created_at), event_type, user_id
+            ) combined
+            WHERE 1=1 {day_filter}
+            GROUP BY event_type, event_date
+            ORDER BY event_date DESC
+        """
+
+        cur.execute(_adapt_query(query), tail_params + day_params)
+        rows = cur.fetchall()
+        return [dict(r) for r in rows]
+
+def get_hourly_event_counts(
+    start: Optional[str] = None, end: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Get event counts per hour and event type (from the hourly rollup plus raw tail)."""
+    from db.rollups import _hour_bucket, tail_condition
+
+    with get_connection(readonly=True) as conn:
+        if settings.DB_TYPE == "postgres":
+             cur = conn.cursor(cursor_factory=RealDictCursor)
+        else:
+             conn.row_factory = sqlite3.Row
+             cur = conn.cursor()
+
+        query = f"""
+            SELECT bucket_start, event_type, SUM(event_count) AS total_events
+            FROM (
+                SELECT bucket_start, event_type, event_count
+                FROM analytics_rollup_hourly
+                UNION ALL
+                SELECT {_hour_bucket('created_at')} AS bucket_start, event_type, COUNT(*) AS event_count
+                FROM analytics_events
+                WHERE {tail_condition()}
+                GROUP BY 1, 2
+            ) combined
             WHERE 1=1
-        """)
-        params = []
+        """
+        params: List[Any] = []
+        if start:
+            query += " AND bucket_start >= %s"
+            params.append(start)
+        if end:
+            query += " AND bucket_start <= %s"
+            params.append(end)
+        query += " GROUP BY bucket_start, event_type ORDER BY bucket_start"
 
-        if start_date:
-            query += " AND created_at >= %s"
-            params.append(start_date)
+        cur.execute(_adapt_query(query), params)
+        return [dict(r) for r in cur.fetchall()]
 
-        if end_date:
-            query += " AND created_at <= %s"
-            params.append(end_date)
+def get_active_user_count(
+    start_date: str, end_date: str, event_type: Optional[str] = None
+) -> int:
+    """
+    Approximate distinct users active in an inclusive date range.
 
-        query += " GROUP BY event_type, DATE(created_at) ORDER BY event_date DESC"
+    Merges one HyperLogLog sketch per day (O(days), ~1.6% error) with the
+    exact user ids of raw events above the rollup watermark.
 
-        cur.execute(query, params)
-        rows = cur.fetchall()
-        return [dict(r) for r in rows]
+    Args:
+        start_date: First day (YYYY-MM-DD)
+        end_date: Last day (YYYY-MM-DD)
+        event_type: Restrict to one event type; None counts any event
+    """
+    from db.hll import HyperLogLog
+    from db.rollups import ALL_EVENTS, tail_condition
+
+    start_day, end_day = str(start_date)[:10], str(end_date)[:10]
+    sketch = HyperLogLog()
+    with get_connection(readonly=True) as conn:
+        cur = conn.cursor()
+
+        # Tail first: a refresh committing between the two reads then shows
+        # up in the sketches, and re-adding a user to a sketch is harmless.
+        query = f"""
+            SELECT DISTINCT user_id FROM analytics_events
+            WHERE {tail_condition()}
+            AND DATE(created_at) >= %s AND DATE(created_at) <= %s
+        """
+        params: List[Any] = [start_day, end_day]
+        if event_type:
+            query += " AND event_type = %s"
+            params.append(event_type)
+        cur.execute(_adapt_query(query), params)
+        sketch.update(row[0] for row in cur.fetchall())
+
+        cur.execute(_adapt_query(
+            "SELECT sketch FROM analytics_hll_daily "
+            "WHERE event_type = %s AND bucket_date >= %s AND bucket_date <= %s"
+        ), (event_type or ALL_EVENTS, start_day, end_day))
+        for (data,) in cur.fetchall():
+            sketch.merge(HyperLogLog.from_bytes(data))
+
+    return sketch.count()
+
+def get_active_user_counts(as_of: Optional[date] = None) -> Dict[str, int]:
+    """Daily, weekly and monthly active users ending on ``as_of`` (default today)."""
+    as_of = as_of or date.today()
+    end = as_of.isoformat()
+    return {
+        "dau": get_active_user_count(end, end),
+        "wau": get_active_user_count((as_of - timedelta(days=6)).isoformat(), end),
+        "mau": get_active_user_count((as_of - timedelta(days=29)).isoformat(), end),
+    }
 
 def get_top_users(limit: int = 5) -> List[Dict[str, Any]]:
-    """Get top active users by event count."""
-    with get_connection() as conn:
+    """Get top active users by event count (per-user totals plus raw tail)."""
+    from db.rollups import tail_condition
+
+    with get_connection(readonly=True) as conn:
         if settings.DB_TYPE == "postgres":
              cur = conn.cursor(cursor_factory=RealDictCursor)
         else:
@@ -444,10 +1082,17 @@ def get_top_users(limit: int = 5) -> List[Dict[str, Any]]:
              cur = conn.cursor()
              
         # Join with users table to get usernames
-        query = _adapt_query("""
-            SELECT u.username, COUNT(a.id) as event_count
-            FROM analytics_events a
-            JOIN users u ON a.user_id = u.id
+        query = _adapt_query(f"""
+            SELECT u.username, SUM(c.event_count) as event_count
+            FROM (
+                SELECT user_id, event_count FROM analytics_user_totals
+                UNION ALL
+                SELECT user_id, COUNT(*) AS event_count
+                FROM analytics_events
+                WHERE {tail_condition()}
+                GROUP BY user_id
+            ) c
+            JOIN users u ON c.user_id = u.id
             GROUP BY u.username
             ORDER BY event_count DESC
             LIMIT %s
@@ -464,14 +1109,15 @@ def get_audit_logs(
     limit: int = 100,
 ) -> List[Dict[str, Any]]:
     """Get audit logs with optional filtering."""
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         if settings.DB_TYPE == "postgres":
              cur = conn.cursor(cursor_factory=RealDictCursor)
         else:
-             conn.row_factory = _dict_factory
              cur = conn.cursor()
+             cur.row_factory = _dict_factory
              
-        query = _adapt_query("SELECT * FROM audit_logs WHERE 1=1")
+        # On partitioned SQLite only the months in range are scanned
+        query = f"SELECT * FROM {relation_for_range('audit_logs', start_date, end_date)} WHERE 1=1"
         params = []
 
         if user_id:
@@ -489,26 +1135,28 @@ def get_audit_logs(
         query += " ORDER BY created_at DESC LIMIT %s"
         params.append(limit)
 
-        cur.execute(query, params)
+        cur.execute(_adapt_query(query), params)
         rows = cur.fetchall()
         
-        # JSON handling for SQLite
+        # JSON handling for SQLite (parsed when first accessed)
         if settings.DB_TYPE == "sqlite":
-             result = []
-             for row in rows:
-                 r = dict(row)
-                 if r.get("changes") and isinstance(r["changes"], str):
-                     try:
-                         r["changes"] = json.loads(r["changes"])
-                     except: pass
-                 result.append(r)
-             return result
+             return json_rows(rows, ("changes",))
              
         return [dict(r) for r in rows]
 
 def close_connection_pool():
-    """Close all connections in the pool."""
-    global _pg_pool
+    """Flush queued audit/analytics events, then close all connections (pools, SQLite writer and readers)."""
+    global _pg_pool, _replica_router, _sqlite_writer
+    from db.event_writer import shutdown_event_writer
+
+    shutdown_event_writer()
+    if _sqlite_writer is not None:
+        _sqlite_writer.shutdown()
+        _sqlite_writer = None
+    _close_sqlite_connections()
+    if _replica_router is not None:
+        _replica_router.closeall()
+        _replica_router = None
     if _pg_pool:
         _pg_pool.closeall()
         _pg_pool = None
@@ -2,14 +2,45 @@
 Database migration and backup utilities for nursing validator.
 
 Handles schema migrations, automated backups, and restoration.
+
+Backups are content-addressed: each backup is a JSON manifest listing the
+hashed chunks of its files under BACKUP_DIR/chunks, so unchanged data is
+stored once across backups and restores can verify every byte.
+
+Migrations are recorded in the ``schema_migrations`` ledger with a checksum
+of their source, so an applied migration that is later edited is reported
+instead of silently diverging. Migrations flagged ``online`` run each step in
+its own short transaction: Postgres indexes are built with CREATE INDEX
+CONCURRENTLY and backfills update one primary-key range per transaction with
+a pause between ranges, so large tables stay writable while they roll out.
+A dry run executes pending migrations inside a transaction that is rolled
+back and reports per-step timings (backfills are sampled and extrapolated).
+
+Usage:
+    python -m db.db_migrations status
+    python -m db.db_migrations migrate [--target VERSION]
+    python -m db.db_migrations dry-run [--target VERSION]
+    python -m db.db_migrations rollback [--steps N]
 """
 
 import os
+import gzip
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import inspect
 import logging
+import argparse
+import tempfile
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, Callable, Iterator
 
 from core.settings import settings
 
@@ -17,154 +48,526 @@ logger = logging.getLogger(__name__)
 
 # Backup configuration
 BACKUP_DIR = os.getenv("BACKUP_DIR", "./backups")
+BACKUP_PREFIX = "nursing_validator_"
+MANIFEST_FORMAT = 1
+
+# Stepped SQLite backups restart when another connection writes; after this
+# many restarts the copy is taken in one step (a plain read transaction)
+SQLITE_BACKUP_MAX_RESTARTS = 3
 
 
 def ensure_backup_dir():
     """Create backup directory if it doesn't exist."""
     Path(BACKUP_DIR).mkdir(parents=True, exist_ok=True)
+    Path(BACKUP_DIR, "chunks").mkdir(exist_ok=True)
     logger.info(f"Backup directory ready: {BACKUP_DIR}")
 
 
-def create_backup(backup_name: Optional[str] = None) -> str:
-    """Create a PostgreSQL database backup."""
-    ensure_backup_dir()
+@contextmanager
+def _backup_lock() -> Iterator[None]:
+    """Serialise backups and chunk garbage collection in BACKUP_DIR."""
+    from core.chat_store import _file_lock
+
+    with _file_lock(os.path.join(BACKUP_DIR, ".lock")):
+        yield
+
+
+def _chunk_path(digest: str) -> str:
+    return os.path.join(BACKUP_DIR, "chunks", digest[:2], digest)
+
+
+def _store_chunk(data: bytes, compress: bool) -> Dict[str, Any]:
+    """Write ``data`` to the content-addressed chunk store unless it is already there."""
+    digest = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(digest)
+    if os.path.exists(path):
+        return {"sha256": digest, "size": len(data), "new": False}
+    payload = gzip.compress(data, compresslevel=settings.BACKUP_COMPRESSION_LEVEL, mtime=0) if compress else data
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(payload)
+    os.replace(tmp, path)
+    return {"sha256": digest, "size": len(data), "new": True, "stored": len(payload)}
+
+
+def _load_chunk(digest: str, compressed: bool) -> bytes:
+    with open(_chunk_path(digest), "rb") as f:
+        data = f.read()
+    if compressed:
+        data = gzip.decompress(data)
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"Backup chunk {digest} is corrupt")
+    return data
+
+
+def _chunk_file(path: str, relpath: str, compress: bool, executor: ThreadPoolExecutor) -> Dict[str, Any]:
+    """Split one file into fixed-size chunks and store them (hashing/compression in parallel)."""
+    chunk_size = settings.BACKUP_CHUNK_SIZE_MB * 1024 * 1024
+    file_hash = hashlib.sha256()
+    futures = []
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            file_hash.update(data)
+            futures.append(executor.submit(_store_chunk, data, compress))
+    chunks = [future.result() for future in futures]
+    return {
+        "path": relpath,
+        "size": sum(c["size"] for c in chunks),
+        "sha256": file_hash.hexdigest(),
+        "compressed": compress,
+        "chunks": [c["sha256"] for c in chunks],
+        "new_chunks": sum(1 for c in chunks if c["new"]),
+        "new_bytes": sum(c.get("stored", 0) for c in chunks),
+    }
+
+
+def _assemble_file(entry: Dict[str, Any], target_dir: str) -> None:
+    """Rebuild one backed-up file from its chunks, verifying every hash."""
+    path = os.path.join(target_dir, entry["path"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    file_hash = hashlib.sha256()
+    with open(path, "wb") as f:
+        for digest in entry["chunks"]:
+            data = _load_chunk(digest, entry["compressed"])
+            file_hash.update(data)
+            f.write(data)
+    if file_hash.hexdigest() != entry["sha256"]:
+        raise ValueError(f"Backup file {entry['path']} does not match its checksum")
+
+
+def _sqlite_tables(conn) -> List[str]:
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' AND sql LIKE 'CREATE TABLE%' ORDER BY name"
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _sqlite_table_stats(conn) -> Dict[str, Dict[str, Any]]:
+    """Row count and an order-independent content checksum per table."""
+    stats = {}
+    for table in _sqlite_tables(conn):
+        count = 0
+        total = 0
+        for row in conn.execute(f'SELECT * FROM "{table}"'):
+            digest = hashlib.md5(repr(tuple(row)).encode("utf-8")).digest()
+            total = (total + int.from_bytes(digest[:8], "big")) % (1 << 64)
+            count += 1
+        stats[table] = {"rows": count, "checksum": f"{total:016x}"}
+    return stats
+
+
+def _pg_table_stats(cur) -> Dict[str, Dict[str, Any]]:
+    """Row count and an order-independent content checksum per table."""
+    cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public' ORDER BY tablename")
+    stats = {}
+    for (table,) in cur.fetchall():
+        cur.execute(
+            f'SELECT COUNT(*), COALESCE(SUM((\'x\' || SUBSTR(MD5(t::text), 1, 15))::bit(60)::bigint), 0) '
+            f'FROM ONLY "{table}" t'
+        )
+        count, total = cur.fetchone()
+        stats[table] = {"rows": int(count), "checksum": str(total)}
+    return stats
 
-    if backup_name is None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_name = f"nursing_validator_{timestamp}.sql"
 
-    backup_path = os.path.join(BACKUP_DIR, backup_name)
+def _pg_env() -> Dict[str, str]:
+    env = os.environ.copy()
+    env["PGPASSWORD"] = settings.DB_PASSWORD
+    return env
+
+
+def _pg_args() -> List[str]:
+    return ["-h", settings.DB_HOST, "-p", str(settings.DB_PORT), "-U", settings.DB_USER, "-d", settings.DB_NAME]
+
 
+def _run_tool(cmd: List[str], what: str) -> None:
     try:
-        env = os.environ.copy()
-        env["PGPASSWORD"] = settings.DB_PASSWORD
-
-        cmd = [
-            "pg_dump",
-            "-h",
-            settings.DB_HOST,
-            "-p",
-            settings.DB_PORT,
-            "-U",
-            settings.DB_USER,
-            "-d",
-            settings.DB_NAME,
-            "--file",
-            backup_path,
-            "--verbose",
-        ]
+        result = subprocess.run(cmd, env=_pg_env(), capture_output=True, text=True)
+    except FileNotFoundError:
+        logger.error(f"{cmd[0]} not found. Please install PostgreSQL client tools.")
+        raise
+    if result.returncode != 0:
+        logger.error(f"{what} failed: {result.stderr}")
+        raise Exception(f"{cmd[0]} failed: {result.stderr}")
 
-        logger.info(f"Starting backup: {backup_path}")
-        result = subprocess.run(cmd, env=env, capture_output=True, text=True)
 
-        if result.returncode != 0:
-            logger.error(f"Backup failed: {result.stderr}")
-            raise Exception(f"pg_dump failed: {result.stderr}")
+def _dump_postgres(work_dir: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Parallel directory-format pg_dump into ``work_dir``; returns table stats.
 
-        file_size = os.path.getsize(backup_path) / (1024 * 1024)  # MB
-        logger.info(f"Backup completed: {backup_path} ({file_size:.2f} MB)")
-        return backup_path
+    Stats are taken in an exported snapshot that pg_dump then reuses, so
+    they describe exactly the data in the dump.
+    """
+    import psycopg2
+    from db.database import _pg_connect
 
-    except FileNotFoundError:
-        logger.error(
-            "pg_dump not found. Please install PostgreSQL client tools."
+    conn = _pg_connect()
+    try:
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cur = conn.cursor()
+        cur.execute("SELECT pg_export_snapshot()")
+        snapshot = cur.fetchone()[0]
+        tables = _pg_table_stats(cur)
+        _run_tool(
+            ["pg_dump", *_pg_args(), "--format=directory",
+             f"--jobs={settings.BACKUP_JOBS}",
+             f"--compress={settings.BACKUP_COMPRESSION_LEVEL}",
+             f"--snapshot={snapshot}", "--file", work_dir],
+            "Backup",
         )
-        raise
+        return tables
+    finally:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+        conn.close()
+
+
+def _copy_sqlite(source: str, target: str) -> None:
+    """
+    Online copy with the SQLite backup API, SQLITE_BACKUP_PAGES pages per step.
+
+    Writers can commit between steps. A write from another connection
+    restarts the copy, so after SQLITE_BACKUP_MAX_RESTARTS restarts the rest
+    is copied in one step; in WAL mode that is a read transaction, which
+    does not block writers either.
+    """
+    class _Restarted(Exception):
+        pass
+
+    state = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > SQLITE_BACKUP_MAX_RESTARTS:
+                raise _Restarted()
+        state["remaining"] = remaining
+
+    src = sqlite3.connect(source, timeout=settings.SQLITE_BUSY_TIMEOUT / 1000.0)
+    dst = sqlite3.connect(target)
+    try:
+        try:
+            src.backup(dst, pages=settings.SQLITE_BACKUP_PAGES, progress=progress,
+                       sleep=settings.SQLITE_BACKUP_SLEEP)
+        except _Restarted:
+            logger.info("SQLite backup kept restarting under writes; copying in one step")
+            src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _restore_sqlite(source: str, target: str) -> None:
+    """
+    Replace the live database at ``target`` with ``source`` through the backup API.
+
+    This process's SQLite writer thread and reader connections are closed
+    first, so none of them writes behind the restore or keeps reading
+    pre-restore pages; they reopen on next use. The copy is one backup
+    step, which holds the destination's write lock throughout, so other
+    processes wait (up to busy_timeout) rather than see a half-restored file.
+    """
+    from db.database import close_connection_pool
+
+    close_connection_pool()
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target, timeout=settings.SQLITE_BUSY_TIMEOUT / 1000.0)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def create_backup(backup_name: Optional[str] = None) -> str:
+    """
+    Create a database backup and return the path of its manifest.
+
+    Postgres: a parallel, compressed directory-format pg_dump. SQLite: an
+    online copy through the backup API. Either way the files are split into
+    chunks stored by content hash under BACKUP_DIR/chunks, so chunks that
+    did not change since an earlier backup are not stored again. The JSON
+    manifest lists each file's chunks and checksum plus per-table row
+    counts and content checksums used to verify restores.
+    """
+    ensure_backup_dir()
+
+    if backup_name is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_name = f"{BACKUP_PREFIX}{timestamp}"
+    manifest_path = os.path.join(BACKUP_DIR, Path(backup_name).stem + ".json")
+    work_dir = tempfile.mkdtemp(prefix=".work-", dir=BACKUP_DIR)
+    started = time.perf_counter()
+
+    try:
+        logger.info(f"Starting backup: {manifest_path}")
+        if settings.DB_TYPE == "sqlite":
+            db_copy = os.path.join(work_dir, "database.sqlite")
+            _copy_sqlite(settings.SQLITE_DB_PATH, db_copy)
+            conn = sqlite3.connect(db_copy)
+            try:
+                tables = _sqlite_table_stats(conn)
+            finally:
+                conn.close()
+            compress = settings.BACKUP_COMPRESSION_LEVEL > 0
+        else:
+            tables = _dump_postgres(os.path.join(work_dir, "dump"))
+            compress = False  # pg_dump already compressed the data files
+
+        with _backup_lock(), ThreadPoolExecutor(max_workers=settings.BACKUP_JOBS) as executor:
+            files = []
+            for root, _dirs, names in os.walk(work_dir):
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    files.append(_chunk_file(path, os.path.relpath(path, work_dir), compress, executor))
+
+            manifest = {
+                "format": MANIFEST_FORMAT,
+                "backend": settings.DB_TYPE,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "files": files,
+                "tables": tables,
+                "stats": {
+                    "bytes": sum(f["size"] for f in files),
+                    "new_bytes": sum(f["new_bytes"] for f in files),
+                    "chunks": sum(len(f["chunks"]) for f in files),
+                    "new_chunks": sum(f["new_chunks"] for f in files),
+                    "seconds": round(time.perf_counter() - started, 3),
+                },
+            }
+            tmp = manifest_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(manifest, f, indent=1)
+            os.replace(tmp, manifest_path)
+
+        stats = manifest["stats"]
+        logger.info(
+            f"Backup completed: {manifest_path} ({stats['bytes'] / (1024 * 1024):.2f} MB, "
+            f"{stats['new_chunks']}/{stats['chunks']} new chunks, "
+            f"{stats['new_bytes'] / (1024 * 1024):.2f} MB written, {stats['seconds']:.1f}s)"
+        )
+        return manifest_path
+
     except Exception as e:
         from core.safe_logging import log_exception_safe
         log_exception_safe(logger, "Backup error", e)
         raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _restore_legacy_sql(backup_path: str) -> bool:
+    """Restore a plain-SQL dump made by earlier versions (psql -f)."""
+    cmd = ["psql", *_pg_args(), "-f", backup_path]
+    logger.info(f"Starting restore from: {backup_path}")
+    result = subprocess.run(cmd, env=_pg_env(), capture_output=True, text=True)
+    if result.returncode != 0:
+        logger.error(f"Restore failed: {result.stderr}")
+        return False
+    logger.info("Restore completed successfully")
+    return True
+
+
+def verify_restore(manifest: Dict[str, Any]) -> List[str]:
+    """Compare live row counts and checksums with a manifest; returns mismatched tables."""
+    if settings.DB_TYPE == "sqlite":
+        conn = sqlite3.connect(settings.SQLITE_DB_PATH)
+        try:
+            live = _sqlite_table_stats(conn)
+        finally:
+            conn.close()
+    else:
+        from db.database import get_connection
+
+        with get_connection() as conn:
+            live = _pg_table_stats(conn.cursor())
+    mismatched = [table for table, expected in manifest["tables"].items() if live.get(table) != expected]
+    for table in mismatched:
+        logger.error(f"Restore verification failed for {table}: expected {manifest['tables'][table]}, got {live.get(table)}")
+    return mismatched
+
+
+def _reset_caches() -> None:
+    """Drop in-process caches that may describe pre-restore rows."""
+    from db import database, partitions, sessions
+
+    database._user_cache.clear()
+    sessions._token_cache.clear()
+    partitions._partitioned_cache.clear()
 
 
 def restore_backup(backup_path: str) -> bool:
-    """Restore database from a backup file."""
+    """
+    Restore database from a backup and verify it.
+
+    Accepts a manifest from create_backup (chunks are checked against their
+    hashes while the files are reassembled in parallel) or a plain .sql
+    dump from earlier versions. Postgres restores with parallel pg_restore;
+    SQLite closes this process's connections and copies the reassembled
+    database over the live one with the backup API. Afterwards every table's row count and checksum must match
+    the manifest.
+    """
     if not os.path.exists(backup_path):
         logger.error(f"Backup file not found: {backup_path}")
         return False
 
+    work_dir = None
     try:
-        env = os.environ.copy()
-        env["PGPASSWORD"] = settings.DB_PASSWORD
-
-        cmd = [
-            "psql",
-            "-h",
-            settings.DB_HOST,
-            "-p",
-            settings.DB_PORT,
-            "-U",
-            settings.DB_USER,
-            "-d",
-            settings.DB_NAME,
-            "-f",
-            backup_path,
-        ]
+        if backup_path.endswith(".sql"):
+            return _restore_legacy_sql(backup_path)
+
+        with open(backup_path) as f:
+            manifest = json.load(f)
+        if manifest.get("backend") != settings.DB_TYPE:
+            logger.error(f"Backup is for {manifest.get('backend')}, database is {settings.DB_TYPE}")
+            return False
 
         logger.info(f"Starting restore from: {backup_path}")
-        result = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        work_dir = tempfile.mkdtemp(prefix=".restore-", dir=BACKUP_DIR)
+        with ThreadPoolExecutor(max_workers=settings.BACKUP_JOBS) as executor:
+            for future in [executor.submit(_assemble_file, entry, work_dir) for entry in manifest["files"]]:
+                future.result()
+
+        if settings.DB_TYPE == "sqlite":
+            restored = os.path.join(work_dir, "database.sqlite")
+            conn = sqlite3.connect(restored)
+            try:
+                if conn.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+                    logger.error("Restored SQLite database failed integrity_check")
+                    return False
+            finally:
+                conn.close()
+            _restore_sqlite(restored, settings.SQLITE_DB_PATH)
+        else:
+            _run_tool(
+                ["pg_restore", *_pg_args(), "--clean", "--if-exists", "--no-owner",
+                 f"--jobs={settings.BACKUP_JOBS}", os.path.join(work_dir, "dump")],
+                "Restore",
+            )
+        _reset_caches()
 
-        if result.returncode != 0:
-            logger.error(f"Restore failed: {result.stderr}")
+        if verify_restore(manifest):
             return False
-
-        logger.info(f"Restore completed successfully")
+        logger.info(f"Restore completed and verified ({len(manifest['tables'])} tables)")
         return True
 
-    except FileNotFoundError:
-        logger.error("psql not found. Please install PostgreSQL client tools.")
-        return False
     except Exception as e:
         from core.safe_logging import log_exception_safe
         log_exception_safe(logger, "Restore error", e)
         return False
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _backup_files() -> List[Path]:
+    """Manifests plus legacy plain-SQL dumps, oldest first."""
+    backups = list(Path(BACKUP_DIR).glob(f"{BACKUP_PREFIX}*.json"))
+    backups += Path(BACKUP_DIR).glob(f"{BACKUP_PREFIX}*.sql")
+    return sorted(backups, key=lambda p: p.stem)
 
 
 def list_backups() -> List[str]:
     """List all available backups."""
     ensure_backup_dir()
-    backups = sorted(Path(BACKUP_DIR).glob("nursing_validator_*.sql"))
-    return [str(b) for b in backups]
+    return [str(b) for b in _backup_files()]
+
+
+def _collect_chunks() -> int:
+    """Delete chunks no remaining manifest references; returns how many."""
+    referenced = set()
+    for manifest_path in Path(BACKUP_DIR).glob("*.json"):
+        with open(manifest_path) as f:
+            for entry in json.load(f).get("files", []):
+                referenced.update(entry["chunks"])
+    removed = 0
+    for chunk in Path(BACKUP_DIR, "chunks").glob("*/*"):
+        if chunk.name not in referenced:
+            chunk.unlink()
+            removed += 1
+    return removed
 
 
 def cleanup_old_backups(keep_count: int = 10) -> int:
-    """Delete old backups, keeping only the most recent."""
+    """Delete old backups, keeping only the most recent, then unreferenced chunks."""
     ensure_backup_dir()
-    backups = sorted(Path(BACKUP_DIR).glob("nursing_validator_*.sql"))
+    backups = _backup_files()
 
     if len(backups) <= keep_count:
         logger.info(f"Keeping {len(backups)} backups (under limit of {keep_count})")
         return 0
 
-    to_delete = backups[:-keep_count]
+    to_delete = backups[:-keep_count] if keep_count > 0 else backups
     deleted_count = 0
 
-    for backup in to_delete:
-        try:
-            backup.unlink()
-            deleted_count += 1
-            logger.info(f"Deleted old backup: {backup.name}")
-        except Exception as e:
-            from core.safe_logging import log_exception_safe
-            log_exception_safe(logger, "Failed to delete backup file", e, level="warning")
-
-    logger.info(f"Cleaned up {deleted_count} old backups")
+    with _backup_lock():
+        for backup in to_delete:
+            try:
+                backup.unlink()
+                deleted_count += 1
+                logger.info(f"Deleted old backup: {backup.name}")
+            except Exception as e:
+                from core.safe_logging import log_exception_safe
+                log_exception_safe(logger, "Failed to delete backup file", e, level="warning")
+        removed_chunks = _collect_chunks()
+
+    logger.info(f"Cleaned up {deleted_count} old backups ({removed_chunks} unreferenced chunks)")
     return deleted_count
 
 
+LEDGER_TABLE = "schema_migrations"
+
+# pg_advisory_lock key shared by every process running migrations
+_PG_LOCK_KEY = 0x6E76_0015
+
+# Backfill ranges executed by a dry run before extrapolating
+DRY_RUN_SAMPLE_BATCHES = 3
+
+
+class MigrationError(Exception):
+    """Raised when the ledger and the known migrations disagree."""
+
+
 class Migration:
-    """Base class for database migrations."""
+    """
+    Base class for database migrations.
+
+    ``up``/``down`` receive the MigrationRunner and express the change as
+    steps (``execute``, ``apply``, ``create_index``, ``drop_index``,
+    ``backfill``). By default all steps share one transaction. Set
+    ``online`` to give every step its own short transaction instead; such
+    steps must be idempotent, since a failure leaves earlier steps applied
+    and the migration is retried from the start on the next run.
+    """
 
     version: int = 0
     description: str = ""
+    online: bool = False
 
-    def up(self):
+    def up(self, runner: "MigrationRunner"):
         """Apply migration."""
         raise NotImplementedError
 
-    def down(self):
+    def down(self, runner: "MigrationRunner"):
         """Rollback migration."""
         raise NotImplementedError
 
+    def checksum(self) -> str:
+        """SHA-256 of the migration's source, recorded in the ledger."""
+        try:
+            source = inspect.getsource(type(self))
+        except (OSError, TypeError):
+            source = f"{self.version}:{self.description}"
+        normalized = "\n".join(line.rstrip() for line in source.strip().splitlines())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
 
 class Migration001CreateInitialSchema(Migration):
     """Initial schema creation."""
@@ -172,25 +575,19 @@ class Migration001CreateInitialSchema(Migration):
     version = 1
     description = "Create initial schema with users, sessions, chat_history, audit_logs"
 
-    def up(self):
+    def up(self, runner):
         """Create initial tables."""
-        from db.database import init_database
+        from db.database import create_schema
 
-        init_database()
+        runner.apply("create baseline schema", create_schema)
         logger.info("Migration 001: Schema created")
 
-    def down(self):
+    def down(self, runner):
         """Drop tables."""
-        from db.database import get_connection
-
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("DROP TABLE IF EXISTS analytics_events CASCADE")
-            cur.execute("DROP TABLE IF EXISTS audit_logs CASCADE")
-            cur.execute("DROP TABLE IF EXISTS chat_history CASCADE")
-            cur.execute("DROP TABLE IF EXISTS sessions CASCADE")
-            cur.execute("DROP TABLE IF EXISTS users CASCADE")
-            logger.info("Migration 001: Schema dropped")
+        cascade = " CASCADE" if settings.DB_TYPE == "postgres" else ""
+        for table in ("analytics_events", "audit_logs", "chat_history", "sessions", "users"):
+            runner.execute(f"DROP TABLE IF EXISTS {table}{cascade}")
+        logger.info("Migration 001: Schema dropped")
 
 
 class Migration002AddAnalyticsTables(Migration):
@@ -199,21 +596,151 @@ class Migration002AddAnalyticsTables(Migration):
     version = 2
     description = "Add analytics_events and related tables"
 
-    def up(self):
+    def up(self, runner):
         """Create analytics tables."""
-        from db.database import init_database
+        from db.database import create_schema
 
-        init_database()
+        runner.apply("create baseline schema", create_schema)
         logger.info("Migration 002: Analytics tables added")
 
-    def down(self):
+    def down(self, runner):
         """Drop analytics tables."""
-        from db.database import get_connection
+        cascade = " CASCADE" if settings.DB_TYPE == "postgres" else ""
+        runner.execute(f"DROP TABLE IF EXISTS analytics_events{cascade}")
+        logger.info("Migration 002: Analytics tables removed")
 
-        with get_connection() as conn:
-            cur = conn.cursor()
-            cur.execute("DROP TABLE IF EXISTS analytics_events CASCADE")
-            logger.info("Migration 002: Analytics tables removed")
+
+class Migration003ChatHistoryKeysetIndex(Migration):
+    """Composite index behind keyset pagination of chat history."""
+
+    version = 3
+    description = "Add chat_history (user_id, created_at, id) index"
+    online = True
+
+    def up(self, runner):
+        runner.create_index("idx_chat_user_created", "chat_history", ["user_id", "created_at", "id"])
+
+    def down(self, runner):
+        runner.drop_index("idx_chat_user_created")
+
+
+class Migration004ChatSearchIndex(Migration):
+    """Full-text search over chat messages."""
+
+    version = 4
+    description = "Add chat history full-text index"
+    online = True
+
+    def up(self, runner):
+        from db.chat_search import TSV_EXPRESSION, ensure_chat_search_index
+
+        runner.apply("create full-text index and triggers", ensure_chat_search_index)
+        if settings.DB_TYPE == "postgres":
+            runner.backfill("chat_history", f"content_tsv = {TSV_EXPRESSION}", "content_tsv IS NULL")
+            runner.create_index("idx_chat_content_tsv", "chat_history", ["content_tsv"], using="GIN")
+
+    def down(self, runner):
+        from db.chat_search import drop_chat_search_index
+
+        runner.apply("drop full-text index", drop_chat_search_index)
+
+
+class Migration005SessionExpiryIndex(Migration):
+    """Session sweeper index and the maintained active-session counter."""
+
+    version = 5
+    description = "Add sessions (is_active, expires_at) index and session_counters"
+    online = True
+
+    def up(self, runner):
+        from db.sessions import ensure_session_counter
+
+        runner.create_index("idx_sessions_active_expires", "sessions", ["is_active", "expires_at"])
+        runner.apply("create session counter", ensure_session_counter)
+
+    def down(self, runner):
+        runner.execute("DROP TABLE IF EXISTS session_counters")
+        runner.drop_index("idx_sessions_active_expires")
+
+
+class Migration006AnswerCache(Migration):
+    """Persistent store of the semantic answer cache."""
+
+    version = 6
+    description = "Add answer_cache table"
+    online = True
+
+    def up(self, runner):
+        from db.answer_cache import ensure_answer_cache_table
+
+        runner.apply("create answer cache table", ensure_answer_cache_table)
+
+    def down(self, runner):
+        runner.execute("DROP TABLE IF EXISTS answer_cache")
+
+
+class Migration007RollupTxidWatermark(Migration):
+    """Commit-safe analytics rollup watermark on Postgres (see db.rollups)."""
+
+    version = 7
+    description = "Add analytics_events.txid and a transaction-id rollup watermark"
+    online = True
+
+    def up(self, runner):
+        if settings.DB_TYPE != "postgres":
+            return  # SQLite ids become visible in order; the id watermark stays
+        from db.partitions import is_partitioned
+        from db.rollups import watermark
+
+        runner.execute("ALTER TABLE analytics_events ADD COLUMN IF NOT EXISTS txid BIGINT")
+        runner.execute("ALTER TABLE analytics_events ALTER COLUMN txid SET DEFAULT txid_current()")
+        # Rows already under the id watermark sort below every real
+        # transaction id, the rest just above the new watermark
+        runner.backfill(
+            "analytics_events",
+            "txid = CASE WHEN id <= (SELECT COALESCE(MAX(last_id), 0) FROM rollup_watermarks "
+            "WHERE name = 'analytics_events') THEN 0 ELSE 1 END",
+            "txid IS NULL",
+        )
+        if is_partitioned("analytics_events"):
+            # CONCURRENTLY is not supported on a partitioned parent
+            runner.execute("CREATE INDEX IF NOT EXISTS idx_analytics_events_txid ON analytics_events(txid)")
+        else:
+            runner.create_index("idx_analytics_events_txid", "analytics_events", ["txid"])
+        # Last, so no refresh starts on the new watermark before the backfill is done
+        runner.execute(
+            "INSERT INTO rollup_watermarks (name, last_id) VALUES (%s, 0) ON CONFLICT DO NOTHING",
+            (watermark()[0],),
+        )
+
+    def down(self, runner):
+        if settings.DB_TYPE != "postgres":
+            return
+        # Resume the id watermark after the last event rolled up by transaction id
+        runner.execute(
+            "UPDATE rollup_watermarks SET last_id = (SELECT COALESCE(MAX(id), 0) FROM analytics_events "
+            "WHERE txid <= (SELECT last_id FROM rollup_watermarks WHERE name = 'analytics_events_txid')) "
+            "WHERE name = 'analytics_events'"
+        )
+        runner.execute("DELETE FROM rollup_watermarks WHERE name = 'analytics_events_txid'")
+        runner.drop_index("idx_analytics_events_txid")
+        runner.execute("ALTER TABLE analytics_events DROP COLUMN IF EXISTS txid")
+
+
+class Migration008AnswerCacheGeneration(Migration):
+    """Purge counter that tells other processes to drop cached answers."""
+
+    version = 8
+    description = "Add answer_cache_generation"
+    online = True
+
+    def up(self, runner):
+        from db.answer_cache import ensure_answer_cache_table
+
+        runner.apply("create answer cache generation", ensure_answer_cache_table)
+
+    def down(self, runner):
+        runner.execute("DROP TABLE IF EXISTS answer_cache_generation")
 
 
 def get_migrations() -> List[Migration]:
@@ -221,52 +748,493 @@ def get_migrations() -> List[Migration]:
     return [
         Migration001CreateInitialSchema(),
         Migration002AddAnalyticsTables(),
+        Migration003ChatHistoryKeysetIndex(),
+        Migration004ChatSearchIndex(),
+        Migration005SessionExpiryIndex(),
+        Migration006AnswerCache(),
+        Migration007RollupTxidWatermark(),
+        Migration008AnswerCacheGeneration(),
     ]
 
 
-def run_migrations() -> bool:
-    """Run all pending migrations."""
-    from db.database import get_connection
+def _describe(statement: str) -> str:
+    return " ".join(statement.split())[:80]
 
-    logger.info("Starting migration process...")
 
-    try:
+class MigrationRunner:
+    """
+    Applies migrations and keeps the ledger.
+
+    Only one runner works on a database at a time (a Postgres advisory lock,
+    or a lock file next to the SQLite database), so several app processes
+    can start together safely.
+
+    Args:
+        migrations: Migrations to consider (default: get_migrations())
+        dry_run: Execute inside a rolled-back transaction and only report timings
+        verify_checksums: Fail when an applied migration's source has changed
+    """
+
+    def __init__(
+        self,
+        migrations: Optional[List[Migration]] = None,
+        dry_run: bool = False,
+        verify_checksums: bool = True,
+    ):
+        self.migrations = sorted(
+            migrations if migrations is not None else get_migrations(),
+            key=lambda m: m.version,
+        )
+        self.dry_run = dry_run
+        self.verify_checksums = verify_checksums
+        self._cur = None  # set while steps share one transaction
+        self._steps: List[Dict[str, Any]] = []
+
+    # -- connections -----------------------------------------------------
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Hold the cross-process migration lock."""
+        if settings.DB_TYPE == "sqlite":
+            from core.chat_store import _file_lock
+
+            with _file_lock(settings.SQLITE_DB_PATH + ".migrate.lock"):
+                yield
+            return
+
+        from db.database import get_connection
+
+        with get_connection() as conn:
+            # Session-level lock held outside any transaction, so it does not
+            # count as an old snapshot that CREATE INDEX CONCURRENTLY waits on
+            conn.autocommit = True
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT pg_advisory_lock(%s)", (_PG_LOCK_KEY,))
+                try:
+                    yield
+                finally:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (_PG_LOCK_KEY,))
+            finally:
+                conn.autocommit = False
+
+    @contextmanager
+    def _transaction(self, rollback: bool = False) -> Iterator[Any]:
+        """A cursor in a fresh transaction, committed (or rolled back) on exit."""
+        from db.database import get_connection
+
         with get_connection() as conn:
             cur = conn.cursor()
+            if settings.DB_TYPE == "sqlite":
+                # Explicit so DDL is transactional too; waits up to busy_timeout
+                cur.execute("BEGIN IMMEDIATE")
+            else:
+                cur.execute(f"SET LOCAL lock_timeout = {int(settings.MIGRATION_LOCK_TIMEOUT_MS)}")
+            yield cur
+            if rollback:
+                conn.rollback()
+
+    @contextmanager
+    def _autocommit(self) -> Iterator[Any]:
+        """A Postgres cursor outside any transaction (for CONCURRENTLY)."""
+        from db.database import get_connection
 
-            # Create migrations table if it doesn't exist
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS schema_migrations (
-                    id SERIAL PRIMARY KEY,
-                    version INTEGER UNIQUE NOT NULL,
-                    description VARCHAR(255),
-                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        with get_connection() as conn:
+            conn.autocommit = True
+            try:
+                cur = conn.cursor()
+                cur.execute(f"SET lock_timeout = {int(settings.MIGRATION_LOCK_TIMEOUT_MS)}")
+                try:
+                    yield cur
+                finally:
+                    cur.execute("RESET lock_timeout")
+            finally:
+                conn.autocommit = False
+
+    def _query(self, fn: Callable[[Any], Any], autocommit: bool = False) -> Any:
+        """Run ``fn(cursor)`` in the shared transaction, or in its own one."""
+        if self._cur is not None:
+            return fn(self._cur)
+        if autocommit and settings.DB_TYPE == "postgres":
+            with self._autocommit() as cur:
+                return fn(cur)
+        with self._transaction() as cur:
+            return fn(cur)
+
+    def _record(self, label: str, seconds: float, **extra: Any) -> None:
+        self._steps.append(dict(step=label, seconds=round(seconds, 6), **extra))
+        logger.info(f"  {label}: {seconds:.3f}s" + (" (estimated)" if extra.get("estimated") else ""))
+
+    # -- steps -----------------------------------------------------------
+
+    def apply(self, label: str, fn: Callable[[Any], Any]) -> None:
+        """Run ``fn(cursor)`` as one step."""
+        started = time.perf_counter()
+        self._query(fn)
+        self._record(label, time.perf_counter() - started)
+
+    def execute(self, statement: str, params: Optional[tuple] = None) -> None:
+        """Run one SQL statement (``%s`` placeholders) as a step."""
+        from db.database import _adapt_query
+
+        statement = _adapt_query(statement)
+        self.apply(
+            _describe(statement),
+            lambda cur: cur.execute(statement) if params is None else cur.execute(statement, params),
+        )
+
+    def create_index(
+        self,
+        name: str,
+        table: str,
+        columns: List[str],
+        unique: bool = False,
+        using: Optional[str] = None,
+        where: Optional[str] = None,
+    ) -> None:
+        """
+        Create an index without blocking writes where the backend allows it.
+
+        On Postgres, outside a shared transaction, this is CREATE INDEX
+        CONCURRENTLY; an invalid index left by an interrupted build is
+        dropped and rebuilt. SQLite has no online build: the statement holds
+        the write lock for its duration (writers wait up to busy_timeout).
+        """
+        concurrently = settings.DB_TYPE == "postgres" and self._cur is None
+        statement = (
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX "
+            f"{'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name} "
+            f"ON {table}{f' USING {using}' if using else ''} ({', '.join(columns)})"
+            f"{f' WHERE {where}' if where else ''}"
+        )
+
+        def build(cur):
+            if concurrently:
+                cur.execute(
+                    "SELECT i.indisvalid FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s",
+                    (name,),
                 )
-            """
+                row = cur.fetchone()
+                if row is not None and not row[0]:
+                    logger.warning(f"Rebuilding invalid index {name} left by an interrupted build")
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            cur.execute(statement)
+
+        started = time.perf_counter()
+        self._query(build, autocommit=True)
+        self._record(f"create index {name}", time.perf_counter() - started)
+
+    def drop_index(self, name: str) -> None:
+        """Drop an index (concurrently on Postgres outside a shared transaction)."""
+        concurrently = settings.DB_TYPE == "postgres" and self._cur is None
+        started = time.perf_counter()
+        self._query(
+            lambda cur: cur.execute(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}"),
+            autocommit=True,
+        )
+        self._record(f"drop index {name}", time.perf_counter() - started)
+
+    def backfill(
+        self,
+        table: str,
+        assignments: str,
+        where: str,
+        params: tuple = (),
+        batch_size: Optional[int] = None,
+        pause: Optional[float] = None,
+        key: str = "id",
+    ) -> int:
+        """
+        ``UPDATE table SET assignments WHERE where`` one ``key`` range at a time.
+
+        Each range of ``batch_size`` keys is its own transaction, followed by
+        a ``pause`` so replicas and concurrent writers keep up. ``where`` must
+        exclude rows already done (e.g. ``col IS NULL``) so an interrupted
+        backfill resumes cheaply. ``params`` fill ``%s`` in ``assignments``
+        then ``where``. A dry run executes the first DRY_RUN_SAMPLE_BATCHES
+        ranges and extrapolates the total. Returns rows updated.
+        """
+        from db.database import _adapt_query
+
+        batch_size = batch_size or settings.MIGRATION_BACKFILL_BATCH
+        pause = settings.MIGRATION_BACKFILL_PAUSE if pause is None else pause
+        label = f"backfill {table}: {_describe(assignments)}"
+
+        def bounds(cur):
+            cur.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}")
+            return tuple(cur.fetchone())
+
+        low, high = self._query(bounds)
+        if low is None:
+            self._record(label, 0.0, rows=0)
+            return 0
+
+        statement = _adapt_query(
+            f"UPDATE {table} SET {assignments} WHERE ({where}) AND {key} >= %s AND {key} < %s"
+        )
+        batches = (high - low) // batch_size + 1
+        run_batches = min(batches, DRY_RUN_SAMPLE_BATCHES) if self.dry_run else batches
+        updated = 0
+        started = time.perf_counter()
+        for i in range(run_batches):
+            start = low + i * batch_size
+
+            def update(cur, start=start):
+                cur.execute(statement, tuple(params) + (start, start + batch_size))
+                return max(cur.rowcount, 0)
+
+            updated += self._query(update)
+            if (i + 1) % 100 == 0:
+                logger.info(f"  {label}: {i + 1}/{batches} batches, {updated} rows")
+            if pause and not self.dry_run and i + 1 < run_batches:
+                time.sleep(pause)
+
+        elapsed = time.perf_counter() - started
+        if run_batches < batches:
+            estimate = elapsed / run_batches * batches + pause * (batches - 1)
+            self._record(label, estimate, rows=updated, batches=batches, estimated=True)
+        else:
+            self._record(label, elapsed, rows=updated, batches=batches)
+        return updated
+
+    # -- ledger ----------------------------------------------------------
+
+    def _ledger_exists(self, cur) -> bool:
+        if settings.DB_TYPE == "sqlite":
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (LEDGER_TABLE,))
+            return cur.fetchone() is not None
+        cur.execute("SELECT to_regclass(%s)", (LEDGER_TABLE,))
+        return cur.fetchone()[0] is not None
+
+    def _ensure_ledger(self, cur) -> None:
+        pk_type = "INTEGER PRIMARY KEY AUTOINCREMENT" if settings.DB_TYPE == "sqlite" else "SERIAL PRIMARY KEY"
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {LEDGER_TABLE} (
+                id {pk_type},
+                version INTEGER UNIQUE NOT NULL,
+                description VARCHAR(255),
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                checksum VARCHAR(64),
+                execution_ms INTEGER
             )
+        """)
+        # Ledgers created before checksums were recorded
+        cur.execute(f"SELECT * FROM {LEDGER_TABLE} WHERE 1 = 0")
+        columns = {d[0] for d in cur.description}
+        for column, column_type in (("checksum", "VARCHAR(64)"), ("execution_ms", "INTEGER")):
+            if column not in columns:
+                cur.execute(f"ALTER TABLE {LEDGER_TABLE} ADD COLUMN {column} {column_type}")
+
+    def _read_ledger(self, cur) -> Dict[int, Dict[str, Any]]:
+        # SELECT * so a dry run can read a ledger that predates checksums
+        cur.execute(f"SELECT * FROM {LEDGER_TABLE} ORDER BY version")
+        columns = [d[0] for d in cur.description]
+        applied = {}
+        for row in cur.fetchall():
+            entry = dict(zip(columns, tuple(row)))
+            applied[entry["version"]] = {
+                "version": entry["version"],
+                "description": entry.get("description"),
+                "checksum": entry.get("checksum"),
+                "execution_ms": entry.get("execution_ms"),
+                "applied_at": entry.get("applied_at"),
+            }
+        return applied
+
+    def _load_ledger(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Applied migrations by version, after verifying checksums.
+
+        Entries recorded without a checksum are stamped with the current one.
+        A dry run reads the ledger but never creates or changes it.
+        """
+        from db.database import _adapt_query
+
+        def load(cur):
+            if self.dry_run:
+                if not self._ledger_exists(cur):
+                    return {}
+            else:
+                self._ensure_ledger(cur)
+            applied = self._read_ledger(cur)
+
+            known = {m.version: m for m in self.migrations}
+            changed = []
+            for version, entry in applied.items():
+                migration = known.get(version)
+                if migration is None:
+                    continue
+                if entry["checksum"] is None:
+                    entry["checksum"] = migration.checksum()
+                    if not self.dry_run:
+                        cur.execute(_adapt_query(
+                            f"UPDATE {LEDGER_TABLE} SET checksum = %s WHERE version = %s"
+                        ), (entry["checksum"], version))
+                elif entry["checksum"] != migration.checksum():
+                    changed.append(version)
+            if changed and self.verify_checksums:
+                raise MigrationError(
+                    f"Applied migration(s) {changed} no longer match their recorded checksum; "
+                    "add a new migration instead of editing an applied one"
+                )
+            for version in changed:
+                logger.warning(f"Migration {version} changed since it was applied")
+            return applied
+
+        return self._query(load)
+
+    def _record_applied(self, cur, migration: Migration, seconds: float) -> None:
+        from db.database import _adapt_query
+
+        cur.execute(_adapt_query(
+            f"INSERT INTO {LEDGER_TABLE} (version, description, checksum, execution_ms) "
+            "VALUES (%s, %s, %s, %s)"
+        ), (migration.version, migration.description, migration.checksum(), int(seconds * 1000)))
+
+    # -- public API ------------------------------------------------------
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Every known or recorded migration with its applied state."""
+        applied = self._load_ledger()
+        rows = []
+        for migration in self.migrations:
+            entry = applied.get(migration.version)
+            rows.append({
+                "version": migration.version,
+                "description": migration.description,
+                "online": migration.online,
+                "applied": entry is not None,
+                "applied_at": entry["applied_at"] if entry else None,
+                "execution_ms": entry["execution_ms"] if entry else None,
+                "checksum_ok": entry["checksum"] == migration.checksum() if entry else None,
+            })
+        known = {m.version for m in self.migrations}
+        for version, entry in applied.items():
+            if version not in known:
+                rows.append({
+                    "version": version,
+                    "description": entry["description"],
+                    "online": None,
+                    "applied": True,
+                    "applied_at": entry["applied_at"],
+                    "execution_ms": entry["execution_ms"],
+                    "checksum_ok": None,
+                })
+        return sorted(rows, key=lambda r: r["version"])
+
+    def pending(self, target: Optional[int] = None) -> List[Migration]:
+        """Migrations not yet applied, up to ``target`` when given."""
+        applied = self._load_ledger()
+        return [
+            m for m in self.migrations
+            if m.version not in applied and (target is None or m.version <= target)
+        ]
 
-            # Get applied migrations
-            cur.execute("SELECT version FROM schema_migrations ORDER BY version")
-            applied = {row[0] for row in cur.fetchall()}
-
-            # Run pending migrations
-            for migration in get_migrations():
-                if migration.version not in applied:
-                    logger.info(
-                        f"Running migration {migration.version}: "
-                        f"{migration.description}"
-                    )
-                    migration.up()
-
-                    cur.execute(
-                        """
-                        INSERT INTO schema_migrations (version, description)
-                        VALUES (%s, %s)
-                    """,
-                        (migration.version, migration.description),
-                    )
+    def _report(self, migration: Migration, seconds: float) -> Dict[str, Any]:
+        return {
+            "version": migration.version,
+            "description": migration.description,
+            "online": migration.online,
+            "dry_run": self.dry_run,
+            "seconds": round(seconds, 6),
+            "estimated_seconds": round(sum(step["seconds"] for step in self._steps), 6),
+            "steps": self._steps,
+        }
+
+    def run(self, target: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Apply pending migrations (up to ``target``) in version order.
+
+        Returns one report per migration with per-step timings. In a dry
+        run every pending migration executes inside a single transaction
+        that is rolled back, so later migrations see earlier ones; on
+        Postgres indexes are then built non-concurrently and take the locks
+        a plain CREATE INDEX would, so point dry runs at a staging copy.
+        """
+        reports = []
+        with self._exclusive():
+            pending = self.pending(target)
+            if not pending:
+                logger.info("No pending migrations")
+                return reports
+
+            if self.dry_run:
+                with self._transaction(rollback=True) as cur:
+                    self._cur = cur
+                    try:
+                        for migration in pending:
+                            reports.append(self._run_one(migration))
+                    finally:
+                        self._cur = None
+                return reports
+
+            for migration in pending:
+                reports.append(self._run_one(migration))
+        return reports
+
+    def _run_one(self, migration: Migration) -> Dict[str, Any]:
+        prefix = "Dry-running" if self.dry_run else "Running"
+        logger.info(f"{prefix} migration {migration.version}: {migration.description}")
+        self._steps = []
+        started = time.perf_counter()
+        if self._cur is not None:
+            migration.up(self)
+        elif migration.online:
+            migration.up(self)
+            with self._transaction() as cur:
+                self._record_applied(cur, migration, time.perf_counter() - started)
+        else:
+            with self._transaction() as cur:
+                self._cur = cur
+                try:
+                    migration.up(self)
+                    self._record_applied(cur, migration, time.perf_counter() - started)
+                finally:
+                    self._cur = None
+        return self._report(migration, time.perf_counter() - started)
+
+    def rollback(self, steps: int = 1) -> List[int]:
+        """Revert the ``steps`` most recently applied migrations; returns their versions."""
+        from db.database import _adapt_query
+
+        delete = _adapt_query(f"DELETE FROM {LEDGER_TABLE} WHERE version = %s")
+        reverted = []
+        with self._exclusive():
+            applied = self._load_ledger()
+            known = {m.version: m for m in self.migrations}
+            for version in sorted(applied, reverse=True)[:steps]:
+                migration = known.get(version)
+                if migration is None:
+                    raise MigrationError(f"Migration {version} is in the ledger but unknown to this build")
+                logger.info(f"Rolling back migration {version}")
+                self._steps = []
+                if migration.online:
+                    migration.down(self)
+                    with self._transaction() as cur:
+                        cur.execute(delete, (version,))
+                else:
+                    with self._transaction() as cur:
+                        self._cur = cur
+                        try:
+                            migration.down(self)
+                            cur.execute(delete, (version,))
+                        finally:
+                            self._cur = None
+                reverted.append(version)
+        return reverted
+
+
+def run_migrations(target: Optional[int] = None) -> bool:
+    """Run all pending migrations (up to ``target``)."""
+    logger.info("Starting migration process...")
 
+    try:
+        reports = MigrationRunner().run(target)
+        for report in reports:
+            logger.info(
+                f"Migration {report['version']} applied in {report['seconds']:.3f}s"
+            )
         logger.info("All migrations completed successfully")
         return True
 
@@ -276,40 +1244,45 @@ def run_migrations() -> bool:
         return False
 
 
+def dry_run_migrations(target: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Time pending migrations without applying them (see MigrationRunner.run)."""
+    return MigrationRunner(dry_run=True).run(target)
+
+
 def rollback_migration(steps: int = 1) -> bool:
     """Rollback N migrations."""
-    from db.database import get_connection
-
     logger.info(f"Rolling back {steps} migration(s)...")
 
     try:
-        with get_connection() as conn:
-            cur = conn.cursor()
-
-            # Get applied migrations
-            cur.execute(
-                "SELECT version FROM schema_migrations "
-                "ORDER BY version DESC LIMIT %s",
-                (steps,),
-            )
-            to_rollback = [row[0] for row in cur.fetchall()]
-
-            # Rollback in reverse order
-            migrations_map = {m.version: m for m in get_migrations()}
-            for version in to_rollback:
-                if version in migrations_map:
-                    logger.info(f"Rolling back migration {version}")
-                    migrations_map[version].down()
-
-                    cur.execute(
-                        "DELETE FROM schema_migrations WHERE version = %s",
-                        (version,),
-                    )
-
-        logger.info(f"Rolled back {len(to_rollback)} migration(s)")
+        reverted = MigrationRunner().rollback(steps)
+        logger.info(f"Rolled back {len(reverted)} migration(s)")
         return True
 
     except Exception as e:
         from core.safe_logging import log_exception_safe
         log_exception_safe(logger, "Rollback failed", e)
         return False
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Schema migrations")
+    parser.add_argument("command", choices=["status", "migrate", "dry-run", "rollback"])
+    parser.add_argument("--target", type=int, help="highest version to apply")
+    parser.add_argument("--steps", type=int, default=1, help="migrations to roll back")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "status":
+        result: Any = MigrationRunner().status()
+    elif args.command == "migrate":
+        result = MigrationRunner().run(args.target)
+    elif args.command == "dry-run":
+        result = dry_run_migrations(args.target)
+    else:
+        result = MigrationRunner().rollback(args.steps)
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
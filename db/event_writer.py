@@ -0,0 +1,463 @@
+"""
+Write-behind queue for audit and analytics events.
+
+Audit and analytics inserts used to run synchronously on the user's request
+path (user lookup, single-row INSERT, commit). EventWriter buffers them in a
+bounded in-memory queue and a background thread flushes them in multi-row
+batches, triggered by batch size or by the flush interval, whichever comes
+first. When the queue is full callers block briefly (backpressure) and then
+fall back to a synchronous write, so events are never silently dropped.
+
+Each batch is written in one transaction, so a failed flush can be retried
+without duplicating rows. A batch that still fails after ``max_retries``
+(e.g. the database is down) is spilled to a JSONL file under
+EVENT_SPILL_DIR and replayed once a later flush succeeds.
+"""
+
+import os
+import json
+import uuid
+import atexit
+import time
+import queue
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core.settings import settings
+from core.safe_logging import log_exception_safe
+
+logger = logging.getLogger(__name__)
+
+# Event kinds understood by the database flush function
+AUDIT = "audit"
+ANALYTICS = "analytics"
+
+Event = Tuple[str, Dict[str, Any]]
+
+
+class EventSpill:
+    """
+    Batches that could not be written, kept on disk until they can be.
+
+    Each batch is one ``<timestamp>-<id>.jsonl`` file (written to a temp
+    name, then renamed), replayed oldest first.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def save(self, batch: List[Event]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.time():017.6f}-{uuid.uuid4().hex}.jsonl"
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            for kind, event in batch:
+                f.write(json.dumps([kind, event], default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        return path
+
+    def pending(self) -> List[str]:
+        """Spilled batch files, oldest first."""
+        try:
+            names = sorted(n for n in os.listdir(self.directory) if n.endswith(".jsonl"))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, n) for n in names]
+
+    def load(self, path: str) -> List[Event]:
+        with open(path, encoding="utf-8") as f:
+            return [tuple(json.loads(line)) for line in f if line.strip()]
+
+
+class _Control:
+    """Queue sentinel asking the writer thread to flush (and optionally stop)."""
+
+    __slots__ = ("done", "stop")
+
+    def __init__(self, stop: bool = False):
+        self.done = threading.Event()
+        self.stop = stop
+
+
+class EventWriter:
+    """
+    Background batching writer.
+
+    Args:
+        flush_fn: Called from the writer thread with a list of ``(kind, event)``
+            tuples; must persist them in as few round trips as possible
+        batch_size: Flush as soon as this many events are buffered
+        flush_interval: Flush buffered events at most this many seconds after
+            the first one arrived
+        max_queue: Upper bound on queued events (bounds memory)
+        enqueue_timeout: Seconds ``submit`` blocks on a full queue before
+            giving up and returning False
+        max_retries: Flush attempts before a batch is spilled
+        spill: Where failed batches are kept for replay; without one they are
+            logged and discarded
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Event]], None],
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        enqueue_timeout: float = 0.25,
+        max_retries: int = 3,
+        spill: Optional[EventSpill] = None,
+    ):
+        self._flush_fn = flush_fn
+        self.spill = spill
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._putting = 0  # submits past the stopped check whose put has not returned
+        self._put_done = threading.Condition(self._lock)
+
+        self._submitted = 0
+        self._rejected = 0
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+        self._spilled = 0
+        self._replayed = 0
+        self._last_flush_s = 0.0
+
+    def start(self) -> "EventWriter":
+        """Start the background thread (idempotent)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="event-writer", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def submit(self, kind: str, event: Dict[str, Any]) -> bool:
+        """
+        Queue an event for the next batch.
+
+        Returns False if the writer is stopped or the queue stayed full for
+        ``enqueue_timeout`` seconds; the caller should then write synchronously.
+        """
+        with self._lock:
+            if self._stopped:
+                return False
+            self._putting += 1
+        # Outside the lock, so a producer waiting on a full queue holds up no
+        # one else; an event landing behind the shutdown sentinel is drained
+        # by the writer thread (see _drain_after_stop)
+        try:
+            self._queue.put((kind, event), timeout=self.enqueue_timeout)
+            accepted = True
+        except queue.Full:
+            accepted = False
+        with self._lock:
+            self._putting -= 1
+            if accepted:
+                self._submitted += 1
+            else:
+                self._rejected += 1
+            self._put_done.notify_all()
+        return accepted
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued before this call has been written."""
+        return self._control(_Control(), timeout)
+
+    def shutdown(self, timeout: Optional[float] = 10.0) -> bool:
+        """Flush remaining events and stop the background thread."""
+        ctl = _Control(stop=True)
+        with self._lock:
+            if self._stopped:
+                return True
+            self._stopped = True
+            if self._thread is None or not self._thread.is_alive():
+                return True
+        try:
+            self._queue.put(ctl, timeout=timeout)
+        except queue.Full:
+            return False
+        done = ctl.done.wait(timeout)
+        self._thread.join(timeout)
+        return done
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth and throughput counters."""
+        return {
+            "queued": self._queue.qsize(),
+            "submitted_total": self._submitted,
+            "rejected_total": self._rejected,
+            "written_total": self._written,
+            "failed_total": self._failed,
+            "batches_total": self._batches,
+            "spilled_total": self._spilled,
+            "replayed_total": self._replayed,
+            "spill_pending": len(self.spill.pending()) if self.spill is not None else 0,
+            "last_flush_s": round(self._last_flush_s, 6),
+        }
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+
+    def _control(self, ctl: _Control, timeout: Optional[float]) -> bool:
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.empty()
+        self._queue.put(ctl, timeout=timeout)
+        return ctl.done.wait(timeout)
+
+    def _run(self) -> None:
+        self._replay()  # batches spilled by an earlier run
+        buffer: List[Event] = []
+        deadline = 0.0
+        while True:
+            wait = self.flush_interval if not buffer else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, _Control):
+                controls = [item]
+                if item.stop:
+                    controls += self._drain_after_stop(buffer)
+                self._write(buffer)
+                buffer = []
+                for ctl in controls:
+                    ctl.done.set()
+                if item.stop:
+                    return
+                continue
+
+            if item is not None:
+                if not buffer:
+                    deadline = time.monotonic() + self.flush_interval
+                buffer.append(item)
+
+            if buffer and (len(buffer) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(buffer)
+                buffer = []
+
+    def _drain_after_stop(self, buffer: List[Event]) -> List[_Control]:
+        """
+        Move events queued behind the stop sentinel into ``buffer``.
+
+        Waits for submits that passed the stopped check before shutdown to
+        finish their put, so every event submit accepted is written. Returns
+        flush requests found on the way, to be completed with the write.
+        """
+        controls = []
+        while True:
+            try:
+                while True:
+                    item = self._queue.get_nowait()
+                    if isinstance(item, _Control):
+                        controls.append(item)
+                    else:
+                        buffer.append(item)
+            except queue.Empty:
+                pass
+            with self._lock:
+                if not self._putting and self._queue.empty():
+                    return controls
+                self._put_done.wait(0.05)
+
+    def _write(self, batch: List[Event]) -> None:
+        if not batch:
+            return
+        if self._flush(batch):
+            self._replay()
+            return
+        self._failed += len(batch)
+        if self.spill is not None:
+            try:
+                path = self.spill.save(batch)
+                self._spilled += len(batch)
+                logger.warning(f"Spilled {len(batch)} audit/analytics events to {path} for replay")
+                return
+            except Exception as e:
+                log_exception_safe(logger, "Failed to spill event batch", e)
+        logger.error(f"Discarded {len(batch)} audit/analytics events after {self.max_retries} attempts")
+
+    def _flush(self, batch: List[Event]) -> bool:
+        """Write ``batch`` (one transaction per attempt); False once every attempt failed."""
+        started = time.monotonic()
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._flush_fn(batch)
+                self._written += len(batch)
+                self._batches += 1
+                self._last_flush_s = time.monotonic() - started
+                return True
+            except Exception as e:
+                log_exception_safe(
+                    logger, f"Event batch flush failed (attempt {attempt})", e, level="warning"
+                )
+                if attempt < self.max_retries:
+                    time.sleep(min(0.1 * 2 ** attempt, 2.0))
+        return False
+
+    def _replay(self) -> None:
+        """Write spilled batches, oldest first, stopping at the first that still fails."""
+        if self.spill is None:
+            return
+        for path in self.spill.pending():
+            try:
+                batch = self.spill.load(path)
+            except Exception as e:
+                log_exception_safe(logger, f"Unreadable spilled event batch {os.path.basename(path)}", e)
+                continue
+            if not self._flush(batch):
+                return
+            os.remove(path)
+            self._replayed += len(batch)
+            logger.info(f"Replayed {len(batch)} spilled audit/analytics events")
+
+
+# ----------------------------------------------------------------------
+# Process-wide writer
+# ----------------------------------------------------------------------
+
+_writer: Optional[EventWriter] = None
+_writer_lock = threading.Lock()
+
+
+def _flush_events(batch: List[Event]) -> None:
+    """Resolve usernames once per batch and bulk-insert each event kind."""
+    from db.database import get_user, _insert_event_rows
+
+    user_ids: Dict[str, Optional[int]] = {}
+    rows: Dict[str, List[tuple]] = defaultdict(list)
+
+    for kind, event in batch:
+        user_id = event.get("user_id")
+        username = event.get("username")
+        if user_id is None and username:
+            if username not in user_ids:
+                user = get_user(username)
+                user_ids[username] = user["id"] if user else None
+            user_id = user_ids[username]
+
+        if kind == AUDIT:
+            if user_id is None and username:
+                continue  # Unknown user: matches synchronous audit_log behaviour
+            rows[AUDIT].append((
+                user_id,
+                event["action"],
+                event.get("resource_type"),
+                event.get("resource_id"),
+                event.get("changes"),
+                event.get("ip_address"),
+            ))
+        elif kind == ANALYTICS:
+            if user_id is None:
+                continue
+            rows[ANALYTICS].append((
+                user_id,
+                event["event_type"],
+                event["event_name"],
+                event.get("data"),
+            ))
+
+    # One transaction for both kinds: a retry never duplicates either
+    _insert_event_rows(rows)
+
+
+def get_event_writer() -> Optional[EventWriter]:
+    """Return the running process-wide writer, or None if write-behind is disabled."""
+    global _writer
+    if not settings.EVENT_WRITE_BEHIND:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = EventWriter(
+                    _flush_events,
+                    batch_size=settings.EVENT_BATCH_SIZE,
+                    flush_interval=settings.EVENT_FLUSH_INTERVAL,
+                    max_queue=settings.EVENT_QUEUE_MAX,
+                    enqueue_timeout=settings.EVENT_ENQUEUE_TIMEOUT,
+                    spill=EventSpill(settings.EVENT_SPILL_DIR) if settings.EVENT_SPILL_DIR else None,
+                ).start()
+                atexit.register(shutdown_event_writer)
+    return _writer
+
+
+def queue_audit_event(
+    action: str,
+    user_id: Optional[int] = None,
+    username: Optional[str] = None,
+    resource_type: Optional[str] = None,
+    resource_id: Optional[str] = None,
+    changes: Optional[Dict] = None,
+    ip_address: Optional[str] = None,
+) -> bool:
+    """Queue an audit event; returns False if the caller must write it synchronously."""
+    writer = get_event_writer()
+    if writer is None:
+        return False
+    return writer.submit(AUDIT, {
+        "action": action,
+        "user_id": user_id,
+        "username": username,
+        "resource_type": resource_type,
+        "resource_id": resource_id,
+        "changes": changes,
+        "ip_address": ip_address,
+    })
+
+
+def queue_analytics_event(
+    event_type: str,
+    event_name: str,
+    user_id: Optional[int] = None,
+    username: Optional[str] = None,
+    data: Optional[Dict] = None,
+) -> bool:
+    """Queue an analytics event; returns False if the caller must write it synchronously."""
+    writer = get_event_writer()
+    if writer is None:
+        return False
+    return writer.submit(ANALYTICS, {
+        "event_type": event_type,
+        "event_name": event_name,
+        "user_id": user_id,
+        "username": username,
+        "data": data,
+    })
+
+
+def flush_event_writer(timeout: Optional[float] = 10.0) -> bool:
+    """Wait for all queued events to be written."""
+    if _writer is None:
+        return True
+    return _writer.flush(timeout)
+
+
+def shutdown_event_writer(timeout: Optional[float] = 10.0) -> bool:
+    """Flush and stop the process-wide writer."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is None:
+        return True
+    done = writer.shutdown(timeout)
+    if not done:
+        logger.warning("Event writer did not finish flushing before shutdown timeout")
+    return done
+
+
+def get_event_writer_metrics() -> Dict[str, Any]:
+    """Metrics for the process-wide writer (empty if not started)."""
+    return _writer.metrics() if _writer is not None else {}
@@ -0,0 +1,88 @@
+"""
+HyperLogLog sketches for approximate distinct counting.
+
+A sketch summarises a set of user ids in a fixed number of bytes. Sketches
+are mergeable, so storing one per day and event type lets any date range
+(DAU, WAU, MAU or custom) be answered by merging one sketch per day instead
+of running COUNT(DISTINCT user_id) over the raw events.
+"""
+import math
+import hashlib
+from typing import Any, Iterable, Optional
+
+DEFAULT_PRECISION = 12  # 4096 registers, ~1.6% standard error
+
+
+def _hash64(value: Any) -> int:
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count estimator with 64-bit hashing.
+
+    Args:
+        precision: log2 of the register count (4-16); higher is more accurate
+            and larger (``2 ** precision`` bytes)
+        registers: Existing register values, used when deserialising
+
+    Example:
+        >>> hll = HyperLogLog()
+        >>> hll.update(range(1000))
+        >>> 980 < hll.count() < 1020
+        True
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[bytes] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.m = 1 << precision
+        if registers is not None and len(registers) != self.m:
+            raise ValueError("register count does not match precision")
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    def add(self, value: Any) -> None:
+        """Add one value (hashed via its string form)."""
+        h = _hash64(value)
+        idx = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def update(self, values: Iterable[Any]) -> None:
+        """Add every value in ``values``."""
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Fold ``other`` into this sketch (set union) and return self."""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches with different precision")
+        regs = self.registers
+        for i, r in enumerate(other.registers):
+            if r > regs[i]:
+                regs[i] = r
+        return self
+
+    def count(self) -> int:
+        """Estimated number of distinct values added."""
+        m = self.m
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """Serialise as one precision byte followed by the registers."""
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        """Inverse of :meth:`to_bytes` (accepts bytes or memoryview)."""
+        data = bytes(data)
+        return cls(precision=data[0], registers=data[1:])
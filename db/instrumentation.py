@@ -0,0 +1,232 @@
+"""
+Query timing for the database layer.
+
+get_connection() hands out connections wrapped in InstrumentedConnection,
+whose cursors time every execute/executemany and count the rows fetched.
+Measurements go to the in-process registry in core.metrics, keyed by a
+normalised query template (whitespace collapsed, literals and VALUES lists
+folded, partition names generalised), so the number of series stays small.
+Queries slower than DB_SLOW_QUERY_MS are kept as samples and logged, with
+parameter values replaced by their types via core.safe_logging.
+"""
+
+import re
+import time
+import logging
+from functools import lru_cache
+from typing import Any, Optional
+
+from core.metrics import get_registry
+from core.safe_logging import redact_params
+
+logger = logging.getLogger(__name__)
+
+QUERY_SECONDS = "db.query.seconds"
+FETCH_SECONDS = "db.fetch.seconds"
+QUERY_ROWS = "db.query.rows"
+QUERY_ERRORS = "db.query.errors"
+POOL_WAIT_SECONDS = "db.pool.wait.seconds"
+SLOW_QUERIES = "db.slow_queries"
+
+_MAX_TEMPLATE = 500
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\?|\$\d+")
+_PARTITION = re.compile(r"\b(\w+)_p\d{6}\b")
+_UNION_RUN = re.compile(r"(SELECT \* FROM (\w+)_pYYYYMM)( UNION ALL SELECT \* FROM \2_pYYYYMM)+")
+_TUPLE_RUN = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def _normalize(sql: str) -> str:
+    text = _WHITESPACE.sub(" ", sql).strip()
+    text = _STRING.sub("%s", text)
+    text = _NUMBER.sub("%s", text)
+    text = _PLACEHOLDER.sub("%s", text)
+    text = _PARTITION.sub(r"\1_pYYYYMM", text)
+    text = _UNION_RUN.sub(r"\1 UNION ALL ...", text)
+    text = _TUPLE_RUN.sub(r"\1, ...", text)
+    return text[:_MAX_TEMPLATE]
+
+
+def query_template(query: Any) -> str:
+    """Normalised form of ``query`` used as the metrics label."""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)  # psycopg2.sql.Composed and similar
+    # Multi-row VALUES statements can be megabytes; the head identifies them
+    return _normalize(query[:4096])
+
+
+def _slow_threshold() -> float:
+    from core.settings import settings
+    return settings.DB_SLOW_QUERY_MS / 1000.0
+
+
+class InstrumentedCursor:
+    """Cursor proxy that records latency, rows and errors for each statement."""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_template", None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        rows = 0
+        for row in self._cursor:
+            rows += 1
+            yield row
+        self._count_rows(rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+        return False
+
+    def _run(self, method, query, params, sample_params):
+        template = query_template(query)
+        object.__setattr__(self, "_template", template)
+        registry = get_registry()
+        started = time.perf_counter()
+        try:
+            result = method(query) if params is None else method(query, params)
+        except Exception:
+            registry.increment(QUERY_ERRORS, template)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.observe(QUERY_SECONDS, template, elapsed)
+        if elapsed >= _slow_threshold():
+            registry.sample(SLOW_QUERIES, {
+                "template": template,
+                "seconds": round(elapsed, 6),
+                "params": sample_params(),
+            })
+            logger.warning(f"Slow query ({elapsed * 1000:.0f} ms): {template}")
+        # sqlite3 returns the cursor for chaining; keep chained calls instrumented
+        return self if result is self._cursor else result
+
+    def execute(self, query, params=None):
+        return self._run(self._cursor.execute, query, params, lambda: redact_params(params))
+
+    def executemany(self, query, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        return self._run(
+            self._cursor.executemany, query, seq_of_params,
+            lambda: {"rows": len(seq_of_params),
+                     "first": redact_params(seq_of_params[0]) if seq_of_params else None},
+        )
+
+    def _count_rows(self, rows: int) -> None:
+        if self._template is not None:
+            get_registry().increment(QUERY_ROWS, self._template, rows)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        if self._template is not None:
+            get_registry().observe(FETCH_SECONDS, self._template, time.perf_counter() - started)
+        return result
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is not None:
+            self._count_rows(1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._fetch(self._cursor.fetchmany, *args)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._count_rows(len(rows))
+        return rows
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are InstrumentedCursor instances."""
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+
+    @property
+    def raw(self):
+        """The wrapped DB-API connection."""
+        return self._conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def execute(self, query, params=None):
+        """sqlite3-style shortcut: execute on a new cursor and return it."""
+        return self.cursor().execute(query, params)
+
+
+def instrument_connection(conn):
+    """Wrap ``conn`` unless instrumentation is disabled or it is already wrapped."""
+    from core.settings import settings
+
+    if not settings.DB_INSTRUMENTATION or isinstance(conn, InstrumentedConnection):
+        return conn
+    return InstrumentedConnection(conn)
+
+
+def record_pool_wait(seconds: float, backend: str) -> None:
+    """Record how long a caller waited for a pooled connection."""
+    get_registry().observe(POOL_WAIT_SECONDS, backend, seconds)
+
+
+def get_query_metrics(sort_by: str = "sum", limit: Optional[int] = None) -> dict:
+    """
+    Per-template query statistics, slowest first, plus pool waits and slow samples.
+
+    Args:
+        sort_by: Histogram field to order templates by (sum, p95, p99, max, count)
+        limit: Keep only the top ``limit`` templates
+    """
+    snap = get_registry().snapshot()
+    hists = snap["histograms"]
+    rows = snap["counters"].get(QUERY_ROWS, {})
+    errors = snap["counters"].get(QUERY_ERRORS, {})
+    fetch = hists.get(FETCH_SECONDS, {})
+    queries = []
+    for template, stats in hists.get(QUERY_SECONDS, {}).items():
+        queries.append(dict(
+            stats,
+            template=template,
+            rows=int(rows.get(template, 0)),
+            errors=int(errors.get(template, 0)),
+            fetch_sum=fetch.get(template, {}).get("sum", 0.0),
+        ))
+    queries.sort(key=lambda q: q.get(sort_by, 0), reverse=True)
+    return {
+        "since": snap["since"],
+        "queries": queries[:limit] if limit else queries,
+        "pool_wait": hists.get(POOL_WAIT_SECONDS, {}),
+        "slow_queries": snap["samples"].get(SLOW_QUERIES, []),
+    }
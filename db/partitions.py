@@ -0,0 +1,458 @@
+"""
+Monthly time partitioning for audit_logs and analytics_events.
+
+Both tables grow without bound. With DB_PARTITIONING enabled they are split
+by calendar month of created_at:
+
+* Postgres: declarative ``PARTITION BY RANGE (created_at)`` with one
+  partition per month (``<table>_pYYYYMM``) plus a default partition. The
+  planner prunes partitions for date-filtered queries.
+* SQLite: one physical table per month (``<table>_pYYYYMM``) and a
+  ``<table>`` view over all of them, so existing read queries keep working.
+  Writes are routed to the current month's table by db.database, and
+  date-filtered reads use :func:`relation_for_range` to touch only the
+  months in range. Each month's AUTOINCREMENT sequence starts at
+  ``YYYYMM * 10**10`` so ids stay unique and increasing across months.
+
+Future partitions are created ahead of time by :func:`ensure_partitions`, and
+:func:`apply_retention` archives and drops whole expired months instead of
+running DELETEs.
+"""
+
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+from datetime import datetime, date
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from core.settings import settings
+from core.safe_logging import log_exception_safe
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("audit_logs", "analytics_events")
+
+# Secondary indexes created on every partition (or the Postgres parent)
+PARTITION_INDEXES = {
+    "audit_logs": ("created_at", "user_id"),
+    "analytics_events": ("created_at", "user_id"),
+}
+
+# Postgres only: inserting transaction id, the rollup watermark (db.rollups)
+PG_PARTITION_INDEXES = {
+    "audit_logs": (),
+    "analytics_events": ("txid",),
+}
+
+# SQLite id space reserved per month (see module docstring)
+SQLITE_ID_STRIDE = 10 ** 10
+
+_state_lock = threading.Lock()
+_partitioned_cache: Dict[str, bool] = {}
+_known_partitions: Dict[str, Set[int]] = {}
+_maintenance: Optional[threading.Thread] = None
+_maintenance_stop = threading.Event()
+
+
+# ----------------------------------------------------------------------
+# Month arithmetic
+# ----------------------------------------------------------------------
+
+def month_key(d: date) -> int:
+    """2026-10-18 -> 202610."""
+    return d.year * 100 + d.month
+
+
+def add_months(key: int, months: int) -> int:
+    """Shift a YYYYMM key by ``months`` (may be negative)."""
+    index = (key // 100) * 12 + (key % 100 - 1) + months
+    return (index // 12) * 100 + index % 12 + 1
+
+
+def month_start(key: int) -> str:
+    """202610 -> '2026-10-01'."""
+    return f"{key // 100:04d}-{key % 100:02d}-01"
+
+
+def partition_name(table: str, key: int) -> str:
+    return f"{table}_p{key}"
+
+
+def _parse_key(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    return int(str(value)[:4]) * 100 + int(str(value)[5:7])
+
+
+# ----------------------------------------------------------------------
+# Introspection
+# ----------------------------------------------------------------------
+
+def is_partitioned(table: str, cur=None) -> bool:
+    """Whether ``table`` currently uses the partitioned layout (cached per process)."""
+    if table not in PARTITIONED_TABLES:
+        return False
+    if table in _partitioned_cache:
+        return _partitioned_cache[table]
+
+    from db.database import get_connection
+
+    def probe(c) -> bool:
+        if settings.DB_TYPE == "postgres":
+            c.execute("SELECT relkind FROM pg_class WHERE relname = %s", (table,))
+            row = c.fetchone()
+            return bool(row) and row[0] == "p"
+        c.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,))
+        row = c.fetchone()
+        return bool(row) and row[0] == "view"
+
+    if cur is not None:
+        result = probe(cur)
+    else:
+        with get_connection() as conn:
+            result = probe(conn.cursor())
+    with _state_lock:
+        _partitioned_cache[table] = result
+    return result
+
+
+def list_partitions(cur, table: str) -> List[int]:
+    """Month keys of the existing partitions of ``table``, oldest first."""
+    if settings.DB_TYPE == "postgres":
+        cur.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s",
+            (table,),
+        )
+    else:
+        cur.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+            (f"{table}_p[0-9][0-9][0-9][0-9][0-9][0-9]",),
+        )
+    prefix = f"{table}_p"
+    keys = sorted(
+        int(name[len(prefix):]) for (name,) in cur.fetchall()
+        if name.startswith(prefix) and name[len(prefix):].isdigit()
+    )
+    with _state_lock:
+        _known_partitions[table] = set(keys)
+    return keys
+
+
+def _invalidate(table: str) -> None:
+    with _state_lock:
+        _partitioned_cache.pop(table, None)
+        _known_partitions.pop(table, None)
+
+
+# ----------------------------------------------------------------------
+# Creation
+# ----------------------------------------------------------------------
+
+def _create_partition(cur, table: str, key: int, columns_ddl: str) -> None:
+    name = partition_name(table, key)
+    if settings.DB_TYPE == "postgres":
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month_start(key)}') TO ('{month_start(add_months(key, 1))}')"
+        )
+        return
+
+    cur.execute(f"SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    if cur.fetchone():
+        return
+    cur.execute(
+        f"CREATE TABLE {name} (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns_ddl})"
+    )
+    cur.execute(
+        "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+        (name, key * SQLITE_ID_STRIDE),
+    )
+    for column in PARTITION_INDEXES[table]:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_{column} ON {name}({column})")
+
+
+def _rebuild_sqlite_view(cur, table: str) -> None:
+    keys = list_partitions(cur, table)
+    cur.execute(f"DROP VIEW IF EXISTS {table}")
+    if keys:
+        union = " UNION ALL ".join(f"SELECT * FROM {partition_name(table, k)}" for k in keys)
+        cur.execute(f"CREATE VIEW {table} AS {union}")
+
+
+def create_partitioned_table(cur, table: str, columns_ddl: str, months_ahead: Optional[int] = None) -> None:
+    """
+    Create ``table`` in the partitioned layout (idempotent).
+
+    Args:
+        cur: Cursor inside the caller's transaction
+        table: One of PARTITIONED_TABLES
+        columns_ddl: Column definitions excluding ``id``
+        months_ahead: Future months to pre-create (default PARTITION_MONTHS_AHEAD)
+    """
+    if settings.DB_TYPE == "postgres":
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (id BIGSERIAL, {columns_ddl}, "
+            f"PRIMARY KEY (id, created_at)) PARTITION BY RANGE (created_at)"
+        )
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+        for column in PARTITION_INDEXES[table] + PG_PARTITION_INDEXES[table]:
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column})")
+    _ensure_table_partitions(cur, table, columns_ddl, months_ahead)
+    _invalidate(table)
+
+
+def _ensure_table_partitions(cur, table: str, columns_ddl: str, months_ahead: Optional[int]) -> List[int]:
+    months_ahead = settings.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_key(datetime.utcnow())
+    existing = set(list_partitions(cur, table))
+    wanted = [add_months(current, i) for i in range(months_ahead + 1)]
+    created = [k for k in wanted if k not in existing]
+    for key in created:
+        _create_partition(cur, table, key, columns_ddl)
+    if settings.DB_TYPE == "sqlite" and (created or not existing):
+        _rebuild_sqlite_view(cur, table)
+    if created:
+        logger.info(f"Created {len(created)} partition(s) for {table}")
+    with _state_lock:
+        _known_partitions[table] = existing | set(created)
+    return created
+
+
+def ensure_partitions(months_ahead: Optional[int] = None) -> Dict[str, List[int]]:
+    """Create the current and next ``months_ahead`` monthly partitions for every partitioned table."""
+    from db.database import get_connection, partitioned_columns_ddl
+
+    created = {}
+    with get_connection() as conn:
+        cur = conn.cursor()
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(table, cur):
+                created[table] = _ensure_table_partitions(
+                    cur, table, partitioned_columns_ddl(table), months_ahead
+                )
+    return created
+
+
+# ----------------------------------------------------------------------
+# Query routing
+# ----------------------------------------------------------------------
+
+def insert_target(table: str) -> Tuple[str, Optional[str]]:
+    """
+    Physical table for new rows of ``table`` and the created_at value to store.
+
+    Returns (table, None) unless SQLite partitioning is active, in which case
+    the row is routed to the current month's table and an explicit UTC
+    timestamp is returned so created_at always matches the table's month.
+    """
+    if settings.DB_TYPE != "sqlite" or not is_partitioned(table):
+        return table, None
+    now = datetime.utcnow().replace(microsecond=0)
+    key = month_key(now)
+    if key not in _known_partitions.get(table, ()):
+        ensure_partitions()
+    return partition_name(table, key), now.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def split_by_partition(cur, table: str, rows: List[tuple], created_at_index: int) -> Dict[str, List[tuple]]:
+    """
+    Group rows for a partitioned SQLite ``table`` by the monthly table their
+    created_at falls in, creating any missing months (bulk history imports).
+
+    Runs on the caller's cursor, so it is safe inside a write job.
+    """
+    from db.database import partitioned_columns_ddl
+
+    groups: Dict[int, List[tuple]] = {}
+    for row in rows:
+        groups.setdefault(_parse_key(str(row[created_at_index])), []).append(row)
+    existing = set(list_partitions(cur, table))
+    missing = [key for key in groups if key not in existing]
+    for key in missing:
+        _create_partition(cur, table, key, partitioned_columns_ddl(table))
+    if missing:
+        _rebuild_sqlite_view(cur, table)
+        with _state_lock:
+            _known_partitions[table] = existing | set(missing)
+    return {partition_name(table, key): group for key, group in groups.items()}
+
+
+def relation_for_range(table: str, start: Optional[str] = None, end: Optional[str] = None) -> str:
+    """
+    FROM-clause relation covering created_at in [start, end].
+
+    Postgres prunes partitions itself, and unpartitioned tables are returned
+    as-is. For SQLite partitioning this is a UNION ALL over only the monthly
+    tables overlapping the range.
+    """
+    if settings.DB_TYPE != "sqlite" or not is_partitioned(table):
+        return table
+    keys = _known_partitions.get(table)
+    if keys is None:
+        from db.database import get_connection
+        with get_connection() as conn:
+            keys = set(list_partitions(conn.cursor(), table))
+    low, high = _parse_key(start), _parse_key(end)
+    chosen = [
+        k for k in sorted(keys)
+        if (low is None or k >= low) and (high is None or k <= high)
+    ]
+    if not chosen:
+        return f"(SELECT * FROM {table} WHERE 0) {table}"
+    union = " UNION ALL ".join(f"SELECT * FROM {partition_name(table, k)}" for k in chosen)
+    return f"({union}) {table}"
+
+
+# ----------------------------------------------------------------------
+# Conversion of existing tables
+# ----------------------------------------------------------------------
+
+def convert_to_partitioned(table: str) -> int:
+    """
+    Move an existing unpartitioned table into the partitioned layout.
+
+    Runs in a single transaction and blocks writers to ``table`` while it
+    copies; schedule it in a maintenance window. Returns rows copied.
+    """
+    from db.database import get_connection, partitioned_columns_ddl
+
+    if is_partitioned(table):
+        return 0
+    columns_ddl = partitioned_columns_ddl(table)
+    legacy = f"{table}_legacy"
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        cur.execute(f"SELECT MIN(created_at), MAX(created_at) FROM {legacy}")
+        first, last = cur.fetchone()
+        if settings.DB_TYPE == "postgres":
+            # Index names are schema-wide on Postgres; free them for the new parent
+            for column in PARTITION_INDEXES[table] + PG_PARTITION_INDEXES[table]:
+                cur.execute(f"DROP INDEX IF EXISTS idx_{table}_{column}")
+            cur.execute(f"DROP INDEX IF EXISTS idx_analytics_user_id")
+        create_partitioned_table(cur, table, columns_ddl)
+
+        keys = []
+        if first is not None:
+            key, stop = _parse_key(str(first)), _parse_key(str(last))
+            while key <= stop:
+                keys.append(key)
+                key = add_months(key, 1)
+            for key in keys:
+                _create_partition(cur, table, key, columns_ddl)
+
+        cur.execute(f"SELECT COUNT(*) FROM {legacy}")
+        copied = cur.fetchone()[0]
+        if settings.DB_TYPE == "postgres":
+            cur.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+            cur.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"GREATEST((SELECT COALESCE(MAX(id), 0) FROM {table}), 1))"
+            )
+        else:
+            for key in keys:
+                cur.execute(
+                    f"INSERT INTO {partition_name(table, key)} SELECT * FROM {legacy} "
+                    f"WHERE strftime('%Y%m', created_at) = ?",
+                    (str(key),),
+                )
+        cur.execute(f"DROP TABLE {legacy}")
+        if settings.DB_TYPE == "sqlite":
+            _rebuild_sqlite_view(cur, table)
+
+    _invalidate(table)
+    logger.info(f"Converted {table} to monthly partitions ({copied} rows)")
+    return copied
+
+
+# ----------------------------------------------------------------------
+# Retention
+# ----------------------------------------------------------------------
+
+def _archive_partition(cur, name: str, archive_dir: str) -> str:
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+    cur.execute(f"SELECT * FROM {name}")
+    columns = [d[0] for d in cur.description]
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as out:
+        while True:
+            rows = cur.fetchmany(5000)
+            if not rows:
+                break
+            for row in rows:
+                out.write(json.dumps(dict(zip(columns, tuple(row))), default=str) + "\n")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def apply_retention(
+    table: str, keep_months: int, archive_dir: Optional[str] = None
+) -> List[str]:
+    """
+    Drop whole monthly partitions older than ``keep_months`` months.
+
+    When ``archive_dir`` is given each partition is first written there as
+    gzipped NDJSON. Returns the names of the dropped partitions.
+    """
+    from db.database import get_connection
+
+    if keep_months <= 0 or not is_partitioned(table):
+        return []
+    cutoff = add_months(month_key(datetime.utcnow()), -keep_months)
+    dropped = []
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        expired = [k for k in list_partitions(cur, table) if k < cutoff]
+        for key in expired:
+            name = partition_name(table, key)
+            if archive_dir:
+                path = _archive_partition(cur, name, archive_dir)
+                logger.info(f"Archived partition {name} to {path}")
+            if settings.DB_TYPE == "postgres":
+                cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            cur.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+        if dropped and settings.DB_TYPE == "sqlite":
+            _rebuild_sqlite_view(cur, table)
+
+    if dropped:
+        _invalidate(table)
+        logger.info(f"Retention dropped {len(dropped)} partition(s) from {table}")
+    return dropped
+
+
+def run_partition_maintenance() -> None:
+    """Create upcoming partitions and apply the configured retention policies."""
+    ensure_partitions()
+    archive_dir = settings.PARTITION_ARCHIVE_DIR or None
+    apply_retention("audit_logs", settings.AUDIT_RETENTION_MONTHS, archive_dir)
+    apply_retention("analytics_events", settings.ANALYTICS_RETENTION_MONTHS, archive_dir)
+
+
+def start_partition_maintenance(interval: Optional[float] = None) -> None:
+    """Run partition maintenance now and then every ``interval`` seconds in a daemon thread."""
+    global _maintenance
+    interval = interval or settings.PARTITION_MAINTENANCE_INTERVAL
+    if _maintenance is not None or not settings.DB_PARTITIONING:
+        return
+
+    def run():
+        while True:
+            try:
+                run_partition_maintenance()
+            except Exception as e:
+                log_exception_safe(logger, "Partition maintenance failed", e, level="warning")
+            if _maintenance_stop.wait(interval):
+                return
+
+    _maintenance_stop.clear()
+    _maintenance = threading.Thread(target=run, name="partition-maintenance", daemon=True)
+    _maintenance.start()
@@ -0,0 +1,313 @@
+"""
+Thread-safe bounded connection pool for the PostgreSQL backend.
+
+psycopg2's SimpleConnectionPool is documented as unsafe to share between
+threads, and Streamlit serves every session on its own thread. This pool
+guards its state with a single lock, parks callers in a FIFO wait queue when
+every connection is checked out, validates connections on checkout and
+recycles them once they reach a maximum lifetime.
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from core.safe_logging import log_exception_safe
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the acquire timeout."""
+
+
+class PoolClosedError(Exception):
+    """Raised when a connection is requested from a closed pool."""
+
+
+class _PooledConnection:
+    """Bookkeeping wrapper for a raw DB-API connection."""
+
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn: Any):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class _Waiter:
+    """A caller parked in the wait queue."""
+
+    __slots__ = ("event", "entry", "may_create")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry: Optional[_PooledConnection] = None
+        self.may_create = False
+
+
+def default_is_alive(conn: Any) -> bool:
+    """Liveness probe: connection not closed and able to run ``SELECT 1``."""
+    if getattr(conn, "closed", 0):
+        return False
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+class BoundedConnectionPool:
+    """
+    Bounded, thread-safe connection pool with a FIFO wait queue.
+
+    Args:
+        connect: Zero-argument callable returning a new DB-API connection
+        minconn: Connections opened eagerly when the pool is created
+        maxconn: Hard upper bound on open connections
+        acquire_timeout: Default seconds to wait for a free connection
+        max_lifetime: Seconds after which a connection is closed and replaced
+            on its next checkout (0 disables recycling)
+        health_check_interval: A connection idle for longer than this is
+            probed with ``is_alive`` before being handed out (0 probes always)
+        is_alive: Liveness probe, defaults to :func:`default_is_alive`
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        minconn: int,
+        maxconn: int,
+        acquire_timeout: float = 10.0,
+        max_lifetime: float = 1800.0,
+        health_check_interval: float = 30.0,
+        is_alive: Optional[Callable[[Any], bool]] = None,
+    ):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError("Invalid pool bounds: require 0 <= minconn <= maxconn, maxconn >= 1")
+
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self._is_alive = is_alive or default_is_alive
+
+        self._lock = threading.Lock()
+        self._idle: Deque[_PooledConnection] = deque()
+        self._in_use: Dict[int, _PooledConnection] = {}
+        self._waiters: Deque[_Waiter] = deque()
+        self._size = 0  # open connections, including ones being created
+        self._closed = False
+
+        # Metrics
+        self._acquired = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._health_failures = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+        for _ in range(minconn):
+            with self._lock:
+                self._size += 1
+            try:
+                self._idle.append(_PooledConnection(self._connect()))
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                self.closeall()
+                raise
+
+    # ------------------------------------------------------------------
+    # Checkout / return
+    # ------------------------------------------------------------------
+
+    def getconn(self, timeout: Optional[float] = None) -> Any:
+        """
+        Check a connection out of the pool.
+
+        Blocks for up to ``timeout`` seconds (default ``acquire_timeout``)
+        when the pool is exhausted, then raises :class:`PoolTimeoutError`.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        started = time.monotonic()
+        waited = False
+
+        waiter = None
+        entry = None
+        may_create = False
+
+        with self._lock:
+            if self._closed:
+                raise PoolClosedError("Connection pool is closed")
+            if self._idle and not self._waiters:
+                entry = self._idle.pop()
+            elif self._size < self.maxconn and not self._waiters:
+                self._size += 1
+                may_create = True
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+
+        if waiter is not None:
+            waited = True
+            remaining = deadline - time.monotonic()
+            waiter.event.wait(max(remaining, 0))
+            with self._lock:
+                if not waiter.event.is_set():
+                    # Timed out while still queued
+                    self._waiters.remove(waiter)
+                    self._timeouts += 1
+                    self._record_wait_locked(time.monotonic() - started)
+                    raise PoolTimeoutError(
+                        f"No database connection available within {timeout:.1f}s "
+                        f"(pool max {self.maxconn})"
+                    )
+                closed = self._closed
+            if closed:
+                if waiter.entry is not None:
+                    self._discard(waiter.entry)
+                raise PoolClosedError("Connection pool is closed")
+            entry, may_create = waiter.entry, waiter.may_create
+
+        if may_create:
+            entry = self._create_entry()
+        else:
+            entry = self._validate(entry)
+
+        with self._lock:
+            self._in_use[id(entry.conn)] = entry
+            self._acquired += 1
+            if waited:
+                self._record_wait_locked(time.monotonic() - started)
+        return entry.conn
+
+    def putconn(self, conn: Any, close: bool = False) -> None:
+        """Return a connection to the pool, closing it if ``close`` is set or it is broken."""
+        with self._lock:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            logger.warning("Attempted to return a connection not owned by this pool")
+            return
+
+        if close or self._closed or getattr(conn, "closed", 0):
+            self._discard(entry)
+            return
+
+        entry.last_used = time.monotonic()
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.entry = entry
+                waiter.event.set()
+            else:
+                self._idle.append(entry)
+
+    def closeall(self) -> None:
+        """Close every idle connection and refuse further checkouts."""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            waiters = list(self._waiters)
+            self._waiters.clear()
+        for waiter in waiters:
+            waiter.event.set()
+        for entry in idle:
+            self._close_quietly(entry.conn)
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return a snapshot of pool utilisation and wait-time counters."""
+        with self._lock:
+            return {
+                "size": self._size,
+                "max": self.maxconn,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "waiters": len(self._waiters),
+                "acquired_total": self._acquired,
+                "timeouts_total": self._timeouts,
+                "recycled_total": self._recycled,
+                "health_check_failures_total": self._health_failures,
+                "waits_total": self._waits,
+                "wait_time_total_s": round(self._wait_time_total, 6),
+                "wait_time_max_s": round(self._wait_time_max, 6),
+                "wait_time_avg_s": round(self._wait_time_total / self._waits, 6) if self._waits else 0.0,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _record_wait_locked(self, seconds: float) -> None:
+        self._waits += 1
+        self._wait_time_total += seconds
+        self._wait_time_max = max(self._wait_time_max, seconds)
+
+    def _create_entry(self) -> _PooledConnection:
+        """Open a new connection for a slot already reserved in ``_size``."""
+        try:
+            return _PooledConnection(self._connect())
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _validate(self, entry: _PooledConnection) -> Optional[_PooledConnection]:
+        """
+        Apply lifetime and liveness checks to a checked-out entry.
+
+        Returns a usable entry (possibly a freshly opened replacement), or
+        None if the slot had to be released.
+        """
+        now = time.monotonic()
+        if self.max_lifetime and now - entry.created_at >= self.max_lifetime:
+            self._close_quietly(entry.conn)
+            with self._lock:
+                self._recycled += 1
+            return self._create_entry()
+
+        if now - entry.last_used >= self.health_check_interval:
+            if not self._is_alive(entry.conn):
+                logger.warning("Discarding dead pooled database connection")
+                self._close_quietly(entry.conn)
+                with self._lock:
+                    self._health_failures += 1
+                return self._create_entry()
+        return entry
+
+    def _discard(self, entry: _PooledConnection) -> None:
+        self._close_quietly(entry.conn)
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        """Give up a connection slot, handing it to the next waiter if any."""
+        with self._lock:
+            if self._waiters and not self._closed:
+                waiter = self._waiters.popleft()
+                waiter.may_create = True
+                waiter.event.set()
+            else:
+                self._size -= 1
+
+    @staticmethod
+    def _close_quietly(conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception as e:
+            log_exception_safe(logger, "Error closing pooled connection", e, level="debug")
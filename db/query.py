@@ -0,0 +1,53 @@
+"""
+Backend-specific placeholder styles, resolved once per query.
+
+The sync layer writes SQL with ``%s`` placeholders and rewrites them for
+SQLite on every call (``_adapt_query``). :class:`Query` does that work when
+the query is defined: it keeps the ``?`` (sqlite3/aiosqlite) and ``$n``
+(asyncpg) forms side by side, so a call only picks one.
+"""
+
+import re
+
+# String literals are matched first so a "%s" inside quotes is left alone
+_TOKEN = re.compile(r"'(?:[^']|'')*'|%s")
+
+
+class Query:
+    """
+    SQL text with ``%s`` placeholders, compiled for every backend.
+
+    Example:
+        >>> q = Query("SELECT * FROM users WHERE id = %s AND role = %s")
+        >>> q.numbered
+        'SELECT * FROM users WHERE id = $1 AND role = $2'
+        >>> q.qmark
+        'SELECT * FROM users WHERE id = ? AND role = ?'
+    """
+
+    __slots__ = ("text", "qmark", "numbered", "params")
+
+    def __init__(self, text: str):
+        self.text = text.strip()
+        count = 0
+
+        def numbered(match):
+            nonlocal count
+            if match.group(0) != "%s":
+                return match.group(0)
+            count += 1
+            return f"${count}"
+
+        self.qmark = _TOKEN.sub(lambda m: "?" if m.group(0) == "%s" else m.group(0), self.text)
+        self.numbered = _TOKEN.sub(numbered, self.text)
+        self.params = count
+
+    def for_backend(self, backend: str) -> str:
+        """The text for ``backend`` ("postgres" or "sqlite")."""
+        return self.numbered if backend == "postgres" else self.qmark
+
+    def __add__(self, suffix: str) -> "Query":
+        return Query(f"{self.text} {suffix}")
+
+    def __repr__(self) -> str:
+        return f"Query({self.text!r})"
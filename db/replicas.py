@@ -0,0 +1,176 @@
+"""
+Read-replica routing for read-only Postgres work.
+
+get_connection(readonly=True) asks a :class:`ReplicaRouter` for a replica.
+The router round-robins over the configured replicas. Each replica's
+replication lag is measured at most once per check interval. Replicas
+that are unreachable, or further behind than the staleness bound, are
+skipped. When no replica qualifies the router returns None, and the caller
+uses the primary.
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from core.metrics import get_registry
+from core.safe_logging import log_exception_safe
+
+logger = logging.getLogger(__name__)
+
+REPLICA_READS = "db.replica.reads"  # label: replica name, or "primary" on fallback
+REPLICA_LAG = "db.replica.lag_seconds"
+
+# Seconds the replica's replayed data trails the primary. A replica that has
+# replayed everything it received counts as current (an idle primary would
+# otherwise look ever more stale), and a primary reports 0.
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def parse_replicas(spec: str, default_port: str) -> List[Tuple[str, str]]:
+    """``"host1:5433, host2"`` -> ``[("host1", "5433"), ("host2", default_port)]``."""
+    replicas = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":") if ":" in item else (item, "", "")
+        replicas.append((host, port or default_port))
+    return replicas
+
+
+def query_lag(conn) -> float:
+    """Replication lag in seconds measured on ``conn`` (see LAG_QUERY)."""
+    cur = conn.cursor()
+    try:
+        cur.execute(LAG_QUERY)
+        return float(cur.fetchone()[0])
+    finally:
+        cur.close()
+        conn.rollback()
+
+
+class Replica:
+    """One replica: its connection pool plus the last lag measurement."""
+
+    __slots__ = ("name", "pool", "lag", "checked_at", "down_until", "probing")
+
+    def __init__(self, name: str, pool: Any):
+        self.name = name
+        self.pool = pool
+        self.lag: Optional[float] = None
+        self.checked_at = float("-inf")
+        self.down_until = float("-inf")
+        self.probing = False
+
+
+class ReplicaRouter:
+    """
+    Round-robin choice among replicas within a staleness bound.
+
+    Args:
+        replicas: (name, pool) pairs; pools provide getconn/putconn
+        max_lag: Default staleness bound in seconds
+        check_interval: Seconds between lag probes of a replica; a replica
+            that failed is also skipped for this long
+        probe: Returns the lag measured on a checked-out connection
+        clock: Monotonic time source, injectable for tests
+    """
+
+    def __init__(
+        self,
+        replicas: Sequence[Tuple[str, Any]],
+        max_lag: float = 30.0,
+        check_interval: float = 5.0,
+        probe: Callable[[Any], float] = query_lag,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.replicas = [Replica(name, pool) for name, pool in replicas]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._probe = probe
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def choose(self, max_lag: Optional[float] = None) -> Optional[Replica]:
+        """The next usable replica, or None when the primary should serve the read."""
+        bound = self.max_lag if max_lag is None else max_lag
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.replicas), 1)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if self._usable(replica, bound):
+                return replica
+        return None
+
+    def record_read(self, replica: Optional[Replica]) -> None:
+        get_registry().increment(REPLICA_READS, replica.name if replica else "primary")
+
+    def mark_down(self, replica: Replica, error: Optional[Exception] = None) -> None:
+        """Skip ``replica`` until it has been re-probed after one check interval."""
+        now = self._clock()
+        with self._lock:
+            replica.down_until = now + self.check_interval
+            replica.checked_at = float("-inf")
+        if error is not None:
+            log_exception_safe(logger, f"Read replica {replica.name} unavailable", error, level="warning")
+
+    def _usable(self, replica: Replica, bound: float) -> bool:
+        now = self._clock()
+        with self._lock:
+            if replica.down_until > now:
+                return False
+            # One caller re-measures; the rest use the previous value meanwhile
+            stale = now - replica.checked_at >= self.check_interval and not replica.probing
+            if stale:
+                replica.probing = True
+        if stale:
+            self._measure(replica)
+        return replica.lag is not None and replica.lag <= bound
+
+    def _measure(self, replica: Replica) -> None:
+        conn = None
+        try:
+            conn = replica.pool.getconn()
+            lag = self._probe(conn)
+        except Exception as e:
+            if conn is not None:
+                replica.pool.putconn(conn, close=True)
+            with self._lock:
+                replica.probing = False
+                replica.lag = None
+            self.mark_down(replica, e)
+            return
+        replica.pool.putconn(conn)
+        get_registry().observe(REPLICA_LAG, replica.name, lag)
+        with self._lock:
+            replica.lag = lag
+            replica.checked_at = self._clock()
+            replica.probing = False
+        if lag > self.max_lag:
+            logger.warning(f"Read replica {replica.name} is {lag:.1f}s behind; reads use other servers")
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per-replica lag, availability and pool utilisation."""
+        now = self._clock()
+        return {
+            r.name: {
+                "lag_s": r.lag,
+                "available": r.down_until <= now,
+                "pool": r.pool.metrics() if hasattr(r.pool, "metrics") else {},
+            }
+            for r in self.replicas
+        }
+
+    def closeall(self) -> None:
+        for replica in self.replicas:
+            replica.pool.closeall()
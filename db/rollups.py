@@ -0,0 +1,240 @@
+"""
+Incrementally maintained analytics rollups.
+
+Dashboards used to GROUP BY over the whole analytics_events table on every
+render. The refresh job here folds new events into hourly and daily rollup
+tables keyed by (bucket, event_type, user_id), per-user totals and per-day
+HyperLogLog sketches of distinct users, and advances a watermark.
+Readers combine the rollups with the short raw tail above the watermark, so
+results stay exact while scanning only a small fraction of the raw data.
+
+The watermark must never pass a row that can still become visible:
+
+* SQLite has one writer at a time, so ids become visible in id order and
+  the watermark is the highest analytics_events.id rolled up.
+* On Postgres ids are allocated before commit, so a long transaction can
+  commit an id below rows that are already visible. Each row therefore
+  records its inserting transaction (``txid``), and the watermark only
+  advances to just below the oldest transaction still running
+  (``txid_snapshot_xmin``); every row with a lower txid has committed or
+  rolled back.
+
+Historical rows bulk-loaded into an older SQLite partition get that month's
+(lower) ids; :func:`fold_below_watermark` rolls them up as they are inserted.
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from core.settings import settings
+from core.safe_logging import log_exception_safe
+from db.hll import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+# event_type under which the all-events distinct-user sketch is stored
+ALL_EVENTS = "*"
+
+_refresher: Optional[threading.Thread] = None
+_refresher_stop = threading.Event()
+_refresh_lock = threading.Lock()
+
+
+def watermark() -> Tuple[str, str]:
+    """(rollup_watermarks name, analytics_events column it tracks) for this backend."""
+    if settings.DB_TYPE == "postgres":
+        return "analytics_events_txid", "txid"
+    return "analytics_events", "id"
+
+
+def tail_condition() -> str:
+    """
+    SQL condition selecting analytics_events rows not yet rolled up.
+
+    Reads the watermark in a subquery, so inside a larger query the rollup
+    and the raw tail come from the same snapshot.
+    """
+    name, column = watermark()
+    return (
+        f"{column} > (SELECT COALESCE(MAX(last_id), 0) FROM rollup_watermarks "
+        f"WHERE name = '{name}')"
+    )
+
+
+def _hour_bucket(column: str) -> str:
+    if settings.DB_TYPE == "postgres":
+        return f"date_trunc('hour', {column})"
+    return f"strftime('%Y-%m-%d %H:00:00', {column})"
+
+
+def _upsert(table: str, key: str, select_sql: str) -> str:
+    """INSERT ... SELECT that adds counts onto existing rollup rows."""
+    return (
+        f"INSERT INTO {table} ({key}, event_count) {select_sql} "
+        f"ON CONFLICT ({key}) DO UPDATE "
+        f"SET event_count = {table}.event_count + excluded.event_count"
+    )
+
+
+def _refresh_batch(max_rows: int) -> Tuple[int, int]:
+    """Roll up one watermark range in a single transaction; returns (low, high) covered."""
+    from db.database import get_connection, _adapt_query
+
+    name, column = watermark()
+    with get_connection() as conn:
+        cur = conn.cursor()
+        # Touch the watermark row first: the row lock (Postgres) or write lock
+        # (SQLite) serialises concurrent refreshers so no range is counted twice.
+        cur.execute(_adapt_query(
+            "UPDATE rollup_watermarks SET updated_at = CURRENT_TIMESTAMP WHERE name = %s"
+        ), (name,))
+        if cur.rowcount == 0:
+            return 0, 0  # created by the schema / migrations; not there yet
+        cur.execute(_adapt_query(
+            "SELECT last_id FROM rollup_watermarks WHERE name = %s"
+        ), (name,))
+        low = cur.fetchone()[0]
+
+        # Postgres: stop below the oldest running transaction (see module docstring)
+        horizon = "txid_snapshot_xmin(txid_current_snapshot()) - 1" if column == "txid" else "NULL"
+        cur.execute(_adapt_query(
+            f"SELECT MAX({column}), {horizon} FROM ("
+            f"  SELECT {column} FROM analytics_events WHERE {column} > %s ORDER BY {column} LIMIT %s"
+            ") batch"
+        ), (low, max_rows))
+        high, horizon = cur.fetchone()
+        if high is not None and horizon is not None:
+            high = min(high, horizon)
+        if not high or high <= low:
+            return low, low
+
+        _fold(cur, f"FROM analytics_events WHERE {column} > %s AND {column} <= %s", (low, high))
+
+        cur.execute(_adapt_query(
+            "UPDATE rollup_watermarks SET last_id = %s WHERE name = %s"
+        ), (high, name))
+        return low, high
+
+
+def fold_below_watermark(cur, relation: str, after_id: int) -> int:
+    """
+    Roll up rows of ``relation`` inserted above ``after_id`` that are already below the id watermark.
+
+    Call in the inserting transaction (SQLite); the refresh never revisits
+    ids under its watermark. Returns the watermark id folded up to, or 0.
+    """
+    from db.database import _adapt_query
+
+    name, column = watermark()
+    cur.execute(_adapt_query(
+        "SELECT COALESCE(MAX(last_id), 0) FROM rollup_watermarks WHERE name = %s"
+    ), (name,))
+    high = cur.fetchone()[0]
+    if column != "id" or high <= after_id:
+        return 0
+    _fold(cur, f"FROM {relation} WHERE id > %s AND id <= %s", (after_id, high))
+    return high
+
+
+def _fold(cur, source: str, params: tuple) -> None:
+    """Add the events selected by ``source`` (a FROM ... WHERE clause) to every rollup."""
+    from db.database import _adapt_query
+
+    cur.execute(_adapt_query(_upsert(
+        "analytics_rollup_hourly",
+        "bucket_start, event_type, user_id",
+        f"SELECT {_hour_bucket('created_at')}, event_type, user_id, COUNT(*) {source} "
+        "GROUP BY 1, 2, 3",
+    )), params)
+    cur.execute(_adapt_query(_upsert(
+        "analytics_rollup_daily",
+        "bucket_date, event_type, user_id",
+        f"SELECT DATE(created_at), event_type, user_id, COUNT(*) {source} "
+        "GROUP BY 1, 2, 3",
+    )), params)
+    cur.execute(_adapt_query(_upsert(
+        "analytics_user_totals",
+        "user_id",
+        f"SELECT user_id, COUNT(*) {source} GROUP BY user_id",
+    )), params)
+    _fold_sketches(cur, source, params)
+
+
+def _fold_sketches(cur, source: str, params: tuple) -> None:
+    """Merge the distinct users of the events in ``source`` into the per-day HLL sketches."""
+    from db.database import _adapt_query
+
+    cur.execute(_adapt_query(
+        f"SELECT DISTINCT DATE(created_at), event_type, user_id {source}"
+    ), params)
+    sketches: Dict[Tuple[Any, str], HyperLogLog] = {}
+    for day, event_type, user_id in cur.fetchall():
+        for key in ((day, event_type), (day, ALL_EVENTS)):
+            if key not in sketches:
+                sketches[key] = HyperLogLog()
+            sketches[key].add(user_id)
+
+    # Read-modify-write is safe: the watermark row lock serialises refreshers.
+    for (day, event_type), sketch in sketches.items():
+        cur.execute(_adapt_query(
+            "SELECT sketch FROM analytics_hll_daily WHERE bucket_date = %s AND event_type = %s"
+        ), (day, event_type))
+        row = cur.fetchone()
+        if row:
+            sketch.merge(HyperLogLog.from_bytes(row[0]))
+        cur.execute(_adapt_query(
+            "INSERT INTO analytics_hll_daily (bucket_date, event_type, sketch) VALUES (%s, %s, %s) "
+            "ON CONFLICT (bucket_date, event_type) DO UPDATE SET sketch = excluded.sketch"
+        ), (day, event_type, sketch.to_bytes()))
+
+
+def refresh_analytics_rollups(max_rows: Optional[int] = None) -> int:
+    """
+    Fold every committed event above the watermark into the rollup tables.
+
+    Works in batches of ``max_rows`` events, one transaction each, so a
+    large backlog never holds locks for long. Returns how far the watermark
+    advanced (event ids on SQLite, transaction ids on Postgres).
+    """
+    max_rows = max_rows or settings.ROLLUP_BATCH_SIZE
+    advanced = 0
+    with _refresh_lock:
+        while True:
+            low, high = _refresh_batch(max_rows)
+            advanced += high - low
+            if high - low == 0:
+                break
+    if advanced:
+        logger.debug(f"Analytics rollup watermark advanced by {advanced}")
+    return advanced
+
+
+def start_rollup_refresher(interval: Optional[float] = None) -> None:
+    """Run refresh_analytics_rollups every ``interval`` seconds in a daemon thread."""
+    global _refresher
+    interval = interval or settings.ROLLUP_REFRESH_INTERVAL
+    if _refresher is not None or interval <= 0:
+        return
+
+    def run():
+        while True:
+            started = time.monotonic()
+            try:
+                refresh_analytics_rollups()
+            except Exception as e:
+                log_exception_safe(logger, "Analytics rollup refresh failed", e, level="warning")
+            if _refresher_stop.wait(max(interval - (time.monotonic() - started), 0)):
+                return
+
+    _refresher_stop.clear()
+    _refresher = threading.Thread(target=run, name="analytics-rollups", daemon=True)
+    _refresher.start()
+
+
+def stop_rollup_refresher() -> None:
+    """Stop the background refresh thread."""
+    global _refresher
+    _refresher_stop.set()
+    _refresher = None
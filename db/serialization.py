@@ -0,0 +1,180 @@
+"""
+JSON encoding for the metadata / changes / data columns.
+
+dumps()/loads() use orjson when it is installed and the stdlib otherwise.
+On Postgres, psycopg2 is pointed at the same functions: parameters are
+wrapped in its ``Json`` adapter, and json/jsonb results are parsed by
+loads(). SQLite stores JSON as text. Rows read back there are
+:class:`JSONRow` objects, which parse a JSON column only when it is
+accessed. A page of chat history read only for role/content never
+decodes its metadata.
+"""
+
+import json
+from typing import Any, Iterable, List, Sequence
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    from psycopg2.extras import Json, register_default_json, register_default_jsonb
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    Json = None
+    PSYCOPG2_AVAILABLE = False
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if ORJSON_AVAILABLE else 0
+
+
+def dumps(data: Any) -> str:
+    """Serialise ``data`` to JSON text."""
+    if isinstance(data, JSONRow):
+        data = dict(data)
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(data, option=_ORJSON_OPTIONS).decode("utf-8")
+        except TypeError:
+            pass  # unsupported type or int beyond 64 bits: the stdlib decides
+    return json.dumps(data)
+
+
+def loads(text: Any) -> Any:
+    """Parse JSON text (str or bytes); raises ValueError when malformed."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def decode(value: Any) -> Any:
+    """Parse a stored JSON value, leaving non-text and malformed values as they are."""
+    if not value or not isinstance(value, str):
+        return value
+    try:
+        return loads(value)
+    except ValueError:
+        return value
+
+
+def pg_json(data: Any) -> Any:
+    """A psycopg2 parameter sending ``data`` as JSON (None stays NULL)."""
+    if data is None:
+        return None
+    return Json(data, dumps=dumps)
+
+
+def register_psycopg2(conn=None) -> None:
+    """Parse json/jsonb results with loads() on ``conn`` (all connections if None)."""
+    if not PSYCOPG2_AVAILABLE:
+        return
+    scope = {"conn_or_curs": conn} if conn is not None else {"globally": True}
+    register_default_json(loads=loads, **scope)
+    register_default_jsonb(loads=loads, **scope)
+
+
+class JSONRow(dict):
+    """
+    Result row whose JSON columns are parsed on first access.
+
+    Until then those columns hold the stored text. Item access, get(), the
+    views, iteration and dict(row) all return parsed values. Only code that
+    reads the dict's storage directly (the stdlib C JSON encoder) sees the
+    text; use :func:`dumps` or ``dict(row)`` for those.
+
+    Example:
+        >>> row = JSONRow({"id": 1, "metadata": '{"k": 1}'}, ("metadata",))
+        >>> row["metadata"]
+        {'k': 1}
+    """
+
+    __slots__ = ("_pending",)
+
+    def __init__(self, row: Any, json_columns: Sequence[str]):
+        super().__init__(row)
+        self._pending = {c for c in json_columns if isinstance(dict.get(self, c), str)}
+
+    def _decode(self, key: Any) -> None:
+        if key in self._pending:
+            self._pending.discard(key)
+            dict.__setitem__(self, key, decode(dict.__getitem__(self, key)))
+
+    def _decode_all(self) -> None:
+        for key in list(self._pending):
+            self._decode(key)
+
+    def __getitem__(self, key):
+        if self._pending:
+            self._decode(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if self._pending:
+            self._decode(key)
+        return dict.get(self, key, default)
+
+    def __setitem__(self, key, value):
+        self._pending.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._pending.discard(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if self._pending:
+            self._decode(key)
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if self._pending:
+            self._decode(key)
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        other = dict(*args, **kwargs)
+        self._pending.difference_update(other)
+        dict.update(self, other)
+
+    # Whole-row access decodes everything first. Overriding __iter__ also
+    # makes dict(row) and {**row} go through keys() and __getitem__.
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def items(self):
+        self._decode_all()
+        return dict.items(self)
+
+    def values(self):
+        self._decode_all()
+        return dict.values(self)
+
+    def copy(self):
+        self._decode_all()
+        return dict(dict.items(self))
+
+    def __eq__(self, other):
+        self._decode_all()
+        if isinstance(other, JSONRow):
+            other._decode_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        self._decode_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return dict, (self.copy(),)
+
+
+def json_rows(rows: Iterable[Any], json_columns: Sequence[str]) -> List[JSONRow]:
+    """Wrap result rows (mappings) as :class:`JSONRow` for ``json_columns``."""
+    return [JSONRow(row, json_columns) for row in rows]
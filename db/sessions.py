@@ -0,0 +1,311 @@
+"""
+Login session service.
+
+Sessions live in the ``sessions`` table. Only a SHA-256 digest of each token
+is stored, so a leaked table cannot be replayed. Validation is served from a
+small in-process TTL cache, so most requests never touch the database.
+Revocation evicts the cache entry, and a cached session is never trusted past
+its own expires_at.
+
+A background sweeper marks expired sessions inactive in small batches, using
+the (is_active, expires_at) index. The number of active sessions is kept in
+``session_counters`` and updated in the same transaction as every change to
+is_active, so dashboards read one row instead of running COUNT(*) on
+sessions. Expired sessions still count until the sweeper reaches them,
+which is at most SESSION_SWEEP_INTERVAL seconds.
+"""
+
+import time
+import hashlib
+import logging
+import secrets
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from core.settings import settings
+from core.cache import TTLCache
+from core.safe_logging import log_exception_safe, mask_identifier
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_SESSIONS = "active_sessions"
+
+_token_cache = TTLCache(maxsize=settings.SESSION_CACHE_SIZE, ttl=settings.SESSION_CACHE_TTL)
+_sweeper: Optional[threading.Thread] = None
+_sweeper_stop = threading.Event()
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _now() -> datetime:
+    return datetime.utcnow().replace(microsecond=0)
+
+
+def _as_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime.fromisoformat(str(value))
+
+
+def ensure_session_counter(cur) -> None:
+    """Create ``session_counters`` and seed the active count once (idempotent)."""
+    from db.database import _adapt_query
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS session_counters (
+            name VARCHAR(50) PRIMARY KEY,
+            value BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute(_adapt_query(
+        "INSERT INTO session_counters (name, value) "
+        "SELECT %s, COUNT(*) FROM sessions WHERE is_active = %s "
+        "ON CONFLICT DO NOTHING"
+    ), (ACTIVE_SESSIONS, True))
+
+
+def _bump_counter(cur, delta: int) -> None:
+    from db.database import _adapt_query
+
+    if delta:
+        cur.execute(_adapt_query(
+            "UPDATE session_counters SET value = value + %s WHERE name = %s"
+        ), (delta, ACTIVE_SESSIONS))
+
+
+def create_session(
+    user_id: int,
+    ip_address: Optional[str] = None,
+    user_agent: Optional[str] = None,
+    ttl: Optional[float] = None,
+) -> str:
+    """
+    Open a session for ``user_id`` and return its token.
+
+    The token is returned once and never stored; keep it client-side.
+    """
+    from db.database import _adapt_query, _run_write
+
+    token = secrets.token_urlsafe(32)
+    expires_at = _now() + timedelta(seconds=ttl or settings.SESSION_TTL)
+    query = _adapt_query("""
+        INSERT INTO sessions (user_id, session_token, expires_at, ip_address, user_agent, is_active)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """)
+    if settings.DB_TYPE == "postgres":
+        query += " RETURNING id"
+
+    def write(cur):
+        cur.execute(query, (user_id, _digest(token), expires_at, ip_address, user_agent, True))
+        session_id = cur.fetchone()[0] if settings.DB_TYPE == "postgres" else cur.lastrowid
+        _bump_counter(cur, 1)
+        return session_id
+
+    session_id = _run_write(write)
+    _token_cache.set(_digest(token), {
+        "session_id": session_id, "user_id": user_id, "expires_at": expires_at,
+    })
+    logger.info(f"Session created for user {mask_identifier(str(user_id), 'id')}")
+    return token
+
+
+def validate_session(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Return ``{session_id, user_id, expires_at}`` for a live session, else None.
+
+    Answers from the token cache when possible; a cached entry is still
+    checked against its expiry.
+    """
+    from db.database import get_connection, _adapt_query
+
+    if not token:
+        return None
+    key = _digest(token)
+    now = _now()
+    cached = _token_cache.get(key)
+    if cached is not None:
+        if cached["expires_at"] > now:
+            return dict(cached)
+        _token_cache.pop(key)
+        return None
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(_adapt_query(
+            "SELECT id, user_id, expires_at FROM sessions "
+            "WHERE session_token = %s AND is_active = %s"
+        ), (key, True))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    session = {"session_id": row[0], "user_id": row[1], "expires_at": _as_datetime(row[2])}
+    if session["expires_at"] <= now:
+        return None
+    _token_cache.set(key, session)
+    return dict(session)
+
+
+def refresh_session(token: str, ttl: Optional[float] = None) -> Optional[datetime]:
+    """Extend a live session to ``ttl`` seconds from now; returns the new expiry or None."""
+    from db.database import _adapt_query, _run_write
+
+    key = _digest(token)
+    now = _now()
+    expires_at = now + timedelta(seconds=ttl or settings.SESSION_TTL)
+
+    def write(cur):
+        cur.execute(_adapt_query(
+            "UPDATE sessions SET expires_at = %s "
+            "WHERE session_token = %s AND is_active = %s AND expires_at > %s"
+        ), (expires_at, key, True, now))
+        return cur.rowcount > 0
+
+    if not _run_write(write):
+        _token_cache.pop(key)
+        return None
+    cached = _token_cache.get(key)
+    if cached is not None:
+        _token_cache.set(key, dict(cached, expires_at=expires_at))
+    return expires_at
+
+
+def revoke_session(token: str) -> bool:
+    """End a session (logout). Returns False if it was not active."""
+    from db.database import _adapt_query, _run_write
+
+    key = _digest(token)
+    _token_cache.pop(key)
+
+    def write(cur):
+        cur.execute(_adapt_query(
+            "UPDATE sessions SET is_active = %s WHERE session_token = %s AND is_active = %s"
+        ), (False, key, True))
+        changed = cur.rowcount
+        _bump_counter(cur, -changed)
+        return changed > 0
+
+    return _run_write(write)
+
+
+def revoke_user_sessions(user_id: int) -> int:
+    """End every active session of a user (e.g. on deactivation); returns how many."""
+    from db.database import _adapt_query, _run_write
+
+    def write(cur):
+        cur.execute(_adapt_query(
+            "UPDATE sessions SET is_active = %s WHERE user_id = %s AND is_active = %s"
+        ), (False, user_id, True))
+        changed = cur.rowcount
+        _bump_counter(cur, -changed)
+        return changed
+
+    revoked = _run_write(write)
+    _token_cache.discard_where(lambda _key, session: session["user_id"] == user_id)
+    return revoked
+
+
+def expire_stale_sessions(batch_size: Optional[int] = None) -> int:
+    """
+    Mark expired sessions inactive, one bounded batch per transaction.
+
+    Each batch is found through the (is_active, expires_at) index, so the
+    sweep costs O(expired rows) rather than a scan of the table.
+    """
+    from db.database import _adapt_query, _run_write
+
+    batch_size = batch_size or settings.SESSION_SWEEP_BATCH
+    expired = 0
+    while True:
+        now = _now()
+
+        def write(cur):
+            cur.execute(_adapt_query(
+                "UPDATE sessions SET is_active = %s WHERE id IN ("
+                "  SELECT id FROM sessions WHERE is_active = %s AND expires_at <= %s LIMIT %s"
+                ")"
+            ), (False, True, now, batch_size))
+            changed = cur.rowcount
+            _bump_counter(cur, -changed)
+            return changed
+
+        count = _run_write(write)
+        expired += count
+        if count < batch_size:
+            break
+    if expired:
+        logger.info(f"Expired {expired} stale session(s)")
+    return expired
+
+
+def reconcile_session_counter() -> int:
+    """Reset the active-session counter from the table (one indexed count); returns it."""
+    from db.database import _adapt_query, _run_write
+
+    def write(cur):
+        cur.execute(_adapt_query("SELECT COUNT(*) FROM sessions WHERE is_active = %s"), (True,))
+        active = cur.fetchone()[0]
+        cur.execute(_adapt_query(
+            "UPDATE session_counters SET value = %s WHERE name = %s"
+        ), (active, ACTIVE_SESSIONS))
+        return active
+
+    return _run_write(write)
+
+
+def get_active_session_count() -> int:
+    """Active sessions from the maintained counter (no table scan)."""
+    from db.database import get_connection, _adapt_query
+
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(_adapt_query(
+            "SELECT value FROM session_counters WHERE name = %s"
+        ), (ACTIVE_SESSIONS,))
+        row = cur.fetchone()
+    return max(int(row[0]), 0) if row else 0
+
+
+def get_session_cache_stats() -> Dict[str, Any]:
+    """Token cache size and hit/miss counters."""
+    return _token_cache.stats()
+
+
+def start_session_sweeper(interval: Optional[float] = None) -> None:
+    """
+    Expire stale sessions every ``interval`` seconds in a daemon thread.
+
+    The first pass also reconciles the counter, correcting any drift from
+    rows changed outside this module.
+    """
+    global _sweeper
+    interval = interval or settings.SESSION_SWEEP_INTERVAL
+    if _sweeper is not None or interval <= 0:
+        return
+
+    def run():
+        try:
+            expire_stale_sessions()
+            reconcile_session_counter()
+        except Exception as e:
+            log_exception_safe(logger, "Session counter reconcile failed", e, level="warning")
+        while not _sweeper_stop.wait(interval):
+            started = time.monotonic()
+            try:
+                expire_stale_sessions()
+            except Exception as e:
+                log_exception_safe(logger, "Session sweep failed", e, level="warning")
+            logger.debug(f"Session sweep took {time.monotonic() - started:.3f}s")
+
+    _sweeper_stop.clear()
+    _sweeper = threading.Thread(target=run, name="session-sweeper", daemon=True)
+    _sweeper.start()
+
+
+def stop_session_sweeper() -> None:
+    """Stop the background sweeper thread."""
+    global _sweeper
+    _sweeper_stop.set()
+    _sweeper = None
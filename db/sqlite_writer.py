@@ -0,0 +1,168 @@
+"""
+Single-writer serialisation for the SQLite backend.
+
+SQLite allows one writer at a time. With a connection per Streamlit thread,
+concurrent INSERT/UPDATE statements race for the database lock and fail with
+``database is locked`` once busy_timeout runs out. SQLiteWriter funnels every
+write through one thread that owns a dedicated connection. Jobs queued while
+a transaction is running are group-committed: each job runs inside its own
+SAVEPOINT (so one failure does not affect the others) and the batch shares a
+single COMMIT, which in WAL mode is one fsync. Readers keep their own
+thread-local connections and, thanks to WAL, never wait for the writer.
+"""
+
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WriteJob = Callable[[sqlite3.Cursor], Any]
+
+
+class SQLiteWriter:
+    """
+    Dedicated writer thread for one SQLite database.
+
+    Args:
+        connect: Returns a new configured sqlite3 connection; called once from
+            the writer thread
+        max_batch: Most jobs folded into one transaction
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_batch: int = 256):
+        self._connect = connect
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Tuple[WriteJob, Future]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopped = False
+
+        self._jobs = 0
+        self._failed = 0
+        self._commits = 0
+        self._wait_s = 0.0
+
+    def start(self) -> "SQLiteWriter":
+        """Start the writer thread (idempotent)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def execute(self, job: WriteJob, timeout: Optional[float] = None) -> Any:
+        """
+        Run ``job(cursor)`` on the writer thread and return its result.
+
+        The job's changes are committed before this returns. Exceptions raised
+        by the job are re-raised here and only roll back that job.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("SQLite write jobs must not submit nested writes")
+        future: Future = Future()
+        started = time.perf_counter()
+        # Checked and queued under the lock so no job lands behind the shutdown sentinel
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("SQLite writer is stopped")
+            self._queue.put((job, future))
+        try:
+            return future.result(timeout)
+        finally:
+            self._wait_s += time.perf_counter() - started
+
+    def shutdown(self, timeout: Optional[float] = 10.0) -> None:
+        """Finish queued jobs and stop the writer thread."""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            running = self._thread is not None and self._thread.is_alive()
+            if running:
+                self._queue.put(None)
+        if running:
+            self._thread.join(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, job/commit counters and mean time callers spent waiting."""
+        return {
+            "queued": self._queue.qsize(),
+            "jobs_total": self._jobs,
+            "failed_total": self._failed,
+            "commits_total": self._commits,
+            "jobs_per_commit": round(self._jobs / self._commits, 2) if self._commits else 0.0,
+            "avg_wait_ms": round(self._wait_s / self._jobs * 1000, 3) if self._jobs else 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        conn = self._connect()
+        conn.isolation_level = None  # transactions are managed explicitly below
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                stop = False
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                self._run_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: List[Tuple[WriteJob, Future]]) -> None:
+        cur = conn.cursor()
+        outcomes: List[Tuple[Future, bool, Any]] = []
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for job, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cur.execute("SAVEPOINT job")
+                try:
+                    result = job(cur)
+                except BaseException as e:
+                    cur.execute("ROLLBACK TO job")
+                    cur.execute("RELEASE job")
+                    outcomes.append((future, False, e))
+                else:
+                    cur.execute("RELEASE job")
+                    outcomes.append((future, True, result))
+            cur.execute("COMMIT")
+            self._commits += 1
+        except BaseException as e:
+            # BEGIN or COMMIT failed: nothing in this batch was persisted
+            if conn.in_transaction:
+                conn.rollback()
+            logger.warning(f"SQLite write batch failed ({len(batch)} jobs): {type(e).__name__}")
+            for job, future in batch:
+                if not future.done():
+                    self._failed += 1
+                    future.set_exception(e)
+            return
+
+        for future, ok, value in outcomes:
+            self._jobs += 1
+            if ok:
+                future.set_result(value)
+            else:
+                self._failed += 1
+                future.set_exception(value)
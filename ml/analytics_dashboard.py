@@ -6,7 +6,10 @@ and clinical outcome tracking for the NHS Nursing Validator.
 """
 
 import os
+import time
+import shutil
 import logging
+import tempfile
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 
@@ -48,20 +51,18 @@ class AnalyticsDashboard:
 
         try:
             from db.database import get_connection
+            from db.sessions import get_active_session_count
 
-            with get_connection() as conn:
+            # Maintained counter; no scan of the sessions table
+            active_sessions = get_active_session_count()
+
+            with get_connection(readonly=True) as conn:
                 cur = conn.cursor()
 
                 # Total users
                 cur.execute("SELECT COUNT(*) FROM users WHERE is_active = TRUE")
                 total_users = cur.fetchone()[0]
 
-                # Active sessions
-                cur.execute(
-                    "SELECT COUNT(*) FROM sessions WHERE is_active = TRUE "
-                    "AND expires_at > CURRENT_TIMESTAMP"
-                )
-                active_sessions = cur.fetchone()[0]
 
                 # Total messages
                 cur.execute("SELECT COUNT(*) FROM chat_history")
@@ -115,7 +116,7 @@ class AnalyticsDashboard:
                     value=datetime.now(),
                 )
 
-            with get_connection() as conn:
+            with get_connection(readonly=True) as conn:
                 cur = conn.cursor()
 
                 # Daily active users
@@ -199,7 +200,7 @@ class AnalyticsDashboard:
                     key="compliance_end",
                 )
 
-            with get_connection() as conn:
+            with get_connection(readonly=True) as conn:
                 cur = conn.cursor()
 
                 # Login/logout audit
@@ -293,7 +294,7 @@ class AnalyticsDashboard:
                 "topics with low confidence scores."
             )
 
-            with get_connection() as conn:
+            with get_connection(readonly=True) as conn:
                 cur = conn.cursor()
 
                 # Questions by topic
@@ -364,7 +365,7 @@ class AnalyticsDashboard:
         try:
             from db.database import get_connection
 
-            with get_connection() as conn:
+            with get_connection(readonly=True) as conn:
                 cur = conn.cursor()
 
                 # User activity summary
@@ -442,19 +443,93 @@ class AnalyticsDashboard:
         """Display data export options."""
         st.subheader("📥 Export Data")
 
-        st.write("Export analytics data for external reporting:")
+        st.write("Export the audit log for compliance reporting:")
 
-        col1, col2, col3 = st.columns(3)
+        if not self.db_available:
+            st.warning("Database required for exports")
+            return
 
-        with col1:
-            if st.button("📊 Export as CSV"):
-                st.info("CSV export functionality ready for implementation")
+        from core.settings import settings
+        from db.export import EXPORT_FORMATS, PARQUET_AVAILABLE, iter_audit_log_export
 
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            start_date = st.date_input(
+                "Export Start Date",
+                value=datetime.now() - timedelta(days=90),
+                key="export_start",
+            )
         with col2:
+            end_date = st.date_input(
+                "Export End Date",
+                value=datetime.now(),
+                key="export_end",
+            )
+        with col3:
+            formats = [f for f in EXPORT_FORMATS if f != "parquet" or PARQUET_AVAILABLE]
+            fmt = st.selectbox("Format", formats, format_func=str.upper, key="export_format")
+
+        if st.button("📊 Export Audit Log"):
+            mime, suffix = EXPORT_FORMATS[fmt]
+            status = st.empty()
+            started = time.monotonic()
+            exported = {"rows": 0}
+
+            def report(rows):
+                exported["rows"] += rows
+                rate = exported["rows"] / max(time.monotonic() - started, 1e-6)
+                status.text(f"Exported {exported['rows']:,} rows ({rate:,.0f} rows/s)")
+
+            fd, path = tempfile.mkstemp(suffix=suffix)
+            file_name = f"audit_logs_{datetime.now():%Y%m%d_%H%M%S}{suffix}"
+            try:
+                # Streamed to disk chunk by chunk, so building the export stays flat in memory
+                with os.fdopen(fd, "wb") as out:
+                    for chunk in iter_audit_log_export(
+                        fmt,
+                        start_date=start_date.isoformat(),
+                        end_date=(end_date + timedelta(days=1)).isoformat(),  # exclusive
+                        on_batch=report,
+                    ):
+                        out.write(chunk)
+                status.success(
+                    f"Exported {exported['rows']:,} rows in {time.monotonic() - started:.1f}s"
+                )
+                size = os.path.getsize(path)
+                if size <= settings.EXPORT_DOWNLOAD_MAX_MB * 1024 * 1024:
+                    # download_button reads the whole file into Streamlit's media store
+                    with open(path, "rb") as f:
+                        st.download_button(
+                            "⬇️ Download export",
+                            f,
+                            file_name=file_name,
+                            mime=mime,
+                        )
+                else:
+                    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+                    saved = os.path.join(settings.EXPORT_DIR, file_name)
+                    shutil.move(path, saved)
+                    st.warning(
+                        f"The export is {size / (1024 * 1024):,.0f} MB, over the "
+                        f"{settings.EXPORT_DOWNLOAD_MAX_MB} MB download limit. It was saved to "
+                        f"{os.path.abspath(saved)} on the server; for large date ranges, "
+                        "write straight to a file with db.export.export_audit_logs()."
+                    )
+            except Exception as e:
+                from core.safe_logging import log_exception_safe
+                log_exception_safe(logger, "Audit log export failed", e)
+                st.error(f"Export failed: {e}")
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)  # download_button has taken its copy
+
+        col1, col2 = st.columns(2)
+
+        with col1:
             if st.button("📄 Export as PDF"):
                 st.info("PDF report generation ready for implementation")
 
-        with col3:
+        with col2:
             if st.button("📈 Export as Excel"):
                 st.info("Excel workbook export ready for implementation")
 
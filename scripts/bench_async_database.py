@@ -0,0 +1,158 @@
+"""
+Sync vs async data-access throughput at high concurrency.
+
+Runs the same workload in two fresh subprocesses:
+
+* sync: db.database, one OS thread per client (ThreadPoolExecutor)
+* async: db.async_database, one coroutine per client on a single event loop
+
+Each client saves a chat message, logs an audit event, reads the user's
+recent history and looks the user up, in a loop. The backend follows
+DB_TYPE: SQLite runs on a scratch database per mode; Postgres uses the
+configured database (bench users get a unique prefix). Usage:
+
+    python scripts/bench_async_database.py --clients 256 --ops 50
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import tempfile
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ("sync", "async")
+
+
+def _summary(latencies: list, errors: int, elapsed: float) -> dict:
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 3) if latencies else 0.0
+
+    return {
+        "iterations_ok": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "iterations_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def _setup(clients: int) -> list:
+    from db import database as db
+    from db.db_migrations import run_migrations
+
+    db.init_database()
+    run_migrations()
+    prefix = uuid.uuid4().hex[:8]
+    return [
+        (f"bench_{prefix}_{i}", db.add_user(f"bench_{prefix}_{i}", "x", "nurse"))
+        for i in range(clients)
+    ]
+
+
+def run_sync(clients: int, ops: int) -> dict:
+    from db import database as db
+
+    users = _setup(clients)
+    latencies, errors = [], [0]
+
+    def client(username: str, user_id: int) -> None:
+        for i in range(ops):
+            t0 = time.perf_counter()
+            try:
+                db.save_chat_message(user_id, "user", f"message {i}", metadata={"i": i})
+                db.log_audit_event(user_id, "chat_message", "chat", str(i))
+                db.get_chat_history(user_id, limit=20)
+                db.get_user(username)
+            except Exception:
+                errors[0] += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(client, *u) for u in users]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    result = _summary(latencies, errors[0], elapsed)
+    db.close_connection_pool()
+    return result
+
+
+def run_async(clients: int, ops: int) -> dict:
+    from db import async_database as adb
+
+    users = _setup(clients)
+    latencies, errors = [], [0]
+
+    async def client(username: str, user_id: int) -> None:
+        for i in range(ops):
+            t0 = time.perf_counter()
+            try:
+                await adb.save_chat_message(user_id, "user", f"message {i}", metadata={"i": i})
+                await adb.log_audit_event(user_id, "chat_message", "chat", str(i))
+                await adb.get_chat_history(user_id, limit=20)
+                await adb.get_user(username)
+            except Exception:
+                errors[0] += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+
+    async def run() -> dict:
+        await adb.init_async_pool()
+        started = time.perf_counter()
+        await asyncio.gather(*(client(*u) for u in users))
+        elapsed = time.perf_counter() - started
+        result = _summary(latencies, errors[0], elapsed)
+        result["pool"] = adb.get_async_pool_metrics()
+        await adb.close_async_pool()
+        return result
+
+    return asyncio.run(run())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sync vs async database benchmark")
+    parser.add_argument("--clients", type=int, default=256, help="concurrent clients")
+    parser.add_argument("--ops", type=int, default=50, help="iterations per client")
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, REPO_ROOT)
+        run = run_sync if args.worker == "sync" else run_async
+        print(json.dumps(run(args.clients, args.ops)))
+        return
+
+    backend = os.environ.get("DB_TYPE", "sqlite")
+    report = {"backend": backend, "clients": args.clients, "ops_per_client": args.ops}
+    for mode in MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DB_TYPE=backend, USE_DATABASE="true")
+            if backend == "sqlite":
+                env["SQLITE_DB_PATH"] = os.path.join(tmp, "bench.db")
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", mode,
+                 "--clients", str(args.clients), "--ops", str(args.ops)],
+                env=env, cwd=tmp, capture_output=True, text=True, check=True,
+            )
+            report[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+    if report["sync"]["iterations_per_s"]:
+        report["async_speedup"] = round(
+            report["async"]["iterations_per_s"] / report["sync"]["iterations_per_s"], 2
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Load generator and latency benchmark for db/database.py.
+
+Seeds a scratch database with synthetic users, chat messages, audit logs and
+analytics events, then drives a weighted mix of reads and writes from a
+thread pool and reports p50/p95/p99 latency and throughput per operation as
+JSON. Keep the JSON output from each run and pass it back with --baseline to
+see per-operation regressions.
+
+SQLite runs against a temporary file. Postgres uses the DB_HOST / DB_PORT /
+DB_NAME / DB_USER / DB_PASSWORD environment variables and must point at a
+disposable database: the benchmark writes into the application tables.
+
+Examples:
+
+    python scripts/bench_database.py --backend sqlite --rows 100000 --concurrency 100
+    python scripts/bench_database.py --backend sqlite,postgres --rows 1000000 \
+        --duration 60 --output bench.json
+    python scripts/bench_database.py --backend sqlite --baseline bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+import platform
+import subprocess
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative frequency of each operation in the mixed workload
+DEFAULT_MIX = {
+    "save_chat_message": 20,
+    "get_chat_history": 20,
+    "get_chat_history_page": 10,
+    "log_audit_event": 20,
+    "log_analytics_event": 15,
+    "get_audit_logs": 5,
+    "get_analytics_summary": 4,
+    "get_top_users": 3,
+    "get_active_user_counts": 3,
+    "search_chat_history": 3,
+    "get_chat_histories": 2,
+}
+
+SEED_BATCH = 50000
+ACTIONS = ("login", "logout", "chat_message", "view_care_plan", "export")
+EVENT_TYPES = ("page_view", "chat", "assessment", "export")
+SEARCH_TERMS = ("pressure ulcer", "falls risk", "sepsis", "fluid balance", "wound*")
+CHAT_PHRASES = (
+    "pressure ulcer prevention and repositioning", "falls risk assessment on admission",
+    "sepsis screening and escalation", "fluid balance monitoring", "wound care and dressings",
+    "medication administration checks", "pain assessment scores",
+)
+
+
+# ----------------------------------------------------------------------
+# Seeding
+# ----------------------------------------------------------------------
+
+def seed(rows: int, users: int, days: int, rng: random.Random) -> Dict[str, Any]:
+    """Insert ``users`` users and ``rows`` rows into each event table."""
+    from db import database as db
+    from db.db_migrations import MigrationRunner
+
+    started = time.perf_counter()
+    db.init_database()
+    MigrationRunner().run()
+
+    user_ids = [db.add_user(f"bench_user_{i}", "x", "nurse") for i in range(users)]
+
+    now = datetime.utcnow()
+    span = days * 86400
+
+    def stamp() -> str:
+        return (now - timedelta(seconds=rng.randrange(span))).strftime("%Y-%m-%d %H:%M:%S")
+
+    loaders = {
+        "chat_history": (db.bulk_save_chat_messages, lambda: {
+            "user_id": rng.choice(user_ids), "role": rng.choice(("user", "assistant")),
+            "content": " ".join(rng.choice(CHAT_PHRASES) for _ in range(rng.randrange(1, 6))),
+            "created_at": stamp(),
+        }),
+        "audit_logs": (db.bulk_log_audit_events, lambda: {
+            "user_id": rng.choice(user_ids), "action": rng.choice(ACTIONS), "resource_type": "chat",
+            "resource_id": str(rng.randrange(10 ** 6)), "changes": {"n": rng.randrange(100)},
+            "created_at": stamp(),
+        }),
+        "analytics_events": (db.bulk_log_analytics_events, lambda: {
+            "user_id": rng.choice(user_ids), "event_type": rng.choice(EVENT_TYPES),
+            "event_name": "synthetic", "data": {"ms": rng.randrange(1000)}, "created_at": stamp(),
+        }),
+    }
+    # Rate of the bulk API alone (row generation is excluded)
+    insert_rates = {}
+    for table, (load, make) in loaders.items():
+        remaining, load_seconds = rows, 0.0
+        while remaining:
+            batch = [make() for _ in range(min(SEED_BATCH, remaining))]
+            load_started = time.perf_counter()
+            load(batch)
+            load_seconds += time.perf_counter() - load_started
+            remaining -= len(batch)
+        insert_rates[table] = round(rows / max(load_seconds, 1e-9))
+
+    with db.get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("ANALYZE")
+
+    from db.rollups import refresh_analytics_rollups
+    refresh_analytics_rollups()
+
+    return {
+        "users": len(user_ids),
+        "rows_per_table": rows,
+        "seconds": round(time.perf_counter() - started, 2),
+        "insert_rows_per_second": insert_rates,
+        "user_ids": user_ids,
+    }
+
+
+# ----------------------------------------------------------------------
+# Workload
+# ----------------------------------------------------------------------
+
+def _operations(user_ids: List[int], rng: random.Random) -> Dict[str, Callable[[], Any]]:
+    from db import database as db
+
+    def uid() -> int:
+        return rng.choice(user_ids)
+
+    def week_ago() -> str:
+        return (datetime.utcnow() - timedelta(days=7)).strftime("%Y-%m-%d")
+
+    def today() -> str:
+        return datetime.utcnow().strftime("%Y-%m-%d")
+
+    return {
+        "save_chat_message": lambda: db.save_chat_message(uid(), "user", "benchmark message"),
+        "get_chat_history": lambda: db.get_chat_history(uid(), limit=50),
+        "get_chat_history_page": lambda: db.get_chat_history_page(uid(), limit=20),
+        "get_chat_histories": lambda: db.get_chat_histories([uid() for _ in range(10)], limit=20),
+        "log_audit_event": lambda: db.log_audit_event(uid(), "chat_message", "chat", "bench"),
+        "log_analytics_event": lambda: db.log_analytics_event(uid(), "chat", "benchmark", {"ms": 1}),
+        "get_audit_logs": lambda: db.get_audit_logs(user_id=uid(), start_date=week_ago(), limit=100),
+        "get_analytics_summary": lambda: db.get_analytics_summary(week_ago(), today()),
+        "get_top_users": lambda: db.get_top_users(limit=10),
+        "get_active_user_counts": lambda: db.get_active_user_counts(),
+        "search_chat_history": lambda: db.search_chat_history(uid(), rng.choice(SEARCH_TERMS)),
+    }
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)]
+
+
+def run_workload(
+    user_ids: List[int],
+    mix: Dict[str, int],
+    concurrency: int,
+    duration: float,
+    max_ops: Optional[int],
+    seed_value: int,
+) -> Dict[str, Any]:
+    """Drive the weighted operation mix from ``concurrency`` threads."""
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    error_samples: Dict[str, str] = {}
+    issued = [0]
+    issued_lock = threading.Lock()
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    deadline = time.perf_counter() + duration
+
+    def worker(index: int) -> None:
+        rng = random.Random(seed_value + index)
+        ops = _operations(user_ids, rng)
+        while time.perf_counter() < deadline:
+            if max_ops is not None:
+                with issued_lock:
+                    if issued[0] >= max_ops:
+                        return
+                    issued[0] += 1
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                ops[name]()
+            except Exception as e:
+                errors[name] += 1
+                error_samples.setdefault(name, type(e).__name__)
+                continue
+            latencies[name].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+        for future in [pool.submit(worker, i) for i in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    report: Dict[str, Any] = {}
+    for name in names:
+        values = sorted(latencies.get(name, []))
+        report[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 3),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            "throughput_per_s": round(len(values) / elapsed, 1),
+        }
+        if name in error_samples:
+            report[name]["error_type"] = error_samples[name]
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total_ops": total,
+        "total_errors": sum(errors.values()),
+        "throughput_per_s": round(total / elapsed, 1),
+        "operations": report,
+    }
+
+
+def run_backend(args: argparse.Namespace) -> Dict[str, Any]:
+    """Body of one benchmark subprocess; backend settings come from the environment."""
+    sys.path.insert(0, REPO_ROOT)
+    from core.settings import settings
+    from db import database as db
+
+    rng = random.Random(args.seed)
+    seeded = seed(args.rows, args.users, args.days, rng)
+    user_ids = seeded.pop("user_ids")
+    mix = dict(DEFAULT_MIX, **json.loads(args.mix)) if args.mix else DEFAULT_MIX
+    result = run_workload(user_ids, mix, args.concurrency, args.duration, args.ops, args.seed)
+    result["seed"] = seeded
+    result["pool"] = db.get_pool_metrics()
+    result["sqlite_writer"] = db.get_sqlite_writer_metrics()
+    result["partitioned"] = settings.DB_PARTITIONING
+    db.close_connection_pool()
+    return result
+
+
+# ----------------------------------------------------------------------
+# Driver
+# ----------------------------------------------------------------------
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Lines describing p95 regressions larger than ``threshold`` (e.g. 0.2 = +20%)."""
+    findings = []
+    for backend, result in current.get("backends", {}).items():
+        old_ops = baseline.get("backends", {}).get(backend, {}).get("operations", {})
+        for name, stats in result.get("operations", {}).items():
+            old = old_ops.get(name)
+            if not old or not old.get("p95_ms"):
+                continue
+            change = stats["p95_ms"] / old["p95_ms"] - 1
+            if change > threshold:
+                findings.append(
+                    f"{backend}/{name}: p95 {old['p95_ms']}ms -> {stats['p95_ms']}ms (+{change:.0%})"
+                )
+    return findings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark db/database.py under concurrent load")
+    parser.add_argument("--backend", default="sqlite", help="comma-separated: sqlite,postgres")
+    parser.add_argument("--rows", type=int, default=10000, help="seed rows per event table (1e4-1e7)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=90, help="spread seeded rows over this many days")
+    parser.add_argument("--concurrency", type=int, default=100, help="worker threads")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of mixed load")
+    parser.add_argument("--ops", type=int, default=None, help="stop after this many operations")
+    parser.add_argument("--mix", help='JSON weight overrides, e.g. \'{"get_top_users": 0}\'')
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare p95 against")
+    parser.add_argument("--regression-threshold", type=float, default=0.2)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args)))
+        return
+
+    report: Dict[str, Any] = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "rows": args.rows, "users": args.users, "concurrency": args.concurrency,
+            "duration_s": args.duration, "ops": args.ops, "seed": args.seed,
+        },
+        "backends": {},
+    }
+    passthrough = [
+        "--rows", str(args.rows), "--users", str(args.users), "--days", str(args.days),
+        "--concurrency", str(args.concurrency), "--duration", str(args.duration),
+        "--seed", str(args.seed),
+    ]
+    if args.ops is not None:
+        passthrough += ["--ops", str(args.ops)]
+    if args.mix:
+        passthrough += ["--mix", args.mix]
+
+    for backend in [b.strip() for b in args.backend.split(",") if b.strip()]:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ,
+                DB_TYPE=backend,
+                USE_DATABASE="true",
+                SQLITE_DB_PATH=os.path.join(tmp, "bench.db"),
+                DB_POOL_MAX=str(max(args.concurrency, 1)),
+                # Measure the synchronous write path, not the write-behind queue
+                EVENT_WRITE_BEHIND="false",
+                ROLLUP_REFRESH_INTERVAL="0",
+            )
+            print(f"Running {backend} benchmark...", file=sys.stderr)
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", backend] + passthrough,
+                env=env, cwd=tmp, capture_output=True, text=True,
+            )
+            if out.returncode != 0:
+                report["backends"][backend] = {"error": out.stderr.strip().splitlines()[-1:] or ["failed"]}
+                continue
+            report["backends"][backend] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.regression_threshold)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Query-embedding latency and call count with and without core.embedding_cache.
+
+Clients ask questions concurrently from a fixed pool with a skewed
+(Zipf-like) popularity, as on a ward where a few topics dominate. The
+embeddings endpoint is simulated: every call takes ``--call-ms`` plus
+``--per-text-ms`` for each text in it. Modes:
+
+* direct: every query calls the endpoint
+* cached: CachedEmbeddings in memory only
+* cached_disk: CachedEmbeddings over a VectorFile warmed by a previous run
+
+Usage:
+
+    python scripts/bench_embedding_cache.py --clients 32 --queries 20 --call-ms 80
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DIM = 1536  # text-embedding-ada-002
+
+
+class SimulatedEmbeddings:
+    def __init__(self, call_seconds: float, per_text_seconds: float):
+        self.call_seconds = call_seconds
+        self.per_text_seconds = per_text_seconds
+        self.calls = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+        time.sleep(self.call_seconds + self.per_text_seconds * len(texts))
+        return [[float(hash(t) % 1000) / 1000.0] * DIM for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _run(embeddings, workload, clients: int) -> dict:
+    latencies = []
+    lock = threading.Lock()
+
+    def client(questions):
+        for question in questions:
+            t0 = time.perf_counter()
+            embeddings.embed_query(question)
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, workload))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+        "wall_s": round(elapsed, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query-embedding cache benchmark")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=20, help="queries per client")
+    parser.add_argument("--distinct", type=int, default=200, help="distinct questions in the pool")
+    parser.add_argument("--call-ms", type=float, default=80.0)
+    parser.add_argument("--per-text-ms", type=float, default=1.0)
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    from core.embedding_cache import CachedEmbeddings, VectorFile
+
+    rng = random.Random(7)
+    pool = [f"question {i} about NEWS2 escalation" for i in range(args.distinct)]
+    weights = [1.0 / (i + 1) for i in range(args.distinct)]
+    workload = [rng.choices(pool, weights, k=args.queries) for _ in range(args.clients)]
+
+    def simulated():
+        return SimulatedEmbeddings(args.call_ms / 1000.0, args.per_text_ms / 1000.0)
+
+    report = {"clients": args.clients, "queries": args.clients * args.queries, "distinct": args.distinct}
+    for mode in ("direct", "cached", "cached_disk"):
+        inner = simulated()
+        with tempfile.TemporaryDirectory() as tmp:
+            if mode == "direct":
+                embeddings = inner
+            else:
+                store = None
+                if mode == "cached_disk":
+                    store = VectorFile(tmp)
+                    # A previous process already embedded the pool
+                    CachedEmbeddings(simulated(), store=store).embed_documents(pool)
+                embeddings = CachedEmbeddings(
+                    inner, store=store, batch_window=args.window_ms / 1000.0, max_batch=16
+                )
+            result = _run(embeddings, workload, args.clients)
+        result.update(calls=inner.calls, texts_sent=inner.texts)
+        report[mode] = result
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Per-turn QA latency: a chain built for every message vs the cached chain.
+
+Starts a local stub of the Azure OpenAI completions endpoint (optionally
+over TLS) and answers the same question repeatedly:
+
+* per_turn: a new AzureOpenAI client and RetrievalQA chain each turn, as
+  the apps did before core.validator.get_qa_chain
+* cached: one chain with the shared keep-alive HTTP pool
+* streaming: the cached chain through core.validator.stream_answer, with
+  time-to-first-token reported separately from total latency
+
+Retrieval is a fixed in-memory retriever so only LLM client, connection
+and chain-assembly costs differ. The stub counts accepted connections.
+Usage:
+
+    python scripts/bench_qa_chain.py --turns 50 --latency-ms 20 --tokens 40 --token-delay-ms 15
+    python scripts/bench_qa_chain.py --certfile cert.pem --keyfile key.pem
+"""
+import os
+import sys
+import json
+import ssl
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEPLOYMENT = "stub-deployment"
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float, tokens: int, token_delay: float):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.connections = 0
+        self._count_lock = threading.Lock()
+
+    def get_request(self):
+        request = super().get_request()
+        with self._count_lock:
+            self.connections += 1
+        return request
+
+
+def _completion(text: str, finish_reason=None) -> dict:
+    return {
+        "id": "cmpl-stub",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": DEPLOYMENT,
+        "choices": [{"text": text, "index": 0, "finish_reason": finish_reason, "logprobs": None}],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Azure completions stub: waits ``latency`` (prompt processing), then
+    produces ``tokens`` tokens ``token_delay`` apart, either as one JSON
+    body or as server-sent events when the request asks to stream.
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        stream = bool(json.loads(self.rfile.read(length) or b"{}").get("stream"))
+        time.sleep(self.server.latency)
+        tokens = [f" tok{i}" for i in range(self.server.tokens)]
+
+        if stream:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(self.server.token_delay)
+                self.wfile.write(f"data: {json.dumps(_completion(token))}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+            return
+
+        time.sleep(self.server.token_delay * len(tokens))
+        body = _completion("".join(tokens), "stop")
+        body["usage"] = {"prompt_tokens": 1, "completion_tokens": len(tokens), "total_tokens": len(tokens) + 1}
+        body = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StaticVectorDB:
+    """Stands in for Chroma: as_retriever() returns the same documents every time."""
+
+    def as_retriever(self, search_kwargs=None):
+        from langchain_core.documents import Document
+        from langchain_core.retrievers import BaseRetriever
+
+        k = (search_kwargs or {}).get("k", 4)
+
+        class StaticRetriever(BaseRetriever):
+            def _get_relevant_documents(self, query, *, run_manager=None):
+                return [Document(page_content=f"Guidance paragraph {i}.") for i in range(k)]
+
+        return StaticRetriever()
+
+
+def _stats(latencies: list) -> dict:
+    latencies = sorted(latencies)
+
+    def pct(p: float) -> float:
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 3)
+
+    return {
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+    }
+
+
+def _summary(latencies: list, connections: int) -> dict:
+    return dict(_stats(latencies), connections_opened=connections)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cached vs per-turn QA chain benchmark")
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated time before the first token")
+    parser.add_argument("--tokens", type=int, default=20, help="tokens per answer")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="simulated time per token")
+    parser.add_argument("--certfile", help="serve over TLS with this certificate (trusted via SSL_CERT_FILE)")
+    parser.add_argument("--keyfile")
+    args = parser.parse_args()
+
+    server = StubServer(("127.0.0.1", 0), args.latency_ms / 1000.0, args.tokens, args.token_delay_ms / 1000.0)
+    scheme = "http"
+    if args.certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(args.certfile, args.keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        os.environ["SSL_CERT_FILE"] = args.certfile
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ.update(
+        AZURE_OPENAI_ENDPOINT=f"{scheme}://127.0.0.1:{server.server_port}",
+        AZURE_OPENAI_API_KEY="stub-key",
+        AZURE_OPENAI_DEPLOYMENT=DEPLOYMENT,
+    )
+    sys.path.insert(0, REPO_ROOT)
+    from core import validator
+
+    vector_db = StaticVectorDB()
+    question = "How often should NEWS2 observations be repeated?"
+    report = {
+        "turns": args.turns, "latency_ms": args.latency_ms, "tokens": args.tokens,
+        "token_delay_ms": args.token_delay_ms, "tls": bool(args.certfile),
+    }
+
+    latencies = []
+    before = server.connections
+    for _ in range(args.turns):
+        t0 = time.perf_counter()
+        validator.build_qa_chain(vector_db, search_k=5, temperature=0.0).run(question)
+        latencies.append(time.perf_counter() - t0)
+    report["per_turn"] = _summary(latencies, server.connections - before)
+
+    chain = validator.build_qa_chain(
+        vector_db, search_k=5, temperature=0.0, http_client=validator.get_llm_http_client()
+    )
+    chain.run(question)  # first turn pays connection setup, as after a restart
+    latencies = []
+    before = server.connections
+    for _ in range(args.turns):
+        t0 = time.perf_counter()
+        chain.run(question)
+        latencies.append(time.perf_counter() - t0)
+    report["cached"] = _summary(latencies, server.connections - before)
+    report["saved_per_turn_ms"] = round(report["per_turn"]["mean_ms"] - report["cached"]["mean_ms"], 3)
+
+    first_token, total = [], []
+    for _ in range(args.turns):
+        answer = validator.stream_answer(question, chain=chain, label="bench", use_cache=False)
+        for _token in answer:
+            pass
+        first_token.append(answer.first_token_seconds)
+        total.append(answer.total_seconds)
+    report["streaming"] = {"first_token": _stats(first_token), "total": _stats(total)}
+
+    server.shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
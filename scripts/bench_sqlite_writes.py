@@ -0,0 +1,121 @@
+"""
+Concurrent chat + audit write throughput on SQLite, before and after tuning.
+
+Runs the same workload twice in fresh subprocesses against a scratch
+database:
+
+* baseline: rollback journal, synchronous=FULL, every thread writing on its
+  own connection (the previous behaviour)
+* tuned: WAL, synchronous=NORMAL, writes serialised through the writer thread
+
+Each worker thread saves a chat message, logs an audit event and reads the
+user's recent history, in a loop. Usage:
+
+    python scripts/bench_sqlite_writes.py --threads 16 --ops 200
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import subprocess
+import threading
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "baseline": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_WRITER_THREAD": "false",
+    },
+    "tuned": {
+        "SQLITE_JOURNAL_MODE": "WAL",
+        "SQLITE_SYNCHRONOUS": "NORMAL",
+        "SQLITE_WRITER_THREAD": "true",
+    },
+}
+
+
+def run_worker_process(threads: int, ops: int) -> dict:
+    """Body of one benchmark subprocess; settings come from the environment."""
+    sys.path.insert(0, REPO_ROOT)
+    from db import database as db
+
+    db.init_database()
+    user_ids = [db.add_user(f"bench_{i}", "x", "nurse") for i in range(threads)]
+
+    errors = {"locked": 0, "other": 0}
+    errors_lock = threading.Lock()
+    latencies = []
+    start_gate = threading.Barrier(threads)
+
+    def work(user_id: int) -> None:
+        start_gate.wait()
+        for i in range(ops):
+            t0 = time.perf_counter()
+            try:
+                db.save_chat_message(user_id, "user", f"message {i}")
+                db.log_audit_event(user_id, "chat_message", "chat", str(i))
+                db.get_chat_history(user_id, limit=20)
+            except Exception as e:
+                with errors_lock:
+                    errors["locked" if "locked" in str(e) else "other"] += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+
+    workers = [threading.Thread(target=work, args=(uid,)) for uid in user_ids]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 3) if latencies else 0.0
+
+    result = {
+        "iterations_ok": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "iterations_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "writer": db.get_sqlite_writer_metrics(),
+    }
+    db.close_connection_pool()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SQLite concurrent write benchmark")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=200, help="iterations per thread")
+    parser.add_argument("--worker", choices=sorted(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker_process(args.threads, args.ops)))
+        return
+
+    report = {"threads": args.threads, "ops_per_thread": args.ops}
+    for mode, overrides in MODES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DB_TYPE="sqlite", USE_DATABASE="true",
+                       SQLITE_DB_PATH=os.path.join(tmp, "bench.db"), **overrides)
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", mode,
+                 "--threads", str(args.threads), "--ops", str(args.ops)],
+                env=env, cwd=tmp, capture_output=True, text=True, check=True,
+            )
+            report[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
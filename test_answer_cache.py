@@ -0,0 +1,260 @@
+"""
+Tests for the answer cache (core/answer_cache.py): exact and semantic
+matches, namespaces, TTL and LRU eviction, persistence and purge, with an
+in-memory store and a toy embedding function.
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.answer_cache import AnswerCache, normalize_question, unit_vector
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryStore:
+    """The db.answer_cache.AnswerCacheStore interface over a dict."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.rows = {}
+        self.loads = 0
+        self.purges = 0
+
+    def _row(self, namespace, key):
+        entry, created_at = self.rows[(namespace, key)]
+        return {"key": key, "question": entry.question, "answer": entry.answer,
+                "sources": entry.sources, "embedding": entry.embedding, "created_at": created_at}
+
+    def load(self, namespace, since, limit):
+        self.loads += 1
+        keys = sorted((k for (ns, k), (_, t) in self.rows.items() if ns == namespace and t >= since),
+                      key=lambda k: -self.rows[(namespace, k)][1])
+        return [self._row(namespace, k) for k in keys[:limit]]
+
+    def fetch(self, namespace, key, since):
+        if (namespace, key) in self.rows and self.rows[(namespace, key)][1] >= since:
+            return self._row(namespace, key)
+        return None
+
+    def save(self, namespace, key, entry):
+        self.rows[(namespace, key)] = (entry, self.clock())
+
+    def purge(self, namespace=None):
+        doomed = [k for k in self.rows if namespace is None or k[0] == namespace]
+        for k in doomed:
+            del self.rows[k]
+        self.purges += 1
+        return len(doomed)
+
+    def generation(self):
+        return self.purges
+
+
+class FailingStore:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("database down")
+        return fail
+
+
+TOPICS = {"news2": [1.0, 0.0, 0.0], "sepsis": [0.0, 1.0, 0.0], "falls": [0.0, 0.0, 1.0]}
+
+
+def embed(text):
+    """Bag-of-topics embedding: questions about the same topic are near-identical."""
+    vector = [0.01, 0.01, 0.01]
+    for topic, axis in TOPICS.items():
+        if topic in text.lower():
+            vector = [v + a for v, a in zip(vector, axis)]
+    return vector
+
+
+def test_normalize_question():
+    assert normalize_question("  What is NEWS2?? ") == normalize_question("what is news2")
+    assert normalize_question("Sepsis\tsix  steps.") == "sepsis six steps"
+    assert list(unit_vector([3.0, 4.0])) == [0.6000000238418579, 0.800000011920929]
+
+
+def test_normalize_question_keeps_clinically_significant_symbols():
+    """Operators, signs, decimal points and units distinguish questions."""
+    distinct = [
+        ("Escalate at NEWS2 >5?", "Escalate at NEWS2 <5?"),
+        ("Give 0.5 mg?", "Give 5 mg?"),
+        ("Is K+ 6.1 high?", "Is K 6.1 high?"),
+        ("Fluid balance -2 L", "Fluid balance 2 L"),
+        ("SpO2 88%", "SpO2 88"),
+    ]
+    for first, second in distinct:
+        assert normalize_question(first) != normalize_question(second), (first, second)
+    assert normalize_question("Escalate at NEWS2 >5?") == "escalate at news2 >5"
+
+
+def test_exact_match_does_not_serve_a_different_threshold_or_dose():
+    cache = AnswerCache()
+    cache.put("kb", "Escalate at NEWS2 >5?", "Yes: urgent review.")
+    cache.put("kb", "Max paracetamol dose 0.5 g?", "Yes, within limits.")
+
+    assert cache.lookup("kb", "escalate at news2 >5").kind == "exact"
+    assert cache.lookup("kb", "Escalate at NEWS2 <5?").kind == "miss"
+    assert cache.lookup("kb", "Max paracetamol dose 5 g?").kind == "miss"
+
+
+def test_near_paraphrase_with_a_different_dose_is_not_served():
+    """Questions differing only in a number embed very close together (cosine ~0.97 here)."""
+    vectors = {"Give 0.5 mg morphine?": [1.0, 0.0], "Give 5 mg morphine?": [1.0, 0.25]}
+    calls = []
+
+    def embed_dose(question):
+        calls.append(question)
+        return vectors[question]
+
+    # Semantic matching is off unless a threshold is given
+    cache = AnswerCache()
+    cache.put("kb", "Give 0.5 mg morphine?", "Within range.", embedding=unit_vector(vectors["Give 0.5 mg morphine?"]))
+    assert cache.lookup("kb", "Give 5 mg morphine?", embed=embed_dose).kind == "miss"
+    assert calls == []
+
+    # Enabled at the default ANSWER_CACHE_SIMILARITY, it still does not match
+    strict = AnswerCache(threshold=0.98)
+    strict.put("kb", "Give 0.5 mg morphine?", "Within range.", embedding=unit_vector(vectors["Give 0.5 mg morphine?"]))
+    assert strict.lookup("kb", "Give 5 mg morphine?", embed=embed_dose).kind == "miss"
+
+
+def test_exact_then_semantic_hit():
+    """Rephrasings hit exactly; related wording hits semantically; other topics miss."""
+    cache = AnswerCache(threshold=0.95)
+    doc = SimpleNamespace(page_content="Score 5 or more: urgent review.", metadata={"source": "news2.pdf", "page": 2})
+    miss = cache.lookup("kb1", "What NEWS2 score triggers escalation?", embed=embed)
+    assert miss.kind == "miss" and miss.embedding is not None
+    cache.put("kb1", "What NEWS2 score triggers escalation?", "Five or more.", [doc], miss.embedding)
+
+    exact = cache.lookup("kb1", "what news2 score triggers escalation", embed=lambda q: 1 / 0)
+    assert exact.kind == "exact" and exact.answer.answer == "Five or more."
+    assert exact.answer.sources[0].metadata == {"source": "news2.pdf", "page": 2}
+
+    semantic = cache.lookup("kb1", "When should I escalate a NEWS2 result?", embed=embed)
+    assert semantic.kind == "semantic" and semantic.answer.answer == "Five or more."
+    assert cache.lookup("kb1", "How do I screen for sepsis?", embed=embed).kind == "miss"
+    assert cache.lookup("kb2", "What NEWS2 score triggers escalation?", embed=embed).kind == "miss"
+
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 3)
+    assert stats["hit_rate"] == 0.4
+
+
+def test_threshold_above_one_disables_semantic_matching():
+    cache = AnswerCache(threshold=1.01)
+    calls = []
+    cache.put("kb", "NEWS2 thresholds", "Five.", embedding=unit_vector(embed("news2")))
+    result = cache.lookup("kb", "NEWS2 escalation", embed=lambda q: calls.append(q) or embed(q))
+    assert result.kind == "miss" and calls == []
+
+
+def test_ttl_and_lru_eviction():
+    clock = Clock()
+    cache = AnswerCache(maxsize=2, ttl=60, clock=clock)
+    cache.put("kb", "a", "A")
+    cache.put("kb", "b", "B")
+    assert cache.lookup("kb", "a").kind == "exact"  # "a" now most recent
+    cache.put("kb", "c", "C")  # evicts "b"
+    assert cache.lookup("kb", "b").kind == "miss"
+    clock.now += 61
+    assert cache.lookup("kb", "a").kind == "miss"
+    assert cache.lookup("kb", "c").kind == "miss"
+
+
+def test_persisted_answers_survive_restart_with_remaining_ttl():
+    clock = Clock()
+    store = MemoryStore(clock)
+    first = AnswerCache(ttl=100, store=store, clock=clock)
+    first.put("kb", "Falls risk assessment?", "Use the multifactorial assessment.",
+              embedding=unit_vector(embed("falls")))
+
+    clock.now += 60
+    second = AnswerCache(ttl=100, threshold=0.95, store=store, clock=clock)  # another process / restart
+    assert second.lookup("kb", "falls risk assessment", embed=embed).kind == "exact"
+    assert second.lookup("kb", "Assessing falls risk", embed=embed).kind == "semantic"
+    second.lookup("kb", "other")
+    assert store.loads == 1  # warmed once per namespace
+
+    clock.now += 41  # the row was written 101 s ago
+    assert second.lookup("kb", "falls risk assessment").kind == "miss"
+
+
+def test_exact_match_written_by_another_process():
+    clock = Clock()
+    store = MemoryStore(clock)
+    reader = AnswerCache(store=store, clock=clock)
+    assert reader.lookup("kb", "Sepsis six?").kind == "miss"  # warms an empty namespace
+    AnswerCache(store=store, clock=clock).put("kb", "Sepsis six?", "Oxygen, cultures, ...")
+    assert reader.lookup("kb", "sepsis six").answer.answer == "Oxygen, cultures, ..."
+
+
+def test_purge_clears_memory_and_store():
+    clock = Clock()
+    store = MemoryStore(clock)
+    cache = AnswerCache(store=store, clock=clock)
+    cache.put("kb1", "q1", "a1")
+    cache.put("kb2", "q2", "a2")
+    assert cache.purge("kb1") == 1
+    assert cache.lookup("kb1", "q1").kind == "miss"
+    assert cache.lookup("kb2", "q2").kind == "exact"
+    assert cache.purge() == 1
+    assert store.rows == {} and cache.stats()["size"] == 0
+
+
+def test_store_failures_fall_back_to_memory():
+    cache = AnswerCache(store=FailingStore())
+    assert cache.lookup("kb", "q").kind == "miss"
+    cache.put("kb", "q", "a")
+    assert cache.lookup("kb", "q").answer.answer == "a"
+    assert cache.purge() == 1
+
+
+def test_purge_in_another_process_reaches_memory_within_purge_check():
+    clock = Clock()
+    store = MemoryStore(clock)
+    reader = AnswerCache(store=store, purge_check=5, clock=clock)
+    reader.put("kb", "NEWS2 escalation?", "Score 5 or more: urgent review")
+    assert reader.lookup("kb", "news2 escalation").kind == "exact"
+
+    assert AnswerCache(store=store, clock=clock).purge() == 1
+    clock.now += 5
+    assert reader.lookup("kb", "news2 escalation").kind == "miss"
+    assert reader.stats()["size"] == 0
+
+    # The reader's own purge does not make it drop answers cached afterwards
+    reader.purge()
+    reader.put("kb", "q", "a")
+    clock.now += 5
+    assert reader.lookup("kb", "q").kind == "exact"
+
+
+def test_database_store_roundtrip_and_purge_generation(sqlite_db):
+    from db.answer_cache import AnswerCacheStore
+
+    store = AnswerCacheStore()
+    writer = AnswerCache(store=store)
+    reader = AnswerCache(store=store, purge_check=0)
+    writer.put("kb", "Sepsis six?", "Oxygen, cultures, ...", sources=[SimpleNamespace(
+        page_content="Give oxygen", metadata={"source": "sepsis.pdf"})], embedding=unit_vector([1.0, 0.0]))
+
+    hit = reader.lookup("kb", "sepsis six").answer
+    assert hit.answer == "Oxygen, cultures, ..."
+    assert hit.sources[0].metadata == {"source": "sepsis.pdf"}
+    assert list(hit.embedding) == [1.0, 0.0]
+
+    generation = store.generation()
+    assert writer.purge("kb") == 1
+    assert store.generation() == generation + 1
+    assert reader.lookup("kb", "sepsis six").kind == "miss"
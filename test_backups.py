@@ -0,0 +1,100 @@
+"""
+Tests for SQLite backups (db/db_migrations.py): chunked, deduplicated
+backups, restore over a live database that still has open connections,
+and verification against the manifest.
+"""
+import os
+import sys
+import json
+from pathlib import Path
+
+import sqlite3
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def backups(sqlite_db, tmp_path, monkeypatch):
+    from db import db_migrations
+
+    monkeypatch.setattr(db_migrations, "BACKUP_DIR", str(tmp_path / "backups"))
+    return db_migrations
+
+
+def usernames(db):
+    with db.get_connection() as conn:
+        return sorted(r[0] for r in conn.cursor().execute("SELECT username FROM users").fetchall())
+
+
+def test_backup_restore_roundtrip_with_open_connections(sqlite_db, backups):
+    db = sqlite_db
+    nurse = db.add_user("nurse1", "h", "nurse")
+    db.save_chat_message(nurse, "user", "Sepsis six?")
+    manifest_path = backups.create_backup("nursing_validator_a")
+
+    # Live changes after the backup, through the writer thread and this thread's reader
+    db.add_user("nurse2", "h", "nurse")
+    db.save_chat_message(nurse, "user", "NEWS2 thresholds?")
+    assert usernames(db) == ["nurse1", "nurse2"]
+    old_writer, old_reader = db._get_sqlite_writer(), db._get_sqlite_conn()
+
+    assert backups.restore_backup(manifest_path)
+    # Nothing opened before the restore can write behind it or read stale pages
+    with pytest.raises(RuntimeError, match="stopped"):
+        old_writer.execute(lambda cur: None)
+    with pytest.raises(sqlite3.ProgrammingError):
+        old_reader.execute("SELECT 1")
+    assert usernames(db) == ["nurse1"]  # reconnected, no stale pages
+    assert [m["content"] for m in db.get_chat_history(nurse)] == ["Sepsis six?"]
+    assert db.get_user("nurse2") is None
+
+    # Writes work again afterwards, through a fresh writer
+    db.add_user("nurse3", "h", "nurse")
+    assert usernames(db) == ["nurse1", "nurse3"]
+    with open(manifest_path) as f:
+        assert backups.verify_restore(json.load(f)) == ["users"]
+
+
+def test_unchanged_data_is_not_stored_twice(sqlite_db, backups):
+    sqlite_db.add_user("nurse1", "h", "nurse")
+    first = backups.create_backup("nursing_validator_a")
+    second = backups.create_backup("nursing_validator_b")
+    with open(second) as f:
+        stats = json.load(f)["stats"]
+    assert stats["new_chunks"] == 0 and stats["chunks"] > 0
+    assert backups.list_backups() == [first, second]
+
+
+def test_corrupt_chunk_aborts_restore_without_touching_live_data(sqlite_db, backups):
+    sqlite_db.add_user("nurse1", "h", "nurse")
+    manifest_path = backups.create_backup("nursing_validator_a")
+    sqlite_db.add_user("nurse2", "h", "nurse")
+
+    with open(manifest_path) as f:
+        digest = json.load(f)["files"][0]["chunks"][0]
+    chunk = Path(backups._chunk_path(digest))
+    chunk.write_bytes(b"garbage")
+
+    assert not backups.restore_backup(manifest_path)
+    assert usernames(sqlite_db) == ["nurse1", "nurse2"]
+
+
+def test_cleanup_removes_old_manifests_and_unreferenced_chunks(sqlite_db, backups):
+    sqlite_db.add_user("nurse1", "h", "nurse")
+    backups.create_backup("nursing_validator_a")
+    sqlite_db.bulk_save_chat_messages(
+        {"user_id": 1, "role": "user", "content": f"message {i} " * 50} for i in range(2000)
+    )
+    latest = backups.create_backup("nursing_validator_b")
+    chunks_before = len(list(Path(backups.BACKUP_DIR, "chunks").glob("*/*")))
+
+    assert backups.cleanup_old_backups(keep_count=1) == 1
+    assert backups.list_backups() == [latest]
+    remaining = {p.name for p in Path(backups.BACKUP_DIR, "chunks").glob("*/*")}
+    with open(latest) as f:
+        referenced = {d for entry in json.load(f)["files"] for d in entry["chunks"]}
+    assert remaining == referenced and len(remaining) < chunks_before
+    assert backups.restore_backup(latest)
@@ -0,0 +1,45 @@
+"""
+Tests for the COPY text encoding and chunking helpers (db/bulk.py).
+"""
+import os
+import sys
+from datetime import datetime
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db.bulk import CopyStream, chunked, copy_text_row, copy_text_value
+
+
+def test_copy_text_escapes_separators_and_nulls():
+    """Tabs, newlines and backslashes are escaped; None becomes \\N."""
+    assert copy_text_value(None) == "\\N"
+    assert copy_text_value("a\tb\nc\\d\re") == "a\\tb\\nc\\\\d\\re"
+    assert copy_text_value(True) == "t"
+    assert copy_text_value(datetime(2026, 1, 2, 3, 4, 5)) == "2026-01-02T03:04:05"
+    assert copy_text_value(b"\x00\xff") == "\\\\x00ff"
+    assert copy_text_row((1, None, '{"k": "v"}')) == '1\t\\N\t{"k": "v"}\n'
+
+
+def test_copy_stream_reads_in_any_size():
+    """Small reads reassemble to exactly the full encoding, and the stream ends with ''."""
+    rows = [(i, f"row {i}", None) for i in range(50)]
+    expected = "".join(copy_text_row(r) for r in rows)
+
+    stream = CopyStream(rows)
+    parts = []
+    while True:
+        data = stream.read(7)
+        if not data:
+            break
+        assert len(data) <= 7
+        parts.append(data)
+    assert "".join(parts) == expected
+    assert CopyStream(iter(rows)).read() == expected
+
+
+def test_chunked_accepts_generators():
+    """Chunks keep order and the last one holds the remainder."""
+    chunks = list(chunked((i for i in range(10)), 4))
+    assert chunks == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert list(chunked([], 3)) == []
@@ -0,0 +1,88 @@
+"""
+Tests for the in-process TTL/LRU cache (core/cache.py).
+"""
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.cache import TTLCache
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_miss_and_expiry():
+    """Entries are served until their TTL elapses."""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=30, clock=clock)
+    cache.set("nurse", {"id": 2})
+
+    assert cache.get("nurse") == {"id": 2}
+    assert cache.get("admin") is None
+
+    clock.now = 31
+    assert cache.get("nurse") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["expirations"] == 1
+    assert stats["size"] == 0
+
+
+def test_lru_eviction():
+    """The least recently used entry is evicted first."""
+    cache = TTLCache(maxsize=2, ttl=0)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" is now least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidation():
+    """pop() and discard_where() remove entries and are counted."""
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("nurse", {"id": 2})
+    cache.set("admin", {"id": 1})
+
+    assert cache.pop("nurse") is True
+    assert cache.pop("nurse") is False
+    assert cache.discard_where(lambda _key, user: user["id"] == 1) == 1
+    assert len(cache) == 0
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_per_entry_ttl_and_items_snapshot():
+    """set(ttl=...) overrides the default lifetime; items() skips expired entries."""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=10, ttl=30, clock=clock)
+    cache.set("short", 1, ttl=5)
+    cache.set("long", 2)
+
+    assert cache.items() == [("short", 1), ("long", 2)]
+    clock.now = 10
+    assert cache.items() == [("long", 2)]
+    assert cache.get("short") is None
+    assert cache.stats()["hits"] == 0
+
+
+if __name__ == "__main__":
+    test_hit_miss_and_expiry()
+    test_lru_eviction()
+    test_invalidation()
+    test_per_entry_ttl_and_items_snapshot()
+    print("✅ ALL CACHE TESTS PASSED")
@@ -0,0 +1,118 @@
+"""
+Tests for chat history search on SQLite (db/chat_search.py): the FTS5
+index scoped per user, query sanitisation, the LIKE fallback, and the
+triggers that keep the index in step with updates and deletes.
+"""
+import os
+import sys
+import sqlite3
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("pydantic_settings")  # db.chat_search reads core.settings
+
+from db.chat_search import fts5_match_expression
+
+
+@pytest.fixture
+def chats(sqlite_db):
+    """Two users whose histories share vocabulary; yields (db, nurse id, clinician id)."""
+    from db import chat_search
+
+    db = sqlite_db
+    nurse = db.add_user("nurse1", "h", "nurse")
+    clinician = db.add_user("clinician1", "h", "clinician")
+    db.save_chat_message(nurse, "user", "Sepsis screening for adults in the emergency department")
+    db.save_chat_message(nurse, "assistant", "Escalate a NEWS2 score of 5 or more to the doctor")
+    db.save_chat_message(clinician, "user", "Sepsis six bundle timings")
+    with db.get_connection() as conn:
+        assert chat_search._sqlite_fts_ready(conn.cursor())
+    return db, nurse, clinician
+
+
+def contents(results):
+    return [r["content"] for r in results]
+
+
+def sql(query, params=()):
+    """Write through a separate connection, as another process would."""
+    from core.settings import settings
+
+    conn = sqlite3.connect(settings.SQLITE_DB_PATH, timeout=10)
+    try:
+        conn.execute(query, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_search_is_scoped_to_the_user(chats):
+    db, nurse, clinician = chats
+
+    assert contents(db.search_chat_history(nurse, "sepsis")) == [
+        "Sepsis screening for adults in the emergency department"
+    ]
+    assert contents(db.search_chat_history(clinician, "sepsis")) == ["Sepsis six bundle timings"]
+    assert db.search_chat_history(clinician, "NEWS2") == []
+
+
+def test_ranking_prefixes_and_highlights(chats):
+    db, nurse, _ = chats
+
+    [hit] = db.search_chat_history(nurse, "escal* doctor", highlight=("[", "]"))
+    assert hit["role"] == "assistant" and hit["rank"] > 0
+    assert "[Escalate]" in hit["snippet"] and "[doctor]" in hit["snippet"]
+    # Porter stemming: "screened" finds "screening"
+    assert len(db.search_chat_history(nurse, "screened")) == 1
+    assert db.search_chat_history(nurse, "sepsis", since="2999-01-01") == []
+
+
+def test_query_syntax_is_neutralised(chats):
+    db, nurse, clinician = chats
+
+    assert fts5_match_expression(1, 'sepsis) OR user_key:"u2" NEAR(') == (
+        'user_key:"u1" AND content:("sepsis" "OR" "user_key" "u2" "NEAR")'
+    )
+    assert fts5_match_expression(1, "scr*") == 'user_key:"u1" AND content:("scr"*)'
+    assert fts5_match_expression(1, '*** "" ()') is None
+
+    # Injected operators are searched as words and cannot widen the scope
+    assert db.search_chat_history(nurse, f'six OR user_key:u{clinician}') == []
+    assert db.search_chat_history(nurse, '"()*') == []
+    assert db.search_chat_history(nurse, "   ") == []
+
+
+def test_like_fallback_without_fts5(chats, monkeypatch):
+    from db import chat_search
+
+    db, nurse, clinician = chats
+    monkeypatch.setattr(chat_search, "_fts5_available", False)
+
+    results = db.search_chat_history(nurse, "emergency sepsis")
+    assert contents(results) == ["Sepsis screening for adults in the emergency department"]
+    assert results[0]["rank"] == 0.0 and results[0]["snippet"] == results[0]["content"]
+    assert db.search_chat_history(clinician, "NEWS2") == []
+    assert db.search_chat_history(nurse, "*") == []
+
+
+def test_triggers_follow_updates_and_deletes(chats):
+    db, nurse, _ = chats
+    [hit] = db.search_chat_history(nurse, "screening")
+
+    sql("UPDATE chat_history SET content = ? WHERE id = ?", ("Falls risk assessment on admission", hit["id"]))
+    assert db.search_chat_history(nurse, "screening") == []
+    assert contents(db.search_chat_history(nurse, "falls")) == ["Falls risk assessment on admission"]
+
+    sql("DELETE FROM chat_history WHERE id = ?", (hit["id"],))
+    assert db.search_chat_history(nurse, "falls") == []
+    assert len(db.search_chat_history(nurse, "doctor")) == 1
+
+    # The index matches its content exactly
+    sql("INSERT INTO chat_history_fts (chat_history_fts, rank) VALUES ('integrity-check', 1)")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,137 @@
+"""
+Tests for the append-only JSONL chat-history store (core/chat_store.py).
+"""
+import json
+import os
+import sys
+import threading
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.chat_store import ChatHistoryStore
+
+
+def test_append_and_tail(tmp_path):
+    """tail() returns the newest messages in chronological order."""
+    store = ChatHistoryStore(str(tmp_path / "store"))
+    for i in range(10):
+        store.append("nurse", "user", f"question {i}")
+    store.append("admin", "user", "other user")
+
+    tail = store.tail("nurse", limit=3)
+    assert [m["content"] for m in tail] == ["question 7", "question 8", "question 9"]
+    assert len(store.tail("nurse", limit=None)) == 10
+    assert store.tail("clinician") == []
+
+
+def test_torn_line_is_skipped_and_compacted(tmp_path):
+    """A partial write does not corrupt later appends and compaction removes it."""
+    store = ChatHistoryStore(str(tmp_path / "store"), max_messages=2)
+    store.append("nurse", "user", "first")
+    shard = store._shard("nurse")
+    with open(shard + ".jsonl", "ab") as f:
+        f.write(b'{"role":"user","cont')
+    store.append("nurse", "assistant", "second")
+    store.append("nurse", "user", "third")
+
+    assert [m["content"] for m in store.tail("nurse", limit=None)] == ["first", "second", "third"]
+
+    assert store.compact() == 1
+    assert [m["content"] for m in store.tail("nurse", limit=5)] == ["second", "third"]
+    assert os.path.getsize(shard + ".idx") == (1 + 2) * 8  # trimmed-count header and two offsets
+
+
+def test_concurrent_writers(tmp_path):
+    """Threads appending to the same shard never interleave lines."""
+    store = ChatHistoryStore(str(tmp_path / "store"))
+
+    def writer(n):
+        for i in range(50):
+            store.append("nurse", "user", f"{n}-{i}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    messages = store.tail("nurse", limit=None)
+    assert len(messages) == 400
+    assert len(store.tail("nurse", limit=400)) == 400
+
+
+def test_migrate_legacy_json(tmp_path):
+    """The old single-file JSON history is imported exactly once."""
+    legacy = tmp_path / ".chat_history.json"
+    legacy.write_text(json.dumps({
+        "nurse": [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}],
+        "admin": [{"role": "user", "content": "status"}],
+    }))
+    store = ChatHistoryStore(str(tmp_path / "store"))
+
+    assert store.migrate_legacy_json(str(legacy)) == 3
+    assert store.migrate_legacy_json(str(legacy)) == 0
+    assert not legacy.exists()
+    assert [m["content"] for m in store.tail("nurse")] == ["hi", "hello"]
+
+
+def test_page_walks_backwards(tmp_path):
+    """page() returns fixed-size pages from newest to oldest."""
+    store = ChatHistoryStore(str(tmp_path / "store"))
+    store.append_many("nurse", [{"role": "user", "content": str(i)} for i in range(7)])
+
+    pages = []
+    before = None
+    while True:
+        messages, before = store.page("nurse", limit=3, before=before)
+        pages.append([m["content"] for m in messages])
+        if before is None:
+            break
+
+    assert pages == [["4", "5", "6"], ["1", "2", "3"], ["0"]]
+    assert store.page("clinician", limit=3) == ([], None)
+
+
+def test_page_cursor_survives_compaction(tmp_path):
+    """A cursor taken before compaction continues at the same message afterwards."""
+    store = ChatHistoryStore(str(tmp_path / "store"), max_messages=8)
+    store.append_many("nurse", [{"role": "user", "content": str(i)} for i in range(10)])
+
+    messages, before = store.page("nurse", limit=3)
+    assert [m["content"] for m in messages] == ["7", "8", "9"] and before == 7
+
+    store.append_many("nurse", [{"role": "user", "content": str(i)} for i in (10, 11)])
+    assert store.compact() == 1  # trims 0-3
+
+    messages, before = store.page("nurse", limit=3, before=before)
+    assert [m["content"] for m in messages] == ["4", "5", "6"]
+    assert before is None  # older messages were trimmed
+
+    messages, before = store.page("nurse", limit=3)
+    assert [m["content"] for m in messages] == ["9", "10", "11"] and before == 9
+    assert store.page("nurse", limit=3, before=3) == ([], None)
+
+    # Positions keep counting through a second trim
+    store.append_many("nurse", [{"role": "user", "content": str(i)} for i in (12, 13)])
+    assert store.compact() == 1
+    messages, before = store.page("nurse", limit=2, before=9)
+    assert [m["content"] for m in messages] == ["7", "8"] and before == 7
+
+
+def test_compaction_skips_shards_within_limit(tmp_path):
+    """Shards under the limit with a complete index are not rewritten."""
+    store = ChatHistoryStore(str(tmp_path / "store"), max_messages=5)
+    store.append_many("nurse", [{"role": "user", "content": str(i)} for i in range(3)])
+    shard = store._shard("nurse")
+    inode = os.stat(shard + ".jsonl").st_ino
+
+    assert store.compact() == 0
+    assert os.stat(shard + ".jsonl").st_ino == inode
+
+    # A write torn at the end leaves the index short of the data: repaired
+    with open(shard + ".jsonl", "ab") as f:
+        f.write(b'{"role":"user","content":"3"}\n{"role":"us')
+    assert store.compact() == 1
+    assert [m["content"] for m in store.tail("nurse", limit=None)] == ["0", "1", "2", "3"]
+    assert os.path.getsize(shard + ".idx") == 4 * 8
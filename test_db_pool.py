@@ -0,0 +1,141 @@
+"""
+Tests for the thread-safe bounded connection pool (db/pool.py).
+Uses a fake connection factory so no PostgreSQL server is required.
+"""
+import os
+import sys
+import threading
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db.pool import BoundedConnectionPool, PoolTimeoutError, PoolClosedError
+
+
+class FakeConnection:
+    """Minimal stand-in for a DB-API connection."""
+
+    def __init__(self):
+        self.closed = 0
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    kwargs.setdefault("is_alive", lambda conn: not conn.closed)
+    return BoundedConnectionPool(connect, **kwargs), created
+
+
+def test_bounded_and_times_out():
+    """Checkouts beyond maxconn wait and then time out."""
+    pool, created = make_pool(minconn=1, maxconn=2, acquire_timeout=0.05)
+    a = pool.getconn()
+    b = pool.getconn()
+    assert len(created) == 2
+
+    try:
+        pool.getconn()
+        assert False, "Expected PoolTimeoutError"
+    except PoolTimeoutError:
+        pass
+
+    metrics = pool.metrics()
+    assert metrics["in_use"] == 2
+    assert metrics["timeouts_total"] == 1
+    assert metrics["waiters"] == 0
+
+    pool.putconn(a)
+    pool.putconn(b)
+    assert pool.metrics()["idle"] == 2
+
+
+def test_waiter_receives_returned_connection():
+    """A queued caller is handed the next returned connection."""
+    pool, _ = make_pool(minconn=0, maxconn=1, acquire_timeout=2)
+    held = pool.getconn()
+    got = []
+
+    t = threading.Thread(target=lambda: got.append(pool.getconn()))
+    t.start()
+    while pool.metrics()["waiters"] == 0:
+        time.sleep(0.001)
+    pool.putconn(held)
+    t.join(timeout=2)
+
+    assert got == [held]
+    assert pool.metrics()["waits_total"] == 1
+
+
+def test_recycles_expired_and_dead_connections():
+    """Connections past max_lifetime or failing the probe are replaced."""
+    pool, created = make_pool(minconn=1, maxconn=1, max_lifetime=0.01, health_check_interval=0)
+    time.sleep(0.02)
+    conn = pool.getconn()
+    assert conn is not created[0]
+    assert created[0].closed
+    assert pool.metrics()["recycled_total"] == 1
+
+    pool.max_lifetime = 0
+    pool.putconn(conn)
+    conn.closed = 1  # dies while idle
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert pool.metrics()["health_check_failures_total"] == 1
+    pool.putconn(fresh)
+
+
+def test_closed_pool_rejects_checkout():
+    """closeall() closes idle connections and blocks further use."""
+    pool, created = make_pool(minconn=2, maxconn=2)
+    pool.closeall()
+    assert all(c.closed for c in created)
+    try:
+        pool.getconn()
+        assert False, "Expected PoolClosedError"
+    except PoolClosedError:
+        pass
+
+
+def test_concurrent_checkouts_never_exceed_max():
+    """Many threads sharing a small pool never open more than maxconn."""
+    pool, created = make_pool(minconn=0, maxconn=3, acquire_timeout=5)
+    peak = []
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(50):
+                conn = pool.getconn()
+                peak.append(pool.metrics()["in_use"])
+                pool.putconn(conn)
+        except Exception as e:  # pragma: no cover - surfaced by assert below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(created) <= 3
+    assert max(peak) <= 3
+    assert pool.metrics()["in_use"] == 0
+
+
+if __name__ == "__main__":
+    test_bounded_and_times_out()
+    test_waiter_receives_returned_connection()
+    test_recycles_expired_and_dead_connections()
+    test_closed_pool_rejects_checkout()
+    test_concurrent_checkouts_never_exceed_max()
+    print("✅ ALL POOL TESTS PASSED")
@@ -0,0 +1,141 @@
+"""
+Tests for the query-embedding cache (core/embedding_cache.py): memory and
+on-disk hits, coalescing of concurrent identical requests, micro-batching
+of concurrent misses, and recovery of a torn vector file.
+"""
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.embedding_cache import CachedEmbeddings, VectorFile, content_key
+
+
+class FakeEmbeddings:
+    """Deterministic 3-d vectors; records every call and can be made slow or failing."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.fail = False
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("embeddings endpoint down")
+        return [[float(len(t)), 0.5, -1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def run_concurrently(fn, args):
+    results = [None] * len(args)
+    barrier = threading.Barrier(len(args))
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn(args[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(args))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_repeat_queries_hit_memory():
+    inner = FakeEmbeddings()
+    cache = CachedEmbeddings(inner, model="m", batch_window=0)
+    assert cache.embed_query("news2") == [5.0, 0.5, -1.0]
+    assert cache.embed_query("news2") == [5.0, 0.5, -1.0]
+    assert inner.calls == [["news2"]]
+    assert content_key("m", "a") != content_key("other", "a")
+    stats = cache.stats()
+    assert (stats["memory"], stats["miss"], stats["calls"]) == (1, 1, 1)
+
+
+def test_concurrent_identical_queries_are_coalesced():
+    inner = FakeEmbeddings(delay=0.05)
+    cache = CachedEmbeddings(inner, batch_window=0)
+    results = run_concurrently(cache.embed_query, ["sepsis six"] * 8)
+    assert all(r == [10.0, 0.5, -1.0] for r in results)
+    assert inner.calls == [["sepsis six"]]
+    stats = cache.stats()
+    assert stats["miss"] == 1 and stats["coalesced"] + stats["memory"] == 7
+
+
+def test_misses_within_window_share_one_call():
+    inner = FakeEmbeddings()
+    cache = CachedEmbeddings(inner, batch_window=0.05, max_batch=16)
+    texts = [f"question {i}" * (i + 1) for i in range(6)]
+    results = run_concurrently(cache.embed_query, texts)
+    assert results == [[float(len(t)), 0.5, -1.0] for t in texts]
+    assert len(inner.calls) == 1 and sorted(inner.calls[0]) == sorted(texts)
+
+
+def test_full_batch_is_sent_without_waiting():
+    inner = FakeEmbeddings()
+    cache = CachedEmbeddings(inner, batch_window=5.0, max_batch=4)
+    started = time.perf_counter()
+    run_concurrently(cache.embed_query, [f"q{i}" for i in range(4)])
+    assert time.perf_counter() - started < 2.0
+    assert [len(c) for c in inner.calls] == [4]
+
+
+def test_failure_reaches_every_waiter_and_is_not_cached():
+    inner = FakeEmbeddings(delay=0.02)
+    inner.fail = True
+    cache = CachedEmbeddings(inner, batch_window=0.01)
+    errors = run_concurrently(lambda t: pytest.raises(ConnectionError, cache.embed_query, t), ["a", "a", "b"])
+    assert all(e is not None for e in errors)
+    inner.fail = False
+    assert cache.embed_query("a") == [1.0, 0.5, -1.0]
+
+
+def test_embed_documents_reuses_cached_vectors():
+    inner = FakeEmbeddings()
+    cache = CachedEmbeddings(inner, batch_window=0)
+    cache.embed_query("b")
+    assert cache.embed_documents(["a", "b", "a", "cc"]) == [
+        [1.0, 0.5, -1.0], [1.0, 0.5, -1.0], [1.0, 0.5, -1.0], [2.0, 0.5, -1.0],
+    ]
+    assert inner.calls == [["b"], ["a", "cc"]]
+
+
+def test_vectors_persist_across_restarts(tmp_path):
+    inner = FakeEmbeddings()
+    first = CachedEmbeddings(inner, store=VectorFile(str(tmp_path)), batch_window=0)
+    first.embed_documents(["falls", "sepsis"])
+    first.embed_query("news2 thresholds")
+
+    restarted = CachedEmbeddings(inner, store=VectorFile(str(tmp_path)), batch_window=0)
+    assert restarted.embed_query("sepsis") == [6.0, 0.5, -1.0]
+    assert restarted.embed_query("news2 thresholds") == [16.0, 0.5, -1.0]
+    assert len(inner.calls) == 2 and restarted.stats()["disk"] == 2
+
+
+def test_vector_file_sees_other_writers_and_drops_torn_tail(tmp_path):
+    reader, writer = VectorFile(str(tmp_path)), VectorFile(str(tmp_path))
+    assert writer.put([(content_key("", "a"), [1.0, 2.0])]) == 1
+    assert list(reader.get(content_key("", "a"))) == [1.0, 2.0]
+
+    # A writer that died after appending half a vector and no key
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(b"\x00" * 6)
+    assert writer.put([(content_key("", "b"), [3.0, 4.0]), (content_key("", "bad"), [1.0])]) == 1
+    assert list(VectorFile(str(tmp_path)).get(content_key("", "b"))) == [3.0, 4.0]
+    assert reader.get(content_key("", "bad")) is None and len(reader) == 2
+
+
+def test_vector_file_max_rows(tmp_path):
+    store = VectorFile(str(tmp_path), max_rows=2)
+    assert store.put([(content_key("", str(i)), [float(i)]) for i in range(5)]) == 2
+    assert len(store) == 2 and store.get(content_key("", "4")) is None
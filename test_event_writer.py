@@ -0,0 +1,234 @@
+"""
+Tests for the write-behind audit/analytics writer (db/event_writer.py):
+retries without duplicates, spilling batches that keep failing, draining
+on shutdown, submits racing shutdown, and producers blocked on a full
+queue.
+"""
+import os
+import sys
+import json
+import time
+import threading
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("pydantic_settings")  # db.event_writer reads core.settings
+
+
+def count(db, table):
+    with db.get_connection() as conn:
+        return conn.cursor().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def audit(i, user_id):
+    return ("audit", {"action": f"action_{i}", "user_id": user_id, "changes": {"i": i}, "ip_address": "10.0.0.1"})
+
+
+def analytics(i, user_id):
+    return ("analytics", {"event_type": "query", "event_name": f"q{i}", "user_id": user_id, "data": {"i": i}})
+
+
+def failing_analytics_insert(db, monkeypatch, failures):
+    """Make the next ``failures`` analytics inserts raise, after audit rows went in."""
+    real = db._bulk_insert
+    left = {"n": failures}
+
+    def insert(cur, table, columns, rows):
+        if table.startswith("analytics_events") and left["n"] > 0:
+            left["n"] -= 1
+            raise RuntimeError("analytics insert failed")
+        return real(cur, table, columns, rows)
+
+    monkeypatch.setattr(db, "_bulk_insert", insert)
+
+
+def test_retried_batch_writes_each_event_once(sqlite_db, monkeypatch):
+    from db.event_writer import EventWriter, _flush_events
+
+    db = sqlite_db
+    nurse = db.add_user("nurse1", "h", "nurse")
+    failing_analytics_insert(db, monkeypatch, failures=1)
+
+    writer = EventWriter(_flush_events, flush_interval=60, max_retries=3).start()
+    for i in range(5):
+        assert writer.submit(*audit(i, nurse))
+        assert writer.submit(*analytics(i, nurse))
+    assert writer.shutdown(timeout=10)
+
+    # The first attempt failed after inserting audit rows; they were rolled back with it
+    assert count(db, "audit_logs") == 5
+    assert count(db, "analytics_events") == 5
+    assert writer.metrics()["batches_total"] == 1
+
+
+def test_failed_batch_is_spilled_and_replayed(sqlite_db, monkeypatch, tmp_path):
+    from db.event_writer import EventSpill, EventWriter, _flush_events
+
+    db = sqlite_db
+    nurse = db.add_user("nurse1", "h", "nurse")
+    spill = EventSpill(str(tmp_path / "spill"))
+    failing_analytics_insert(db, monkeypatch, failures=2)
+
+    writer = EventWriter(_flush_events, flush_interval=60, max_retries=2, spill=spill).start()
+    assert writer.submit(*audit(0, nurse))
+    assert writer.submit(*analytics(0, nurse))
+    assert writer.flush(timeout=10)
+
+    assert count(db, "audit_logs") == 0
+    assert len(spill.pending()) == 1
+    assert writer.metrics()["spilled_total"] == 2
+
+    # The next successful flush replays the spilled batch too
+    assert writer.submit(*audit(1, nurse))
+    assert writer.shutdown(timeout=10)
+    assert spill.pending() == []
+    assert count(db, "audit_logs") == 2
+    assert count(db, "analytics_events") == 1
+    assert writer.metrics()["replayed_total"] == 2
+
+
+def test_spilled_batch_is_replayed_by_next_writer(sqlite_db, tmp_path):
+    from db.event_writer import EventSpill, EventWriter, _flush_events
+
+    db = sqlite_db
+    nurse = db.add_user("nurse1", "h", "nurse")
+    spill = EventSpill(str(tmp_path / "spill"))
+    spill.save([audit(0, nurse), analytics(0, nurse)])
+
+    writer = EventWriter(_flush_events, spill=spill).start()
+    assert writer.shutdown(timeout=10)
+    assert spill.pending() == []
+    assert count(db, "audit_logs") == 1
+    assert count(db, "analytics_events") == 1
+
+
+def test_shutdown_drains_queue(sqlite_db):
+    from db.event_writer import EventWriter, _flush_events
+
+    db = sqlite_db
+    nurse = db.add_user("nurse1", "h", "nurse")
+    writer = EventWriter(_flush_events, batch_size=7, flush_interval=60).start()
+    for i in range(50):
+        assert writer.submit(*audit(i, nurse))
+    assert writer.shutdown(timeout=10)
+
+    assert count(db, "audit_logs") == 50
+    with db.get_connection() as conn:
+        row = conn.cursor().execute(
+            "SELECT changes, ip_address FROM audit_logs WHERE action = 'action_3'"
+        ).fetchone()
+    assert json.loads(row[0]) == {"i": 3}
+    assert row[1] == "10.0.0.1"
+    assert not writer.submit(*audit(50, nurse))
+
+
+def test_submit_racing_shutdown_loses_no_accepted_event():
+    from db.event_writer import EventWriter
+
+    written = []
+    writer = EventWriter(written.extend, batch_size=3, flush_interval=0.01).start()
+    accepted = []
+    lock = threading.Lock()
+    go = threading.Event()
+
+    def producer(n):
+        go.wait()
+        for i in range(200):
+            event = ("audit", {"action": f"{n}-{i}"})
+            if writer.submit(*event):
+                with lock:
+                    accepted.append(event)
+
+    threads = [threading.Thread(target=producer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    go.set()
+    assert writer.shutdown(timeout=10)
+    for t in threads:
+        t.join(10)
+
+    assert sorted(e[1]["action"] for e in written) == sorted(e[1]["action"] for e in accepted)
+
+
+def blocked_writer(enqueue_timeout):
+    """A writer with a one-slot queue, held full while its flush is blocked; returns (writer, written, release)."""
+    from db.event_writer import EventWriter
+
+    written = []
+    release = threading.Event()
+
+    def flush(batch):
+        release.wait(10)
+        written.extend(batch)
+
+    writer = EventWriter(flush, batch_size=1, flush_interval=0.01, max_queue=1,
+                         enqueue_timeout=enqueue_timeout).start()
+    assert writer.submit("audit", {"action": "flushing"})
+    while not writer._queue.empty():  # taken by the writer thread, now stuck in flush
+        time.sleep(0.01)
+    assert writer.submit("audit", {"action": "queued"})
+    return writer, written, release
+
+
+def test_producers_blocked_on_a_full_queue_wait_side_by_side():
+    writer, written, release = blocked_writer(enqueue_timeout=0.5)
+    results = {}
+
+    def producer(n):
+        started = time.monotonic()
+        results[n] = (writer.submit("audit", {"action": f"p{n}"}), time.monotonic() - started)
+
+    threads = [threading.Thread(target=producer, args=(n,)) for n in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    # Each waited out its own timeout, not the other's as well
+    assert [ok for ok, _ in results.values()] == [False, False]
+    assert all(elapsed < 0.9 for _, elapsed in results.values())
+    assert writer.metrics()["rejected_total"] == 2
+
+    release.set()
+    assert writer.shutdown(timeout=10)
+    assert sorted(e[1]["action"] for e in written) == ["flushing", "queued"]
+
+
+def test_event_queued_behind_the_shutdown_sentinel_is_written():
+    from db.event_writer import EventWriter
+
+    written = []
+    writer = EventWriter(written.extend, flush_interval=0.01).start()
+    real_put = writer._queue.put
+    in_put = threading.Event()
+    gate = threading.Event()
+
+    def put(item, *args, **kwargs):
+        if isinstance(item, tuple):  # an event, not a control
+            in_put.set()
+            gate.wait(10)
+        real_put(item, *args, **kwargs)
+
+    writer._queue.put = put
+    accepted = []
+    producer = threading.Thread(target=lambda: accepted.append(writer.submit("audit", {"action": "late"})))
+    producer.start()
+    assert in_put.wait(10)  # past the stopped check, not yet queued
+    done = []
+    stopper = threading.Thread(target=lambda: done.append(writer.shutdown(timeout=10)))
+    stopper.start()
+    time.sleep(0.1)  # the sentinel is queued first
+    assert not done
+    gate.set()
+    producer.join(10)
+    stopper.join(10)
+
+    assert accepted == [True] and done == [True]
+    assert [e[1]["action"] for e in written] == ["late"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
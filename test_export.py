@@ -0,0 +1,91 @@
+"""
+Tests for the streaming audit-log export (db/export.py): CSV and NDJSON
+round trips and the half-open [start_date, end_date) range at both edges.
+"""
+import io
+import os
+import sys
+import csv
+import json
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Around a March 2026 export: only the two middle rows are in range
+EDGES = {
+    "before_start": "2026-02-28 23:59:59",
+    "at_start": "2026-03-01 00:00:00",
+    "last_second": "2026-03-31 23:59:59",
+    "at_end": "2026-04-01 00:00:00",
+}
+
+
+@pytest.fixture
+def audit_db(sqlite_db):
+    nurse = sqlite_db.add_user("nurse1", "h", "nurse")
+    sqlite_db.bulk_log_audit_events([
+        {"user_id": nurse, "action": action, "resource_type": "care_plan", "resource_id": "cp-1",
+         "changes": {"field": "news2", "to": 5}, "ip_address": "10.0.0.1", "created_at": created_at}
+        for action, created_at in EDGES.items()
+    ])
+    return sqlite_db
+
+
+def export(fmt, **kwargs):
+    from db.export import export_audit_logs
+
+    out = io.BytesIO()
+    stats = export_audit_logs(fmt, out, batch_size=1, **kwargs)
+    return out.getvalue().decode("utf-8"), stats
+
+
+def test_csv_round_trip_respects_both_date_edges(audit_db):
+    from db.export import AUDIT_COLUMNS
+
+    text, stats = export("csv", start_date="2026-03-01", end_date="2026-04-01")
+    rows = list(csv.DictReader(io.StringIO(text)))
+
+    assert stats["rows"] == 2
+    assert tuple(rows[0]) == AUDIT_COLUMNS
+    assert [r["action"] for r in rows] == ["at_start", "last_second"]
+    assert [r["created_at"] for r in rows] == ["2026-03-01T00:00:00", "2026-03-31T23:59:59"]
+    assert json.loads(rows[0]["changes"]) == {"field": "news2", "to": 5}
+    assert rows[0]["ip_address"] == "10.0.0.1"
+
+
+def test_ndjson_round_trip_respects_both_date_edges(audit_db):
+    text, stats = export("ndjson", start_date="2026-03-01", end_date="2026-04-01")
+    records = [json.loads(line) for line in text.splitlines()]
+
+    assert stats["rows"] == 2
+    assert [r["action"] for r in records] == ["at_start", "last_second"]
+    assert records[1]["changes"] == {"field": "news2", "to": 5}
+    assert records[1]["resource_id"] == "cp-1"
+
+
+def test_unbounded_and_empty_exports(audit_db):
+    from db.export import AUDIT_COLUMNS
+
+    text, _ = export("ndjson")
+    assert [json.loads(line)["action"] for line in text.splitlines()] == list(EDGES)
+
+    text, stats = export("csv", start_date="2027-01-01")
+    assert stats["rows"] == 0
+    assert text.splitlines() == [",".join(AUDIT_COLUMNS)]
+
+
+def test_iterator_yields_chunks_per_batch(audit_db):
+    from db.export import iter_audit_log_export
+
+    batches = []
+    chunks = list(iter_audit_log_export("ndjson", batch_size=3, on_batch=batches.append))
+    assert batches == [3, 1]
+    assert len(chunks) == 2
+    with pytest.raises(ValueError):
+        iter_audit_log_export("xml")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,52 @@
+"""
+Tests for the HyperLogLog distinct-count sketch (db/hll.py).
+"""
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db.hll import HyperLogLog
+
+
+def test_estimate_within_error_bounds():
+    """Estimates stay within a few standard errors across magnitudes."""
+    for n in (10, 1000, 50000):
+        hll = HyperLogLog()
+        hll.update(range(n))
+        assert abs(hll.count() - n) <= max(2, 0.05 * n), (n, hll.count())
+
+
+def test_duplicates_do_not_inflate_count():
+    """Adding the same user repeatedly counts once."""
+    hll = HyperLogLog()
+    for _ in range(100):
+        hll.update([1, 2, 3])
+    assert hll.count() == 3
+
+
+def test_merge_is_union():
+    """Merging per-day sketches counts users active on several days once."""
+    monday, tuesday = HyperLogLog(), HyperLogLog()
+    monday.update(range(0, 600))
+    tuesday.update(range(400, 1000))
+    week = HyperLogLog().merge(monday).merge(tuesday)
+    assert abs(week.count() - 1000) <= 50
+
+
+def test_round_trip_bytes():
+    """Sketches survive serialisation to the database column format."""
+    hll = HyperLogLog(precision=10)
+    hll.update(range(250))
+    restored = HyperLogLog.from_bytes(memoryview(hll.to_bytes()))
+    assert restored.precision == 10
+    assert restored.count() == hll.count()
+
+
+if __name__ == "__main__":
+    test_estimate_within_error_bounds()
+    test_duplicates_do_not_inflate_count()
+    test_merge_is_union()
+    test_round_trip_bytes()
+    print("✅ ALL HYPERLOGLOG TESTS PASSED")
@@ -0,0 +1,65 @@
+"""
+Tests for the metrics registry (core/metrics.py) and query template
+normalisation (db/instrumentation.py).
+"""
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.metrics import Histogram, MetricsRegistry
+from core.safe_logging import redact_params
+from db.instrumentation import query_template
+
+
+def test_histogram_percentiles_follow_distribution():
+    """Percentiles land in the bucket holding that share of observations."""
+    hist = Histogram()
+    for _ in range(90):
+        hist.observe(0.002)
+    for _ in range(10):
+        hist.observe(0.4)
+    assert hist.count == 100
+    assert 0.001 <= hist.percentile(0.50) <= 0.0025
+    assert 0.25 <= hist.percentile(0.99) <= 0.4
+    assert hist.max == 0.4
+
+
+def test_registry_snapshot_and_reset():
+    """Histograms, counters and bounded samples are reported per label."""
+    reg = MetricsRegistry(sample_size=2)
+    reg.observe("q", "SELECT %s", 0.01)
+    reg.observe("q", "SELECT %s", 0.03)
+    reg.increment("rows", "SELECT %s", 5)
+    for i in range(3):
+        reg.sample("slow", {"i": i})
+
+    snap = reg.snapshot()
+    assert snap["histograms"]["q"]["SELECT %s"]["count"] == 2
+    assert snap["counters"]["rows"]["SELECT %s"] == 5
+    assert [s["i"] for s in snap["samples"]["slow"]] == [1, 2]
+
+    reg.reset()
+    assert reg.snapshot()["histograms"] == {}
+
+
+def test_query_template_folds_literals_and_partitions():
+    """Queries differing only in values or partition months share a template."""
+    assert query_template("SELECT *\n  FROM users WHERE id = 5") == query_template(
+        "SELECT * FROM users WHERE id = ?"
+    )
+    assert query_template(b"INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y')") == (
+        "INSERT INTO t (a, b) VALUES (%s, %s), ..."
+    )
+    assert query_template(
+        "SELECT * FROM (SELECT * FROM audit_logs_p202401 UNION ALL "
+        "SELECT * FROM audit_logs_p202402) audit_logs"
+    ) == "SELECT * FROM (SELECT * FROM audit_logs_pYYYYMM UNION ALL ...) audit_logs"
+
+
+def test_redact_params_hides_values():
+    """Only parameter types survive redaction."""
+    redacted = redact_params(("alice@example.com", 42, None))
+    assert redacted == ("<str>", "<int>", None)
+    assert "alice" not in repr(redact_params({"email": "alice@example.com"}))
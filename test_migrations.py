@@ -0,0 +1,172 @@
+"""
+Tests for the migration runner on SQLite (db/db_migrations.py): applying
+and re-applying, refusing edited migrations, dry runs that roll back and
+sample backfills, and backfills that resume after an interruption.
+"""
+import os
+import sys
+import sqlite3
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("pydantic_settings")  # db.db_migrations reads core.settings
+
+from db.db_migrations import Migration, MigrationError, MigrationRunner
+
+
+class CreateWidgets(Migration):
+    version = 901
+    description = "Create widgets"
+
+    def up(self, runner):
+        runner.execute("CREATE TABLE widgets (id INTEGER PRIMARY KEY, name TEXT, flag INTEGER)")
+
+    def down(self, runner):
+        runner.execute("DROP TABLE widgets")
+
+
+class CreateWidgetsEdited(Migration):
+    """Version 901 again, with a different body."""
+    version = 901
+    description = "Create widgets"
+
+    def up(self, runner):
+        runner.execute("CREATE TABLE widgets (id INTEGER PRIMARY KEY, name TEXT, flag INTEGER, size INTEGER)")
+
+    def down(self, runner):
+        runner.execute("DROP TABLE widgets")
+
+
+class FlagWidgets(Migration):
+    version = 902
+    description = "Index and backfill widgets.flag"
+    online = True
+
+    def up(self, runner):
+        runner.create_index("idx_widgets_flag", "widgets", ["flag"])
+        runner.backfill("widgets", "flag = %s", "flag IS NULL", params=(1,), batch_size=2, pause=0.01)
+
+    def down(self, runner):
+        runner.drop_index("idx_widgets_flag")
+        runner.execute("UPDATE widgets SET flag = NULL")
+
+
+def sql(query, params=()):
+    """Run ``query`` on its own connection, outside the app's pool."""
+    from core.settings import settings
+
+    conn = sqlite3.connect(settings.SQLITE_DB_PATH, timeout=10)
+    try:
+        rows = conn.execute(query, params).fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def ledger_versions():
+    return [r[0] for r in sql("SELECT version FROM schema_migrations WHERE version > 900 ORDER BY version")]
+
+
+def flagged():
+    return sql("SELECT COUNT(*) FROM widgets WHERE flag = 1")[0][0]
+
+
+def status_of(runner, version):
+    return next(row for row in runner.status() if row["version"] == version)
+
+
+def has_index(name):
+    return bool(sql("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)))
+
+
+@pytest.fixture
+def widgets(sqlite_db):
+    """The widgets table (migration 901 applied) with ten unflagged rows."""
+    MigrationRunner([CreateWidgets()]).run()
+    for i in range(10):
+        sql("INSERT INTO widgets (name) VALUES (?)", (f"w{i}",))
+    return sqlite_db
+
+
+def test_apply_records_ledger_and_reapply_is_a_no_op(sqlite_db):
+    runner = MigrationRunner([CreateWidgets()])
+    [report] = runner.run()
+
+    assert report["version"] == 901 and not report["dry_run"]
+    assert [s["step"] for s in report["steps"]] == [
+        "CREATE TABLE widgets (id INTEGER PRIMARY KEY, name TEXT, flag INTEGER)"
+    ]
+    assert ledger_versions() == [901]
+    status = status_of(runner, 901)
+    assert status["applied"] and status["checksum_ok"] and status["execution_ms"] is not None
+
+    assert MigrationRunner([CreateWidgets()]).run() == []
+    assert runner.pending() == []
+    assert ledger_versions() == [901]
+
+
+def test_edited_migration_is_refused(sqlite_db):
+    MigrationRunner([CreateWidgets()]).run()
+
+    with pytest.raises(MigrationError, match="901"):
+        MigrationRunner([CreateWidgetsEdited()]).run()
+
+    status = status_of(MigrationRunner([CreateWidgetsEdited()], verify_checksums=False), 901)
+    assert status["applied"] and status["checksum_ok"] is False
+
+
+def test_dry_run_rolls_back_and_samples_backfill(widgets):
+    from db.db_migrations import DRY_RUN_SAMPLE_BATCHES
+
+    [report] = MigrationRunner([CreateWidgets(), FlagWidgets()], dry_run=True).run()
+
+    assert report["version"] == 902 and report["dry_run"]
+    index, backfill = report["steps"]
+    assert index["step"] == "create index idx_widgets_flag"
+    assert backfill["estimated"] and backfill["batches"] == 5
+    assert backfill["rows"] == 2 * DRY_RUN_SAMPLE_BATCHES
+    # Nothing was kept
+    assert flagged() == 0
+    assert not has_index("idx_widgets_flag")
+    assert ledger_versions() == [901]
+
+
+def test_interrupted_backfill_resumes_where_it_stopped(widgets, monkeypatch):
+    import time
+
+    real_sleep = time.sleep
+    pauses = []
+
+    def sleep(seconds):
+        pauses.append(seconds)
+        if len(pauses) == 2:
+            raise RuntimeError("interrupted")
+        real_sleep(0)
+
+    monkeypatch.setattr(time, "sleep", sleep)
+    with pytest.raises(RuntimeError):
+        MigrationRunner([CreateWidgets(), FlagWidgets()]).run()
+
+    # The two ranges before the interruption stay committed; 902 is not recorded
+    assert flagged() == 4
+    assert has_index("idx_widgets_flag")
+    assert ledger_versions() == [901]
+
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    [report] = MigrationRunner([CreateWidgets(), FlagWidgets()]).run()
+    assert report["steps"][1]["rows"] == 6
+    assert flagged() == 10
+    assert ledger_versions() == [901, 902]
+
+    assert MigrationRunner([CreateWidgets(), FlagWidgets()]).rollback() == [902]
+    assert flagged() == 0
+    assert not has_index("idx_widgets_flag")
+    assert ledger_versions() == [901]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,153 @@
+"""
+Tests for monthly partitioning on SQLite (db/partitions.py): routing of
+new and historical rows, the UNION ALL view and range pruning, and
+retention with archiving.
+"""
+import os
+import sys
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("pydantic_settings")  # db.partitions reads core.settings
+
+from db.partitions import (
+    SQLITE_ID_STRIDE, add_months, list_partitions, month_key, month_start, partition_name,
+)
+
+CURRENT = month_key(datetime.utcnow())
+OLD = add_months(CURRENT, -14)
+
+
+@pytest.fixture
+def partitioning(monkeypatch):
+    from core.settings import settings
+
+    monkeypatch.setattr(settings, "DB_PARTITIONING", True)
+    monkeypatch.setattr(settings, "PARTITION_MONTHS_AHEAD", 1)
+
+
+@pytest.fixture
+def db(partitioning, sqlite_db):
+    """A partitioned SQLite database (``partitioning`` must apply before ``sqlite_db``)."""
+    return sqlite_db
+
+
+def partitions(db, table):
+    with db.get_connection() as conn:
+        return list_partitions(conn.cursor(), table)
+
+
+def ids_in(db, relation):
+    with db.get_connection() as conn:
+        return [r[0] for r in conn.cursor().execute(f"SELECT id FROM {relation} ORDER BY id").fetchall()]
+
+
+def test_schema_creates_view_and_monthly_tables(db):
+    for table in ("audit_logs", "analytics_events"):
+        assert partitions(db, table) == [CURRENT, add_months(CURRENT, 1)]
+        with db.get_connection() as conn:
+            kind = conn.cursor().execute(
+                "SELECT type FROM sqlite_master WHERE name = ?", (table,)
+            ).fetchone()[0]
+        assert kind == "view"
+
+
+def test_new_rows_go_to_the_current_month(db):
+    nurse = db.add_user("nurse1", "h", "nurse")
+    event_id = db.log_analytics_event(nurse, "query", "q1")
+    audit_id = db.log_audit_event(nurse, "login")
+
+    assert ids_in(db, partition_name("analytics_events", CURRENT)) == [event_id]
+    assert ids_in(db, partition_name("audit_logs", CURRENT)) == [audit_id]
+    # Each month's ids start at YYYYMM * SQLITE_ID_STRIDE
+    assert event_id == CURRENT * SQLITE_ID_STRIDE + 1
+    assert ids_in(db, "analytics_events") == [event_id]
+
+
+def test_historical_bulk_rows_are_routed_by_created_at(db):
+    nurse = db.add_user("nurse1", "h", "nurse")
+    old_day = month_start(OLD)
+    db.bulk_log_analytics_events([
+        {"user_id": nurse, "event_type": "query", "event_name": "old", "created_at": f"{old_day} 09:00:00"},
+        {"user_id": nurse, "event_type": "query", "event_name": "new"},
+    ])
+
+    assert OLD in partitions(db, "analytics_events")
+    [old_id] = ids_in(db, partition_name("analytics_events", OLD))
+    assert old_id // SQLITE_ID_STRIDE == OLD
+    assert len(ids_in(db, partition_name("analytics_events", CURRENT))) == 1
+    # The view is rebuilt to include the new month
+    assert len(ids_in(db, "analytics_events")) == 2
+
+
+def test_historical_rows_below_the_rollup_watermark_are_rolled_up(db):
+    from db.rollups import refresh_analytics_rollups
+
+    nurse = db.add_user("nurse1", "h", "nurse")
+    db.log_analytics_event(nurse, "query", "now")
+    refresh_analytics_rollups()
+
+    old_day = month_start(OLD)
+    db.bulk_log_analytics_events([
+        {"user_id": nurse, "event_type": "query", "event_name": f"old{i}", "created_at": f"{old_day} 09:00:00"}
+        for i in range(3)
+    ])
+    refresh_analytics_rollups()
+
+    assert {r["username"]: r["event_count"] for r in db.get_top_users()} == {"nurse1": 4}
+    summary = db.get_analytics_summary(old_day, old_day)
+    assert [(r["event_date"], r["total_events"]) for r in summary] == [(old_day, 3)]
+    with db.get_connection() as conn:
+        rolled_up = conn.cursor().execute("SELECT SUM(event_count) FROM analytics_user_totals").fetchone()[0]
+    assert rolled_up == 4
+
+
+def test_range_reads_touch_only_months_in_range(db):
+    from db.partitions import relation_for_range
+
+    nurse = db.add_user("nurse1", "h", "nurse")
+    old_day = month_start(OLD)
+    db.bulk_log_audit_events([
+        {"user_id": nurse, "action": "old", "created_at": f"{old_day} 09:00:00"},
+        {"user_id": nurse, "action": "new"},
+    ])
+
+    relation = relation_for_range("audit_logs", old_day, old_day)
+    assert partition_name("audit_logs", OLD) in relation
+    assert partition_name("audit_logs", CURRENT) not in relation
+    logs = db.get_audit_logs(start_date=old_day, end_date=f"{old_day} 23:59:59")
+    assert [r["action"] for r in logs] == ["old"]
+    assert {r["action"] for r in db.get_audit_logs()} == {"old", "new"}
+
+
+def test_retention_archives_and_drops_expired_months(db, tmp_path):
+    from db.partitions import apply_retention
+
+    nurse = db.add_user("nurse1", "h", "nurse")
+    db.bulk_log_analytics_events([
+        {"user_id": nurse, "event_type": "query", "event_name": "old",
+         "created_at": f"{month_start(OLD)} 09:00:00"},
+        {"user_id": nurse, "event_type": "query", "event_name": "new"},
+    ])
+
+    dropped = apply_retention("analytics_events", keep_months=12, archive_dir=str(tmp_path))
+    assert dropped == [partition_name("analytics_events", OLD)]
+    assert OLD not in partitions(db, "analytics_events")
+    assert len(ids_in(db, "analytics_events")) == 1
+
+    with gzip.open(tmp_path / f"{dropped[0]}.ndjson.gz", "rt", encoding="utf-8") as f:
+        archived = [json.loads(line) for line in f]
+    assert [r["event_name"] for r in archived] == ["old"]
+
+    # Nothing else has expired
+    assert apply_retention("analytics_events", keep_months=12) == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
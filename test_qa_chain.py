@@ -0,0 +1,47 @@
+"""
+Tests for the shared QA chain (core/validator.py): one chain per vector
+store and parameters, rebuilt when the store is reopened.
+"""
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("streamlit")
+pytest.importorskip("pydantic_settings")
+
+
+def test_chain_is_shared_per_store_and_rebuilt_for_a_new_one(monkeypatch):
+    from core import validator
+
+    validator._shared_qa_chain.clear()
+    first, second = object(), object()
+    stores = [first]
+    built = []
+
+    def build(vector_db, search_k, temperature, http_client=None):
+        built.append((vector_db, search_k))
+        return object()
+
+    monkeypatch.setattr(validator, "AI_AVAILABLE", True)
+    monkeypatch.setattr(validator, "load_vector_db", lambda: stores[-1])
+    monkeypatch.setattr(validator, "build_qa_chain", build)
+    monkeypatch.setattr(validator, "get_llm_http_client", lambda: None)
+    try:
+        chain = validator.get_qa_chain(search_k=4)
+        assert validator.get_qa_chain(search_k=4) is chain
+        assert validator.get_qa_chain(search_k=8) is not chain
+
+        # e.g. the loader was reset and the vector DB reopened
+        stores.append(second)
+        assert validator.get_qa_chain(search_k=4) is not chain
+        assert built == [(first, 4), (first, 8), (second, 4)]
+    finally:
+        validator._shared_qa_chain.clear()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
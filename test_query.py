@@ -0,0 +1,35 @@
+"""
+Tests for placeholder compilation in db/query.py.
+"""
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db.query import Query
+
+
+def test_placeholders_compiled_for_each_backend():
+    """%s becomes ? for SQLite and $1..$n for asyncpg, in order."""
+    q = Query("SELECT * FROM t WHERE a = %s AND b IN (%s, %s) LIMIT %s")
+    assert q.qmark == "SELECT * FROM t WHERE a = ? AND b IN (?, ?) LIMIT ?"
+    assert q.numbered == "SELECT * FROM t WHERE a = $1 AND b IN ($2, $3) LIMIT $4"
+    assert q.params == 4
+    assert q.for_backend("postgres") == q.numbered
+    assert q.for_backend("sqlite") == q.qmark
+
+
+def test_string_literals_are_left_alone():
+    """A %s inside a quoted literal (including escaped quotes) is not a parameter."""
+    q = Query("SELECT '%s', 'it''s %s' FROM t WHERE x = %s")
+    assert q.numbered == "SELECT '%s', 'it''s %s' FROM t WHERE x = $1"
+    assert q.qmark == "SELECT '%s', 'it''s %s' FROM t WHERE x = ?"
+    assert q.params == 1
+
+
+def test_suffix_keeps_numbering():
+    """Appending a clause recompiles, continuing the parameter count."""
+    q = Query("  INSERT INTO t (a) VALUES (%s)  ") + "RETURNING id"
+    assert q.text == "INSERT INTO t (a) VALUES (%s) RETURNING id"
+    assert (Query("SELECT %s") + "LIMIT %s").numbered == "SELECT $1 LIMIT $2"
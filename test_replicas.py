@@ -0,0 +1,142 @@
+"""
+Tests for read-replica routing (db/replicas.py).
+
+The router tests use fake pools. The end-to-end test needs two local
+Postgres servers and runs only when TEST_PG_PRIMARY and TEST_PG_REPLICA
+(host:port) are set, e.g.:
+
+    TEST_PG_PRIMARY=localhost:5432 TEST_PG_REPLICA=localhost:5433 pytest test_replicas.py
+"""
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db.replicas import ReplicaRouter, parse_replicas
+
+
+class FakePool:
+    """getconn/putconn stand-in reporting a configurable lag."""
+
+    def __init__(self, lag=0.0, fail=False):
+        self.lag = lag
+        self.fail = fail
+        self.probes = 0
+
+    def getconn(self):
+        if self.fail:
+            raise ConnectionError("replica down")
+        return self
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def closeall(self):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def probe(pool):
+    pool.probes += 1
+    return pool.lag
+
+
+def make_router(pools, clock, max_lag=10.0):
+    return ReplicaRouter(
+        [(f"r{i}", p) for i, p in enumerate(pools)],
+        max_lag=max_lag, check_interval=5.0, probe=probe, clock=clock,
+    )
+
+
+def test_parse_replicas():
+    """Ports default to the primary's; blanks are ignored."""
+    assert parse_replicas("a:5433, b,,", "5432") == [("a", "5433"), ("b", "5432")]
+    assert parse_replicas("", "5432") == []
+
+
+def test_round_robin_and_probe_interval():
+    """Reads alternate between replicas; lag is probed once per interval."""
+    clock = Clock()
+    pools = [FakePool(), FakePool()]
+    router = make_router(pools, clock)
+    assert [router.choose().name for _ in range(4)] == ["r0", "r1", "r0", "r1"]
+    assert [p.probes for p in pools] == [1, 1]
+    clock.now = 6.0
+    router.choose()
+    router.choose()
+    assert [p.probes for p in pools] == [2, 2]
+
+
+def test_staleness_bound_and_primary_fallback():
+    """Lagging replicas are skipped; with none left the caller uses the primary."""
+    clock = Clock()
+    pools = [FakePool(lag=60.0), FakePool(lag=1.0)]
+    router = make_router(pools, clock)
+    assert {router.choose().name for _ in range(3)} == {"r1"}
+    assert router.choose(max_lag=0.5) is None
+    pools[1].lag = 60.0
+    clock.now = 6.0
+    assert router.choose() is None
+
+
+def test_unreachable_replica_is_retried_after_interval():
+    """A failed probe takes the replica out until the next check interval."""
+    clock = Clock()
+    down = FakePool(fail=True)
+    router = make_router([down], clock)
+    assert router.choose() is None
+    down.fail = False
+    clock.now = 1.0
+    assert router.choose() is None
+    clock.now = 6.0
+    assert router.choose().name == "r0"
+    assert router.metrics()["r0"]["available"]
+
+
+@pytest.mark.skipif(
+    not (os.environ.get("TEST_PG_PRIMARY") and os.environ.get("TEST_PG_REPLICA")),
+    reason="set TEST_PG_PRIMARY and TEST_PG_REPLICA (host:port) to run against Postgres",
+)
+def test_readonly_connections_use_replica_then_primary(monkeypatch):
+    """get_connection(readonly=True) reads the replica, and the primary once it is unusable."""
+    pytest.importorskip("psycopg2")
+    pytest.importorskip("pydantic_settings")
+    from core.settings import settings
+    from db import database as db
+
+    primary_host, _, primary_port = os.environ["TEST_PG_PRIMARY"].rpartition(":")
+    monkeypatch.setattr(settings, "DB_TYPE", "postgres")
+    monkeypatch.setattr(settings, "DB_HOST", primary_host)
+    monkeypatch.setattr(settings, "DB_PORT", primary_port)
+    monkeypatch.setattr(settings, "DB_READ_REPLICAS", os.environ["TEST_PG_REPLICA"])
+    db.close_connection_pool()
+
+    def server_port(readonly, **kwargs):
+        with db.get_connection(readonly=readonly, **kwargs) as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT current_setting('port')")
+            return cur.fetchone()[0]
+
+    try:
+        replica_port = os.environ["TEST_PG_REPLICA"].rpartition(":")[2]
+        assert server_port(False) == primary_port
+        assert server_port(True) == replica_port
+        # Two independent servers report zero lag, so only a negative bound rejects the replica
+        assert server_port(True, max_lag=-1) == primary_port
+
+        db.close_connection_pool()
+        monkeypatch.setattr(settings, "DB_READ_REPLICAS", "127.0.0.1:1")
+        assert server_port(True) == primary_port
+        assert db.get_replica_metrics()["127.0.0.1:1"]["available"] is False
+    finally:
+        db.close_connection_pool()
@@ -0,0 +1,136 @@
+"""
+Tests for incrementally maintained analytics rollups (db/rollups.py): the
+rollup plus the raw tail stays exact, and the watermark never passes an
+event that commits late.
+
+The Postgres test needs a local server and runs only when TEST_PG_PRIMARY
+(host:port) is set, e.g.:
+
+    TEST_PG_PRIMARY=localhost:5432 pytest test_rollups.py
+"""
+import os
+import sys
+import time
+import sqlite3
+import threading
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def rolled_up(db, user_id):
+    with db.get_connection() as conn:
+        row = conn.cursor().execute(
+            db._adapt_query("SELECT event_count FROM analytics_user_totals WHERE user_id = %s"),
+            (user_id,),
+        ).fetchone()
+    return row[0] if row else 0
+
+
+def total_events(db, username):
+    return {r["username"]: r["event_count"] for r in db.get_top_users(limit=100)}.get(username, 0)
+
+
+def test_rollup_plus_tail_is_exact_across_refreshes(sqlite_db):
+    from db.rollups import refresh_analytics_rollups
+
+    db = sqlite_db
+    nurse = db.add_user("nurse1", "h", "nurse")
+    for i in range(3):
+        db.log_analytics_event(nurse, "query", f"q{i}")
+    assert total_events(db, "nurse1") == 3
+
+    # No settle delay: committed events are rolled up at once
+    assert refresh_analytics_rollups() > 0
+    assert rolled_up(db, nurse) == 3
+
+    db.log_analytics_event(nurse, "query", "q3")
+    assert total_events(db, "nurse1") == 4
+    refresh_analytics_rollups()
+    assert rolled_up(db, nurse) == 4
+    assert refresh_analytics_rollups() == 0
+    assert sum(r["total_events"] for r in db.get_hourly_event_counts()) == 4
+
+
+def test_event_committed_during_refresh_is_counted_once(sqlite_db):
+    from core.settings import settings
+    from db.rollups import refresh_analytics_rollups
+
+    db = sqlite_db
+    nurse = db.add_user("nurse1", "h", "nurse")
+    db.log_analytics_event(nurse, "query", "before")
+
+    # A slow transaction holds an uncommitted event while the refresh starts
+    slow = sqlite3.connect(settings.SQLITE_DB_PATH, isolation_level=None, timeout=10)
+    slow.execute("BEGIN IMMEDIATE")
+    slow.execute(
+        "INSERT INTO analytics_events (user_id, event_type, event_name) VALUES (?, 'query', 'late')",
+        (nurse,),
+    )
+    refresher = threading.Thread(target=refresh_analytics_rollups)
+    refresher.start()
+    time.sleep(0.2)
+    slow.execute("COMMIT")
+    slow.close()
+    refresher.join(10)
+
+    refresh_analytics_rollups()
+    assert rolled_up(db, nurse) == 2
+    assert total_events(db, "nurse1") == 2
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TEST_PG_PRIMARY"),
+    reason="set TEST_PG_PRIMARY (host:port) to run against Postgres",
+)
+def test_out_of_order_commits_are_not_skipped(monkeypatch):
+    """An event whose id is below already-visible events, committed after a refresh, still counts."""
+    pytest.importorskip("psycopg2")
+    pytest.importorskip("pydantic_settings")
+    from core.settings import settings
+    from db import database as db
+    from db.db_migrations import run_migrations
+    from db.rollups import refresh_analytics_rollups
+
+    host, _, port = os.environ["TEST_PG_PRIMARY"].rpartition(":")
+    monkeypatch.setattr(settings, "USE_DATABASE", True)
+    monkeypatch.setattr(settings, "DB_TYPE", "postgres")
+    monkeypatch.setattr(settings, "DB_HOST", host)
+    monkeypatch.setattr(settings, "DB_PORT", port)
+    monkeypatch.setattr(settings, "DB_READ_REPLICAS", "")
+    db.close_connection_pool()
+    try:
+        db.init_database()
+        assert run_migrations()
+        username = f"rollup_{os.getpid()}_{time.time_ns()}"
+        nurse = db.add_user(username, "h", "nurse")
+        insert = (
+            "INSERT INTO analytics_events (user_id, event_type, event_name) "
+            "VALUES (%s, 'query', %s) RETURNING id"
+        )
+
+        # The long transaction takes the lower id but commits last
+        slow = db._pg_connect()
+        slow_cur = slow.cursor()
+        slow_cur.execute(insert, (nurse, "slow"))
+        slow_id = slow_cur.fetchone()[0]
+        fast_id = db.log_analytics_event(nurse, "query", "fast")
+        assert slow_id < fast_id
+
+        refresh_analytics_rollups()
+        assert rolled_up(db, nurse) == 0  # held back by the running transaction
+        assert total_events(db, username) == 1
+
+        slow.commit()
+        slow.close()
+        refresh_analytics_rollups()
+        assert rolled_up(db, nurse) == 2
+        assert total_events(db, username) == 2
+    finally:
+        db.close_connection_pool()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,52 @@
+"""
+Tests for JSON column encoding and lazy row decoding (db/serialization.py).
+"""
+import os
+import sys
+import pickle
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db.serialization import JSONRow, decode, dumps, json_rows, loads
+
+
+def test_dumps_round_trips_and_falls_back():
+    """orjson/stdlib output parses back; types orjson rejects use the stdlib."""
+    data = {"k": [1, 2.5, None, True], "nested": {"s": "é"}}
+    assert loads(dumps(data)) == data
+    assert dumps(10 ** 30) == str(10 ** 30)
+    assert decode("not json") == "not json"
+    assert decode(None) is None and decode("") == ""
+
+
+def test_json_columns_decode_on_access_only():
+    """Stored text stays untouched until the column is read."""
+    row = JSONRow({"id": 1, "role": "user", "metadata": '{"k": 1}'}, ("metadata",))
+    assert row["role"] == "user"
+    assert dict.__getitem__(row, "metadata") == '{"k": 1}'
+    assert row.get("metadata") == {"k": 1}
+    assert dict.__getitem__(row, "metadata") == {"k": 1}
+
+
+def test_whole_row_views_are_decoded():
+    """dict(), unpacking, items(), equality and pickling all see parsed values."""
+    def make():
+        return JSONRow({"id": 1, "changes": '{"a": [1]}', "bad": "{oops"}, ("changes", "bad"))
+
+    expected = {"id": 1, "changes": {"a": [1]}, "bad": "{oops"}
+    assert dict(make()) == expected
+    assert {**make()} == expected
+    assert dict(make().items()) == expected
+    assert make() == expected and expected == make()
+    assert pickle.loads(pickle.dumps(make())) == expected
+    assert loads(dumps(make())) == expected
+
+
+def test_json_rows_skips_non_text_values():
+    """Already-decoded or NULL values are never parsed."""
+    rows = json_rows([{"metadata": None}, {"metadata": {"k": 1}}], ("metadata",))
+    assert [r["metadata"] for r in rows] == [None, {"k": 1}]
+    row = rows[0]
+    row["metadata"] = '{"raw": "text"}'
+    assert row["metadata"] == '{"raw": "text"}'
@@ -0,0 +1,146 @@
+"""
+Tests for login sessions on SQLite (db/sessions.py): create, validate,
+refresh, revoke and the expiry sweep, with the active-session counter kept
+in step throughout.
+"""
+import os
+import sys
+import hashlib
+import sqlite3
+from datetime import timedelta
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("pydantic_settings")  # db.sessions reads core.settings
+
+
+@pytest.fixture
+def clock(sqlite_db, monkeypatch):
+    """Controls db.sessions' notion of now; advance with ``clock.advance(seconds)``."""
+    from db import sessions
+
+    class Clock:
+        now = sessions._now()
+
+        def advance(self, seconds):
+            self.now += timedelta(seconds=seconds)
+
+    clock = Clock()
+    monkeypatch.setattr(sessions, "_now", lambda: clock.now)
+    return clock
+
+
+@pytest.fixture
+def nurse(sqlite_db):
+    return sqlite_db.add_user("nurse1", "h", "nurse")
+
+
+def sql(query, params=()):
+    """Run ``query`` on a separate connection, as another process would."""
+    from core.settings import settings
+
+    conn = sqlite3.connect(settings.SQLITE_DB_PATH, timeout=10)
+    try:
+        rows = conn.execute(query, params).fetchall()
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+
+def forget_cache():
+    from db import sessions
+
+    sessions._token_cache.clear()
+
+
+def test_create_and_validate(clock, nurse):
+    from db.sessions import create_session, get_active_session_count, validate_session
+
+    token = create_session(nurse, ip_address="10.0.0.1", ttl=60)
+    session = validate_session(token)
+    assert session["user_id"] == nurse
+    assert session["expires_at"] == clock.now + timedelta(seconds=60)
+
+    # Only the digest is stored
+    [(stored,)] = sql("SELECT session_token FROM sessions")
+    assert stored == hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    forget_cache()
+    assert validate_session(token)["session_id"] == session["session_id"]  # from the table
+    assert validate_session("not-a-token") is None
+    assert validate_session(None) is None
+    assert get_active_session_count() == 1
+
+    clock.advance(61)
+    assert validate_session(token) is None  # the cached entry expires too
+
+
+def test_refresh_extends_a_live_session(clock, nurse):
+    from db.sessions import create_session, refresh_session, revoke_session, validate_session
+
+    token = create_session(nurse, ttl=60)
+    clock.advance(50)
+    assert refresh_session(token, ttl=600) == clock.now + timedelta(seconds=600)
+
+    clock.advance(100)
+    assert validate_session(token) is not None
+    forget_cache()
+    assert validate_session(token) is not None
+
+    clock.advance(600)
+    assert refresh_session(token) is None  # already expired
+    other = create_session(nurse, ttl=60)
+    revoke_session(other)
+    assert refresh_session(other) is None
+
+
+def test_revoke(clock, nurse):
+    from db.sessions import (
+        create_session, get_active_session_count, revoke_session, revoke_user_sessions, validate_session,
+    )
+
+    first, second, third = (create_session(nurse, ttl=60) for _ in range(3))
+    assert get_active_session_count() == 3
+
+    assert revoke_session(first)
+    assert validate_session(first) is None
+    assert not revoke_session(first)
+    assert get_active_session_count() == 2
+
+    validate_session(second)  # cached
+    assert revoke_user_sessions(nurse) == 2
+    assert validate_session(second) is None and validate_session(third) is None
+    assert get_active_session_count() == 0
+
+
+def test_sweep_expires_stale_sessions_in_batches(clock, nurse):
+    from db.sessions import (
+        create_session, expire_stale_sessions, get_active_session_count, reconcile_session_counter,
+        validate_session,
+    )
+
+    stale = [create_session(nurse, ttl=60) for _ in range(5)]
+    live = create_session(nurse, ttl=3600)
+    clock.advance(120)
+    assert get_active_session_count() == 6  # counted until the sweeper reaches them
+
+    assert expire_stale_sessions(batch_size=2) == 5
+    assert get_active_session_count() == 1
+    assert sql("SELECT COUNT(*) FROM sessions WHERE is_active = 1") == [(1,)]
+    assert validate_session(live) is not None
+    assert all(validate_session(token) is None for token in stale)
+    assert expire_stale_sessions() == 0
+
+    # Rows changed behind the service's back are corrected by reconciling
+    sql("UPDATE sessions SET is_active = 0")
+    assert get_active_session_count() == 1
+    assert reconcile_session_counter() == 0
+    assert get_active_session_count() == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
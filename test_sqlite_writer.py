@@ -0,0 +1,139 @@
+"""
+Tests for the SQLite single-writer thread (db/sqlite_writer.py): group
+commit, per-job rollback inside a batch, nested-write rejection and
+shutdown draining.
+"""
+import os
+import sys
+import sqlite3
+import threading
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db.sqlite_writer import SQLiteWriter
+
+
+@pytest.fixture
+def writer(tmp_path):
+    path = str(tmp_path / "w.db")
+    setup = sqlite3.connect(path)
+    setup.execute("PRAGMA journal_mode = WAL")
+    setup.execute("CREATE TABLE t (v INTEGER UNIQUE)")
+    setup.commit()
+    setup.close()
+    w = SQLiteWriter(lambda: sqlite3.connect(path, check_same_thread=False)).start()
+    w.path = path
+    yield w
+    w.shutdown()
+
+
+def values(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(v for (v,) in conn.execute("SELECT v FROM t"))
+    finally:
+        conn.close()
+
+
+def insert(v):
+    return lambda cur: cur.execute("INSERT INTO t (v) VALUES (?)", (v,)).lastrowid
+
+
+def hold_writer(writer):
+    """Occupy the writer thread until the returned event is set."""
+    release, started = threading.Event(), threading.Event()
+
+    def job(cur):
+        started.set()
+        release.wait(5)
+
+    threading.Thread(target=writer.execute, args=(job,), daemon=True).start()
+    started.wait(5)
+    return release
+
+
+def submit_all(writer, jobs):
+    results = [None] * len(jobs)
+
+    def run(i):
+        try:
+            results[i] = ("ok", writer.execute(jobs[i]))
+        except Exception as e:
+            results[i] = ("error", e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(jobs))]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_jobs_queued_during_a_transaction_share_one_commit(writer):
+    release = hold_writer(writer)
+    threads, results = submit_all(writer, [insert(i) for i in range(20)])
+    while writer.metrics()["queued"] < 20:
+        pass
+    release.set()
+    for t in threads:
+        t.join()
+    assert all(kind == "ok" for kind, _ in results)
+    assert values(writer.path) == list(range(20))
+    assert writer.metrics()["commits_total"] == 2  # the holding job, then all 20 together
+
+
+def test_failed_job_rolls_back_alone(writer):
+    def partial_then_fail(cur):
+        cur.execute("INSERT INTO t (v) VALUES (100)")
+        raise ValueError("bad row")
+
+    release = hold_writer(writer)
+    threads, results = submit_all(writer, [insert(1), partial_then_fail, insert(2)])
+    while writer.metrics()["queued"] < 3:
+        pass
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results[0][0] == results[2][0] == "ok"
+    assert results[1][0] == "error" and isinstance(results[1][1], ValueError)
+    assert values(writer.path) == [1, 2]  # the failed job's insert of 100 was rolled back
+    assert writer.metrics()["commits_total"] == 2 and writer.metrics()["failed_total"] == 1
+
+
+def test_nested_write_is_rejected(writer):
+    with pytest.raises(RuntimeError, match="nested"):
+        writer.execute(lambda cur: writer.execute(insert(1)))
+    assert values(writer.path) == []
+
+
+def test_shutdown_drains_queue_and_rejects_later_jobs(writer):
+    release = hold_writer(writer)
+    threads, results = submit_all(writer, [insert(i) for i in range(5)])
+    while writer.metrics()["queued"] < 5:
+        pass
+    stopper = threading.Thread(target=writer.shutdown)
+    stopper.start()
+    release.set()
+    stopper.join(5)
+    for t in threads:
+        t.join(5)
+    assert all(kind == "ok" for kind, _ in results)
+    assert values(writer.path) == list(range(5))
+    with pytest.raises(RuntimeError, match="stopped"):
+        writer.execute(insert(99))
+
+
+def test_execute_racing_shutdown_never_hangs(tmp_path):
+    """Every execute() either completes or raises; none is queued behind the sentinel."""
+    path = str(tmp_path / "race.db")
+    sqlite3.connect(path).execute("CREATE TABLE t (v INTEGER)").connection.close()
+    for _ in range(20):
+        w = SQLiteWriter(lambda: sqlite3.connect(path, check_same_thread=False)).start()
+        threads, results = submit_all(w, [insert(i) for i in range(10)])
+        w.shutdown()
+        for t in threads:
+            t.join(5)
+            assert not t.is_alive()
+        assert all(r is not None for r in results)
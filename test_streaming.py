@@ -0,0 +1,192 @@
+"""
+Tests for streaming answers (core/streaming.py) against a local fake
+streaming endpoint that sends server-sent events with a delay per token.
+
+The end-to-end test drives core.validator.stream_answer through a real
+RetrievalQA chain and Azure OpenAI client pointed at the fake endpoint; it
+needs the LangChain and Streamlit packages and is skipped without them.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.metrics import MetricsRegistry
+import core.streaming as streaming
+from core.streaming import StreamingAnswer, format_sources
+
+TOKENS = ["Repeat ", "observations ", "hourly."]
+TOKEN_DELAY = 0.05
+
+
+class FakeStreamHandler(BaseHTTPRequestHandler):
+    """Completion-style SSE stream: one data event per token, then [DONE]."""
+
+    requests = []  # (path, JSON body) of every request served
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        FakeStreamHandler.requests.append((self.path, json.loads(body or b"{}")))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for token in TOKENS:
+            time.sleep(TOKEN_DELAY)
+            event = {
+                "id": "cmpl-test", "object": "text_completion", "created": 0, "model": "test",
+                "choices": [{"text": token, "index": 0, "logprobs": None, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+def stream_tokens(url):
+    request = urllib.request.Request(url, data=b"{}", method="POST")
+    with urllib.request.urlopen(request) as response:
+        for line in response:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data: "):
+                continue
+            payload = line[len("data: "):]
+            if payload == "[DONE]":
+                return
+            yield json.loads(payload)["choices"][0]["text"]
+
+
+def with_registry(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(streaming, "get_registry", lambda: registry)
+    return registry
+
+
+def test_first_token_reported_before_completion(monkeypatch):
+    """Tokens arrive incrementally; time-to-first-token is well below the total."""
+    registry = with_registry(monkeypatch)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        started = time.perf_counter()
+        sources = [SimpleNamespace(metadata={"source": "news2.pdf", "page": 3})]
+        answer = StreamingAnswer(sources, stream_tokens(f"http://127.0.0.1:{server.server_port}/"),
+                                 started, retrieval_seconds=0.01, label="test")
+        assert answer.sources is sources  # available before any token
+
+        seen = []
+        for token in answer:
+            seen.append((token, time.perf_counter() - started))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert [t for t, _ in seen] == TOKENS and answer.text == "".join(TOKENS)
+    assert seen[0][1] < seen[-1][1]
+    assert TOKEN_DELAY * 0.8 <= answer.first_token_seconds < answer.total_seconds
+    assert answer.total_seconds >= TOKEN_DELAY * len(TOKENS) * 0.8
+
+    histograms = registry.snapshot()["histograms"]
+    assert histograms[streaming.FIRST_TOKEN_SECONDS]["test"]["count"] == 1
+    assert histograms[streaming.TOTAL_SECONDS]["test"]["count"] == 1
+    assert histograms[streaming.RETRIEVAL_SECONDS]["test"]["count"] == 1
+
+
+def test_stream_answer_streams_llm_tokens_through_the_qa_prompt(monkeypatch):
+    """stream_answer fills the chain's "stuff" prompt and streams the Azure completion token by token."""
+    for module in ("pydantic_settings", "streamlit", "httpx", "langchain", "langchain_openai", "langchain_chroma"):
+        pytest.importorskip(module)
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.vectorstores import InMemoryVectorStore
+    from core import validator
+    from core.settings import settings
+
+    if not validator.AI_AVAILABLE:
+        pytest.skip("LangChain integrations unavailable")
+    registry = with_registry(monkeypatch)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    FakeStreamHandler.requests = []
+    monkeypatch.setattr(settings, "AZURE_OPENAI_ENDPOINT", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(settings, "AZURE_OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "AZURE_OPENAI_DEPLOYMENT", "test-deployment")
+
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=16))
+    store.add_documents([Document("Escalate a NEWS2 score of 5 or more to the medical team.",
+                                  metadata={"source": "news2.pdf", "page": 2})])
+    http_client = validator.get_llm_http_client()
+    try:
+        chain = validator.build_qa_chain(store, search_k=1, temperature=0.0, http_client=http_client)
+        answer = validator.stream_answer("When should NEWS2 be escalated?", chain=chain,
+                                         label="e2e", use_cache=False)
+        assert [d.metadata["source"] for d in answer.sources] == ["news2.pdf"]
+        assert FakeStreamHandler.requests == []  # the completion starts when iterated
+
+        started = time.perf_counter()
+        arrivals = [(token, time.perf_counter() - started) for token in answer if token]
+    finally:
+        http_client.close()
+        server.shutdown()
+        server.server_close()
+
+    assert "".join(t for t, _ in arrivals) == "".join(TOKENS) == answer.text
+    assert len(arrivals) == len(TOKENS)
+    assert arrivals[0][1] < arrivals[-1][1]
+    assert answer.first_token_seconds < answer.total_seconds
+
+    [(path, body)] = FakeStreamHandler.requests
+    assert "/openai/deployments/test-deployment/completions" in path
+    assert body["stream"] is True
+    prompt = body["prompt"] if isinstance(body["prompt"], str) else body["prompt"][0]
+    assert "Escalate a NEWS2 score of 5 or more" in prompt
+    assert "When should NEWS2 be escalated?" in prompt
+    assert registry.snapshot()["histograms"][streaming.FIRST_TOKEN_SECONDS]["e2e"]["count"] == 1
+
+
+def test_abandoned_stream_is_counted_not_timed(monkeypatch):
+    """Stopping early records first-token time and an abort, but no total."""
+    registry = with_registry(monkeypatch)
+    completed = []
+    answer = StreamingAnswer([], iter(["a", "", "b", "c"]), time.perf_counter(), label="test",
+                             on_complete=completed.append)
+    stream = iter(answer)
+    assert next(stream) == "a"
+    stream.close()
+
+    snapshot = registry.snapshot()
+    assert snapshot["counters"][streaming.STREAM_ABORTED]["test"] == 1
+    assert "test" not in snapshot["histograms"].get(streaming.TOTAL_SECONDS, {})
+    assert answer.text == "a" and answer.total_seconds is not None
+    assert completed == []
+
+
+def test_on_complete_receives_full_text(monkeypatch):
+    """The completion callback runs once, after the last token."""
+    with_registry(monkeypatch)
+    completed = []
+    answer = StreamingAnswer([], iter(["Hel", "lo"]), time.perf_counter(), on_complete=completed.append)
+    assert "".join(answer) == "Hello"
+    assert completed == ["Hello"]
+    assert answer.timings()["cached"] is False
+
+
+def test_format_sources_dedupes_in_rank_order():
+    """Page numbers display one-based; documents without a source are skipped."""
+    docs = [
+        SimpleNamespace(metadata={"source": "b.pdf", "page": 0}),
+        SimpleNamespace(metadata={"source": "a.pdf"}),
+        SimpleNamespace(metadata={"source": "b.pdf", "page": 0}),
+        SimpleNamespace(metadata={}),
+    ]
+    assert format_sources(docs) == ["b.pdf (p. 1)", "a.pdf"]
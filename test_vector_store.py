@@ -0,0 +1,206 @@
+"""
+Tests for vector store startup (core/vector_store.py): background loading
+with phase timings, page-cache prefaulting and copy-on-first-write of an
+index opened in place, which must leave the shared index untouched.
+"""
+import os
+import sys
+import hashlib
+import threading
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.metrics import MetricsRegistry
+import core.vector_store as vector_store
+from core.vector_store import (
+    SourceChangedError, VectorStoreLoader, check_unchanged, copy_on_write, fingerprint, prefault_files,
+)
+
+
+class FileStore:
+    """Stands in for Chroma: one text file per document in ``path``."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def similarity_search(self, query):
+        return sorted(os.listdir(self.path))
+
+    def add_texts(self, texts):
+        for text in texts:
+            with open(os.path.join(self.path, text), "w") as f:
+                f.write(text)
+        return list(texts)
+
+
+def contents(path):
+    """SHA-256 of every file under ``path``, by relative path."""
+    digests = {}
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            with open(os.path.join(root, name), "rb") as f:
+                digests[os.path.relpath(os.path.join(root, name), path)] = hashlib.sha256(f.read()).hexdigest()
+    return digests
+
+
+def with_registry(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(vector_store, "get_registry", lambda: registry)
+    return registry
+
+
+def test_loader_opens_in_background_and_times_phases(monkeypatch):
+    registry = with_registry(monkeypatch)
+    release = threading.Event()
+
+    def open_store(loader):
+        with loader.phase("open"):
+            release.wait(5)
+        return "store"
+
+    loader = VectorStoreLoader(open_store).start()
+    assert loader.result(timeout=0.01) is None  # still opening
+    assert loader.status()["state"] == "opening"
+    release.set()
+    assert loader.result(timeout=5) == "store"
+
+    status = loader.status()
+    assert status["state"] == "ready" and set(status["timings_s"]) == {"open", "total", "first_query_wait"}
+    histograms = registry.snapshot()["histograms"][vector_store.STARTUP_SECONDS]
+    assert histograms["first_query_wait"]["count"] == 1  # only the first wait is recorded
+    assert histograms["open"]["count"] == 1
+
+
+def test_loader_failure_returns_none(monkeypatch):
+    with_registry(monkeypatch)
+
+    def open_store(loader):
+        with loader.phase("open"):
+            raise OSError("index missing")
+
+    loader = VectorStoreLoader(open_store)
+    assert loader.result(timeout=5) is None
+    assert loader.status()["state"] == "failed" and "open" in loader.status()["timings_s"]
+
+
+def test_prefault_files(tmp_path):
+    (tmp_path / "seg").mkdir()
+    (tmp_path / "seg" / "data_level0.bin").write_bytes(b"x" * 10000)
+    (tmp_path / "chroma.sqlite3").write_bytes(b"y" * 100)
+    (tmp_path / "empty").write_bytes(b"")
+    assert prefault_files(str(tmp_path)) == 10100
+
+
+def test_copy_on_first_write(monkeypatch, tmp_path):
+    with_registry(monkeypatch)
+    source, target = tmp_path / "index", tmp_path / "local"
+    source.mkdir()
+    (source / "a").write_text("a")
+    target.mkdir()
+    (target / "stale").write_text("old copy")
+
+    closed = []
+    store = copy_on_write(FileStore(str(source)), str(source), str(target), FileStore, close=lambda: closed.append(1))
+    search = store.similarity_search  # e.g. held by a retriever
+    assert search("q") == ["a"] and store.path == str(source)
+
+    assert store.add_texts(["b"]) == ["b"]
+    assert sorted(os.listdir(source)) == ["a"]  # source untouched
+    assert search("q") == ["a", "b"] and store.path == str(target)
+    assert "add_texts" not in vars(store)  # back to the plain method
+    assert closed == [1]  # the handle on the source was released
+
+    store.add_texts(["c"])
+    assert sorted(os.listdir(target)) == ["a", "b", "c"]
+    assert closed == [1]
+
+
+def test_check_unchanged(tmp_path):
+    (tmp_path / "chroma.sqlite3").write_bytes(b"x" * 10)
+    before = fingerprint(str(tmp_path))
+    check_unchanged(str(tmp_path), before)
+
+    (tmp_path / "chroma.sqlite3-journal").write_bytes(b"j")
+    with pytest.raises(SourceChangedError, match="chroma.sqlite3-journal"):
+        check_unchanged(str(tmp_path), before)
+
+
+def open_vector_db(monkeypatch, source, target, embeddings):
+    """Run validator._open_vector_db in in_place mode on ``source``; returns the loader."""
+    from core import validator
+    from core.settings import settings
+
+    with_registry(monkeypatch)
+    monkeypatch.setattr(settings, "VECTOR_DB_PATH", str(source))
+    monkeypatch.setattr(settings, "LOCAL_DB_PATH", str(target))
+    monkeypatch.setattr(settings, "VECTOR_DB_OPEN_MODE", "in_place")
+    monkeypatch.setattr(validator, "_load_embeddings", lambda: embeddings)
+    loader = VectorStoreLoader(validator._open_vector_db)
+    loader.result(timeout=60)
+    return loader
+
+
+def test_chroma_never_writes_to_source(monkeypatch, tmp_path):
+    pytest.importorskip("chromadb")
+    pytest.importorskip("langchain_chroma")
+    pytest.importorskip("streamlit")
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from core import validator
+
+    if not validator.AI_AVAILABLE:
+        pytest.skip("langchain modules not available")
+    source, target = tmp_path / "index", tmp_path / "local"
+    embeddings = DeterministicFakeEmbedding(size=16)
+    built, client = validator._open_chroma(str(source), embeddings)
+    built.add_texts(["sepsis screening", "falls risk", "pressure ulcer care"])
+    client.close()
+    original = contents(source)
+
+    # Chroma writes to whatever it opens, so a writable index is copied first
+    loader = open_vector_db(monkeypatch, source, target, embeddings)
+    store = loader.result()
+    assert loader.status()["state"] == "ready"
+    assert {"copy", "warm"} <= set(loader.status()["timings_s"])
+
+    assert [d.page_content for d in store.similarity_search("falls risk", k=1)] == ["falls risk"]
+    assert contents(source) == original
+
+    store.add_texts(["hand hygiene"])
+    assert len(store.get()["ids"]) == 4
+    assert contents(source) == original
+
+
+def test_in_place_open_that_modifies_source_falls_back_to_copy(monkeypatch, tmp_path):
+    pytest.importorskip("streamlit")
+    from core import validator
+    from core.settings import settings
+
+    if not validator.AI_AVAILABLE:
+        pytest.skip("langchain modules not available")
+    source, target = tmp_path / "index", tmp_path / "local"
+    source.mkdir()
+    (source / "a").write_text("a")
+    closed = []
+
+    class Client:
+        def __init__(self, path):
+            self.path = path
+
+        def close(self):
+            closed.append(self.path)
+
+    def open_chroma(path, embeddings):
+        if path == str(source):
+            (source / "lock").write_text("opened")  # as Chroma's acquire_write row does
+        return FileStore(path), Client(path)
+
+    monkeypatch.setattr(vector_store, "is_read_only", lambda path: True)
+    monkeypatch.setattr(validator, "_open_chroma", open_chroma)
+    monkeypatch.setattr(settings, "VECTOR_DB_WARMUP", False)
+    store = open_vector_db(monkeypatch, source, target, embeddings=None).result()
+
+    assert store.path == str(target)
+    assert closed == [str(source)]